@@ -0,0 +1,1555 @@
+"""Micro-benchmarks for the school app.
+
+Run from the repository root, e.g.:
+
+    python benchmark.py pool
+
+Every benchmark works on a scratch copy of database.db so the real file is
+never touched.
+"""
+import argparse
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+
+# Copy database.db into a temporary directory and point the app at it
+def use_scratch_database(source="database.db"):
+    scratch_dir = tempfile.mkdtemp(prefix="school_bench_")
+    path = os.path.join(scratch_dir, "database.db")
+    if source and os.path.exists(source):
+        shutil.copyfile(source, path)
+    os.environ["SCHOOL_DB_PATH"] = path
+    import db
+    db.DB_PATH = path
+    return path
+
+
+# Run fn repeatedly for `seconds` and return calls per second
+def rate(fn, seconds=2.0):
+    fn()  # warm up
+    calls = 0
+    start = time.perf_counter()
+    while time.perf_counter() - start < seconds:
+        fn()
+        calls += 1
+    return calls / (time.perf_counter() - start)
+
+
+def superadmin_rerun():
+    import superadmin
+    superadmin.get_data()
+
+
+def branchadmin_rerun():
+    import branchadmin
+    import manage_sections_classes
+    import manage_teachers
+    branchadmin.get_branches()
+    for class_id, _ in manage_sections_classes.get_classes_by_grade("1"):
+        for section_id, _ in manage_sections_classes.get_sections(class_id):
+            manage_sections_classes.get_students(section_id)
+    manage_teachers.get_teachers_by_subject("Mathematics")
+
+
+# Data-access reruns/second per page, with one connection per call (the old
+# behaviour) and with the pooled connection layer. The query cache is emptied
+# before every rerun, so each one opens (or reuses) connections and runs its
+# SQL instead of being served from memory.
+def bench_pool(args):
+    use_scratch_database()
+    import database
+    import db
+    import query_cache
+
+    database.init_db()
+
+    pages = [("superadmin", superadmin_rerun), ("branchadmin", branchadmin_rerun)]
+    print(f"{'page':<12} {'per-call':>12} {'pooled':>12} {'speedup':>8}")
+    for name, rerun in pages:
+        def uncached():
+            query_cache.clear()
+            rerun()
+        db.set_pool_enabled(False)
+        before = rate(uncached, args.seconds)
+        db.set_pool_enabled(True)
+        after = rate(uncached, args.seconds)
+        print(f"{name:<12} {before:>10.0f}/s {after:>10.0f}/s {after / before:>7.1f}x")
+
+
+# Startup migration cost, and what every rerun pays with and without the
+# process-level "already migrated" guard
+def bench_migrations(args):
+    fresh = os.path.join(tempfile.mkdtemp(prefix="school_bench_"), "database.db")
+    import db
+    import migrations
+
+    start = time.perf_counter()
+    report = migrations.ensure_migrated(fresh)
+    cold = time.perf_counter() - start
+    print(f"fresh database: {len(report['applied'])} migration(s) in {cold * 1000:.1f} ms")
+
+    legacy = use_scratch_database()
+    report = migrations.ensure_migrated(legacy)
+    print(f"database.db: v{report['from_version']} -> v{report['to_version']} in {report['seconds'] * 1000:.1f} ms")
+
+    def rerun_schema():
+        with db.pooled(legacy) as connection:
+            cursor = connection.cursor()
+            for _, _, step in migrations.MIGRATIONS:
+                step(cursor)
+            connection.commit()
+
+    guarded = rate(lambda: migrations.ensure_migrated(legacy), args.seconds)
+    unguarded = rate(rerun_schema, args.seconds)
+    print(f"per rerun: schema re-run {1000 / unguarded:.3f} ms, guarded {1000 / guarded:.5f} ms")
+
+
+# Page data reruns/second with the query cache cold (cleared before every
+# rerun) and warm
+def bench_cache(args):
+    use_scratch_database()
+    import database
+    import query_cache
+
+    database.init_db()
+    pages = [("superadmin", superadmin_rerun), ("branchadmin", branchadmin_rerun)]
+    print(f"{'page':<12} {'uncached':>12} {'cached':>12} {'speedup':>8}")
+    for name, rerun in pages:
+        def uncached():
+            query_cache.clear()
+            rerun()
+        before = rate(uncached, args.seconds)
+        after = rate(rerun, args.seconds)
+        print(f"{name:<12} {before:>10.0f}/s {after:>10.0f}/s {after / before:>7.1f}x")
+    print(query_cache.stats())
+
+
+# Write a roster CSV of `rows` students, with a few deliberately bad rows
+def write_roster_csv(path, rows):
+    import csv
+    genders = ("Male", "Female", "Other")
+    with open(path, "w", newline="") as f:
+        writer = csv.writer(f)
+        writer.writerow(["Student Name", "Father Name", "Mother Name", "Roll Number", "Gender",
+                         "Phone Number", "Date of Birth", "Address"])
+        for i in range(rows):
+            roll_number = f"BENCH{i:07d}"
+            gender = genders[i % 3]
+            if i % 1000 == 999:
+                roll_number = f"BENCH{i - 1:07d}"  # duplicate in file
+            elif i % 1000 == 998:
+                gender = "Unknown"
+            writer.writerow([f"Student {i}", f"Father {i}", f"Mother {i}", roll_number, gender,
+                             f"9{i:09d}", "2012-06-01", f"{i} Main Street"])
+
+
+# Bulk student import throughput; exits 1 below --min-rate rows/second
+def bench_import(args):
+    use_scratch_database()
+    import bulk_import
+    import database
+    import db
+
+    database.init_db()
+    connection = db.get_connection()
+    with connection:
+        branch_id = connection.execute("INSERT INTO branch (branch_name, location, contact_number) VALUES ('Benchmark Branch', 'Benchmark', '0')").lastrowid
+        class_id = connection.execute(
+            "INSERT INTO class (class_name, grade, branch_id) VALUES ('Benchmark 1', '1', ?)", (branch_id,)
+        ).lastrowid
+        section_id = connection.execute(
+            "INSERT INTO section (section_name, class_id) VALUES ('A', ?)", (class_id,)
+        ).lastrowid
+
+    csv_path = os.path.join(os.path.dirname(db.DB_PATH), "roster.csv")
+    write_roster_csv(csv_path, args.rows)
+    report = bulk_import.import_students(csv_path, section_id)
+    if report.rejects_path:
+        os.unlink(report.rejects_path)
+
+    print(f"{report.rows_read} rows in {report.seconds:.2f}s: {report.inserted} inserted, "
+          f"{report.rejected} rejected, {report.rows_per_second:,.0f} rows/s")
+    if report.rows_per_second < args.min_rate:
+        print(f"below the {args.min_rate:,.0f} rows/s target")
+        return 1
+
+
+# Curriculum CSV import of `--topics` topics (20 per chapter), then the same
+# file again, which must add nothing; exits 1 over --max-seconds
+def bench_curriculum(args):
+    use_scratch_database()
+    import csv
+    import curriculum_import
+    import database
+    import db
+
+    database.init_db()
+    csv_path = os.path.join(os.path.dirname(db.DB_PATH), "curriculum.csv")
+    with open(csv_path, "w", newline="") as f:
+        writer = csv.writer(f)
+        writer.writerow(curriculum_import.CURRICULUM_CSV_COLUMNS)
+        for i in range(args.topics):
+            chapter = i // 20
+            writer.writerow([f"Bench Chapter {chapter}", f"Plan for chapter {chapter}", f"Bench Topic {i}",
+                             f"Description of topic {i}", f"Outcome of topic {i}"])
+
+    first = curriculum_import.import_curriculum(csv_path, class_id=1)
+    again = curriculum_import.import_curriculum(csv_path, class_id=1)
+    for label, report in (("first import", first), ("re-import", again)):
+        print(f"{label}: {report.rows_read} rows in {report.seconds * 1000:.0f} ms, "
+              f"{report.chapters_added} chapters, {report.topics_added} topics, "
+              f"{report.associations_added} links, {report.outcomes_added} outcomes added")
+
+    failed = False
+    if again.chapters_added or again.topics_added or again.associations_added or again.outcomes_added:
+        print("re-import was not idempotent")
+        failed = True
+    if first.seconds > args.max_seconds:
+        print(f"first import exceeded {args.max_seconds:.2f}s")
+        failed = True
+    return 1 if failed else 0
+
+
+# Entering a full section of grades: one save_grade call per cell (the
+# click-per-grade flow) against a single grid save, on the largest section
+# of a small generated school
+def bench_grades(args):
+    import generate_data
+    path = use_scratch_database(source=None)
+    generate_data.generate(path, 0.05, progress=lambda message: None)
+    import db
+    import teachers
+
+    branch_id, grade, section_name = db.get_connection().execute("""
+    SELECT c.branch_id, c.grade, sec.section_name
+    FROM section sec JOIN class c ON c.class_id = sec.class_id JOIN student s ON s.section_id = sec.section_id
+    GROUP BY sec.section_id ORDER BY COUNT(*) DESC LIMIT 1
+    """).fetchone()
+    subject, section = "Mathematics", teachers.section_label(section_name)
+    original = teachers.load_grade_grid(subject, branch_id, grade, section_name)
+    chapters = teachers.get_chapters_for_subject(subject)
+    edited = original.copy()
+    for i, student_id in enumerate(edited.index):
+        for j, chapter in enumerate(chapters):
+            edited.loc[student_id, chapter] = (i + j) % 10 + 1
+    cells = len(edited.index) * len(chapters)
+
+    start = time.perf_counter()
+    for student_id in edited.index:
+        for chapter in chapters:
+            teachers.save_grade(student_id, edited.loc[student_id, "Student"], subject, chapter, section,
+                                int(edited.loc[student_id, chapter]))
+    per_cell = time.perf_counter() - start
+
+    teachers.save_grade_grid(subject, section, edited, original)  # clears the cells again
+    start = time.perf_counter()
+    saved, _ = teachers.save_grade_grid(subject, section, original, edited)
+    grid = time.perf_counter() - start
+    print(f"{cells} cells: per-cell saves {per_cell * 1000:.1f} ms, grid save {grid * 1000:.1f} ms "
+          f"({saved} written, {per_cell / grid:.1f}x)")
+
+    reloaded = teachers.load_grade_grid(subject, branch_id, grade, section_name)
+    saved, _ = teachers.save_grade_grid(subject, section, reloaded, edited)
+    print(f"saving the same grid again writes {saved} cell(s)")
+
+
+# Cold-start import cost of the login page, from `python -X importtime`.
+# Exits 1 over --budget-ms or if login pulls in a dashboard-only library
+# (streamlit itself already imports the light plotly.graph_objects shim).
+LOGIN_LAZY_MODULES = ("pandas", "plotly.express", "matplotlib", "superadmin", "teachers", "branchadmin")
+
+
+def bench_importtime(args):
+    import subprocess
+    env = dict(os.environ, SCHOOL_DB_PATH=use_scratch_database())
+    timings = []
+    for _ in range(args.runs):
+        result = subprocess.run([sys.executable, "-X", "importtime", "-c", f"import {args.module}"],
+                                capture_output=True, text=True, env=env, check=True)
+        modules = {}
+        for line in result.stderr.splitlines():
+            if not line.startswith("import time:") or "|" not in line:
+                continue
+            _, cumulative, name = line[len("import time:"):].split("|")
+            if cumulative.strip().isdigit():
+                modules[name[1:]] = int(cumulative)  # nested imports keep their indentation
+        timings.append(modules)
+
+    total_ms = min(modules[args.module] for modules in timings) / 1000
+    imported = {name.strip() for name in timings[0]}
+    # What the module imports directly
+    direct = [(us, name.strip()) for name, us in timings[0].items() if name.startswith("  ") and not name.startswith("    ")]
+    print(f"import {args.module}: {total_ms:.0f} ms (best of {args.runs}), budget {args.budget_ms:.0f} ms")
+    for us, name in sorted(direct, reverse=True)[:8]:
+        print(f"  {us / 1000:>8.1f} ms  {name}")
+
+    failed = False
+    if args.module == "login":
+        loaded = [name for name in LOGIN_LAZY_MODULES if name in imported]
+        if loaded:
+            print(f"login imports {', '.join(loaded)} at startup")
+            failed = True
+    if total_ms > args.budget_ms:
+        print(f"over budget by {total_ms - args.budget_ms:.0f} ms")
+        failed = True
+    return 1 if failed else 0
+
+
+# Median seconds of `repeat` calls of fn
+def median_time(fn, repeat):
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        times.append(time.perf_counter() - start)
+    return sorted(times)[len(times) // 2]
+
+
+# Roster page latency for sections of different sizes: the first page, a
+# page from the middle (keyset), the same page with LIMIT/OFFSET, and the
+# old whole-section fetch. Exits 1 if a middle page of the largest section
+# is over --max-ratio times slower than in the smallest.
+def bench_roster(args):
+    use_scratch_database()
+    import database
+    import db
+    import manage_sections_classes
+    import query_cache
+    import roster
+
+    database.init_db()
+    connection = db.get_connection()
+    sizes = sorted(args.sizes)
+    sections = {}
+    with connection:
+        class_id = connection.execute(
+            "INSERT INTO class (class_name, grade, branch_id) VALUES ('Roster Bench', '1', NULL)"
+        ).lastrowid
+        for size in sizes:
+            section_id = connection.execute(
+                "INSERT INTO section (section_name, class_id) VALUES (?, ?)", (f"Bench {size}", class_id)
+            ).lastrowid
+            connection.executemany(
+                "INSERT INTO student (section_id, student_name, roll_number, father_name, mother_name, gender, "
+                "phone_number, address) VALUES (?, ?, ?, 'F', 'M', 'Male', '0', 'Address')",
+                ((section_id, f"Student {(i * 7919) % size:07d}", f"R{size}-{i:07d}") for i in range(size)),
+            )
+            sections[size] = section_id
+
+    def uncached(fn):
+        def run():
+            query_cache.clear()
+            return fn()
+        return run
+
+    print(f"{'students':>9} {'first page':>11} {'middle page':>12} {'name sort':>10} {'offset':>9} {'whole section':>14}")
+    middle_times = {}
+    for size, section_id in sections.items():
+        middle = connection.execute(
+            "SELECT roll_number FROM student WHERE section_id = ? ORDER BY roll_number LIMIT 1 OFFSET ?",
+            (section_id, size // 2),
+        ).fetchone()
+        middle_by_name = connection.execute(
+            "SELECT student_name, roll_number FROM student WHERE section_id = ? "
+            "ORDER BY student_name, roll_number LIMIT 1 OFFSET ?",
+            (section_id, size // 2),
+        ).fetchone()
+        offset_sql = (
+            "SELECT student_name, roll_number, gender, phone_number, dob, address, father_name, mother_name "
+            "FROM student WHERE section_id = ? ORDER BY roll_number LIMIT ? OFFSET ?"
+        )
+        first = median_time(uncached(lambda: roster.fetch_page("section", section_id)), args.repeat)
+        keyset = median_time(uncached(lambda: roster.fetch_page("section", section_id, after=middle)), args.repeat)
+        by_name = median_time(uncached(lambda: roster.fetch_page("section", section_id, sort="student_name",
+                                                                 after=middle_by_name)), args.repeat)
+        offset = median_time(lambda: connection.execute(offset_sql, (section_id, roster.PAGE_SIZE, size // 2)).fetchall(),
+                             args.repeat)
+        whole = median_time(uncached(lambda: manage_sections_classes.get_students(section_id)), 1)
+        middle_times[size] = keyset
+        print(f"{size:>9} {first * 1000:>9.2f}ms {keyset * 1000:>10.2f}ms {by_name * 1000:>8.2f}ms "
+              f"{offset * 1000:>7.2f}ms {whole * 1000:>12.1f}ms")
+
+    ratio = middle_times[sizes[-1]] / middle_times[sizes[0]]
+    print(f"middle page, {sizes[-1]} vs {sizes[0]} students: {ratio:.2f}x")
+    if ratio > args.max_ratio:
+        print(f"page latency grows with section size (over {args.max_ratio:.1f}x)")
+        return 1
+
+
+FIRST_NAMES = ("Aarav", "Vivaan", "Aditya", "Vihaan", "Arjun", "Sai", "Reyansh", "Ayaan", "Krishna", "Ishaan",
+               "Ananya", "Diya", "Priya", "Aadhya", "Saanvi", "Anika", "Kavya", "Meera", "Riya", "Sneha",
+               "John", "Emily", "Michael", "Sarah", "David", "Laura", "Daniel", "Grace", "Olivia", "Ethan")
+LAST_NAMES = ("Sharma", "Verma", "Reddy", "Rao", "Patel", "Iyer", "Nair", "Gupta", "Singh", "Kumar",
+              "Das", "Joshi", "Mehta", "Shah", "Naidu", "Pillai", "Menon", "Bose", "Khan", "Smith")
+
+
+# Student search latency on a table of --students students spread over
+# branches; exits 1 if any query's p95 is over --max-ms
+def bench_search(args):
+    import random
+    use_scratch_database()
+    import database
+    import db
+    import query_cache
+    import search
+
+    database.init_db()
+    connection = db.get_connection()
+    rng = random.Random(42)
+    start = time.perf_counter()
+    with connection:
+        sections = []
+        for b in range(10):
+            branch_id = connection.execute(
+                "INSERT INTO branch (branch_name, location, contact_number) VALUES (?, 'Bench', '0')", (f"Search Bench {b}",)
+            ).lastrowid
+            class_id = connection.execute(
+                "INSERT INTO class (class_name, grade, branch_id) VALUES ('Bench', '5', ?)", (branch_id,)
+            ).lastrowid
+            sections.append((branch_id, connection.execute(
+                "INSERT INTO section (section_name, class_id) VALUES ('A', ?)", (class_id,)
+            ).lastrowid))
+
+        def students():
+            for i in range(args.students):
+                last = rng.choice(LAST_NAMES)
+                yield (sections[i % len(sections)][1], f"{rng.choice(FIRST_NAMES)} {last}", f"SR{i:07d}",
+                       f"{rng.choice(FIRST_NAMES)} {last}", f"{rng.choice(FIRST_NAMES)} {last}", "Male",
+                       f"9{rng.randrange(10 ** 9):09d}", "Address", f"student{i}@school.example")
+
+        connection.executemany(
+            "INSERT INTO student (section_id, student_name, roll_number, father_name, mother_name, gender, "
+            "phone_number, address, email) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)", students()
+        )
+    print(f"{args.students} students indexed in {time.perf_counter() - start:.1f}s")
+
+    phone = connection.execute("SELECT phone_number FROM student ORDER BY student_id DESC LIMIT 1").fetchone()[0]
+    queries = [
+        ("one letter", "a", None),
+        ("first name prefix", "Sne", None),
+        ("full name", "Priya Sharma", None),
+        ("name prefixes", "kav me", None),
+        ("roll number", f"SR{args.students // 2:07d}", None),
+        ("phone prefix", phone[:6], None),
+        ("parent name", "Vihaan Iyer", None),
+        ("email", f"student{args.students - 1}", None),
+        ("name in branch", "Priya Sharma", sections[3][0]),
+        ("prefix in branch", "Sne", sections[3][0]),
+    ]
+    print(f"{'query':<20} {'results':>8} {'p50':>9} {'p95':>9}")
+    failed = False
+    for label, text, branch_id in queries:
+        times = []
+        for _ in range(args.repeat):
+            query_cache.clear()
+            begin = time.perf_counter()
+            results = search.search_students(text, branch_id)
+            times.append(time.perf_counter() - begin)
+        times.sort()
+        p50, p95 = times[len(times) // 2] * 1000, times[int(len(times) * 0.95)] * 1000
+        print(f"{label:<20} {len(results):>8} {p50:>7.2f}ms {p95:>7.2f}ms")
+        failed = failed or p95 > args.max_ms
+    if failed:
+        print(f"a query's p95 exceeded {args.max_ms:.0f} ms")
+        return 1
+
+
+# The student dashboard's old per-row code: an if/elif band per score, then
+# list comprehensions picking one subject's and one student's rows
+def loop_analytics(performance_data, subject, student_id):
+    grades = []
+    for entry in performance_data:
+        score = entry["score"]
+        if score >= 90:
+            grades.append("A")
+        elif score >= 75:
+            grades.append("B")
+        elif score >= 60:
+            grades.append("C")
+        else:
+            grades.append("D")
+    by_subject = [entry for entry in performance_data if entry["subject"] == subject]
+    by_student = [entry for entry in performance_data if entry["student_id"] == student_id]
+    return grades, by_subject, by_student
+
+
+# The same work on the typed frame
+def vectorized_analytics(frame, subject, student_id):
+    import grade_analytics
+    bands = grade_analytics.grade_bands(frame["score"].to_numpy())
+    return bands, frame[frame["subject"] == subject], frame[frame["student_id"].to_numpy() == student_id]
+
+
+# Grade analytics over --rows grade rows: loading the typed frame, the old
+# dashboard's per-row work against its vectorized form (the loop runs on
+# --loop-rows rows and is scaled up), then the full set of aggregates.
+# Exits 1 if loading plus aggregates exceed --max-seconds.
+def bench_analytics(args):
+    use_scratch_database()
+    import database
+    import db
+    import grade_analytics
+
+    database.init_db()
+    connection = db.get_connection()
+    start = time.perf_counter()
+    with connection:
+        connection.execute("DELETE FROM grades")
+        # 5 subjects x 10 chapters per student, 4 sections
+        connection.execute("""
+        WITH RECURSIVE n(i) AS (SELECT 0 UNION ALL SELECT i + 1 FROM n WHERE i + 1 < ?)
+        INSERT INTO grades (student_id, student_name, subject, chapter, section, grade)
+        SELECT i / 50 + 1, 'Student ' || (i / 50 + 1),
+               CASE i % 5 WHEN 0 THEN 'Math' WHEN 1 THEN 'English' WHEN 2 THEN 'Science'
+                          WHEN 3 THEN 'History' ELSE 'Art' END,
+               'Chapter ' || ((i / 5) % 10 + 1), 'Section ' || char(65 + (i / 50) % 4),
+               abs(random()) % 10 + 1
+        FROM n
+        """, (args.rows,))
+    print(f"{args.rows:,} grade rows generated in {time.perf_counter() - start:.1f}s")
+
+    start = time.perf_counter()
+    frame = grade_analytics.read_grades()
+    load = time.perf_counter() - start
+    memory = frame.memory_usage(deep=True).sum() / 1024 ** 2
+    print(f"load: {load:.2f}s, {memory:.0f} MB in memory")
+
+    rows = connection.execute(
+        "SELECT student_id, subject, grade * 10 FROM grades LIMIT ?", (args.loop_rows,)
+    ).fetchall()
+    performance_data = [{"student_id": s, "subject": subject, "score": score} for s, subject, score in rows]
+    start = time.perf_counter()
+    loop_analytics(performance_data, "Math", 7)
+    loop = (time.perf_counter() - start) * args.rows / len(performance_data)
+    start = time.perf_counter()
+    vectorized_analytics(frame, "Math", 7)
+    vectorized = time.perf_counter() - start
+    print(f"bands + subject + student rows: per-row loop {loop:.2f}s (scaled from {len(performance_data):,} rows), "
+          f"vectorized {vectorized:.2f}s, {loop / vectorized:.0f}x")
+
+    start = time.perf_counter()
+    scores = grade_analytics.student_subject_scores(frame)
+    summary = grade_analytics.subject_summary(frame, scores)
+    grade_analytics.band_distribution(frame, frame["student_id"].to_numpy() == 7)
+    aggregates = time.perf_counter() - start
+    print(f"aggregates: {aggregates:.2f}s for {len(scores):,} student-subject scores and {len(summary)} subjects")
+
+    if load + aggregates > args.max_seconds:
+        print(f"load plus aggregates exceeded {args.max_seconds:.0f}s")
+        return 1
+
+
+# Dashboard lookups from the aggregate cube vs computing the same cells from
+# the base tables, and the cost of refreshing one branch after a write.
+# Exits 1 if a lookup's p95 is over --max-ms or a refresh over --max-refresh-ms.
+def bench_cube(args):
+    use_scratch_database()
+    import bulk_import
+    import cube
+    import database
+    import db
+
+    database.init_db()
+    connection = db.get_connection()
+    start = time.perf_counter()
+    names = [
+        name for (name,) in connection.execute(
+            "SELECT name FROM sqlite_master WHERE type = 'trigger' AND tbl_name IN ('student', 'grades') "
+            "AND name LIKE '%insert'"
+        )
+    ]
+    with bulk_import.suspended_triggers(connection, names) as (cursor, triggers):
+        branch_ids = []
+        for b in range(args.branches):
+            branch_id = cursor.execute(
+                "INSERT INTO branch (branch_name, location, contact_number) VALUES (?, 'Bench', '0')", (f"Cube Bench {b}",)
+            ).lastrowid
+            branch_ids.append(branch_id)
+            for grade in range(1, 11):
+                class_id = cursor.execute(
+                    "INSERT INTO class (class_name, grade, branch_id) VALUES (?, ?, ?)", (f"Class {grade}", grade, branch_id)
+                ).lastrowid
+                for section in "ABCD":
+                    section_id = cursor.execute(
+                        "INSERT INTO section (section_name, class_id) VALUES (?, ?)", (section, class_id)
+                    ).lastrowid
+                    cursor.execute("""
+                    WITH RECURSIVE n(i) AS (SELECT 0 UNION ALL SELECT i + 1 FROM n WHERE i + 1 < ?2)
+                    INSERT INTO student (section_id, student_name, roll_number, father_name, mother_name, gender,
+                                         phone_number, address)
+                    SELECT ?1, 'Student ' || i, 'CB' || ?1 || '-' || i, 'F', 'M', 'Male', '0', 'Address' FROM n
+                    """, (section_id, args.students))
+            cursor.executemany(
+                "INSERT INTO teachers (teacher_name, branch_id, email, subject, password) VALUES ('T', ?, ?, ?, 'x')",
+                [(branch_id, f"cube{b}-{s}@school.example", s) for s in ("Math", "English", "Science")],
+            )
+        # 5 subjects x 4 chapters per student
+        cursor.execute("""
+        WITH subjects(subject) AS (VALUES ('Math'), ('English'), ('Science'), ('History'), ('Art')),
+             chapters(chapter) AS (VALUES ('Chapter 1'), ('Chapter 2'), ('Chapter 3'), ('Chapter 4'))
+        INSERT INTO grades (student_id, student_name, subject, chapter, section, grade)
+        SELECT s.student_id, s.student_name, subject, chapter, 'A', abs(random()) % 10 + 1
+        FROM student s CROSS JOIN subjects CROSS JOIN chapters
+        """)
+        for _, sql in triggers:
+            cursor.execute(sql)
+    students, grades = connection.execute("SELECT (SELECT COUNT(*) FROM student), (SELECT COUNT(*) FROM grades)").fetchone()
+    print(f"{students:,} students and {grades:,} grades generated in {time.perf_counter() - start:.1f}s")
+
+    start = time.perf_counter()
+    connection.execute("BEGIN IMMEDIATE")
+    cube.rebuild_cube(connection.cursor())
+    connection.commit()
+    cells = connection.execute("SELECT COUNT(*) FROM agg_cube").fetchone()[0]
+    print(f"full build: {time.perf_counter() - start:.2f}s for {cells:,} cells")
+
+    branch_id = branch_ids[len(branch_ids) // 2]
+    lookups = [
+        ("branch overview", lambda: cube.cell(branch_id)),
+        ("subject + grade", lambda: cube.cell(branch_id, 5, "Math")),
+        ("grade + section", lambda: cube.cell(branch_id, 5, section="B")),
+        ("all branches", lambda: cube.cell()),
+        ("sidebar options", lambda: (cube.subjects(branch_id), cube.grades(branch_id, "Math"), cube.sections(branch_id, 5))),
+        ("grade breakdown", lambda: cube.breakdown(branch_id, "grade")),
+    ]
+    print(f"{'lookup':<18} {'p50':>9} {'p95':>9}")
+    failed = False
+    for label, lookup in lookups:
+        times = []
+        for _ in range(args.repeat):
+            begin = time.perf_counter()
+            lookup()
+            times.append(time.perf_counter() - begin)
+        times.sort()
+        p50, p95 = times[len(times) // 2] * 1000, times[int(len(times) * 0.95)] * 1000
+        print(f"{label:<18} {p50:>7.3f}ms {p95:>7.3f}ms")
+        failed = failed or p95 > args.max_ms
+    joins = median_time(lambda: connection.execute(cube.CUBE_SQL, (f"[[{branch_id}, {cube.ALL_GRADES}]]", cube.PASS_GRADE)).fetchall(), 3)
+    print(f"the same cells from the base tables: {joins * 1000:.0f}ms per branch")
+
+    student_id = connection.execute(
+        "SELECT s.student_id FROM student s JOIN section sec ON s.section_id = sec.section_id "
+        "JOIN class c ON sec.class_id = c.class_id WHERE c.branch_id = ? LIMIT 1", (branch_id,)
+    ).fetchone()[0]
+    refresh_times = []
+    for grade in range(1, args.repeat // 10 + 2):
+        with connection:
+            connection.execute("UPDATE grades SET grade = ? WHERE student_id = ? AND subject = 'Math'",
+                               (grade % 10 + 1, student_id))
+        begin = time.perf_counter()
+        cube.refresh()
+        refresh_times.append(time.perf_counter() - begin)
+    refresh_ms = sorted(refresh_times)[len(refresh_times) // 2] * 1000
+    print(f"refresh after a grade change: {refresh_ms:.0f}ms (one grade of one branch of {len(branch_ids)})")
+    differences = cube.check_cube(connection)
+    if differences:
+        print(f"cube differs from the base tables in {len(differences)} place(s), e.g. {differences[0]}")
+        return 1
+    if refresh_ms > args.max_refresh_ms:
+        print(f"refresh exceeded {args.max_refresh_ms:.0f} ms")
+        return 1
+    if failed:
+        print(f"a lookup's p95 exceeded {args.max_ms:.1f} ms")
+        return 1
+
+
+# Resident memory of this process in MB: now and at its peak (Linux)
+def memory_mb():
+    with open("/proc/self/status") as status:
+        fields = dict(line.split(":", 1) for line in status)
+    return int(fields["VmRSS"].split()[0]) / 1024, int(fields["VmHWM"].split()[0]) / 1024
+
+
+# Replace the grades table with `rows` generated grades, 50 per student
+def fill_grades(connection, rows):
+    with connection:
+        connection.execute("DELETE FROM grades")
+        connection.execute("""
+        WITH RECURSIVE n(i) AS (SELECT 0 UNION ALL SELECT i + 1 FROM n WHERE i + 1 < ?)
+        INSERT INTO grades (student_id, student_name, subject, chapter, section, grade)
+        SELECT i / 50 + 1, 'Student ' || (i / 50 + 1),
+               CASE i % 5 WHEN 0 THEN 'Math' WHEN 1 THEN 'English' WHEN 2 THEN 'Science'
+                          WHEN 3 THEN 'History' ELSE 'Art' END,
+               'Chapter ' || ((i / 5) % 10 + 1), 'Section ' || char(65 + (i / 50) % 4),
+               abs(random()) % 10 + 1
+        FROM n
+        """, (rows,))
+
+
+# Run one export in this (fresh) process and print its figures as JSON
+def measure_export(dataset, fmt, chunk_rows, download=False):
+    import json
+    import pyarrow.csv  # noqa: F401 - loaded before the baseline, like in the app
+    import pyarrow.parquet  # noqa: F401
+    import export
+
+    # A one-row export first: Arrow's allocator and the connection pool take
+    # a fixed ~50 MB on first use, which is not what this measures
+    path = os.path.join(tempfile.mkdtemp(prefix="school_bench_"), "export")
+    export.write_export(path, dataset, fmt, filters={"grade_ids": [1]}, chunk_rows=chunk_rows)
+    baseline, _ = memory_mb()
+    if download:
+        # What the download button does: write the file, then read it whole
+        start = time.perf_counter()
+        with export.export_to_file(dataset, fmt) as handle:
+            data = handle.read()
+        report = export.ExportReport()
+        report.rows, report.bytes, report.seconds = export.export_count(dataset), len(data), time.perf_counter() - start
+        del data
+    else:
+        report = export.write_export(path, dataset, fmt, chunk_rows=chunk_rows)
+    _, peak = memory_mb()
+    if os.path.exists(path):
+        os.unlink(path)
+    print(json.dumps({"rows": report.rows, "bytes": report.bytes, "seconds": report.seconds, "growth_mb": peak - baseline}))
+
+
+# Peak memory of exporting --rows grades in each format, each in its own
+# process, and of a browser download of export.MAX_DOWNLOAD_ROWS rows, which
+# Streamlit holds in memory whole; exits 1 if a file export grows the
+# process by over --max-mb or a download by over --max-download-mb
+def bench_export(args):
+    import json
+    import subprocess
+    import export
+    path = use_scratch_database()
+    import database
+    import db
+
+    database.init_db()
+    connection = db.get_connection()
+    start = time.perf_counter()
+    fill_grades(connection, args.rows)
+    print(f"{args.rows:,} grade rows generated in {time.perf_counter() - start:.1f}s")
+
+    env = dict(os.environ, SCHOOL_DB_PATH=path)
+    print(f"{'format':<20} {'rows':>12} {'seconds':>8} {'size':>10} {'peak growth':>12}")
+    failed = False
+    runs = [(fmt, fmt, args.rows, False, args.max_mb) for fmt in args.formats]
+    download_rows = min(args.rows, export.MAX_DOWNLOAD_ROWS)
+    runs += [(f"{fmt} download", fmt, download_rows, True, args.max_download_mb) for fmt in args.formats]
+    for label, fmt, rows, download, limit in runs:
+        if download and connection.execute("SELECT COUNT(*) FROM grades").fetchone()[0] > rows:
+            with connection:
+                connection.execute("DELETE FROM grades WHERE grade_id NOT IN "
+                                   "(SELECT grade_id FROM grades ORDER BY grade_id LIMIT ?)", (rows,))
+        code = f"import benchmark; benchmark.measure_export('grades', {fmt!r}, {args.chunk_rows}, {download})"
+        result = subprocess.run([sys.executable, "-c", code], capture_output=True, text=True, env=env, check=True)
+        figures = json.loads(result.stdout.splitlines()[-1])
+        print(f"{label:<20} {figures['rows']:>12,} {figures['seconds']:>7.1f}s "
+              f"{figures['bytes'] / 1024 ** 2:>8.1f}MB {figures['growth_mb']:>10.1f}MB")
+        if figures["rows"] != rows:
+            print(f"{label} exported {figures['rows']:,} rows, expected {rows:,}")
+            failed = True
+        if figures["growth_mb"] > limit:
+            print(f"{label} grew memory by over {limit:.0f} MB")
+            failed = True
+    if failed:
+        return 1
+
+
+# Rerun time of the chart-heavy dashboards with the figure cache cleared
+# before each run vs kept, and LRU eviction under a small budget. Exits 1
+# if warm reruns are not at least --min-speedup times faster.
+def bench_figures(args):
+    use_scratch_database()
+    import database
+    import db
+    import branch_dashboard
+    import branchadmin_dashboard
+    import cube
+    import figure_cache
+    import student_dashboard
+
+    database.init_db()
+    branch_id = db.get_connection().execute("SELECT MIN(branch_id) FROM branch").fetchone()[0]
+    # The first grade and section, as the student dashboard's sidebar defaults
+    # to (None, like an empty selectbox, when the branch has no classes)
+    grade = next(iter(cube.grades(branch_id)), None)
+    section = next(iter(cube.sections(branch_id, grade)), None)
+
+    def student_page():
+        student_dashboard.performance_analysis()
+        selected_student, filtered_data = student_dashboard.student_progress_tracking(branch_id, grade, section)
+        student_dashboard.grade_distribution(filtered_data, selected_student)
+
+    pages = [
+        ("branch dashboard", lambda: branch_dashboard.display_branch_dashboard(branch_id)),
+        ("branch admin", lambda: branchadmin_dashboard.display_branch_dashboard(branch_id)),
+        ("student dashboard", student_page),
+    ]
+
+    def cold(page):
+        figure_cache.clear()
+        page()
+
+    print(f"{'page':<18} {'cold':>9} {'warm':>9} {'speedup':>8}")
+    failed = False
+    for label, page in pages:
+        page()  # imports and the query cache
+        cold_ms = median_time(lambda: cold(page), args.repeat) * 1000
+        warm_ms = median_time(page, args.repeat) * 1000
+        print(f"{label:<18} {cold_ms:>7.1f}ms {warm_ms:>7.1f}ms {cold_ms / warm_ms:>7.1f}x")
+        failed = failed or cold_ms / warm_ms < args.min_speedup
+    figure_cache.clear()
+    for _, page in pages:
+        page()
+    stats = figure_cache.stats()
+    print(f"cache after every page: {stats['entries']} figures, {stats['bytes'] / 1024:.0f} KB")
+
+    # Eviction: a budget of about two figures
+    figure_cache.clear()
+    figure_cache._cache.max_bytes = stats["bytes"] // max(stats["entries"], 1) * 2
+    for _, page in pages:
+        page()
+    small = figure_cache.stats()
+    print(f"{small['max_bytes'] / 1024:.0f} KB budget: {small['entries']} figures kept, "
+          f"{small['evictions']} evicted, {small['bytes'] / 1024:.0f} KB")
+    if small["bytes"] > small["max_bytes"] or not small["evictions"]:
+        print("the cache did not stay within its budget")
+        return 1
+    if failed:
+        print(f"a warm rerun was less than {args.min_speedup:.1f}x faster than a cold one")
+        return 1
+
+
+# Render time and browser payload of a per-student chart as the population
+# grows. Exits 1 if any payload passes charts.MAX_PAYLOAD_BYTES or a render
+# takes over --max-ms.
+def bench_charts(args):
+    import numpy as np
+    import pandas as pd
+    import streamlit as st
+    import charts
+
+    print(f"{'students':>10} {'chart':<10} {'render':>9} {'payload':>10}")
+    failed = False
+    rng = np.random.default_rng(7)
+    for count in args.sizes:
+        df = pd.DataFrame({
+            "student_id": np.arange(count),
+            "score": rng.normal(6, 1.8, count).clip(1, 10),
+        })
+        if charts.shows_each_student(count):
+            df["student_name"] = "Student " + df["student_id"].astype(str)
+
+        def render():
+            fig = charts.population_figure(df, x="student_name", y="score", title="Bench")
+            st.plotly_chart(fig)
+            return fig
+
+        render()
+        seconds = median_time(render, args.repeat)
+        fig = render()
+        size = charts.payload_bytes(fig)
+        kind = "bars" if count <= charts.MAX_BARS else "webgl" if fig.data[0].type == "scattergl" else "binned"
+        print(f"{count:>10,} {kind:<10} {seconds * 1000:>7.1f}ms {size / 1024:>8.1f}KB")
+        failed = failed or size > charts.MAX_PAYLOAD_BYTES or seconds * 1000 > args.max_ms
+    if failed:
+        print(f"a chart passed {charts.MAX_PAYLOAD_BYTES // 1024} KB or took over {args.max_ms:.0f} ms")
+        return 1
+
+
+# Job functions that fail (or kill their worker process) on their first attempt
+def flaky_job(params, job):
+    if job.attempt == 1:
+        if params.get("crash"):
+            os._exit(1)
+        raise RuntimeError("first attempt fails")
+    return {"attempt": job.attempt}
+
+
+# Wait for jobs to finish; returns their final rows
+def wait_for_jobs(job_ids, timeout):
+    import jobs
+    deadline = time.monotonic() + timeout
+    while True:
+        finished = [jobs.get(job_id) for job_id in job_ids]
+        if all(job["status"] in ("done", "failed") for job in finished) or time.monotonic() > deadline:
+            return finished
+        time.sleep(0.05)
+
+
+# Page cost of a heavy report built inline vs submitted as a job (reused once
+# done), worker throughput with one process vs every core, and retries after a
+# job error and after a worker crash. Exits 1 if a job does not finish, or if
+# submitting is slower than --max-submit-ms.
+def bench_jobs(args):
+    import threading
+    use_scratch_database()
+    import database
+    import dashboard
+    import jobs
+    import superadmin
+    import teachers
+
+    database.init_db()
+    jobs.START_WORKER = False  # the benchmark runs its own dispatchers
+    jobs.RETRY_SECONDS = 0.1
+    jobs.JOB_KINDS["bench_flaky"] = "benchmark:flaky_job"
+    branch_stats = superadmin.get_data()[4]
+    params = {"branch_stats": branch_stats.to_dict("records")}
+
+    class InlineJob:
+        attempt = 1
+        directory = tempfile.mkdtemp(prefix="school_bench_")
+
+        def progress(self, fraction, message=None):
+            pass
+
+    def inline_branch_figures():
+        for _, fig in dashboard.branch_stats_figures(branch_stats):
+            fig.to_json()
+
+    inline = [
+        ("branch figures", inline_branch_figures),
+        ("chapter charts", lambda: teachers.chapter_charts_report({"subject": "Mathematics"}, InlineJob())),
+    ]
+
+    def dispatch(processes):
+        stop = threading.Event()
+        thread = threading.Thread(target=jobs.Dispatcher(processes).run, args=(stop,), daemon=True)
+        thread.start()
+        return stop, thread
+
+    failed = False
+    stop, thread = dispatch(jobs.WORKER_PROCESSES)
+    job_ids = [jobs.submit("branch_stats_figures", params), jobs.submit("chapter_charts", {"subject": "Mathematics"})]
+    for job in wait_for_jobs(job_ids, args.timeout):
+        if job["status"] != "done":
+            print(f"job {job['job_id']} ({job['kind']}) is {job['status']}: {job['error']}")
+            failed = True
+    print(f"{'report':<16} {'inline':>9} {'job rerun':>10}")
+    submits = [
+        lambda: jobs.get(jobs.submit("branch_stats_figures", params)),
+        lambda: jobs.get(jobs.submit("chapter_charts", {"subject": "Mathematics"})),
+    ]
+    for (label, build), submit in zip(inline, submits):
+        build()  # imports
+        inline_ms = median_time(build, 5) * 1000
+        submit_ms = median_time(submit, 50) * 1000
+        print(f"{label:<16} {inline_ms:>7.1f}ms {submit_ms:>8.2f}ms")
+        failed = failed or submit_ms > args.max_submit_ms
+
+    # Retries: an exception, then a worker process that dies
+    job_ids = [jobs.submit("bench_flaky", {}), jobs.submit("bench_flaky", {"crash": True})]
+    for job, label in zip(wait_for_jobs(job_ids, args.timeout), ("job error", "worker crash")):
+        print(f"retry after {label}: {job['status']} after {job['attempts']} attempt(s)")
+        failed = failed or job["status"] != "done" or job["attempts"] != 2
+    stop.set()
+    thread.join()
+
+    for processes in sorted({1, jobs.WORKER_PROCESSES}):
+        stop, thread = dispatch(processes)
+        start = time.perf_counter()
+        job_ids = [
+            jobs.submit("chapter_charts", {"subject": subject}, reuse=False)
+            for subject in list(teachers.CHAPTER_DATA) * (args.jobs // len(teachers.CHAPTER_DATA))
+        ]
+        finished = wait_for_jobs(job_ids, args.timeout)
+        seconds = time.perf_counter() - start
+        stop.set()
+        thread.join()
+        done = sum(job["status"] == "done" for job in finished)
+        print(f"{processes} process(es): {done}/{len(job_ids)} chart jobs in {seconds:.1f}s "
+              f"({done / seconds:.1f} jobs/s)")
+        failed = failed or done != len(job_ids)
+    if failed:
+        print("a job did not finish, or submitting exceeded "
+              f"{args.max_submit_ms:.0f} ms")
+        return 1
+
+
+# Hash of the generated tables' contents (schema_version and job timestamps
+# differ between runs by design)
+def generated_checksum(path):
+    import hashlib
+    import sqlite3
+    import generate_data
+    digest = hashlib.blake2b(digest_size=16)
+    connection = sqlite3.connect(path)
+    for table in generate_data.COLUMNS:
+        for row in connection.execute(f"SELECT * FROM {table} ORDER BY rowid"):
+            digest.update(repr(row).encode())
+    connection.close()
+    return digest.hexdigest()
+
+
+# Generate the --sf dataset, check its size and derived tables, and check
+# that a seed always gives the same data; exits 1 on a mismatch or when the
+# run exceeds --max-seconds
+def bench_generate(args):
+    import generate_data
+    path = use_scratch_database(source=None)
+    counts = generate_data.generate(path, args.sf, args.seed, progress=lambda message: None)
+    seconds = counts.pop("seconds")
+    print(f"SF{args.sf:g}: {', '.join(f'{count:,} {table}' for table, count in counts.items())}")
+    rows = sum(counts.values())
+    print(f"generated in {seconds:.1f}s ({rows / seconds:,.0f} rows/s, ~{seconds / args.sf:.0f}s per scale factor)")
+
+    import cube
+    import db
+    import rollup
+    branches, students = generate_data.scale(args.sf)
+    failed = counts["branch"] != branches or counts["student"] != students
+    with db.pooled(path) as connection:
+        problems = len(rollup.check_branch_rollup(connection)) + len(cube.check_cube(connection))
+    print(f"{branches:,} branches and {students:,} students expected; {problems} rollup/cube difference(s)")
+    failed = failed or problems > 0 or seconds > args.max_seconds
+
+    scratch = tempfile.mkdtemp(prefix="school_bench_")
+    checksums = []
+    for name, seed in (("a", args.seed), ("b", args.seed), ("c", args.seed + 1)):
+        copy = os.path.join(scratch, f"{name}.db")
+        generate_data.generate(copy, 0.05, seed, progress=lambda message: None)
+        checksums.append(generated_checksum(copy))
+    reproducible = checksums[0] == checksums[1] != checksums[2]
+    print(f"same seed, same data: {'yes' if reproducible else 'NO'}")
+    if failed or not reproducible:
+        return 1
+
+
+# p95 latency budget in ms of each page query in `benchmark.py suite`, at
+# every dataset size the suite runs
+SUITE_BUDGETS_MS = {
+    "superadmin.get_data": 50.0,
+    "manage_branches.get_branch_admins": 25.0,
+    "manage_sections_classes.get_students": 5.0,
+    "manage_subjects.fetch_topics": 5.0,
+    "login.authenticate_user": 2.0,
+    "teachers.save_grade": 20.0,
+}
+
+
+# The calls behind each page: query name -> (draw the arguments of one call
+# from rng, function, rows in its result)
+def suite_cases(connection):
+    import login
+    import manage_branches
+    import manage_sections_classes
+    import manage_subjects
+    import superadmin
+    import teachers
+
+    section_ids = [row[0] for row in connection.execute("SELECT section_id FROM section")]
+    chapter_ids = [row[0] for row in connection.execute("SELECT DISTINCT chapter_id FROM topic_association")]
+    logins = connection.execute("SELECT email, password FROM user").fetchall()
+    students = connection.execute("""
+    SELECT s.student_id, s.student_name, 'Section ' || sec.section_name
+    FROM student s JOIN section sec ON s.section_id = sec.section_id
+    """).fetchall()
+    cells = connection.execute("SELECT DISTINCT subject, chapter FROM grades").fetchall()
+
+    # One in five logins uses a wrong password
+    def login_args(rng):
+        email, password = rng.choice(logins)
+        return email, password if rng.random() < 0.8 else password + "?"
+
+    # A grade for a random cell: an update where the student has one, else an insert
+    def grade_args(rng):
+        student_id, student_name, section = rng.choice(students)
+        subject, chapter = rng.choice(cells)
+        return student_id, student_name, subject, chapter, section, rng.randint(1, 10)
+
+    return {
+        "superadmin.get_data": (lambda rng: (), superadmin.get_data, lambda result: len(result[4])),
+        "manage_branches.get_branch_admins": (lambda rng: (), manage_branches.get_branch_admins, len),
+        "manage_sections_classes.get_students": (
+            lambda rng: (rng.choice(section_ids),), manage_sections_classes.get_students, len,
+        ),
+        "manage_subjects.fetch_topics": (lambda rng: (rng.choice(chapter_ids),), manage_subjects.fetch_topics, len),
+        "login.authenticate_user": (login_args, login.authenticate_user, lambda result: 1),
+        "teachers.save_grade": (grade_args, teachers.save_grade, lambda result: 1),
+    }
+
+
+# Time `repeat` calls with fresh arguments; the query cache is emptied before
+# each one so the SQL and pandas work is measured, not the cache
+def time_suite_case(draw, call, count, repeat, rng):
+    import query_cache
+    call(*draw(rng))  # imports and prepared statements
+    times, rows = [], 0
+    for _ in range(repeat):
+        arguments = draw(rng)
+        query_cache.clear()
+        start = time.perf_counter()
+        result = call(*arguments)
+        times.append(time.perf_counter() - start)
+        rows += count(result)
+    return times, rows
+
+
+def git_commit():
+    import subprocess
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                              check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+# p50/p95/p99 latency and rows/second of each page query on generated
+# datasets of every --sf; writes the results to --json and compares them
+# with --compare (an earlier results file). Exits 1 if a query's p95 is over
+# its SUITE_BUDGETS_MS budget.
+def bench_suite(args):
+    import json
+    import platform
+    import random
+    import statistics
+    import db
+    import generate_data
+
+    results = []
+    print(f"{'SF':>5} {'query':<38} {'p50':>8} {'p95':>8} {'p99':>8} {'rows/s':>11} {'budget':>8}")
+    for sf in args.sf:
+        path = use_scratch_database(source=None)
+        generate_data.generate(path, sf, args.seed, progress=lambda message: None)
+        rng = random.Random(args.seed)
+        for name, (draw, call, count) in suite_cases(db.get_connection(path)).items():
+            times, rows = time_suite_case(draw, call, count, args.repeat, rng)
+            cuts = statistics.quantiles(times, n=100)
+            result = {
+                "sf": sf, "query": name, "calls": len(times),
+                "p50_ms": cuts[49] * 1000, "p95_ms": cuts[94] * 1000, "p99_ms": cuts[98] * 1000,
+                "rows_per_second": rows / sum(times), "budget_ms": SUITE_BUDGETS_MS[name],
+            }
+            result["over_budget"] = result["p95_ms"] > result["budget_ms"]
+            results.append(result)
+            print(f"{sf:>5g} {name:<38} {result['p50_ms']:>6.2f}ms {result['p95_ms']:>6.2f}ms "
+                  f"{result['p99_ms']:>6.2f}ms {result['rows_per_second']:>11,.0f} "
+                  f"{result['budget_ms']:>6.0f}ms{'  OVER' if result['over_budget'] else ''}")
+
+    report = {
+        "run_at": time.strftime("%Y-%m-%dT%H:%M:%S"), "commit": git_commit(),
+        "python": platform.python_version(), "seed": args.seed, "repeat": args.repeat, "results": results,
+    }
+    path = args.json or os.path.join("benchmark_results", f"suite_{time.strftime('%Y%m%d_%H%M%S')}.json")
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    with open(path, "w") as output:
+        json.dump(report, output, indent=2)
+    print(f"results written to {path}")
+
+    if args.compare:
+        with open(args.compare) as earlier:
+            before = {(r["sf"], r["query"]): r for r in json.load(earlier)["results"]}
+        print(f"p95 change against {args.compare}:")
+        for result in results:
+            old = before.get((result["sf"], result["query"]))
+            if old:
+                change = (result["p95_ms"] - old["p95_ms"]) / old["p95_ms"] * 100
+                print(f"{result['sf']:>5g} {result['query']:<38} {old['p95_ms']:>6.2f}ms -> "
+                      f"{result['p95_ms']:>6.2f}ms ({change:+.0f}%)")
+
+    over = [f"{r['query']} at SF{r['sf']:g}" for r in results if r["over_budget"]]
+    if over:
+        print(f"over budget: {', '.join(over)}")
+        return 1
+
+
+# Cost of recording a metric, what it adds to a page query with metrics on
+# and off, and a scrape of the /metrics endpoint checked line by line.
+# Exits 1 if recording costs more than --budget-us per call, a query slows
+# down by more than --budget-percent or --floor-us, whichever is more (a
+# microsecond is a large share of a 15 us login lookup but not of a rerun),
+# or the exposition is malformed.
+def bench_metrics(args):
+    import re
+    import statistics
+    import timeit
+    import urllib.request
+    use_scratch_database()
+    import database
+    import db
+    import login
+    import metrics
+    import query_cache
+    import query_log
+
+    database.init_db()
+    failures = []
+
+    counter = metrics.Counter("bench_calls_total", "Benchmark counter.", ("page",))
+    histogram = metrics.Histogram("bench_seconds", "Benchmark histogram.", ("page", "statement"))
+    calls = 200000
+    costs = {
+        "Counter.inc": timeit.timeit(lambda: counter.inc("Login"), number=calls) / calls,
+        "Histogram.observe": timeit.timeit(lambda: histogram.observe(0.0003, "Login", "select"), number=calls) / calls,
+        "per statement": timeit.timeit(
+            lambda: metrics.QUERY_SECONDS.observe(0.0003, "Login", query_log.statement_kind("SELECT role FROM user")),
+            number=calls) / calls,
+    }
+    for name, seconds in costs.items():
+        print(f"{name:<20} {seconds * 1e6:>6.2f} us")
+        if seconds * 1e6 > args.budget_us:
+            failures.append(f"{name} costs {seconds * 1e6:.2f} us")
+
+    # Interleaved rounds, alternating which side goes first, so drift and
+    # warm-up hit both sides alike; the overhead is the median of each
+    # round's difference, which a single disturbed round cannot move. Some
+    # processes still carry a steady offset of about 5% either way from code
+    # and heap layout alone, so the default budget sits above it
+    email, password = db.get_connection().execute("SELECT email, password FROM user").fetchone()
+    cases = {
+        "login.authenticate_user": lambda: login.authenticate_user(email, password),
+        "superadmin.get_data": lambda: (query_cache.clear(), superadmin_rerun()),
+    }
+    for name, call in cases.items():
+        timings = {True: [], False: []}
+        for round_number in range(args.rounds):
+            for enabled in ((False, True) if round_number % 2 else (True, False)):
+                metrics.set_enabled(enabled)
+                timings[enabled].append(timeit.timeit(call, number=args.repeat) / args.repeat)
+        metrics.set_enabled(True)
+        off = statistics.median(timings[False])
+        on = off + statistics.median(b - a for a, b in zip(timings[False], timings[True]))
+        overhead = (on - off) / off * 100
+        print(f"{name:<24} off {off * 1e6:>8.1f} us  on {on * 1e6:>8.1f} us  "
+              f"({(on - off) * 1e6:+.1f} us, {overhead:+.1f}%)")
+        if on - off > max(off * args.budget_percent / 100, args.floor_us * 1e-6):
+            failures.append(f"{name} is {(on - off) * 1e6:.1f} us ({overhead:.1f}%) slower with metrics")
+
+    server = metrics.serve(port=0)
+    try:
+        url = f"http://127.0.0.1:{server.server_port}/metrics"
+        with urllib.request.urlopen(url) as response:
+            content_type = response.headers["Content-Type"]
+            body = response.read().decode()
+    finally:
+        server.shutdown()
+    sample = re.compile(r'^[a-zA-Z_:][a-zA-Z0-9_:]*(\{[a-zA-Z_][a-zA-Z0-9_]*="(?:[^"\\]|\\.)*"'
+                        r'(?:,[a-zA-Z_][a-zA-Z0-9_]*="(?:[^"\\]|\\.)*")*\})? \S+$')
+    lines = body.splitlines()
+    bad = [line for line in lines if not line.startswith("#") and not sample.match(line)]
+    families = {line.split()[2] for line in lines if line.startswith("# TYPE")}
+    missing = {"school_db_query_seconds", "school_login_attempts_total", "school_query_cache_hits_total"} - families
+    print(f"scraped {url}: {len(lines)} lines, {len(families)} families, {content_type}")
+    if bad:
+        failures.append(f"malformed lines, e.g. {bad[0]!r}")
+    if missing:
+        failures.append(f"missing {', '.join(sorted(missing))}")
+    if not metrics.LOGIN_ATTEMPTS.value("success"):
+        failures.append("logins were not counted")
+
+    if failures:
+        print(f"failed: {'; '.join(failures)}")
+        return 1
+
+
+# Grade saves from `writers` threads for `seconds`, writer i on the i-th
+# branch's students through paths[i]; returns saves per second
+def concurrent_grade_saves(paths, cases, seconds):
+    import random
+    import threading
+    import db
+    import teachers
+
+    stop = threading.Event()
+    counts = [0] * len(paths)
+
+    def write(index):
+        rng = random.Random(index)
+        with db.routed(paths[index]):
+            while not stop.is_set():
+                teachers.save_grade(*rng.choice(cases[index]), rng.randint(1, 10))
+                counts[index] += 1
+
+    threads = [threading.Thread(target=write, args=(index,)) for index in range(len(paths))]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    time.sleep(seconds)
+    stop.set()
+    for thread in threads:
+        thread.join()
+    return sum(counts) / (time.perf_counter() - start)
+
+
+# Grade save latencies on one branch while another branch bulk-imports
+# `rows` students; the import runs on import_path, the saves on save_path
+def saves_during_import(import_path, section_id, save_path, cases, rows, csv_path):
+    import random
+    import threading
+    import bulk_import
+    import db
+    import teachers
+
+    write_roster_csv(csv_path, rows)
+    done = threading.Event()
+
+    def bulk():
+        with db.routed(import_path):
+            report = bulk_import.import_students(csv_path, section_id, chunk_rows=5000)
+        if report.rejects_path:
+            os.unlink(report.rejects_path)
+        done.set()
+
+    rng = random.Random(0)
+    times = []
+    thread = threading.Thread(target=bulk)
+    thread.start()
+    with db.routed(save_path):
+        while not done.is_set():
+            start = time.perf_counter()
+            teachers.save_grade(*rng.choice(cases), rng.randint(1, 10))
+            times.append(time.perf_counter() - start)
+    thread.join()
+    return times
+
+
+# The sharded layout against one database file, on a generated dataset
+# split with sharding.split: superadmin.get_data must agree, its fan-out is
+# timed against visiting the shards one by one, and grade saves are timed
+# with 1..N branches written at once and while another branch bulk-imports.
+# Exits 1 if get_data disagrees, sharded saves scale worse than the single
+# file, or a bulk import holds up another branch's saves longer than it
+# does on the single file. Fan-out and extra writers only pay off with
+# more than one core; on one core they show the thread overhead.
+def bench_shards(args):
+    import statistics
+    import pandas as pd
+    import db
+    import generate_data
+    import query_cache
+    import sharding
+    import superadmin
+
+    path = use_scratch_database(source=None)
+    generate_data.generate(path, args.sf, args.seed, progress=lambda message: None)
+    directory = os.path.join(os.path.dirname(path), "shards")
+    start = time.perf_counter()
+    shards = sharding.split(path, directory, progress=lambda message: None)
+    catalog = os.path.join(directory, sharding.CATALOG_NAME)
+    print(f"SF{args.sf:g}: {len(shards)} shards written in {time.perf_counter() - start:.1f}s")
+    failures = []
+
+    # Switch between the single file and the sharded layout
+    def use(sharded):
+        sharding.SHARD_DIR = directory if sharded else None
+        db.DB_PATH = catalog if sharded else path
+        query_cache.clear()
+
+    use(False)
+    single = superadmin.get_data()
+    use(True)
+    sharded = superadmin.get_data()
+    if single[:4] != sharded[:4]:
+        failures.append(f"get_data totals differ: {single[:4]} vs {sharded[:4]}")
+    try:
+        pd.testing.assert_frame_equal(single[4], sharded[4], check_exact=False)
+    except AssertionError as e:
+        failures.append(f"get_data branch_stats differ: {e}")
+
+    def one_by_one():
+        for branch_id in shards:
+            with db.routed(sharding.shard_path(branch_id)):
+                superadmin.database_data()
+
+    def fan_out():
+        sharding.fan_out(superadmin.database_data)
+
+    for name, call in (("shards one by one", one_by_one), ("fan-out", fan_out)):
+        times = []
+        for _ in range(args.repeat):
+            query_cache.clear()
+            begin = time.perf_counter()
+            call()
+            times.append(time.perf_counter() - begin)
+        print(f"get_data, cold cache, {name:<18} {statistics.median(times) * 1000:>8.1f} ms")
+    if os.path.isdir("/proc/self/fd"):
+        # fan_out() keeps at most SHARD_CONNECTIONS connections (database,
+        # -wal and -shm each), whatever the number of shards and threads
+        sharding.close_connections()
+        before = len(os.listdir("/proc/self/fd"))
+        for _ in range(2):
+            query_cache.clear()
+            fan_out()
+        opened = len(os.listdir("/proc/self/fd")) - before
+        limit = 3 * min(len(shards), sharding.SHARD_CONNECTIONS) + 1
+        print(f"files held after fan-outs over {len(shards)} shards: {opened} (limit {limit})")
+        if opened > limit:
+            failures.append(f"fan-outs hold {opened} files, over {limit}")
+
+    connection = db.get_connection(path)
+    cells = connection.execute("SELECT DISTINCT subject, chapter FROM grades").fetchall()
+    cases = []
+    for branch_id in shards:
+        students = connection.execute("""
+        SELECT s.student_id, s.student_name, 'Section ' || sec.section_name
+        FROM student s JOIN section sec ON s.section_id = sec.section_id JOIN class c ON sec.class_id = c.class_id
+        WHERE c.branch_id = ?
+        """, (branch_id,)).fetchall()
+        cases.append([(student[0], student[1], subject, chapter, student[2])
+                      for student in students[:200] for subject, chapter in cells[:5]])
+
+    writers = [count for count in args.writers if count <= len(shards)]
+    print(f"{'writers':>8} {'single file':>14} {'sharded':>14}")
+    rates = {}
+    for count in writers:
+        use(False)
+        one_file = concurrent_grade_saves([path] * count, cases[:count], args.seconds)
+        use(True)
+        per_branch = concurrent_grade_saves([sharding.shard_path(b) for b in list(shards)[:count]], cases[:count],
+                                            args.seconds)
+        rates[count] = (one_file, per_branch)
+        print(f"{count:>8} {one_file:>12,.0f}/s {per_branch:>12,.0f}/s")
+    if writers and len(writers) > 1:
+        low, high = writers[0], writers[-1]
+        single_scaling = rates[high][0] / rates[low][0]
+        sharded_scaling = rates[high][1] / rates[low][1]
+        print(f"{low} -> {high} writers: single file x{single_scaling:.2f}, sharded x{sharded_scaling:.2f}")
+        if sharded_scaling < single_scaling:
+            failures.append("sharded saves scale worse than the single file")
+
+    if len(shards) > 1:
+        importing, saving = list(shards)[:2]
+        section_id = connection.execute(
+            "SELECT MIN(section_id) FROM section JOIN class USING (class_id) WHERE branch_id = ?", (importing,)
+        ).fetchone()[0]
+        worst = {}
+        for sharded in (False, True):
+            use(sharded)
+            times = saves_during_import(
+                sharding.shard_path(importing) if sharded else path, section_id,
+                sharding.shard_path(saving) if sharded else path, cases[1], args.import_rows,
+                os.path.join(os.path.dirname(path), f"roster_{int(sharded)}.csv"),
+            )
+            cuts = statistics.quantiles(times, n=1000, method="inclusive")
+            worst[sharded] = max(times)
+            print(f"saves during another branch's import ({'sharded' if sharded else 'single file'}): "
+                  f"{len(times)} saves, p50 {cuts[499] * 1000:.2f} ms, p99.9 {cuts[998] * 1000:.2f} ms, "
+                  f"max {worst[sharded] * 1000:.1f} ms")
+        if worst[True] > worst[False]:
+            failures.append("a bulk import holds up other branches' saves longer when sharded")
+
+    if failures:
+        print(f"failed: {'; '.join(failures)}")
+        return 1
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    pool = commands.add_parser("pool", help="connection pool vs connect-per-call")
+    pool.add_argument("--seconds", type=float, default=2.0)
+    pool.set_defaults(run=bench_pool)
+
+    migrate = commands.add_parser("migrations", help="startup migration and per-rerun schema cost")
+    migrate.add_argument("--seconds", type=float, default=2.0)
+    migrate.set_defaults(run=bench_migrations)
+
+    cache = commands.add_parser("cache", help="query result cache cold vs warm")
+    cache.add_argument("--seconds", type=float, default=2.0)
+    cache.set_defaults(run=bench_cache)
+
+    bulk = commands.add_parser("import", help="bulk student CSV import throughput")
+    bulk.add_argument("--rows", type=int, default=100000)
+    bulk.add_argument("--min-rate", type=float, default=50000)
+    bulk.set_defaults(run=bench_import)
+
+    curriculum = commands.add_parser("curriculum", help="curriculum CSV import time and idempotence")
+    curriculum.add_argument("--topics", type=int, default=10000)
+    curriculum.add_argument("--max-seconds", type=float, default=1.0)
+    curriculum.set_defaults(run=bench_curriculum)
+
+    grades = commands.add_parser("grades", help="per-cell grade saves vs one grid save")
+    grades.set_defaults(run=bench_grades)
+
+    importtime = commands.add_parser("importtime", help="cold-start import time budget for the login page")
+    importtime.add_argument("--module", default="login")
+    importtime.add_argument("--runs", type=int, default=3)
+    importtime.add_argument("--budget-ms", type=float, default=750)
+    importtime.set_defaults(run=bench_importtime)
+
+    pages = commands.add_parser("roster", help="roster page latency vs section size")
+    pages.add_argument("--sizes", type=int, nargs="+", default=[1000, 100000, 1000000])
+    pages.add_argument("--repeat", type=int, default=25)
+    pages.add_argument("--max-ratio", type=float, default=3.0)
+    pages.set_defaults(run=bench_roster)
+
+    find = commands.add_parser("search", help="student full-text search latency")
+    find.add_argument("--students", type=int, default=1000000)
+    find.add_argument("--repeat", type=int, default=20)
+    find.add_argument("--max-ms", type=float, default=20.0)
+    find.set_defaults(run=bench_search)
+
+    analytics = commands.add_parser("analytics", help="vectorized grade analytics vs the per-row loop")
+    analytics.add_argument("--rows", type=int, default=10000000)
+    analytics.add_argument("--loop-rows", type=int, default=1000000)
+    analytics.add_argument("--max-seconds", type=float, default=10.0)
+    analytics.set_defaults(run=bench_analytics)
+
+    agg = commands.add_parser("cube", help="aggregate cube lookups and incremental refresh")
+    agg.add_argument("--branches", type=int, default=20)
+    agg.add_argument("--students", type=int, default=25, help="per section (10 grades x 4 sections per branch)")
+    agg.add_argument("--repeat", type=int, default=200)
+    agg.add_argument("--max-ms", type=float, default=1.0)
+    agg.add_argument("--max-refresh-ms", type=float, default=500.0)
+    agg.set_defaults(run=bench_cube)
+
+    extract = commands.add_parser("export", help="peak memory of streaming grade exports")
+    extract.add_argument("--rows", type=int, default=10000000)
+    extract.add_argument("--formats", nargs="+", default=["csv", "csv.zst", "parquet"])
+    extract.add_argument("--chunk-rows", type=int, default=10000)
+    extract.add_argument("--max-mb", type=float, default=100.0)
+    extract.add_argument("--max-download-mb", type=float, default=150.0)
+    extract.set_defaults(run=bench_export)
+
+    figures = commands.add_parser("figures", help="chart-heavy page reruns with and without the figure cache")
+    figures.add_argument("--repeat", type=int, default=5)
+    figures.add_argument("--min-speedup", type=float, default=2.0)
+    figures.set_defaults(run=bench_figures)
+
+    chart = commands.add_parser("charts", help="per-student chart render time and payload vs population")
+    chart.add_argument("--sizes", type=int, nargs="+", default=[10, 50, 500, 5000, 50000, 500000, 2000000])
+    chart.add_argument("--repeat", type=int, default=3)
+    chart.add_argument("--max-ms", type=float, default=1000.0)
+    chart.set_defaults(run=bench_charts)
+
+    queue = commands.add_parser("jobs", help="background report jobs vs building reports inline")
+    queue.add_argument("--jobs", type=int, default=30)
+    queue.add_argument("--timeout", type=float, default=300.0)
+    queue.add_argument("--max-submit-ms", type=float, default=5.0)
+    queue.set_defaults(run=bench_jobs)
+
+    gen = commands.add_parser("generate", help="synthetic dataset generation time, consistency and reproducibility")
+    gen.add_argument("--sf", type=float, default=1.0)
+    gen.add_argument("--seed", type=int, default=42)
+    gen.add_argument("--max-seconds", type=float, default=120.0)
+    gen.set_defaults(run=bench_generate)
+
+    suite = commands.add_parser("suite", help="page query latency percentiles against their budgets")
+    suite.add_argument("--sf", type=float, nargs="+", default=[0.1, 1.0])
+    suite.add_argument("--seed", type=int, default=42)
+    suite.add_argument("--repeat", type=int, default=200)
+    suite.add_argument("--json", help="results file (default benchmark_results/suite_<time>.json)")
+    suite.add_argument("--compare", help="earlier results file to compare p95 with")
+    suite.set_defaults(run=bench_suite)
+
+    registry = commands.add_parser("metrics", help="cost of recording metrics and the /metrics exposition")
+    registry.add_argument("--rounds", type=int, default=15)
+    registry.add_argument("--repeat", type=int, default=200)
+    registry.add_argument("--budget-us", type=float, default=2.0)
+    registry.add_argument("--budget-percent", type=float, default=10.0)
+    registry.add_argument("--floor-us", type=float, default=5.0)
+    registry.set_defaults(run=bench_metrics)
+
+    shard = commands.add_parser("shards", help="per-branch shards vs one database file")
+    shard.add_argument("--sf", type=float, default=1.0)
+    shard.add_argument("--seed", type=int, default=42)
+    shard.add_argument("--repeat", type=int, default=20)
+    shard.add_argument("--seconds", type=float, default=3.0)
+    shard.add_argument("--writers", type=int, nargs="+", default=[1, 2, 4, 8])
+    shard.add_argument("--import-rows", type=int, default=50000)
+    shard.set_defaults(run=bench_shards)
+
+    args = parser.parse_args(argv)
+    return args.run(args) or 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
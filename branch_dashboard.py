@@ -1,103 +1,149 @@
 import streamlit as st
 import pandas as pd
-import plotly.express as px
-import random
+import cube
+import figure_cache
+import profiling
+import query_cache
 
-# Load the branch data from CSV
-@st.cache_data
-def load_branch_data():
-    return pd.read_csv('branch.csv')
+# Branch name, or None if there is no such branch
+def get_branch_name(branch_id):
+    row = query_cache.fetchone("SELECT branch_name FROM branch WHERE branch_id = ?", (branch_id,), tables=("branch",))
+    return row[0] if row else None
 
-# Fetch branch data for a given branch id
+# Overview counts for the branch, from the aggregate cube
 def fetch_overview_statistics(branch_id):
-    branch_data = load_branch_data()
-    branch_info = branch_data[branch_data['index'] == branch_id]
-    
-    if not branch_info.empty:
-        return branch_info.iloc[0].to_dict()  # Convert the row to a dictionary
-    return {}
+    name = get_branch_name(branch_id)
+    if name is None:
+        return {}
+    totals = cube.cell(branch_id)
+    return {
+        "name": name,
+        "students": totals["students"],
+        "teachers": totals["teachers"],
+        "subjects": len(cube.subjects(branch_id)),
+        "classes": totals["classes"],
+        "sections": totals["sections"],
+    }
+
+# Bar chart of the teachers of one subject
+def teacher_distribution_figure(teacher_data, title):
+    import plotly.express as px
+    return px.bar(teacher_data, x='Subject', y='Teacher Count', 
+                  title=title,
+                  labels={'Subject': 'Subject', 'Teacher Count': 'Number of Teachers'},
+                  color='Teacher Count', color_continuous_scale='Viridis')
 
 # Function to display teacher distribution per subject and grade
 def teacher_distribution(branch_id, selected_grade, selected_subject):
-    branch_data = load_branch_data()
-    branch_info = branch_data[branch_data['index'] == branch_id]
-    
-    if not branch_info.empty:
-        # List of subjects (limited to 4)
-        subjects = [selected_subject]  # Only show the selected subject
-        teacher_count = []
-        
-        for subject in subjects:
-            # Check for columns with the format 'Subject_Grade_teachers'
-            column_name = f"{subject}_{selected_grade}_teachers"
-            if column_name in branch_info.columns:
-                teacher_count.append(branch_info[column_name].values[0])
-            else:
-                teacher_count.append(0)  # Set default value if column is missing
-        
-        # Create a DataFrame for Plotly visualization
-        teacher_data = pd.DataFrame({
-            'Subject': subjects,
-            'Teacher Count': teacher_count
-        })
-        
-        # Create a bar chart showing teacher distribution per subject
-        fig = px.bar(teacher_data, x='Subject', y='Teacher Count', 
-                     title=f"Teacher Distribution for {branch_info['name'].values[0]} - Grade {selected_grade}",
-                     labels={'Subject': 'Subject', 'Teacher Count': 'Number of Teachers'},
-                     color='Teacher Count', color_continuous_scale='Viridis')
-        st.plotly_chart(fig)
-
-# Function to simulate performance data
+    teachers = cube.cell(branch_id, selected_grade, selected_subject)["teachers"]
+
+    # Only show the selected subject
+    teacher_data = pd.DataFrame({
+        'Subject': [selected_subject],
+        'Teacher Count': [teachers]
+    })
+
+    # Create a bar chart showing teacher distribution per subject
+    figure_cache.plotly_chart(teacher_distribution_figure, teacher_data,
+                              title=f"Teacher Distribution for {get_branch_name(branch_id)} - Grade {selected_grade}")
+
+# Chapters and topics listed in the activity panels
+TOP_ACTIVE = 5
+
+# What the activity panels show for one branch (?1), subject (?2) and grade
+# (?3), in one query: the ?4 most active chapters and topics as
+# ('chapter'/'topic', name, count) rows. A chapter's activity is the grades
+# recorded for it plus the evaluations of its topics; a topic's is its
+# evaluations.
+ACTIVITY_SQL = """
+WITH scope_grades AS (
+    -- The branch's students first, then each one's grades by (student_id,
+    -- subject), never every grade recorded in the subject
+    SELECT g.student_id, g.chapter, g.grade
+    FROM class c
+    CROSS JOIN section sec ON sec.class_id = c.class_id
+    CROSS JOIN student s ON s.section_id = sec.section_id
+    CROSS JOIN grades g INDEXED BY idx_grades_cell ON g.student_id = s.student_id AND g.subject = ?2
+    WHERE c.branch_id = ?1 AND c.grade = ?3
+),
+topic_activity AS (
+    SELECT ch.chapter_name, t.topic_name, COUNT(*) AS active
+    FROM class c
+    JOIN chapter ch ON ch.class_id = c.class_id
+    JOIN topic_association ta ON ta.chapter_id = ch.chapter_id
+    LEFT JOIN subject sub ON sub.subject_id = ta.subject_id
+    JOIN topic t ON t.topic_id = ta.topic_id
+    JOIN evaluation e ON e.topic_id = t.topic_id
+    WHERE c.branch_id = ?1 AND c.grade = ?3 AND (ta.subject_id IS NULL OR sub.subject_name = ?2)
+    GROUP BY ch.chapter_id, t.topic_id
+),
+activity AS (
+    SELECT 'chapter' AS kind, name, SUM(active) AS active
+    FROM (SELECT chapter AS name, COUNT(*) AS active FROM scope_grades GROUP BY chapter
+          UNION ALL
+          SELECT chapter_name, active FROM topic_activity)
+    GROUP BY name
+    UNION ALL
+    SELECT 'topic', topic_name, SUM(active) FROM topic_activity GROUP BY topic_name
+),
+ranked AS (
+    SELECT kind, name, active, ROW_NUMBER() OVER (PARTITION BY kind ORDER BY active DESC, name) AS position
+    FROM activity
+)
+SELECT kind, name, active FROM ranked WHERE position <= ?4
+ORDER BY 1, 3 DESC, 2
+"""
+
+ACTIVITY_TABLES = ("class", "section", "student", "grades", "chapter", "topic_association", "subject", "topic", "evaluation")
+
+# Most active chapters and topics for the panels below. The query result is
+# cached, so the panels share one fetch per data version.
+def get_branch_activity(branch_id, subject, grade):
+    rows = query_cache.fetchall(ACTIVITY_SQL, (branch_id, subject, grade, TOP_ACTIVE), tables=ACTIVITY_TABLES)
+    activity = {"Chapters": [], "Topics": []}
+    for kind, name, count in rows:
+        if kind == "chapter":
+            activity["Chapters"].append({"Chapter": name, "Active Count": count})
+        else:
+            activity["Topics"].append({"Topic": name, "Active Count": count})
+    return activity
+
+# Number of students whose subject average reaches cube.PASS_GRADE ("Yes")
+# and of those below it ("No")
 def get_performance_data(branch_id, subject, grade):
-    num_students = 50  # Assume 50 students for each grade
-    performance = []
-    
-    for _ in range(num_students):
-        performance.append(random.choice(["Yes", "No"]))
-    
-    return performance
+    totals = cube.cell(branch_id, grade, subject)
+    return {"Yes": totals["passed"], "No": totals["assessed"] - totals["passed"]}
+
+# Bar chart of the "Yes" and "No" student counts
+def performance_figure(performance_count, title):
+    import plotly.express as px
+    return px.bar(performance_count, x="Result", y="Count", 
+                  title=title,
+                  labels={"Result": "Pass/Fail", "Count": "Number of Students"},
+                  color="Result", color_discrete_map={"Yes": "green", "No": "red"})
 
 # Function to display performance analysis with grade distribution
 def performance_analysis(branch_id, selected_subject, selected_grade):
-    # Fetch or simulate performance data
     performance_data = get_performance_data(branch_id, selected_subject, selected_grade)
-    
-    # Create a DataFrame to count "Yes" and "No" distributions
-    performance_df = pd.DataFrame(performance_data, columns=["Performance"])
-    performance_count = performance_df["Performance"].value_counts().reset_index()
-    performance_count.columns = ["Result", "Count"]
-    
+
+    # "Yes" and "No" student counts
+    performance_count = pd.DataFrame({"Result": list(performance_data), "Count": list(performance_data.values())})
+
     # Plotting the distribution using a bar chart
-    fig = px.bar(performance_count, x="Result", y="Count", 
-                 title=f"Performance Distribution for {selected_subject} - Grade {selected_grade}",
-                 labels={"Result": "Pass/Fail", "Count": "Number of Students"},
-                 color="Result", color_discrete_map={"Yes": "green", "No": "red"})
-    st.plotly_chart(fig)
+    figure_cache.plotly_chart(performance_figure, performance_count,
+                              title=f"Performance Distribution for {selected_subject} - Grade {selected_grade}")
 
     # Display the Performance Data in a table format
     st.subheader(f"Grade Distribution for {selected_subject} - Grade {selected_grade}")
-    
-    # Adding "Yes" and "No" counts to the table
-    performance_table = pd.DataFrame({
-        "Result": ["Yes", "No"],
-        "Count": [performance_count[performance_count["Result"] == "Yes"]["Count"].sum(),
-                  performance_count[performance_count["Result"] == "No"]["Count"].sum()]
-    })
-
-    # Display the performance table
-    st.table(performance_table)
+    st.table(performance_count)
 
 # Function to display most active chapters
 def most_active_chapters(branch_id, selected_subject, selected_grade):
     active_data = get_active_chapters_topics(branch_id, selected_subject, selected_grade)
     chapters_data = active_data["Chapters"]
     
-    # Creating a DataFrame for most active chapters
-    chapters_df = pd.DataFrame(chapters_data)
-    
-    # Sorting by active count to display most active chapters
-    chapters_df = chapters_df.sort_values(by="Active Count", ascending=False)
+    # Most active first (the query already sorts them)
+    chapters_df = pd.DataFrame(chapters_data, columns=["Chapter", "Active Count"])
     
     # Displaying table for most active chapters
     with st.expander("Most actvie chapters"):
@@ -109,47 +155,40 @@ def most_active_topics(branch_id, selected_subject, selected_grade):
     active_data = get_active_chapters_topics(branch_id, selected_subject, selected_grade)
     topics_data = active_data["Topics"]
     
-    # Creating a DataFrame for most active topics
-    topics_df = pd.DataFrame(topics_data)
-    
-    # Sorting by active count to display most active topics
-    topics_df = topics_df.sort_values(by="Active Count", ascending=False)
+    # Most active first (the query already sorts them)
+    topics_df = pd.DataFrame(topics_data, columns=["Topic", "Active Count"])
     
     # Displaying table for most active topics
     with st.expander("Most actvie topics"):
         st.subheader(f"Most Active Topics for {selected_subject} - Grade {selected_grade}")
         st.table(topics_df)
 
-# Function to simulate getting active chapters and topics data
+# Most active chapters and topics, each a list of {name, "Active Count"} dicts
 def get_active_chapters_topics(branch_id, selected_subject, selected_grade):
-    # Simulated data for chapters and topics with active counts
-    active_data = {
-        "Chapters": [
-            {"Chapter": "Algebra", "Active Count": random.randint(5, 20)},
-            {"Chapter": "Geometry", "Active Count": random.randint(5, 20)},
-            {"Chapter": "Calculus", "Active Count": random.randint(5, 20)},
-            {"Chapter": "Statistics", "Active Count": random.randint(5, 20)},
-            {"Chapter": "Trigonometry", "Active Count": random.randint(5, 20)}
-        ],
-        "Topics": [
-            {"Topic": "Linear Equations", "Active Count": random.randint(5, 20)},
-            {"Topic": "Polynomials", "Active Count": random.randint(5, 20)},
-            {"Topic": "Quadratic Equations", "Active Count": random.randint(5, 20)},
-            {"Topic": "Factorization", "Active Count": random.randint(5, 20)},
-            {"Topic": "Functions", "Active Count": random.randint(5, 20)}
-        ]
-    }
-    return active_data
+    return get_branch_activity(branch_id, selected_subject, selected_grade)
 
 # Sidebar options for subject and grade selection
-def sidebar_selection():
-    selected_subject = st.sidebar.selectbox("Select Subject", ["Math", "Physics", "Chemistry", "Biology"])
-    selected_grade = st.sidebar.selectbox("Select Grade", ["1", "2", "3", "4"])
+# Subjects and grades with data in the branch, from the aggregate cube; the
+# old fixed lists while the branch has none
+def sidebar_selection(branch_id):
+    subjects = cube.subjects(branch_id) or ["Math", "Physics", "Chemistry", "Biology"]
+    selected_subject = st.sidebar.selectbox("Select Subject", subjects)
+    grades = cube.grades(branch_id, selected_subject) or [1, 2, 3, 4]
+    selected_grade = st.sidebar.selectbox("Select Grade", grades)
     return selected_subject, selected_grade
 
+# Bar chart of the branch's section count
+def sections_overview_figure(overview_df, branch_name):
+    import plotly.express as px
+    return px.bar(overview_df, x='Categories', y='Counts', 
+                  title=f"Sections Overview for {branch_name}",
+                  labels={'Categories': 'Category', 'Counts': 'Count'},
+                  color='Counts', color_continuous_scale='Viridis', hover_name="Counts")
+
 # Example usage in the display branch dashboard function
+@profiling.profiled("display_branch_dashboard")
 def display_branch_dashboard(branch_id):
-    selected_subject, selected_grade = sidebar_selection()
+    selected_subject, selected_grade = sidebar_selection(branch_id)
 
     # Get branch info
     branch_info = fetch_overview_statistics(branch_id)
@@ -176,11 +215,7 @@ def display_branch_dashboard(branch_id):
     # Plotly Overview Statistics
     overview_data = {'Categories': ['Sections'], 'Counts': [branch_info['sections']]}
     overview_df = pd.DataFrame(overview_data)
-    fig = px.bar(overview_df, x='Categories', y='Counts', 
-                 title=f"Sections Overview for {branch_name}",
-                 labels={'Categories': 'Category', 'Counts': 'Count'},
-                 color='Counts', color_continuous_scale='Viridis', hover_name="Counts")
-    st.plotly_chart(fig)
+    figure_cache.plotly_chart(sections_overview_figure, overview_df, branch_name=branch_name)
 
     # Teacher Distribution per Grade and Subject
     teacher_distribution(branch_id, selected_grade, selected_subject)
@@ -197,6 +232,16 @@ def display_branch_dashboard(branch_id):
     # Display Most Active Topics
     most_active_topics(branch_id, selected_subject, selected_grade)
 
+# Sunburst of a subject's chapters and subtopics
+def subject_structure_figure(sunburst_df, subject):
+    import plotly.express as px
+    return px.sunburst(sunburst_df, 
+                       path=['Chapter', 'Subtopic'],
+                       title=f"Subject Structure for {subject}",
+                       labels={'Chapter': 'Chapter', 'Subtopic': 'Subtopic'},
+                       color='Level',
+                       color_discrete_map={'Chapter': 'blue', 'Subtopic': 'orange'})
+
 # Function to display the subject structure
 def display_subject_structure(subject):
     subject_data = subject_structure(subject)
@@ -221,16 +266,12 @@ def display_subject_structure(subject):
     # Create a DataFrame for the sunburst chart
     sunburst_df = pd.DataFrame(sunburst_data)
 
-    # Create sunburst chart using Plotly
-    fig = px.sunburst(sunburst_df, 
-                      path=['Chapter', 'Subtopic'],
-                      title=f"Subject Structure for {subject}",
-                      labels={'Chapter': 'Chapter', 'Subtopic': 'Subtopic'},
-                      color='Level',
-                      color_discrete_map={'Chapter': 'blue', 'Subtopic': 'orange'})
-    
-    # Display the sunburst chart
-    st.plotly_chart(fig)
+    if sunburst_df.empty:
+        st.info(f"No chapter structure available for {subject}.")
+        return
+
+    # Create and display the sunburst chart
+    figure_cache.plotly_chart(subject_structure_figure, sunburst_df, subject=subject)
 
 # Function to get subject structure (chapters and subtopics)
 def subject_structure(subject):
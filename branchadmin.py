@@ -1,21 +1,22 @@
 import streamlit as st
-import sqlite3
+import db
+import profiling
+import query_cache
+import query_log
 
 def get_connection():
     """Establish a database connection."""
-    return sqlite3.connect("database.db")
+    return db.get_connection()
 
 # Utility functions for fetching branches
+BRANCHES_SQL = "SELECT branch_id, branch_name FROM branch"
+
 def get_branches():
     """Fetch all branches from the database."""
-    conn = get_connection()
-    cursor = conn.cursor()
-    cursor.execute("SELECT branch_id, branch_name FROM branch")
-    branches = cursor.fetchall()
-    conn.close()
-    return branches
+    return query_cache.fetchall(BRANCHES_SQL, tables=("branch",))
 
 # BranchAdmin Dashboard
+@profiling.profiled("branchadmin_dashboard")
 def branchadmin_dashboard():
     """BranchAdmin Dashboard for managing teachers and classes/sections."""
     st.sidebar.title("Navigation")
@@ -23,6 +24,7 @@ def branchadmin_dashboard():
 
     options = ["Dashboard","Manage Classes and Sections","Manage Teachers"]
     choice = st.sidebar.radio("Select an option", options)
+    query_log.set_page(f"Branchadmin: {choice}")
 
     branches = get_branches()
     if not branches:
@@ -34,6 +36,10 @@ def branchadmin_dashboard():
 
     st.title("BranchAdmin Dashboard")
 
+    with st.expander("Search students"):
+        from search import student_search_box
+        student_search_box(branch_id, key="branchadmin_student_search")
+
     if choice == "Dashboard":
         # Import the manage_classes_sections functionality
         from branch_dashboard import display_branch_dashboard
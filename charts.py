@@ -0,0 +1,117 @@
+"""Charts whose size does not grow with the number of students.
+
+population_figure() shows one value per student (a score, an average) in the
+cheapest form that still reads well for the population size:
+
+    up to MAX_BARS students     one bar per student
+    up to MAX_POINTS students   a WebGL rank plot, one marker per student
+    beyond that                 a histogram binned on the server, with the
+                                quartiles and the 10th/90th percentiles marked
+
+so the figure sent to the browser holds at most MAX_POINTS values. A rank
+plot whose JSON would pass MAX_PAYLOAD_BYTES (long labels) is binned too.
+top_bottom() picks the students to list next to a binned chart.
+
+    python benchmark.py charts
+"""
+MAX_BARS = 50
+MAX_POINTS = 5000
+BINS = 40
+TOP_N = 10
+MAX_PAYLOAD_BYTES = 512 * 1024
+
+QUANTILES = (0.1, 0.25, 0.5, 0.75, 0.9)
+
+
+def shows_each_student(count):
+    """Whether population_figure() draws every student (and needs their labels)."""
+    return count <= MAX_POINTS
+
+
+def population_figure(df, x, y, title, labels=None):
+    """Figure of column `y` per row of `df`, labelled by column `x` when drawn."""
+    count = len(df)
+    labels = labels or {}
+    if count <= MAX_BARS:
+        import plotly.express as px
+        return px.bar(df, x=x, y=y, title=title, labels=labels, color=y)
+    if count <= MAX_POINTS:
+        fig = _rank_figure(df, x, y, title, labels)
+        if payload_bytes(fig) <= MAX_PAYLOAD_BYTES:
+            return fig
+    return _binned_figure(df[y], title, labels.get(y, y))
+
+
+# Every student as a WebGL marker, best first
+def _rank_figure(df, x, y, title, labels):
+    import numpy as np
+    import plotly.graph_objects as go
+    ranked = df.sort_values(y, ascending=False, kind="stable")
+    fig = go.Figure(go.Scattergl(
+        x=np.arange(1, len(ranked) + 1), y=ranked[y].to_numpy(dtype="float64"),
+        text=ranked[x].astype(str).to_numpy(), mode="markers",
+        marker=dict(size=4, color=ranked[y].to_numpy(dtype="float64"), colorscale="Plasma"),
+        hovertemplate="%{text}: %{y:.2f}<extra></extra>",
+    ))
+    fig.update_layout(title=f"{title} ({len(ranked):,} students)", xaxis_title="Rank",
+                      yaxis_title=labels.get(y, y))
+    return fig
+
+
+# Histogram counted here (BINS bars whatever the population) with the
+# quantile bands drawn as shapes. One sort serves both: the bins are counted
+# with searchsorted and the quantiles read by position (as np.quantile's
+# default linear method), which costs less than np.histogram and np.quantile
+# each making their own pass over a million values.
+def _binned_figure(values, title, value_label):
+    import numpy as np
+    import plotly.graph_objects as go
+    values = np.sort(values.dropna().to_numpy(dtype="float64"))
+    if values.size == 0:
+        return go.Figure(layout=dict(title=title))
+    counts, edges = _histogram(values)
+    centres = (edges[:-1] + edges[1:]) / 2
+    fig = go.Figure(go.Bar(
+        x=centres, y=counts, width=np.diff(edges), marker_color="#636efa",
+        customdata=np.column_stack([edges[:-1], edges[1:]]),
+        hovertemplate="%{customdata[0]:.2f} to %{customdata[1]:.2f}: %{y} students<extra></extra>",
+    ))
+    p10, p25, median, p75, p90 = _quantiles(values)
+    fig.add_vrect(x0=p25, x1=p75, fillcolor="orange", opacity=0.15, line_width=0,
+                  annotation_text="middle 50%", annotation_position="top left")
+    fig.add_vrect(x0=p10, x1=p90, fillcolor="orange", opacity=0.07, line_width=0)
+    fig.add_vline(x=median, line_color="orange", annotation_text=f"median {median:.2f}")
+    fig.update_layout(title=f"{title} ({values.size:,} students)", xaxis_title=value_label,
+                      yaxis_title="Students", bargap=0.05)
+    return fig
+
+
+# BINS equal-width bins over sorted values, as np.histogram(values, BINS)
+def _histogram(values):
+    import numpy as np
+    first, last = values[0], values[-1]
+    if first == last:
+        first, last = first - 0.5, last + 0.5
+    edges = np.linspace(first, last, BINS + 1)
+    starts = np.searchsorted(values, edges, side="left")
+    starts[-1] = values.size  # the last bin includes its right edge
+    return np.diff(starts), edges
+
+
+# QUANTILES of sorted values, interpolating linearly between neighbours
+def _quantiles(values):
+    import numpy as np
+    positions = np.asarray(QUANTILES) * (values.size - 1)
+    below = np.floor(positions).astype(np.intp)
+    above = np.minimum(below + 1, values.size - 1)
+    return values[below] + (values[above] - values[below]) * (positions - below)
+
+
+def top_bottom(df, y, n=TOP_N):
+    """The n highest and n lowest rows by `y`, as (top, bottom)."""
+    return df.nlargest(n, y), df.nsmallest(n, y)
+
+
+def payload_bytes(fig):
+    """Size of the JSON the browser receives for `fig`."""
+    return len(fig.to_json())
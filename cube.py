@@ -0,0 +1,608 @@
+"""Precomputed dashboard measures by branch, grade, subject and section.
+
+agg_cube holds one row per cell of branch x grade x subject x section,
+plus the rollups the dashboards filter on: ALL_BRANCHES, ALL_GRADES and ""
+(all subjects / all sections) stand for "every value". A sidebar selection
+is therefore a single primary-key lookup instead of joins over students,
+grades, teachers and the curriculum.
+
+Triggers on the base tables only record which (branch, grade) pairs changed
+in agg_cube_dirty. refresh() recomputes just those grades' cells, rebuilds
+the branch totals from them and moves the all-branches rollup by the
+difference, in one transaction. Readers never refresh: the job worker
+(jobs.Dispatcher, started by login.main) does it on every pass, so the
+dashboards trail a write by about jobs.POLL_SECONDS. With
+SCHOOL_JOB_WORKER=0, run `python jobs.py worker` alongside the app.
+
+    python cube.py check    # recompute from scratch and diff against the table
+    python cube.py refresh  # recompute the dirty cells now
+    python cube.py rebuild  # recompute every branch
+    python benchmark.py cube
+"""
+import json
+import sys
+
+import db
+
+ALL_BRANCHES = 0
+ALL_GRADES = 0
+
+# Grade out of 10 a student's average must reach to count as passed
+PASS_GRADE = 4
+
+# students/classes/sections describe enrolment and ignore the subject;
+# teachers are per branch and subject; chapters/topics/evaluated_topics are
+# the curriculum of the branch's classes and ignore the section; assessed and
+# passed count students with grades in the cell, whose average reaches
+# PASS_GRADE for passed.
+MEASURES = (
+    "students", "classes", "sections", "teachers", "assessed", "passed",
+    "grade_count", "grade_sum", "chapters", "topics", "evaluated_topics",
+)
+
+# Parts CUBE_SQL and BRANCH_TOTALS_SQL share: whether a topic is evaluated,
+# the curriculum measures over curriculum_rows, and teachers per subject
+# (and in all, under subject '') of the branch ids {branches} selects
+_EVALUATED = "EXISTS (SELECT 1 FROM evaluation e WHERE e.topic_id = ta.topic_id AND e.is_evaluated = 1)"
+_CURRICULUM_COUNTS = (
+    "COUNT(DISTINCT cr.chapter_id) AS chapters, COUNT(DISTINCT cr.topic_id) AS topics, "
+    "COUNT(DISTINCT CASE WHEN cr.evaluated THEN cr.topic_id END) AS evaluated_topics"
+)
+_TEACHER_COUNTS = """
+    SELECT branch_id, subject, COUNT(*) AS teachers
+    FROM teachers
+    WHERE branch_id IN ({branches}) AND subject IS NOT NULL
+    GROUP BY branch_id, subject
+    UNION ALL
+    SELECT branch_id, '', COUNT(*)
+    FROM teachers
+    WHERE branch_id IN ({branches})
+    GROUP BY branch_id
+"""
+
+# Every cell of the slices in the JSON list ?1 of [branch_id, grade] pairs.
+# A pair with grade ALL_GRADES stands for the whole branch; any other pair
+# gives that grade's cells only, leaving the branch totals to
+# BRANCH_TOTALS_SQL. Each section, curriculum row and teacher is placed into
+# each rollup level it belongs to before grouping, so a level is one GROUP
+# BY instead of a query per combination.
+CUBE_SQL = f"""
+WITH slices AS (
+    SELECT json_extract(value, '$[0]') AS branch_id, json_extract(value, '$[1]') AS grade FROM json_each(?1)
+),
+scope AS (
+    SELECT c.branch_id, c.class_id, c.grade, sec.section_id, sec.section_name, sl.grade = {ALL_GRADES} AS whole
+    FROM slices sl
+    JOIN class c ON c.branch_id = sl.branch_id AND (sl.grade = {ALL_GRADES} OR c.grade = sl.grade)
+    JOIN section sec ON sec.class_id = c.class_id
+),
+levels(by_grade, by_section) AS (VALUES (1, 1), (1, 0), (0, 0)),
+placed AS (
+    SELECT sc.branch_id, sc.class_id, sc.section_id,
+           CASE WHEN l.by_grade THEN sc.grade ELSE 0 END AS grade,
+           CASE WHEN l.by_section THEN sc.section_name ELSE '' END AS section
+    FROM scope sc CROSS JOIN levels l
+    WHERE (sc.grade IS NOT NULL OR NOT l.by_grade) AND (l.by_grade OR sc.whole)
+),
+enrolment AS (
+    SELECT branch_id, grade, section, COUNT(DISTINCT class_id) AS classes, COUNT(*) AS sections,
+           SUM((SELECT COUNT(*) FROM student s WHERE s.section_id = placed.section_id)) AS students
+    FROM placed
+    GROUP BY branch_id, grade, section
+),
+student_subjects AS (
+    SELECT s.student_id, s.section_id, g.subject, COUNT(*) AS n, SUM(g.grade) AS total
+    FROM scope sc
+    CROSS JOIN student s ON s.section_id = sc.section_id
+    CROSS JOIN grades g INDEXED BY idx_grades_cell ON g.student_id = s.student_id
+    WHERE g.subject IS NOT NULL AND g.grade IS NOT NULL
+    GROUP BY s.student_id, g.subject
+),
+student_totals AS (
+    SELECT student_id, section_id, subject, n, total FROM student_subjects
+    UNION ALL
+    SELECT student_id, section_id, '', SUM(n), SUM(total) FROM student_subjects GROUP BY student_id
+),
+results AS (
+    SELECT p.branch_id, p.grade, st.subject, p.section, COUNT(*) AS assessed,
+           SUM(st.total >= ?2 * st.n) AS passed, SUM(st.n) AS grade_count, SUM(st.total) AS grade_sum
+    FROM student_totals st
+    JOIN placed p ON p.section_id = st.section_id
+    GROUP BY p.branch_id, p.grade, st.subject, p.section
+),
+curriculum_rows AS (
+    SELECT c.branch_id, c.grade, sl.grade = {ALL_GRADES} AS whole, sub.subject_name AS subject, ch.chapter_id,
+           ta.topic_id, {_EVALUATED} AS evaluated
+    FROM slices sl
+    JOIN class c ON c.branch_id = sl.branch_id AND (sl.grade = {ALL_GRADES} OR c.grade = sl.grade)
+    JOIN chapter ch ON ch.class_id = c.class_id
+    LEFT JOIN topic_association ta ON ta.chapter_id = ch.chapter_id
+    LEFT JOIN subject sub ON sub.subject_id = ta.subject_id
+),
+curriculum AS (
+    SELECT cr.branch_id,
+           CASE WHEN g.by_grade THEN cr.grade ELSE 0 END AS grade,
+           CASE WHEN s.by_subject THEN cr.subject ELSE '' END AS subject,
+           {_CURRICULUM_COUNTS}
+    FROM curriculum_rows cr
+    CROSS JOIN (SELECT 1 AS by_grade UNION ALL SELECT 0) g
+    CROSS JOIN (SELECT 1 AS by_subject UNION ALL SELECT 0) s
+    WHERE (cr.grade IS NOT NULL OR NOT g.by_grade) AND (cr.subject IS NOT NULL OR NOT s.by_subject)
+      AND (g.by_grade OR cr.whole)
+    GROUP BY 1, 2, 3
+),
+teacher_counts AS (
+    {_TEACHER_COUNTS.format(branches="SELECT branch_id FROM slices")}
+),
+cells AS (
+    SELECT branch_id, grade, subject, section FROM results
+    UNION SELECT branch_id, grade, '', section FROM enrolment
+    UNION SELECT branch_id, grade, subject, '' FROM curriculum
+    UNION SELECT branch_id, 0, subject, '' FROM teacher_counts
+    WHERE branch_id IN (SELECT branch_id FROM slices WHERE grade = {ALL_GRADES})
+)
+SELECT k.branch_id, k.grade, k.subject, k.section,
+       COALESCE(e.students, 0), COALESCE(e.classes, 0), COALESCE(e.sections, 0), COALESCE(t.teachers, 0),
+       COALESCE(r.assessed, 0), COALESCE(r.passed, 0), COALESCE(r.grade_count, 0), COALESCE(r.grade_sum, 0),
+       COALESCE(cu.chapters, 0), COALESCE(cu.topics, 0), COALESCE(cu.evaluated_topics, 0)
+FROM cells k
+LEFT JOIN enrolment e ON e.branch_id = k.branch_id AND e.grade = k.grade AND e.section = k.section
+LEFT JOIN teacher_counts t ON t.branch_id = k.branch_id AND t.subject = k.subject
+LEFT JOIN results r ON r.branch_id = k.branch_id AND r.grade = k.grade AND r.subject = k.subject AND r.section = k.section
+LEFT JOIN curriculum cu ON cu.branch_id = k.branch_id AND cu.grade = k.grade AND cu.subject = k.subject
+"""
+
+# Totals (grade ALL_GRADES) of the branches in the JSON list ?1 from their
+# grade cells, which CUBE_SQL has just replaced. Enrolment and results add up
+# over grades, as a class has one grade; chapters, topics and teachers are
+# counted again from the base tables, as a topic can be taught in several
+# grades. Only for branches whose classes all have a grade.
+BRANCH_TOTALS_SQL = f"""
+WITH branches AS (SELECT value AS branch_id FROM json_each(?1)),
+grade_cells AS (
+    SELECT * FROM agg_cube
+    WHERE branch_id IN (SELECT branch_id FROM branches) AND grade != {ALL_GRADES} AND section = ''
+),
+enrolment AS (
+    SELECT branch_id, SUM(students) AS students, SUM(classes) AS classes, SUM(sections) AS sections
+    FROM grade_cells WHERE subject = ''
+    GROUP BY branch_id
+),
+results AS (
+    SELECT branch_id, subject, SUM(assessed) AS assessed, SUM(passed) AS passed,
+           SUM(grade_count) AS grade_count, SUM(grade_sum) AS grade_sum
+    FROM grade_cells
+    GROUP BY branch_id, subject
+),
+curriculum_rows AS (
+    SELECT c.branch_id, sub.subject_name AS subject, ch.chapter_id, ta.topic_id, {_EVALUATED} AS evaluated
+    FROM class c
+    JOIN chapter ch ON ch.class_id = c.class_id
+    LEFT JOIN topic_association ta ON ta.chapter_id = ch.chapter_id
+    LEFT JOIN subject sub ON sub.subject_id = ta.subject_id
+    WHERE c.branch_id IN (SELECT branch_id FROM branches)
+),
+curriculum AS (
+    SELECT cr.branch_id, CASE WHEN s.by_subject THEN cr.subject ELSE '' END AS subject, {_CURRICULUM_COUNTS}
+    FROM curriculum_rows cr
+    CROSS JOIN (SELECT 1 AS by_subject UNION ALL SELECT 0) s
+    WHERE cr.subject IS NOT NULL OR NOT s.by_subject
+    GROUP BY 1, 2
+),
+teacher_counts AS (
+    {_TEACHER_COUNTS.format(branches="SELECT branch_id FROM branches")}
+),
+cells AS (
+    SELECT branch_id, subject FROM results
+    UNION SELECT branch_id, subject FROM curriculum
+    UNION SELECT branch_id, subject FROM teacher_counts
+)
+SELECT k.branch_id, {ALL_GRADES}, k.subject, '',
+       COALESCE(e.students, 0), COALESCE(e.classes, 0), COALESCE(e.sections, 0), COALESCE(t.teachers, 0),
+       COALESCE(r.assessed, 0), COALESCE(r.passed, 0), COALESCE(r.grade_count, 0), COALESCE(r.grade_sum, 0),
+       COALESCE(cu.chapters, 0), COALESCE(cu.topics, 0), COALESCE(cu.evaluated_topics, 0)
+FROM cells k
+LEFT JOIN enrolment e ON e.branch_id = k.branch_id
+LEFT JOIN teacher_counts t ON t.branch_id = k.branch_id AND t.subject = k.subject
+LEFT JOIN results r ON r.branch_id = k.branch_id AND r.subject = k.subject
+LEFT JOIN curriculum cu ON cu.branch_id = k.branch_id AND cu.subject = k.subject
+"""
+
+# Branch cells a refresh of the slices in ?1 replaces: a whole branch, or a
+# grade's cells plus the branch totals
+_REPLACED = f"""
+branch_id IN (SELECT json_extract(value, '$[0]') FROM json_each(?1))
+AND (grade = {ALL_GRADES} OR EXISTS (
+    SELECT 1 FROM json_each(?1)
+    WHERE json_extract(value, '$[0]') = agg_cube.branch_id AND json_extract(value, '$[1]') IN ({ALL_GRADES}, agg_cube.grade)
+))
+"""
+
+# Branches partition students, teachers and classes, so every measure of an
+# all-branches cell is the sum of the branch cells: the replaced cells are
+# subtracted from it ({sign} "-") before a refresh and their new values
+# added ({sign} "+") after it
+_ALL_BRANCHES_DELTA_SQL = f"""
+INSERT INTO agg_cube (branch_id, grade, subject, section, {', '.join(MEASURES)})
+SELECT {ALL_BRANCHES}, grade, subject, section, {', '.join(f'{{sign}}SUM({m})' for m in MEASURES)}
+FROM agg_cube
+WHERE branch_id != {ALL_BRANCHES} AND {_REPLACED}
+GROUP BY grade, subject, section
+ON CONFLICT (branch_id, subject, grade, section) DO UPDATE SET
+    {', '.join(f'{m} = {m} + excluded.{m}' for m in MEASURES)}
+"""
+
+# Branch and grade of a class / section / student / chapter, and of the
+# classes teaching a topic or subject, as SELECTs of (branch_id, grade)
+_CLASS_CELL = "SELECT branch_id, grade FROM class WHERE class_id = {class_id}"
+_SECTION_CELL = (
+    "SELECT c.branch_id, c.grade FROM section sec JOIN class c ON sec.class_id = c.class_id "
+    "WHERE sec.section_id = {section}"
+)
+_STUDENT_CELL = (
+    "SELECT c.branch_id, c.grade FROM student s JOIN section sec ON s.section_id = sec.section_id "
+    "JOIN class c ON sec.class_id = c.class_id WHERE s.student_id = {student}"
+)
+_CHAPTER_CELL = (
+    "SELECT c.branch_id, c.grade FROM chapter ch JOIN class c ON ch.class_id = c.class_id WHERE ch.chapter_id = {chapter}"
+)
+_TOPIC_CELLS = (
+    "SELECT c.branch_id, c.grade FROM topic_association ta JOIN chapter ch ON ta.chapter_id = ch.chapter_id "
+    "JOIN class c ON ch.class_id = c.class_id WHERE ta.topic_id = {topic}"
+)
+_SUBJECT_CELLS = (
+    "SELECT c.branch_id, c.grade FROM topic_association ta JOIN chapter ch ON ta.chapter_id = ch.chapter_id "
+    "JOIN class c ON ch.class_id = c.class_id WHERE ta.subject_id = {subject}"
+)
+
+
+# A class without a grade is only in its branch's totals, so it marks the
+# whole branch (grade ALL_GRADES). Not INSERT OR IGNORE: an upsert's conflict
+# handling overrides the OR IGNORE of the triggers it fires, so marking the
+# same pair twice (OLD and NEW of an update) would fail the upsert
+def _mark(*cell_queries):
+    return "".join(
+        f"INSERT INTO agg_cube_dirty (branch_id, grade) "
+        f"SELECT DISTINCT branch_id, COALESCE(grade, {ALL_GRADES}) FROM ({query}) "
+        f"WHERE branch_id IS NOT NULL "
+        f"AND (branch_id, COALESCE(grade, {ALL_GRADES})) NOT IN (SELECT branch_id, grade FROM agg_cube_dirty);"
+        for query in cell_queries
+    )
+
+
+def _mark_value(branch, grade):
+    return _mark(f"SELECT {branch} AS branch_id, {grade} AS grade")
+
+
+# Trigger name -> (event, body). Every write that can change a cell marks the
+# (branch, grade) pairs it touches; nothing is recomputed inside the write
+# itself. Teachers count in every grade of their branch.
+TRIGGERS = {
+    "trg_cube_class_insert": ("AFTER INSERT ON class", _mark_value("NEW.branch_id", "NEW.grade")),
+    "trg_cube_class_delete": ("AFTER DELETE ON class", _mark_value("OLD.branch_id", "OLD.grade")),
+    "trg_cube_class_update": (
+        "AFTER UPDATE OF branch_id, grade ON class",
+        _mark_value("OLD.branch_id", "OLD.grade") + _mark_value("NEW.branch_id", "NEW.grade"),
+    ),
+    "trg_cube_section_insert": ("AFTER INSERT ON section", _mark(_CLASS_CELL.format(class_id="NEW.class_id"))),
+    "trg_cube_section_delete": ("AFTER DELETE ON section", _mark(_CLASS_CELL.format(class_id="OLD.class_id"))),
+    "trg_cube_section_update": (
+        "AFTER UPDATE OF class_id, section_name ON section",
+        _mark(_CLASS_CELL.format(class_id="OLD.class_id"), _CLASS_CELL.format(class_id="NEW.class_id")),
+    ),
+    "trg_cube_student_insert": ("AFTER INSERT ON student", _mark(_SECTION_CELL.format(section="NEW.section_id"))),
+    "trg_cube_student_delete": ("AFTER DELETE ON student", _mark(_SECTION_CELL.format(section="OLD.section_id"))),
+    "trg_cube_student_move": (
+        "AFTER UPDATE OF section_id ON student WHEN OLD.section_id IS NOT NEW.section_id",
+        _mark(_SECTION_CELL.format(section="OLD.section_id"), _SECTION_CELL.format(section="NEW.section_id")),
+    ),
+    "trg_cube_grade_insert": ("AFTER INSERT ON grades", _mark(_STUDENT_CELL.format(student="NEW.student_id"))),
+    "trg_cube_grade_delete": ("AFTER DELETE ON grades", _mark(_STUDENT_CELL.format(student="OLD.student_id"))),
+    "trg_cube_grade_update": (
+        "AFTER UPDATE OF student_id, subject, grade ON grades",
+        _mark(_STUDENT_CELL.format(student="OLD.student_id"), _STUDENT_CELL.format(student="NEW.student_id")),
+    ),
+    "trg_cube_teacher_insert": ("AFTER INSERT ON teachers", _mark_value("NEW.branch_id", ALL_GRADES)),
+    "trg_cube_teacher_delete": ("AFTER DELETE ON teachers", _mark_value("OLD.branch_id", ALL_GRADES)),
+    "trg_cube_teacher_update": (
+        "AFTER UPDATE OF branch_id, subject ON teachers",
+        _mark_value("OLD.branch_id", ALL_GRADES) + _mark_value("NEW.branch_id", ALL_GRADES),
+    ),
+    "trg_cube_chapter_insert": ("AFTER INSERT ON chapter", _mark(_CLASS_CELL.format(class_id="NEW.class_id"))),
+    "trg_cube_chapter_delete": ("AFTER DELETE ON chapter", _mark(_CLASS_CELL.format(class_id="OLD.class_id"))),
+    "trg_cube_chapter_move": (
+        "AFTER UPDATE OF class_id ON chapter",
+        _mark(_CLASS_CELL.format(class_id="OLD.class_id"), _CLASS_CELL.format(class_id="NEW.class_id")),
+    ),
+    "trg_cube_association_insert": (
+        "AFTER INSERT ON topic_association", _mark(_CHAPTER_CELL.format(chapter="NEW.chapter_id")),
+    ),
+    "trg_cube_association_delete": (
+        "AFTER DELETE ON topic_association", _mark(_CHAPTER_CELL.format(chapter="OLD.chapter_id")),
+    ),
+    "trg_cube_association_update": (
+        "AFTER UPDATE ON topic_association",
+        _mark(_CHAPTER_CELL.format(chapter="OLD.chapter_id"), _CHAPTER_CELL.format(chapter="NEW.chapter_id")),
+    ),
+    "trg_cube_subject_rename": (
+        "AFTER UPDATE OF subject_name ON subject", _mark(_SUBJECT_CELLS.format(subject="NEW.subject_id")),
+    ),
+    "trg_cube_evaluation_insert": ("AFTER INSERT ON evaluation", _mark(_TOPIC_CELLS.format(topic="NEW.topic_id"))),
+    "trg_cube_evaluation_delete": ("AFTER DELETE ON evaluation", _mark(_TOPIC_CELLS.format(topic="OLD.topic_id"))),
+    "trg_cube_evaluation_update": (
+        "AFTER UPDATE ON evaluation",
+        _mark(_TOPIC_CELLS.format(topic="OLD.topic_id"), _TOPIC_CELLS.format(topic="NEW.topic_id")),
+    ),
+}
+
+_CREATE_DIRTY = """
+CREATE TABLE IF NOT EXISTS agg_cube_dirty (
+    branch_id INTEGER NOT NULL,
+    grade INTEGER NOT NULL,
+    PRIMARY KEY (branch_id, grade)
+) WITHOUT ROWID
+"""
+
+
+def _create_triggers(cursor):
+    for name, (event, body) in TRIGGERS.items():
+        cursor.execute(f"DROP TRIGGER IF EXISTS {name}")
+        cursor.execute(f"CREATE TRIGGER {name} {event} BEGIN {body} END")
+
+
+def create_cube(cursor):
+    """Create agg_cube, agg_cube_dirty and their triggers, and fill the cube (migration step)."""
+    cursor.execute(f"""
+    CREATE TABLE IF NOT EXISTS agg_cube (
+        branch_id INTEGER NOT NULL,
+        subject TEXT NOT NULL,
+        grade INTEGER NOT NULL,
+        section TEXT NOT NULL,
+        {', '.join(f'{m} {"REAL" if m == "grade_sum" else "INTEGER"} NOT NULL DEFAULT 0' for m in MEASURES)},
+        PRIMARY KEY (branch_id, subject, grade, section)
+    ) WITHOUT ROWID
+    """)
+    cursor.execute(_CREATE_DIRTY)
+    _create_triggers(cursor)
+    rebuild_cube(cursor)
+
+
+def track_dirty_cells(cursor):
+    """Key agg_cube_dirty by (branch, grade) instead of branch (migration step).
+
+    Branches already marked stay marked as whole branches.
+    """
+    columns = [row[1] for row in cursor.execute("PRAGMA table_info(agg_cube_dirty)")]
+    if "grade" not in columns:
+        marked = [row[0] for row in cursor.execute("SELECT branch_id FROM agg_cube_dirty")]
+        cursor.execute("DROP TABLE agg_cube_dirty")
+        cursor.execute(_CREATE_DIRTY)
+        cursor.executemany("INSERT INTO agg_cube_dirty (branch_id, grade) VALUES (?, ?)",
+                           [(branch_id, ALL_GRADES) for branch_id in marked])
+    _create_triggers(cursor)
+
+
+# Insert triggers a bulk curriculum load suspends (see curriculum_import.py)
+CURRICULUM_INSERT_TRIGGERS = ("trg_cube_chapter_insert", "trg_cube_association_insert")
+
+
+def mark_classes(cursor, class_ids):
+    """Mark the grades of `class_ids` for refresh (bulk loads that bypass the triggers)."""
+    cursor.execute(
+        f"INSERT OR IGNORE INTO agg_cube_dirty (branch_id, grade) "
+        f"SELECT DISTINCT branch_id, COALESCE(grade, {ALL_GRADES}) FROM class "
+        f"WHERE class_id IN (SELECT value FROM json_each(?)) AND branch_id IS NOT NULL",
+        (json.dumps(list(class_ids)),),
+    )
+
+
+def mark_sections(cursor, section_ids):
+    """Mark the grades of `section_ids` for refresh (bulk loads that bypass the triggers)."""
+    cursor.execute(
+        f"INSERT OR IGNORE INTO agg_cube_dirty (branch_id, grade) "
+        f"SELECT DISTINCT c.branch_id, COALESCE(c.grade, {ALL_GRADES}) "
+        f"FROM section sec JOIN class c ON sec.class_id = c.class_id "
+        f"WHERE sec.section_id IN (SELECT value FROM json_each(?)) AND c.branch_id IS NOT NULL",
+        (json.dumps(list(section_ids)),),
+    )
+
+
+# Replace the cells of the (branch, grade) pairs in `dirty` and move the
+# all-branches rollup by the difference. A branch with a class that has no
+# grade is recomputed whole, as that class is only in the branch totals.
+def _recompute(cursor, dirty):
+    dirty = list(dirty)
+    branch_ids = sorted({branch_id for branch_id, _ in dirty})
+    whole = {branch_id for branch_id, grade in dirty if grade == ALL_GRADES}
+    whole.update(row[0] for row in cursor.execute(
+        "SELECT DISTINCT branch_id FROM class WHERE branch_id IN (SELECT value FROM json_each(?)) AND grade IS NULL",
+        (json.dumps(branch_ids),),
+    ))
+    slices = json.dumps([[branch_id, ALL_GRADES] for branch_id in sorted(whole)] + sorted(
+        [branch_id, grade] for branch_id, grade in set(dirty) if branch_id not in whole
+    ))
+    partial = json.dumps(sorted(set(branch_ids) - whole))
+    cursor.execute(_ALL_BRANCHES_DELTA_SQL.format(sign="-"), (slices,))
+    cursor.execute(f"DELETE FROM agg_cube WHERE branch_id != {ALL_BRANCHES} AND {_REPLACED}", (slices,))
+    columns = f"branch_id, grade, subject, section, {', '.join(MEASURES)}"
+    cursor.execute(f"INSERT INTO agg_cube ({columns}) {CUBE_SQL}", (slices, PASS_GRADE))
+    cursor.execute(f"INSERT INTO agg_cube ({columns}) {BRANCH_TOTALS_SQL}", (partial,))
+    cursor.execute(_ALL_BRANCHES_DELTA_SQL.format(sign="+"), (slices,))
+    # grade_sum is left out: adding and subtracting it can leave a rounding residue
+    cursor.execute(
+        f"DELETE FROM agg_cube WHERE branch_id = {ALL_BRANCHES} AND "
+        f"{' AND '.join(f'{m} = 0' for m in MEASURES if m != 'grade_sum')}"
+    )
+    cursor.executemany("DELETE FROM agg_cube_dirty WHERE branch_id = ? AND grade = ?", dirty)
+
+
+def _all_branch_ids(cursor):
+    rows = cursor.execute(
+        "SELECT branch_id FROM class WHERE branch_id IS NOT NULL UNION SELECT branch_id FROM teachers"
+    ).fetchall()
+    return [row[0] for row in rows]
+
+
+def rebuild_cube(cursor):
+    cursor.execute("DELETE FROM agg_cube")
+    _recompute(cursor, [(branch_id, ALL_GRADES) for branch_id in _all_branch_ids(cursor)])
+    cursor.execute("DELETE FROM agg_cube_dirty")
+
+
+def refresh(path=None):
+    """Recompute the (branch, grade) pairs changed since the last refresh; returns how many.
+
+    Called by the job worker, not by readers.
+    """
+    connection = db.get_connection(path)
+    if connection.execute("SELECT 1 FROM agg_cube_dirty LIMIT 1").fetchone() is None:
+        return 0
+    # Another process may be refreshing the same pairs; the dirty list is
+    # read again once this one holds the write lock
+    connection.execute("BEGIN IMMEDIATE")
+    try:
+        dirty = connection.execute("SELECT branch_id, grade FROM agg_cube_dirty").fetchall()
+        if dirty:
+            _recompute(connection.cursor(), dirty)
+        connection.commit()
+    except Exception:
+        connection.rollback()
+        raise
+    return len(dirty)
+
+
+def refresh_all(path=None):
+    """refresh() the database at `path` and, when sharded, every existing branch shard."""
+    import sharding
+    return sum(refresh(shard) for shard in [path or db.DB_PATH] + sharding.shard_paths())
+
+
+_CELL_SQL = (
+    f"SELECT {', '.join(MEASURES)} FROM agg_cube "
+    "WHERE branch_id = ? AND subject = ? AND grade = ? AND section = ?"
+)
+
+
+def _with_rates(values):
+    values["average_grade"] = values["grade_sum"] / values["grade_count"] if values["grade_count"] else 0.0
+    values["pass_rate"] = values["passed"] / values["assessed"] if values["assessed"] else 0.0
+    values["completion"] = values["evaluated_topics"] / values["topics"] if values["topics"] else 0.0
+    return values
+
+
+def cell(branch_id=ALL_BRANCHES, grade=ALL_GRADES, subject="", section="", path=None):
+    """Measures of one cell as a dict, with average_grade, pass_rate and completion added.
+
+    A cell with no data has every measure at 0.
+    """
+    row = db.get_connection(path).execute(_CELL_SQL, (branch_id, subject or "", grade or ALL_GRADES, section or "")).fetchone()
+    return _with_rates(dict(zip(MEASURES, row or (0,) * len(MEASURES))))
+
+
+# Value of each key column that stands for "every value"
+_ALL = {"subject": "", "grade": ALL_GRADES, "section": ""}
+
+
+def breakdown(branch_id, by, grade=ALL_GRADES, subject="", section="", path=None):
+    """The cells of each `by` value ("subject", "grade" or "section"), the other two fixed.
+
+    Returns a list of measure dicts, each with `by` set to its value.
+    """
+    if by not in _ALL:
+        raise ValueError(f"cannot break the cube down by {by!r}")
+    fixed = {"subject": subject or "", "grade": grade or ALL_GRADES, "section": section or ""}
+    del fixed[by]
+    rows = db.get_connection(path).execute(
+        f"SELECT {by}, {', '.join(MEASURES)} FROM agg_cube "
+        f"WHERE branch_id = ? AND {' AND '.join(f'{column} = ?' for column in fixed)} AND {by} != ?",
+        (branch_id, *fixed.values(), _ALL[by]),
+    )
+    return [_with_rates(dict(zip((by,) + MEASURES, row))) for row in rows]
+
+
+# Sidebar options, each read from the cube's primary key
+
+def subjects(branch_id=ALL_BRANCHES, path=None):
+    """Subjects with data in the branch."""
+    rows = db.get_connection(path).execute(
+        "SELECT subject FROM agg_cube WHERE branch_id = ? AND subject != '' AND grade = ? AND section = ''",
+        (branch_id, ALL_GRADES),
+    )
+    return [row[0] for row in rows]
+
+
+def grades(branch_id=ALL_BRANCHES, subject="", path=None):
+    """Grades with data in the branch (in `subject`, if given)."""
+    rows = db.get_connection(path).execute(
+        "SELECT grade FROM agg_cube WHERE branch_id = ? AND subject = ? AND grade != ? AND section = ''",
+        (branch_id, subject or "", ALL_GRADES),
+    )
+    return [row[0] for row in rows]
+
+
+def sections(branch_id=ALL_BRANCHES, grade=ALL_GRADES, path=None):
+    """Section names in the branch (in `grade`, if given)."""
+    rows = db.get_connection(path).execute(
+        "SELECT section FROM agg_cube WHERE branch_id = ? AND subject = '' AND grade = ? AND section != ''",
+        (branch_id, grade or ALL_GRADES),
+    )
+    return [row[0] for row in rows]
+
+
+# Recompute every branch and return each difference from the stored table
+# as (cell, measure, stored value, expected value)
+def check_cube(connection):
+    refresh()
+    key = lambda row: tuple(row[:4])
+    slices = json.dumps([[branch_id, ALL_GRADES] for branch_id in _all_branch_ids(connection)])
+    expected = {key(row): row[4:] for row in connection.execute(CUBE_SQL, (slices, PASS_GRADE))}
+    totals = {}
+    for cell_key, values in expected.items():
+        rollup = (ALL_BRANCHES,) + cell_key[1:]
+        totals[rollup] = tuple(a + b for a, b in zip(totals.get(rollup, (0,) * len(MEASURES)), values))
+    expected.update(totals)
+    stored = {
+        key(row): row[4:]
+        for row in connection.execute(f"SELECT branch_id, grade, subject, section, {', '.join(MEASURES)} FROM agg_cube")
+    }
+    differences = []
+    for cell_key in sorted(expected.keys() | stored.keys(), key=repr):
+        want = expected.get(cell_key)
+        have = stored.get(cell_key)
+        if want is None or have is None:
+            differences.append((cell_key, "row", have, want))
+            continue
+        for measure, have_value, want_value in zip(MEASURES, have, want):
+            if abs(have_value - want_value) > 1e-6:
+                differences.append((cell_key, measure, have_value, want_value))
+    return differences
+
+
+def main(argv=None):
+    argv = sys.argv[1:] if argv is None else argv
+    command = argv[0] if argv else "check"
+    import migrations
+    migrations.ensure_migrated()
+
+    with db.pooled() as connection:
+        if command == "rebuild":
+            connection.execute("BEGIN IMMEDIATE")
+            rebuild_cube(connection.cursor())
+            connection.commit()
+            print("agg_cube rebuilt.")
+            return 0
+        if command == "refresh":
+            print(f"{refresh_all()} dirty (branch, grade) pairs recomputed.")
+            return 0
+
+        differences = check_cube(connection)
+    if not differences:
+        print("agg_cube is consistent.")
+        return 0
+    for cell_key, measure, stored, expected in differences:
+        print(f"cell {cell_key}: {measure} is {stored}, expected {expected}")
+    return 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
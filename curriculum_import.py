@@ -0,0 +1,171 @@
+"""Bulk import of chapters and topics in the sample_chapters_topics.csv layout.
+
+One row per topic: Chapter Name, Action Plan, Topic Name, Description,
+Expected Outcome. Chapters and topics are deduplicated by name in memory,
+existing ids are resolved with one query per table, and every insert is a
+batched executemany inside a single transaction. Rows already present are
+left alone, so importing the same file twice adds nothing the second time.
+The search index and the dashboard cube are updated once for the whole file
+rather than per row. In the sharded layout topics and outcomes, which every
+branch shares, are written in the catalog and published to the shards
+first (sharding.publish); chapters and their links go to the branch's shard.
+"""
+import json
+import time
+
+import pandas as pd
+
+import bulk_import
+import cube
+import db
+import search_index
+import sharding
+
+CURRICULUM_CSV_COLUMNS = ("Chapter Name", "Action Plan", "Topic Name", "Description", "Expected Outcome")
+
+
+class CurriculumReport:
+    """Outcome of a curriculum import."""
+
+    def __init__(self):
+        self.rows_read = 0
+        self.chapters_added = 0
+        self.topics_added = 0
+        self.associations_added = 0
+        self.outcomes_added = 0
+        self.seconds = 0.0
+
+
+# Class and subject a curriculum upload belongs to: (None, None) when the
+# branch has no class for the grade, as chapters need one. The subject is
+# optional.
+def resolve_class_and_subject(connection, branch_id, grade, subject_name):
+    row = connection.execute(
+        "SELECT class_id FROM class WHERE branch_id = ? AND grade = ? ORDER BY class_id LIMIT 1",
+        (branch_id, grade),
+    ).fetchone()
+    if row is None:
+        return None, None
+    class_id = row[0]
+    row = connection.execute(
+        "SELECT subject_id FROM subject WHERE branch_id = ? AND class_id = ? AND subject_name = ?",
+        (branch_id, class_id, subject_name),
+    ).fetchone()
+    return class_id, row[0] if row else None
+
+
+# name -> id for every name in `names` that already exists
+def _resolve(connection, sql, names, *params):
+    return dict(connection.execute(sql, (*params, json.dumps(list(names)))))
+
+
+def read_curriculum(csv_file):
+    data = pd.read_csv(csv_file, dtype=object)
+    missing = [c for c in CURRICULUM_CSV_COLUMNS if c not in data]
+    if missing:
+        raise ValueError(f"CSV is missing column(s): {', '.join(missing)}")
+    data = data[list(CURRICULUM_CSV_COLUMNS)].apply(lambda column: column.str.strip())
+    return data.dropna(subset=["Chapter Name", "Topic Name"])
+
+
+TOPIC_SQL = "SELECT topic_name, topic_id FROM topic WHERE topic_name IN (SELECT value FROM json_each(?))"
+
+
+# Insert the topics and outcomes of `data` that are missing (the tables every
+# branch shares); returns topic name -> id and the ids of the topics to
+# re-index: new ones, and ones that may have gained outcomes
+def _import_topics(cursor, data, report):
+    topics = data.drop_duplicates("Topic Name")
+    topic_ids = _resolve(cursor, TOPIC_SQL, topics["Topic Name"])
+    new_topics = topics[~topics["Topic Name"].isin(topic_ids)]
+    cursor.executemany(
+        "INSERT INTO topic (topic_name, description) VALUES (?, ?)",
+        list(zip(new_topics["Topic Name"], new_topics["Description"])),
+    )
+    report.topics_added = len(new_topics)
+    topic_ids.update(_resolve(cursor, TOPIC_SQL, new_topics["Topic Name"]))
+
+    # Outcome rows have no unique key, so each insert is guarded by an anti-join
+    outcomes = data[["Topic Name", "Expected Outcome"]].dropna().drop_duplicates()
+    cursor.executemany(
+        """
+        INSERT INTO topic_outcome (topic_id, expected_outcome)
+        SELECT ?1, ?2
+        WHERE NOT EXISTS (SELECT 1 FROM topic_outcome WHERE topic_id = ?1 AND expected_outcome = ?2)
+        """,
+        [(topic_ids[topic], outcome) for topic, outcome in outcomes.itertuples(index=False)],
+    )
+    report.outcomes_added = cursor.rowcount
+
+    changed = set(new_topics["Topic Name"])
+    if report.outcomes_added:
+        changed.update(outcomes["Topic Name"])
+    return topic_ids, [topic_ids[name] for name in changed]
+
+
+def import_curriculum(csv_file, class_id, subject_id=None):
+    """Import a curriculum CSV into `class_id` (and `subject_id`, if known)."""
+    start = time.perf_counter()
+    report = CurriculumReport()
+    data = read_curriculum(csv_file)
+    report.rows_read = len(data)
+    # Empty cells are NaN, which SQLite binds as NULL
+    chapters = data.drop_duplicates("Chapter Name")
+
+    connection = db.get_connection()
+    shared = sharding.shared_connection()
+    if shared is not connection:
+        # Sharded: topics are written in the catalog and published to every
+        # shard before this branch's chapters link to them
+        with bulk_import.suspended_triggers(shared, search_index.CURRICULUM_INSERT_TRIGGERS) as (cursor, triggers):
+            topic_ids, changed_topics = _import_topics(cursor, data, report)
+            search_index.index_curriculum(cursor, [], changed_topics)
+            for _, sql in triggers:
+                cursor.execute(sql)
+        sharding.publish(changed_topics)
+
+    with bulk_import.suspended_triggers(
+        connection, search_index.CURRICULUM_INSERT_TRIGGERS + cube.CURRICULUM_INSERT_TRIGGERS
+    ) as (cursor, triggers):
+
+        chapter_sql = (
+            "SELECT chapter_name, chapter_id FROM chapter "
+            "WHERE class_id = ? AND chapter_name IN (SELECT value FROM json_each(?))"
+        )
+        chapter_ids = _resolve(cursor, chapter_sql, chapters["Chapter Name"], class_id)
+        new_chapters = chapters[~chapters["Chapter Name"].isin(chapter_ids)]
+        cursor.executemany(
+            "INSERT INTO chapter (class_id, chapter_name, description) VALUES (?, ?, ?)",
+            [(class_id, name, plan) for name, plan in zip(new_chapters["Chapter Name"], new_chapters["Action Plan"])],
+        )
+        report.chapters_added = len(new_chapters)
+        chapter_ids.update(_resolve(cursor, chapter_sql, new_chapters["Chapter Name"], class_id))
+
+        if shared is connection:
+            topic_ids, changed_topics = _import_topics(cursor, data, report)
+        else:
+            changed_topics = []
+
+        # Link rows have no usable unique key (subject_id may be NULL), so
+        # each insert is guarded by an anti-join
+        links = data[["Topic Name", "Chapter Name"]].drop_duplicates()
+        cursor.executemany(
+            """
+            INSERT INTO topic_association (topic_id, subject_id, chapter_id)
+            SELECT ?1, ?2, ?3
+            WHERE NOT EXISTS (SELECT 1 FROM topic_association
+                              WHERE chapter_id = ?3 AND topic_id = ?1 AND subject_id IS ?2)
+            """,
+            [(topic_ids[topic], subject_id, chapter_ids[chapter]) for topic, chapter in links.itertuples(index=False)],
+        )
+        report.associations_added = cursor.rowcount
+
+        # New chapters and topics, and topics that may have gained outcomes
+        search_index.index_curriculum(cursor, [chapter_ids[name] for name in new_chapters["Chapter Name"]],
+                                      changed_topics)
+        cube.mark_classes(cursor, [class_id])
+        for _, sql in triggers:
+            cursor.execute(sql)
+
+    report.seconds = time.perf_counter() - start
+    return report
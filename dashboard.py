@@ -68,7 +68,6 @@
 
 import streamlit as st
 import pandas as pd
-import plotly.express as px
 
 # Sample branch data
 branch_data = {
@@ -99,8 +98,45 @@ def display_overall_stats(total_branches, total_teachers, total_students, total_
     bar_chart_data = pd.DataFrame(overall_data, index=[0])
     st.bar_chart(bar_chart_data)
 
-# Function to display branch stats using Plotly
+# Branch-wise figures as (file name, figure); built by a background job
+def branch_stats_figures(branch_stats):
+    import plotly.express as px
+    # Plotly Bar chart for Number of Students per Branch
+    students = px.bar(branch_stats, x='branch_name', y='students', 
+                      labels={'branch_name': 'Branch Name', 'students': 'Number of Students'},
+                      title='Number of Students per Branch')
+
+    # Plotly Bar chart for Average Math Scores per Branch
+    math_avg = px.bar(branch_stats, x='branch_name', y='math_avg', color='branch_name',
+                      labels={'branch_name': 'Branch Name', 'math_avg': 'Average Math Score'},
+                      title='Average Math Scores per Branch')
+
+    # Plotly Bar chart for Number of Teachers per Branch
+    teachers = px.bar(branch_stats, x='branch_name', y='teachers', color='branch_name',
+                      labels={'branch_name': 'Branch Name', 'teachers': 'Number of Teachers'},
+                      title='Number of Teachers per Branch')
+    return [("students.json", students), ("math_avg.json", math_avg), ("teachers.json", teachers)]
+
+# Job "branch_stats_figures": write the figures of params["branch_stats"]
+# (a list of row dicts) as plotly JSON files
+def branch_stats_report(params, job):
+    import os
+    job.progress(0.1, "building figures")
+    figures = branch_stats_figures(pd.DataFrame(params["branch_stats"]))
+    for done, (file_name, fig) in enumerate(figures, start=1):
+        fig.write_json(os.path.join(job.directory, file_name))
+        job.progress(0.1 + 0.9 * done / len(figures), f"wrote {file_name}")
+    return {"figures": [file_name for file_name, _ in figures]}
+
+def show_branch_stats_figures(result, directory):
+    import os
+    import plotly.io as pio
+    for file_name in result["figures"]:
+        st.plotly_chart(pio.read_json(os.path.join(directory, file_name)))
+
+# Function to display branch stats; the figures are built by a background job
 def display_branch_stats(branch_stats, grade_filter=None, subject_filter=None):
+    import jobs
     st.subheader("Branch-wise Statistics")
     
     # Apply filters if any
@@ -112,23 +148,8 @@ def display_branch_stats(branch_stats, grade_filter=None, subject_filter=None):
     # Display the branch statistics as a table
     st.dataframe(branch_stats)
 
-    # Plotly Bar chart for Number of Students per Branch
-    fig = px.bar(branch_stats, x='branch_name', y='students', 
-                 labels={'branch_name': 'Branch Name', 'students': 'Number of Students'},
-                 title='Number of Students per Branch')
-    st.plotly_chart(fig)
-
-    # Plotly Bar chart for Average Math Scores per Branch
-    fig = px.bar(branch_stats, x='branch_name', y='math_avg', color='branch_name',
-                 labels={'branch_name': 'Branch Name', 'math_avg': 'Average Math Score'},
-                 title='Average Math Scores per Branch')
-    st.plotly_chart(fig)
-
-    # Plotly Bar chart for Number of Teachers per Branch
-    fig = px.bar(branch_stats, x='branch_name', y='teachers', color='branch_name',
-                 labels={'branch_name': 'Branch Name', 'teachers': 'Number of Teachers'},
-                 title='Number of Teachers per Branch')
-    st.plotly_chart(fig)
+    jobs.show("branch_stats_figures", {"branch_stats": branch_stats.to_dict("records")},
+              show_branch_stats_figures, label="Branch charts")
 
 # Main Application Logic
 def main():
@@ -0,0 +1,239 @@
+import os
+import queue
+import sqlite3
+import threading
+import weakref
+from contextlib import contextmanager
+
+import query_log
+
+# Path of the application database (override with SCHOOL_DB_PATH, e.g. for benchmarks)
+DB_PATH = os.environ.get("SCHOOL_DB_PATH", "database.db")
+
+# Number of idle connections kept per database file and the cap on
+# connections handed out to background work at the same time
+POOL_SIZE = int(os.environ.get("SCHOOL_DB_POOL_SIZE", "8"))
+
+# Set SCHOOL_DB_POOL=0 to fall back to one connection per call (used by the benchmark)
+POOL_ENABLED = os.environ.get("SCHOOL_DB_POOL", "1") != "0"
+
+# Applied once, when a connection is first opened. foreign_keys is left off on
+# purpose: the legacy schema has references (e.g. grades -> student_new) that
+# the application does not keep consistent.
+CONNECTION_PRAGMAS = (
+    "PRAGMA journal_mode = WAL",
+    "PRAGMA synchronous = NORMAL",
+    "PRAGMA busy_timeout = 5000",
+    "PRAGMA temp_store = MEMORY",
+    "PRAGMA cache_size = -16000",
+)
+
+STATEMENT_CACHE_SIZE = 256
+
+
+class PooledConnection(sqlite3.Connection):
+    """sqlite3 connection owned by a pool.
+
+    close() does not close the underlying handle: it rolls back anything the
+    caller left uncommitted and keeps the connection (and its prepared
+    statement cache) for the next call on the same thread.
+    """
+
+    pooled = True
+
+    # Cursors record every statement (see query_log.py); Connection.execute
+    # does not go through cursor(), so the shortcuts are routed here too
+    def cursor(self, factory=None):
+        return super().cursor(factory or query_log.cursor_class())
+
+    def execute(self, sql, parameters=()):
+        return self.cursor().execute(sql, parameters)
+
+    def executemany(self, sql, seq_of_parameters):
+        return self.cursor().executemany(sql, seq_of_parameters)
+
+    def executescript(self, sql_script):
+        return self.cursor().executescript(sql_script)
+
+    def close(self):
+        if not self.pooled:
+            super().close()
+            return
+        if self.in_transaction:
+            self.rollback()
+
+    def _dispose(self):
+        super().close()
+
+
+class ConnectionPool:
+    """Connections for one database file.
+
+    Each thread gets one connection bound to it for its lifetime (Streamlit
+    runs every script rerun on its own thread); when the thread goes away the
+    connection goes back to the idle queue for the next thread. Background
+    work borrows connections with pooled(), bounded by POOL_SIZE.
+    """
+
+    def __init__(self, path, size=POOL_SIZE):
+        self.path = path
+        self.size = size
+        self._idle = queue.LifoQueue()
+        self._local = threading.local()
+        self._borrow_slots = threading.BoundedSemaphore(size)
+
+    def _open(self):
+        conn = sqlite3.connect(
+            self.path,
+            factory=PooledConnection,
+            check_same_thread=False,
+            cached_statements=STATEMENT_CACHE_SIZE,
+        )
+        for pragma in CONNECTION_PRAGMAS:
+            conn.execute(pragma)
+        return conn
+
+    def _take(self):
+        try:
+            return self._idle.get_nowait()
+        except queue.Empty:
+            return self._open()
+
+    def _give_back(self, conn):
+        if conn.in_transaction:
+            conn.rollback()
+        if self._idle.qsize() < self.size:
+            self._idle.put(conn)
+        else:
+            conn._dispose()
+
+    def connection(self):
+        """Return the connection bound to the calling thread."""
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = self._take()
+            self._local.conn = conn
+            weakref.finalize(threading.current_thread(), self._give_back, conn)
+        return conn
+
+    @contextmanager
+    def borrow(self):
+        """Borrow a connection for the duration of a with-block."""
+        with self._borrow_slots:
+            conn = self._take()
+            try:
+                yield conn
+            finally:
+                self._give_back(conn)
+
+    def close_idle(self):
+        while True:
+            try:
+                self._idle.get_nowait()._dispose()
+            except queue.Empty:
+                return
+
+
+_pools = {}
+_pools_lock = threading.Lock()
+_route = threading.local()
+
+
+def current_path():
+    """The database file calls without a path use: the thread's route, else DB_PATH."""
+    return getattr(_route, "path", None) or DB_PATH
+
+
+def set_route(path):
+    """Send this thread's path-less calls to `path` (None: back to DB_PATH).
+
+    The sharded layout (sharding.py) routes each rerun to the logged-in
+    user's branch shard this way.
+    """
+    _route.path = path
+
+
+@contextmanager
+def routed(path):
+    """Route this thread's path-less calls to `path` for a with-block."""
+    previous = getattr(_route, "path", None)
+    _route.path = path
+    try:
+        yield
+    finally:
+        _route.path = previous
+
+
+@contextmanager
+def lent(path, conn):
+    """Route this thread's calls to `path` through `conn`, a connection the caller owns, for a with-block.
+
+    For work that visits many files and keeps its own bounded set of
+    connections to them (sharding.fan_out) instead of binding one per file
+    to every thread.
+    """
+    previous = getattr(_route, "path", None), getattr(_route, "lent", None)
+    _route.path, _route.lent = path, (path, conn)
+    try:
+        yield conn
+    finally:
+        _route.path, _route.lent = previous
+
+
+def lent_connection(path):
+    """The connection lent() has routed `path` to on this thread, or None."""
+    lent = getattr(_route, "lent", None)
+    return lent[1] if lent is not None and lent[0] == path else None
+
+
+def open_connection(path):
+    """A new connection to `path` with the pool's settings, owned by the caller (close it with _dispose())."""
+    return get_pool(path)._open()
+
+
+def get_pool(path=None):
+    path = path or current_path()
+    pool = _pools.get(path)
+    if pool is None:
+        with _pools_lock:
+            pool = _pools.setdefault(path, ConnectionPool(path))
+    return pool
+
+
+def get_connection(path=None):
+    """Return the calling thread's connection to the application database."""
+    conn = lent_connection(path or current_path())
+    if conn is not None:
+        return conn
+    if not POOL_ENABLED:
+        conn = sqlite3.connect(path or current_path(), factory=PooledConnection)
+        conn.pooled = False
+        return conn
+    return get_pool(path).connection()
+
+
+@contextmanager
+def pooled(path=None):
+    """Borrow a connection for background work (worker threads, reports)."""
+    if not POOL_ENABLED:
+        conn = get_connection(path)
+        try:
+            yield conn
+        finally:
+            conn.close()
+        return
+    with get_pool(path).borrow() as conn:
+        yield conn
+
+
+def set_pool_enabled(enabled):
+    global POOL_ENABLED
+    POOL_ENABLED = enabled
+
+
+def close_all():
+    """Close idle connections of every pool (tests, benchmarks, shutdown)."""
+    with _pools_lock:
+        for pool in _pools.values():
+            pool.close_idle()
+        _pools.clear()
@@ -0,0 +1,344 @@
+"""Streaming CSV and Parquet exports of grades, students, scores and teachers.
+
+An export runs one query and pulls its rows CHUNK_ROWS at a time into Arrow
+record batches, which are appended to the output file as they arrive, so
+memory stays at a chunk whatever the size of the extract. Datasets, their
+columns and their filters are whitelisted.
+
+Browser downloads do not stay at a chunk: st.download_button reads the
+finished file into Streamlit's in-memory media store to serve it, so a
+download holds the whole file (about 60 MB per million grade rows as CSV,
+5 MB compressed) while it is served. Downloads are therefore capped at
+MAX_DOWNLOAD_ROWS rows (SCHOOL_EXPORT_MAX_ROWS); larger extracts are written
+on the server, which streams:
+
+    python export.py grades grades.parquet --format parquet [--branch 3]
+    python benchmark.py export   # peak memory of a 10M-row export and of a capped download
+"""
+import json
+import os
+import sys
+import tempfile
+import time
+from contextlib import nullcontext
+
+import streamlit as st
+
+import db
+
+CHUNK_ROWS = 10000
+MAX_DOWNLOAD_ROWS = int(os.environ.get("SCHOOL_EXPORT_MAX_ROWS", "1000000"))
+
+# Format -> (file extension, MIME type)
+EXPORT_FORMATS = {
+    "csv": (".csv", "text/csv"),
+    "csv.zst": (".csv.zst", "application/zstd"),
+    "parquet": (".parquet", "application/vnd.apache.parquet"),
+}
+FORMAT_LABELS = {"csv": "CSV", "csv.zst": "CSV (zstd)", "parquet": "Parquet (zstd)"}
+ZSTD_LEVEL = 3
+
+# SQLite type affinity of an exported column -> CAST target
+_CASTS = {"int": "INTEGER", "real": "REAL", "text": "TEXT"}
+
+# Students of one branch, for the branch filter of tables keyed by student_id
+_BRANCH_STUDENTS = (
+    "student_id IN (SELECT s.student_id FROM student s JOIN section sec ON s.section_id = sec.section_id "
+    "JOIN class c ON sec.class_id = c.class_id WHERE c.branch_id = ?)"
+)
+
+# Dataset -> label, FROM clause, the tables it reads (for the cached row
+# count), (column, SQL expression, type) in export order, filter name ->
+# condition with one parameter, and ORDER BY. Passwords
+# are never exported.
+EXPORTS = {
+    "grades": {
+        "label": "Grades",
+        "from": "grades",
+        "tables": ("grades", "student", "section", "class"),
+        "columns": (
+            ("grade_id", "grade_id", "int"),
+            ("student_id", "student_id", "int"),
+            ("student_name", "student_name", "text"),
+            ("subject", "subject", "text"),
+            ("chapter", "chapter", "text"),
+            ("section", "section", "text"),
+            ("grade", "grade", "int"),
+        ),
+        "filters": {
+            "branch_id": _BRANCH_STUDENTS,
+            "subject": "subject = ?",
+            "section": "section = ?",
+            "grade_ids": "grade_id IN (SELECT value FROM json_each(?))",
+        },
+        "order": "grades.grade_id",
+    },
+    "students": {
+        "label": "Students",
+        "tables": ("student", "section", "class", "branch"),
+        "from": (
+            "student s JOIN section sec ON s.section_id = sec.section_id "
+            "JOIN class c ON sec.class_id = c.class_id LEFT JOIN branch b ON c.branch_id = b.branch_id"
+        ),
+        "columns": (
+            ("student_id", "s.student_id", "int"),
+            ("student_name", "s.student_name", "text"),
+            ("roll_number", "s.roll_number", "text"),
+            ("gender", "s.gender", "text"),
+            ("dob", "s.dob", "text"),
+            ("phone_number", "s.phone_number", "text"),
+            ("email", "s.email", "text"),
+            ("address", "s.address", "text"),
+            ("father_name", "s.father_name", "text"),
+            ("mother_name", "s.mother_name", "text"),
+            ("section", "sec.section_name", "text"),
+            ("class", "c.class_name", "text"),
+            ("grade", "c.grade", "int"),
+            ("branch_id", "c.branch_id", "int"),
+            ("branch", "b.branch_name", "text"),
+        ),
+        "filters": {
+            "branch_id": "c.branch_id = ?",
+            "section_id": "s.section_id = ?",
+        },
+        "order": "s.student_id",
+    },
+    "scores": {
+        "label": "Scores",
+        "from": "scores",
+        "tables": ("scores", "student", "section", "class"),
+        "columns": (
+            ("score_id", "score_id", "int"),
+            ("student_id", "student_id", "int"),
+            ("subject_id", "subject_id", "int"),
+            ("math", "math", "real"),
+            ("science", "science", "real"),
+        ),
+        "filters": {
+            "branch_id": _BRANCH_STUDENTS,
+        },
+        "order": "scores.score_id",
+    },
+    "teachers": {
+        "label": "Teachers",
+        "from": "teachers",
+        "tables": ("teachers",),
+        "columns": (
+            ("teacher_id", "teacher_id", "int"),
+            ("teacher_name", "teacher_name", "text"),
+            ("branch_id", "branch_id", "int"),
+            ("email", "email", "text"),
+            ("subject", "subject", "text"),
+            ("classes", "classes", "text"),
+        ),
+        "filters": {
+            "branch_id": "branch_id = ?",
+        },
+        "order": "teachers.teacher_id",
+    },
+}
+
+
+class ExportReport:
+    """Outcome of an export."""
+
+    def __init__(self):
+        self.rows = 0
+        self.bytes = 0
+        self.seconds = 0.0
+
+
+def export_columns(dataset):
+    return [column for column, _, _ in EXPORTS[dataset]["columns"]]
+
+
+def export_sql(dataset, columns=None, filters=None):
+    """SQL, parameters and (column, type) pairs of an export.
+
+    Raises ValueError for unknown columns or filters.
+    """
+    spec = EXPORTS[dataset]
+    available = {column: (expression, kind) for column, expression, kind in spec["columns"]}
+    columns = list(columns or available)
+    unknown = [c for c in columns if c not in available]
+    if unknown or not columns:
+        raise ValueError(f"Unknown export column or filter: {', '.join(unknown) or '(no columns)'}")
+
+    where, params = _where(spec, filters)
+    # CAST pins every value to its column's type, so rows whose stored type
+    # differs (SQLite is dynamically typed) still fit the Arrow schema
+    select = ", ".join(f"CAST({available[c][0]} AS {_CASTS[available[c][1]]}) AS {c}" for c in columns)
+    sql = f"SELECT {select} FROM {spec['from']} {where} ORDER BY {spec['order']}"
+    return sql, params, [(c, available[c][1]) for c in columns]
+
+
+# WHERE clause (empty without filters) and parameters of the filters that
+# are set; raises ValueError for unknown ones
+def _where(spec, filters):
+    filters = {name: value for name, value in (filters or {}).items() if value is not None}
+    unknown = [name for name in filters if name not in spec["filters"]]
+    if unknown:
+        raise ValueError(f"Unknown export column or filter: {', '.join(unknown)}")
+    where = " AND ".join(spec["filters"][name] for name in filters)
+    params = [json.dumps(list(value)) if name == "grade_ids" else value for name, value in filters.items()]
+    return ("WHERE " + where if where else ""), params
+
+
+def export_count(dataset, filters=None, db_path=None):
+    """Rows an export would write (cached until its tables change)."""
+    import query_cache
+    spec = EXPORTS[dataset]
+    where, params = _where(spec, filters)
+    rows = query_cache.fetchall(f"SELECT COUNT(*) FROM {spec['from']} {where}", params, tables=spec["tables"],
+                                path=db_path)
+    return rows[0][0]
+
+
+def _schema(columns):
+    import pyarrow as pa
+    types = {"int": pa.int64(), "real": pa.float64(), "text": pa.string()}
+    return pa.schema([(name, types[kind]) for name, kind in columns])
+
+
+# Open the Arrow writer for a format; returns (writer, sink) where sink is
+# the stream to close after the writer (or None)
+def _open_writer(path, fmt, schema):
+    import pyarrow as pa
+    if fmt == "parquet":
+        import pyarrow.parquet as pq
+        return pq.ParquetWriter(path, schema, compression="zstd", compression_level=ZSTD_LEVEL), None
+    import pyarrow.csv as pacsv
+    if fmt == "csv.zst":
+        sink = pa.CompressedOutputStream(pa.OSFile(path, "wb"), "zstd")
+    else:
+        sink = pa.OSFile(path, "wb")
+    return pacsv.CSVWriter(sink, schema), sink
+
+
+def write_export(path, dataset, fmt="csv", columns=None, filters=None, chunk_rows=CHUNK_ROWS, db_path=None):
+    """Stream an export to `path`; returns an ExportReport."""
+    import pyarrow as pa
+    if fmt not in EXPORT_FORMATS:
+        raise ValueError(f"Unknown export format: {fmt}")
+    start = time.perf_counter()
+    report = ExportReport()
+    sql, params, typed_columns = export_sql(dataset, columns, filters)
+    schema = _schema(typed_columns)
+
+    # A pooled connection of its own, so the download callback (which runs
+    # on another thread) never shares the page's connection
+    with db.pooled(db_path) as connection:
+        cursor = connection.execute(sql, params)
+        writer, sink = _open_writer(path, fmt, schema)
+        try:
+            while True:
+                rows = cursor.fetchmany(chunk_rows)
+                if not rows:
+                    break
+                arrays = [pa.array(values, type=field.type) for values, field in zip(zip(*rows), schema)]
+                writer.write_batch(pa.RecordBatch.from_arrays(arrays, schema=schema))
+                report.rows += len(rows)
+                del rows, arrays
+        finally:
+            writer.close()
+            if sink is not None:
+                sink.close()
+
+    report.bytes = os.path.getsize(path)
+    report.seconds = time.perf_counter() - start
+    return report
+
+
+def export_to_file(dataset, fmt="csv", columns=None, filters=None, db_path=None):
+    """Write an export to a temporary file and return it open for reading.
+
+    The file is unlinked at once, so it disappears when the handle is closed.
+    """
+    extension, _ = EXPORT_FORMATS[fmt]
+    handle, path = tempfile.mkstemp(prefix=f"export_{dataset}_", suffix=extension)
+    os.close(handle)
+    try:
+        write_export(path, dataset, fmt, columns, filters, db_path=db_path)
+        return open(path, "rb", buffering=0)
+    finally:
+        os.unlink(path)
+
+
+def export_download(dataset, file_stem, filters=None, key="export", default_columns=None):
+    """Format and column pickers and a download button for one export.
+
+    The export is only written when the button is clicked. Exports over
+    MAX_DOWNLOAD_ROWS get the command that writes them on the server instead.
+    """
+    col1, col2 = st.columns([1, 3])
+    with col1:
+        fmt = st.selectbox("Format", list(EXPORT_FORMATS), format_func=FORMAT_LABELS.get, key=f"{key}_format")
+    with col2:
+        columns = st.multiselect("Columns", export_columns(dataset), default=default_columns or export_columns(dataset),
+                                 key=f"{key}_columns")
+    if not columns:
+        st.warning("Select at least one column to export.")
+        return
+    # The button calls data() off the script thread, where this rerun's
+    # route (the branch shard in the sharded layout) does not apply
+    path = db.current_path()
+    rows = export_count(dataset, filters, path)
+    if rows > MAX_DOWNLOAD_ROWS:
+        branch = (filters or {}).get("branch_id")
+        st.warning(
+            f"{rows:,} rows is over the {MAX_DOWNLOAD_ROWS:,}-row limit for browser downloads, which are held in "
+            f"memory while they are served. Narrow the selection, or write the file on the server with "
+            f"`python export.py {dataset} <file> --format {fmt}{f' --branch {branch}' if branch is not None else ''}`."
+        )
+        return
+    extension, mime = EXPORT_FORMATS[fmt]
+    st.download_button(
+        label=f"Download {EXPORTS[dataset]['label']} ({FORMAT_LABELS[fmt]}, {rows:,} rows)",
+        data=lambda: export_to_file(dataset, fmt, columns, filters, db_path=path),
+        file_name=f"{file_stem}{extension}",
+        mime=mime,
+        key=f"{key}_download",
+    )
+
+
+# Network-wide or single-branch extracts of any dataset (superadmin). In the
+# sharded layout a branch's rows are in its shard, so exports are per branch.
+def export_page(branches):
+    import sharding
+    st.subheader("Data Exports")
+    dataset = st.selectbox("Dataset", list(EXPORTS), format_func=lambda name: EXPORTS[name]["label"],
+                           key="export_page_dataset")
+    branch_names = dict(branches) if sharding.enabled() else {None: "All branches", **dict(branches)}
+    if not branch_names:
+        st.info("No branches yet.")
+        return
+    branch_id = st.selectbox("Branch", list(branch_names), format_func=branch_names.get, key="export_page_branch")
+    if sharding.enabled():
+        st.caption("Branches are stored in separate shards, so each export covers one branch.")
+    stem = dataset if branch_id is None else f"{dataset}_branch_{branch_id}"
+    with sharding.branch_route(branch_id) if branch_id is not None else nullcontext():
+        export_download(dataset, stem, filters={"branch_id": branch_id}, key="export_page")
+
+
+def main(argv=None):
+    import argparse
+    parser = argparse.ArgumentParser(description="Stream an export to a file on the server.")
+    parser.add_argument("dataset", choices=list(EXPORTS))
+    parser.add_argument("path")
+    parser.add_argument("--format", choices=list(EXPORT_FORMATS), default="csv")
+    parser.add_argument("--branch", type=int, help="only this branch's rows")
+    parser.add_argument("--columns", nargs="+", help="default: every column")
+    args = parser.parse_args(argv)
+    import migrations
+    migrations.ensure_migrated()
+    try:
+        report = write_export(args.path, args.dataset, args.format, args.columns, {"branch_id": args.branch})
+    except (ValueError, OSError) as e:
+        print(f"Could not export {args.dataset}: {e}")
+        return 1
+    print(f"{report.rows:,} rows ({report.bytes / 1024 ** 2:.1f} MB) written to {args.path} in {report.seconds:.1f}s")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,89 @@
+"""Process-wide cache of rendered charts, keyed on the data they show.
+
+A chart is built by a function of DataFrames and plain parameters. The
+cache key is that function plus a hash of the frames' contents and the
+parameters, so a rerun (or another session) with the same data skips the
+build: px.* figure construction is ~100 ms per chart, re-reading cached
+plotly JSON ~15 ms. Plotly figures are stored as JSON and matplotlib
+figures as PNG bytes, evicted least recently used beyond
+SCHOOL_FIGURE_CACHE_MB.
+
+Builders must depend only on their arguments.
+
+    python benchmark.py figures
+"""
+import hashlib
+import json
+import os
+
+import streamlit as st
+
+from query_cache import LRUCache
+
+FIGURE_BUDGET_BYTES = int(float(os.environ.get("SCHOOL_FIGURE_CACHE_MB", "32")) * 1024 * 1024)
+
+_cache = LRUCache(FIGURE_BUDGET_BYTES)
+
+
+def fingerprint(*parts):
+    """Hash of DataFrames/Series (contents, index, columns and dtypes) and plain values."""
+    import pandas as pd
+    digest = hashlib.blake2b(digest_size=16)
+    for part in parts:
+        if isinstance(part, (pd.DataFrame, pd.Series)):
+            columns = list(part.columns) if isinstance(part, pd.DataFrame) else [part.name]
+            dtypes = part.dtypes.astype(str).tolist() if isinstance(part, pd.DataFrame) else [str(part.dtype)]
+            digest.update(repr((type(part).__name__, columns, dtypes, len(part))).encode())
+            digest.update(pd.util.hash_pandas_object(part, index=True).to_numpy().tobytes())
+        else:
+            digest.update(json.dumps(part, sort_keys=True, default=repr).encode())
+        digest.update(b"\0")
+    return digest.hexdigest()
+
+
+def _key(kind, build, data, params):
+    code = build.__code__
+    return (kind, build.__module__, build.__qualname__, code.co_firstlineno, fingerprint(*data, params))
+
+
+def plotly_figure(build, *data, **params):
+    """build(*data, **params), cached as plotly JSON."""
+    import plotly.io as pio
+    key = _key("plotly", build, data, params)
+    spec = _cache.get(key)
+    if spec is None:
+        spec = build(*data, **params).to_json()
+        _cache.put(key, spec, len(spec))
+    return pio.from_json(spec)
+
+
+def plotly_chart(build, *data, **params):
+    st.plotly_chart(plotly_figure(build, *data, **params))
+
+
+def png(build, *data, dpi=100, **params):
+    """PNG bytes of the matplotlib figure build(*data, **params), cached."""
+    key = _key("png", build, data, dict(params, dpi=dpi))
+    image = _cache.get(key)
+    if image is None:
+        import io
+        import matplotlib.pyplot as plt
+        fig = build(*data, **params)
+        buffer = io.BytesIO()
+        fig.savefig(buffer, format="png", dpi=dpi, bbox_inches="tight")
+        plt.close(fig)
+        image = buffer.getvalue()
+        _cache.put(key, image, len(image))
+    return image
+
+
+def pyplot(build, *data, dpi=100, **params):
+    st.image(png(build, *data, dpi=dpi, **params))
+
+
+def stats():
+    return _cache.stats()
+
+
+def clear():
+    _cache.clear()
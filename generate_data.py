@@ -0,0 +1,405 @@
+"""Synthetic school data at a chosen scale factor, the standard dataset for performance work.
+
+Scale factor 1 is 10 branches and 20,000 students and both grow linearly
+(SF100: 1,000 branches and 2M students). Every branch teaches grades 1-10,
+one class per grade split into sections of about SECTION_SIZE students, with
+a teacher per subject for every few sections and the SUBJECTS curriculum
+(chapters, topics, outcomes and which topics were evaluated). Each student
+has a score row and a grade for every chapter the branch has taught so far.
+Grades combine the student's ability, their aptitude for the subject, the
+branch and the chapter's difficulty, so averages, pass rates and rankings
+spread the way real ones do.
+
+The same --sf and --seed always produce the same database. The target file
+must not exist yet (or pass --force): the load drops the triggers and
+secondary indexes, inserts with executemany, and recreates the indexes and
+the derived tables (branch_rollup, agg_cube, the full-text indexes) once at
+the end.
+
+    python generate_data.py --sf 1            # writes school_sf1.db
+    SCHOOL_DB_PATH=school_sf1.db streamlit run login.py
+    python benchmark.py generate
+"""
+import argparse
+import os
+import sqlite3
+import sys
+import time
+
+import numpy as np
+
+import migrations
+
+BRANCHES_PER_SF = 10
+STUDENTS_PER_SF = 20000
+GRADE_LEVELS = tuple(range(1, 11))
+SECTION_SIZE = 40
+SECTIONS_PER_TEACHER = 6
+TOPICS_PER_CHAPTER = 4
+# Ages are those at the start of this academic year
+REFERENCE_YEAR = 2025
+DEFAULT_SEED = 42
+BRANCHES_PER_COMMIT = 20
+
+# Subject -> chapters in teaching order
+SUBJECTS = {
+    "Mathematics": ("Numbers", "Algebra", "Geometry", "Measurement", "Data Handling", "Ratio and Proportion"),
+    "Science": ("Living World", "Matter", "Forces and Motion", "Energy", "Light and Sound", "Earth and Space"),
+    "English": ("Reading", "Grammar", "Vocabulary", "Writing", "Poetry", "Literature"),
+    "Social Studies": ("History", "Geography", "Civics", "Economics", "Culture", "Map Work"),
+    "Computer Science": ("Computer Basics", "Algorithms", "Programming", "Data Structures", "Networks", "Internet Safety"),
+}
+TOPIC_KINDS = ("Introduction", "Key Concepts", "Practice", "Assessment")
+# Share of a chapter's topics already evaluated, by chapter position
+EVALUATED_SHARE = (0.95, 0.85, 0.65, 0.45, 0.25, 0.1)
+
+# City -> relative number of branches
+CITIES = {
+    "Hyderabad": 30, "Bengaluru": 22, "Chennai": 18, "Pune": 12, "Warangal": 6, "Nalgonda": 4,
+    "Vijayawada": 6, "Visakhapatnam": 7, "Mysuru": 4, "Coimbatore": 5,
+}
+MALE_NAMES = (
+    "Aarav", "Arjun", "Vihaan", "Rohan", "Karthik", "Rahul", "Aditya", "Siddharth", "Nikhil", "Varun",
+    "Rajesh", "Suresh", "Anil", "Kiran", "Ravi", "Manoj", "Vikram", "Harish", "James", "David",
+)
+FEMALE_NAMES = (
+    "Ananya", "Diya", "Priya", "Sneha", "Kavya", "Meera", "Aisha", "Pooja", "Lakshmi", "Divya",
+    "Sunita", "Anjali", "Shreya", "Nandini", "Swathi", "Keerthi", "Radha", "Deepa", "Emily", "Sarah",
+)
+LAST_NAMES = (
+    "Reddy", "Rao", "Sharma", "Kumar", "Naidu", "Iyer", "Nair", "Patel", "Gupta", "Singh",
+    "Verma", "Menon", "Pillai", "Chowdary", "Varma", "Joshi", "Das", "Khan", "Thomas", "Fernandes",
+)
+STREETS = (
+    "MG Road", "Station Road", "Temple Street", "Lake View Road", "Gandhi Nagar", "Nehru Street",
+    "Park Avenue", "Market Road", "Main Road", "Church Street", "Hill Colony", "Ring Road",
+)
+GENDERS = ("Male", "Female", "Other")
+GENDER_SHARES = (0.49, 0.49, 0.02)
+EMAIL_SHARE = 0.7
+MISSING_GRADE_SHARE = 0.03
+
+# Table -> columns the generator fills, in insert order (parents first)
+COLUMNS = {
+    "branch": ("branch_id", "branch_name", "location", "contact_number"),
+    "class": ("class_id", "class_name", "branch_id", "grade"),
+    "section": ("section_id", "class_id", "section_name"),
+    "subject": ("subject_id", "subject_name", "description", "branch_id", "class_id"),
+    "chapter": ("chapter_id", "class_id", "chapter_name", "description"),
+    "topic": ("topic_id", "topic_name", "description"),
+    "topic_outcome": ("topic_id", "expected_outcome"),
+    "topic_association": ("topic_id", "subject_id", "chapter_id"),
+    "evaluation": ("evaluation_id", "topic_id", "is_evaluated"),
+    "teachers": ("teacher_id", "teacher_name", "branch_id", "email", "subject", "password", "classes"),
+    "student": (
+        "student_id", "section_id", "student_name", "roll_number", "father_name", "mother_name", "gender",
+        "phone_number", "dob", "address", "email",
+    ),
+    "scores": ("score_id", "student_id", "subject_id", "math", "science"),
+    "grades": ("grade_id", "student_id", "student_name", "subject", "chapter", "section", "grade"),
+}
+INSERT_SQL = {
+    table: f"INSERT INTO {table} ({', '.join(columns)}) VALUES ({', '.join('?' for _ in columns)})"
+    for table, columns in COLUMNS.items()
+}
+
+# Only this generator writes the file while it loads, and a failed load is
+# thrown away, so the journal is off
+LOAD_PRAGMAS = (
+    "PRAGMA journal_mode = OFF",
+    "PRAGMA synchronous = OFF",
+    "PRAGMA cache_size = -200000",
+)
+
+
+def scale(sf):
+    """(branches, students) at scale factor `sf`."""
+    return max(1, round(BRANCHES_PER_SF * sf)), max(1, round(STUDENTS_PER_SF * sf))
+
+
+def default_path(sf):
+    return f"school_sf{sf:g}.db"
+
+
+# Students per branch: lognormal weights (a few large campuses, many small
+# ones) rounded so they add up to exactly `students`
+def _branch_sizes(rng, branches, students):
+    weights = rng.lognormal(0.0, 0.4, branches)
+    shares = weights / weights.sum() * students
+    sizes = np.floor(shares).astype(np.int64)
+    sizes[np.argsort(sizes - shares)[: students - sizes.sum()]] += 1
+    return sizes
+
+
+def _section_name(position):
+    return chr(ord("A") + position) if position < 26 else f"S{position + 1}"
+
+
+def _names(rng, first_names, size):
+    return np.asarray(first_names, dtype=object)[rng.integers(0, len(first_names), size)]
+
+
+class Curriculum:
+    """Topics shared by every branch, with their outcomes, evaluation and difficulty.
+
+    A branch's chapters and subjects are its own rows; they are associated
+    with the same topic ids at every branch.
+    """
+
+    def __init__(self, seed):
+        rng = np.random.default_rng([seed, 0])
+        shape = (len(GRADE_LEVELS), len(SUBJECTS), max(len(c) for c in SUBJECTS.values()))
+        # Difficulty of each chapter, in grade points; later chapters are harder
+        self.difficulty = rng.normal(0.0, 0.4, shape) + np.linspace(-0.3, 0.3, shape[2])
+        self.topic_ids = np.zeros(shape + (TOPICS_PER_CHAPTER,), dtype=np.int64)
+        self.topics, self.outcomes, self.evaluations = [], [], []
+        for g, grade in enumerate(GRADE_LEVELS):
+            for s, (subject, chapters) in enumerate(SUBJECTS.items()):
+                for c, chapter in enumerate(chapters):
+                    for k, kind in enumerate(TOPIC_KINDS):
+                        topic_id = len(self.topics) + 1
+                        name = f"{chapter} {grade}.{k + 1}: {kind}"
+                        self.topic_ids[g, s, c, k] = topic_id
+                        self.topics.append((topic_id, name, f"{kind} of {chapter.lower()} in grade {grade} {subject}"))
+                        self.outcomes.append((topic_id, f"Students can explain and apply {chapter.lower()} ({kind.lower()})"))
+                        evaluated = int(rng.random() < EVALUATED_SHARE[min(c, len(EVALUATED_SHARE) - 1)])
+                        self.evaluations.append((topic_id, topic_id, evaluated))
+
+    def rows(self):
+        return {"topic": self.topics, "topic_outcome": self.outcomes, "evaluation": self.evaluations}
+
+
+# Rows of every table for branch number `number` (1-based) with `size`
+# students. Ids continue from `ids` (table -> next id), which is updated.
+def branch_rows(seed, number, size, curriculum, ids):
+    rng = np.random.default_rng([seed, number])
+    rows = {table: [] for table in COLUMNS}
+    branch_id = ids["branch"]
+    ids["branch"] += 1
+    city = list(CITIES)[rng.choice(len(CITIES), p=np.array(list(CITIES.values())) / sum(CITIES.values()))]
+    rows["branch"].append((branch_id, f"{city} Campus {number}", city, str(rng.integers(6_000_000_000, 10_000_000_000))))
+
+    # Enrolment thins out slightly in the higher grades
+    grade_weights = np.linspace(1.0, 0.85, len(GRADE_LEVELS))
+    per_grade = rng.multinomial(size, grade_weights / grade_weights.sum())
+    subject_names = list(SUBJECTS)
+    chapters_taught = int(rng.integers(2, 6))
+    branch_effect = rng.normal(0.0, 0.3)
+
+    student_grade, student_section, student_label, student_roll = [], [], [], []
+    class_subjects = {}
+    section_labels = []
+    for g, (grade, count) in enumerate(zip(GRADE_LEVELS, per_grade)):
+        class_id = ids["class"]
+        ids["class"] += 1
+        rows["class"].append((class_id, f"Class {grade}", branch_id, grade))
+
+        subject_ids = []
+        for s, (subject, chapters) in enumerate(SUBJECTS.items()):
+            subject_id = ids["subject"]
+            ids["subject"] += 1
+            subject_ids.append(subject_id)
+            rows["subject"].append((subject_id, subject, f"{subject} for grade {grade}", branch_id, class_id))
+            for c, chapter in enumerate(chapters):
+                chapter_id = ids["chapter"]
+                ids["chapter"] += 1
+                rows["chapter"].append((chapter_id, class_id, chapter, f"{subject}, grade {grade}, chapter {c + 1}"))
+                rows["topic_association"].extend(
+                    (int(topic_id), subject_id, chapter_id) for topic_id in curriculum.topic_ids[g, s, c]
+                )
+        class_subjects[g] = subject_ids
+
+        sections = max(1, round(count / SECTION_SIZE))
+        for position, members in enumerate(np.array_split(np.arange(count), sections)):
+            section_id = ids["section"]
+            ids["section"] += 1
+            name = _section_name(position)
+            rows["section"].append((section_id, class_id, name))
+            section_labels.append(f"Class {grade}-{name}")
+            student_grade.extend([g] * len(members))
+            student_section.extend([section_id] * len(members))
+            student_label.extend([f"Section {name}"] * len(members))
+            student_roll.extend(f"B{branch_id}-{grade}{name}-{m + 1:03d}" for m in range(len(members)))
+
+    # Teachers: one per subject for every SECTIONS_PER_TEACHER sections
+    for subject in subject_names:
+        teachers = -(-len(section_labels) // SECTIONS_PER_TEACHER)
+        for t in range(teachers):
+            teacher_id = ids["teachers"]
+            ids["teachers"] += 1
+            given = MALE_NAMES if rng.random() < 0.45 else FEMALE_NAMES
+            first = given[rng.integers(0, len(given))]
+            last = LAST_NAMES[rng.integers(0, len(LAST_NAMES))]
+            rows["teachers"].append((
+                teacher_id, f"{first} {last}", branch_id, f"{first}.{last}.{teacher_id}@staff.example".lower(),
+                subject, "changeme", ", ".join(section_labels[t::teachers]),
+            ))
+
+    if size == 0:
+        return rows
+
+    student_ids = np.arange(ids["student"], ids["student"] + size)
+    ids["student"] += size
+    grade_index = np.asarray(student_grade)
+    gender = np.asarray(GENDERS, dtype=object)[rng.choice(len(GENDERS), size, p=GENDER_SHARES)]
+    first = np.where(gender == "Female", _names(rng, FEMALE_NAMES, size), _names(rng, MALE_NAMES, size))
+    other = gender == "Other"
+    first[other] = np.where(rng.random(other.sum()) < 0.5, _names(rng, FEMALE_NAMES, other.sum()),
+                            _names(rng, MALE_NAMES, other.sum()))
+    last = _names(rng, LAST_NAMES, size)
+    names = first + " " + last
+    fathers = _names(rng, MALE_NAMES, size) + " " + last
+    mothers = _names(rng, FEMALE_NAMES, size) + " " + last
+    phones = rng.integers(6_000_000_000, 10_000_000_000, size).astype(str)
+    # Born in the year that makes a grade-g student g + 5, on any day
+    birth_years = (REFERENCE_YEAR - 5 - np.asarray(GRADE_LEVELS)[grade_index] - 1970).astype("datetime64[Y]")
+    dobs = (birth_years.astype("datetime64[D]") + rng.integers(0, 365, size)).astype(str)
+    houses = rng.integers(1, 400, size)
+    streets = _names(rng, STREETS, size)
+    has_email = rng.random(size) < EMAIL_SHARE
+    rows["student"] = [
+        (int(student_id), section_id, name, roll, father, mother, g, phone, dob,
+         f"{house}, {street}, {city}", f"{fn}.{ln}{student_id}@students.example".lower() if email else None)
+        for student_id, section_id, name, roll, father, mother, g, phone, dob, house, street, fn, ln, email in zip(
+            student_ids, student_section, names, student_roll, fathers, mothers, gender, phones, dobs,
+            houses, streets, first, last, has_email,
+        )
+    ]
+
+    ability = rng.normal(0.0, 1.0, size) + branch_effect
+    aptitude = rng.normal(0.0, 0.6, (size, len(SUBJECTS)))
+    subject_ids = np.asarray([class_subjects[g] for g in range(len(GRADE_LEVELS))])[grade_index]
+    math, science = subject_names.index("Mathematics"), subject_names.index("Science")
+    percentages = np.clip(np.round(65 + 15 * (ability[:, None] + aptitude[:, [math, science]])
+                                   + rng.normal(0, 5, (size, 2)), 1), 0, 100)
+    rows["scores"] = [
+        (int(score_id), int(student_id), int(subject_id), float(m), float(sc))
+        for score_id, student_id, subject_id, (m, sc) in zip(
+            range(ids["scores"], ids["scores"] + size), student_ids, subject_ids[:, math], percentages,
+        )
+    ]
+    ids["scores"] += size
+
+    # Grades out of 10 for the chapters taught so far, a few left ungraded
+    student_label = np.asarray(student_label, dtype=object)
+    for s, (subject, chapters) in enumerate(SUBJECTS.items()):
+        for c, chapter in enumerate(chapters[:chapters_taught]):
+            marks = (6.0 + 1.5 * ability + aptitude[:, s] - curriculum.difficulty[grade_index, s, c]
+                     + rng.normal(0.0, 1.0, size))
+            marks = np.clip(np.rint(marks), 1, 10).astype(np.int64)
+            graded = np.flatnonzero(rng.random(size) >= MISSING_GRADE_SHARE)
+            first_id = ids["grades"]
+            ids["grades"] += len(graded)
+            rows["grades"].extend(
+                (grade_id, int(student_id), name, subject, chapter, section, int(mark))
+                for grade_id, student_id, name, section, mark in zip(
+                    range(first_id, ids["grades"]), student_ids[graded], names[graded],
+                    student_label[graded], marks[graded],
+                )
+            )
+    return rows
+
+
+# Drop every trigger and the secondary indexes of the generated tables;
+# returns the SQL that recreates them, indexes first
+def _suspend(cursor):
+    tables = ", ".join(f"'{table}'" for table in COLUMNS)
+    objects = cursor.execute(f"""
+    SELECT type, name, sql FROM sqlite_master
+    WHERE type = 'trigger' OR (type = 'index' AND sql IS NOT NULL AND tbl_name IN ({tables}))
+    ORDER BY type = 'trigger'
+    """).fetchall()
+    for kind, name, _ in objects:
+        cursor.execute(f"DROP {kind.upper()} {name}")
+    return [sql for _, _, sql in objects]
+
+
+# Recompute everything the suspended triggers would have maintained
+def _rebuild_derived(cursor):
+    import cube
+    import query_cache
+    import rollup
+    import search_index
+    rollup.rebuild_branch_rollup(cursor)
+    search_index.rebuild_student_search(cursor)
+    search_index.rebuild_curriculum_search(cursor)
+    cube.rebuild_cube(cursor)
+    for table in query_cache.TRACKED_TABLES:
+        query_cache.bump_version(cursor, table)
+
+
+def generate(path, sf=1, seed=DEFAULT_SEED, progress=print):
+    """Create the database at `path` (which must not exist) at scale factor `sf`.
+
+    Returns table -> row count plus "seconds".
+    """
+    if os.path.exists(path):
+        raise FileExistsError(f"{path} already exists")
+    start = time.perf_counter()
+    branches, students = scale(sf)
+    sizes = _branch_sizes(np.random.default_rng([seed, 1]), branches, students)
+    curriculum = Curriculum(seed)
+
+    connection = sqlite3.connect(path)
+    try:
+        for pragma in LOAD_PRAGMAS:
+            connection.execute(pragma)
+        migrations.migrate(connection)
+        cursor = connection.cursor()
+        cursor.execute("BEGIN")
+        recreate = _suspend(cursor)
+        ids = {table: 1 + cursor.execute(f"SELECT COALESCE(MAX(rowid), 0) FROM {table}").fetchone()[0]
+               for table in COLUMNS}
+        counts = dict.fromkeys(COLUMNS, 0)
+        for table, rows in curriculum.rows().items():
+            cursor.executemany(INSERT_SQL[table], rows)
+            counts[table] += len(rows)
+
+        for number, size in enumerate(sizes, start=1):
+            for table, rows in branch_rows(seed, number, int(size), curriculum, ids).items():
+                cursor.executemany(INSERT_SQL[table], rows)
+                counts[table] += len(rows)
+            if number % BRANCHES_PER_COMMIT == 0 or number == branches:
+                connection.commit()
+                progress(f"{number:,}/{branches:,} branches, {counts['student']:,} students, "
+                         f"{counts['grades']:,} grades ({time.perf_counter() - start:.0f}s)")
+                cursor.execute("BEGIN")
+
+        progress(f"Recreating {len(recreate)} indexes and triggers and the derived tables")
+        for sql in recreate:
+            cursor.execute(sql)
+        _rebuild_derived(cursor)
+        connection.commit()
+        connection.execute("PRAGMA journal_mode = WAL")
+        connection.execute("PRAGMA optimize")
+    finally:
+        connection.close()
+    counts["seconds"] = time.perf_counter() - start
+    return counts
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Generate a synthetic school database.")
+    parser.add_argument("--sf", type=float, default=1.0, help="scale factor (1 = 10 branches, 20,000 students)")
+    parser.add_argument("--seed", type=int, default=DEFAULT_SEED)
+    parser.add_argument("--db", help="output file (default school_sf<SF>.db)")
+    parser.add_argument("--force", action="store_true", help="replace the output file if it exists")
+    args = parser.parse_args(argv)
+
+    path = args.db or default_path(args.sf)
+    if os.path.exists(path):
+        if not args.force:
+            print(f"{path} already exists; pass --force to replace it.")
+            return 1
+        for suffix in ("", "-wal", "-shm"):
+            if os.path.exists(path + suffix):
+                os.unlink(path + suffix)
+
+    counts = generate(path, args.sf, args.seed)
+    seconds = counts.pop("seconds")
+    print(f"{path}: {', '.join(f'{count:,} {table}' for table, count in counts.items())} in {seconds:.1f}s")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,127 @@
+"""Index advisor: runs EXPLAIN QUERY PLAN over the app's SQL and flags full scans.
+
+    python index_advisor.py                      # report on database.db
+    python index_advisor.py --max-scan-rows 1000 # exit 1 on an unexpected scan of a table over 1000 rows
+"""
+import argparse
+import re
+import sys
+
+import branch_dashboard
+import branchadmin
+import db
+import login
+import manage_branches
+import manage_sections_classes
+import manage_subjects
+import manage_teachers
+import migrations
+import roster
+import superadmin
+import teachers
+
+# Registry of the statements the pages run: (name, sql, sample parameters,
+# tables that are scanned on purpose, e.g. to list every branch). The SQL is
+# the pages' own, so a page edit is checked here without a copy to update.
+QUERY_REGISTRY = [
+    ("login.authenticate_user", login.AUTHENTICATE_SQL, ("super@example.com", "123"), ()),
+    ("superadmin.get_data:branch_stats", superadmin.BRANCH_STATS_SQL, (), ("branch", "branch_rollup")),
+    ("branchadmin.get_branches", branchadmin.BRANCHES_SQL, (), ("branch",)),
+    ("branch_dashboard.fetch_activity", branch_dashboard.ACTIVITY_SQL, (1, "Mathematics", 1, 5), ()),
+    ("manage_branches.display_existing_branches", manage_branches.BRANCH_ADMINS_SQL, (), ("branch",)),
+    ("manage_branches.display_branch_details", manage_branches.BRANCH_DETAILS_SQL, (1,), ()),
+    ("manage_sections_classes.get_classes_by_grade", manage_sections_classes.CLASSES_BY_GRADE_SQL, ("1",), ()),
+    ("manage_sections_classes.get_sections", manage_sections_classes.SECTIONS_SQL, (1,), ()),
+    ("manage_sections_classes.get_students", manage_sections_classes.STUDENTS_SQL, (1,), ()),
+    ("manage_teachers.get_teachers_by_subject", manage_teachers.TEACHERS_BY_SUBJECT_SQL, ("Mathematics",), ()),
+    ("manage_subjects.fetch_branches", manage_subjects.BRANCHES_SQL, (), ("branch",)),
+    ("manage_subjects.manage_subjects:chapters", manage_subjects.CHAPTERS_SQL, (), ("chapter",)),
+    ("manage_subjects.fetch_topics", manage_subjects.TOPICS_SQL, (1,), ()),
+    ("roster.section_students", roster.SECTION_STUDENTS_SQL, (1, 1, "A"), ()),
+    ("teachers.load_grade_grid", teachers.GRADE_GRID_SQL, (1, 1, "A", "Mathematics", "Section A"), ()),
+] + [
+    # Every sort order of the section roster, past the first page
+    (f"roster.fetch_page:{sort}", roster.page_sql("section", ("student_name", "roll_number"), sort, keyed=True),
+     (1, *("R" for _ in keys), 50), ())
+    for sort, keys in roster.ROSTERS["section"]["sorts"].items()
+]
+
+_TABLE_REFERENCE = re.compile(
+    r'\b(?:FROM|JOIN)\s+"?(\w+)"?(?:\s+(?:AS\s+)?"?(?!ON\b|WHERE\b|LEFT\b|JOIN\b|GROUP\b|ORDER\b|LIMIT\b|USING\b)(\w+)"?)?',
+    re.IGNORECASE,
+)
+_SCAN = re.compile(r"^SCAN (\w+)(?: USING (COVERING )?INDEX (\w+))?")
+
+
+# Map every alias used in a statement to its table name
+def table_aliases(sql):
+    aliases = {}
+    for table, alias in _TABLE_REFERENCE.findall(sql):
+        aliases[table] = table
+        if alias:
+            aliases[alias] = table
+    return aliases
+
+
+def table_rows(connection, table):
+    return connection.execute(f'SELECT COUNT(*) FROM "{table}"').fetchone()[0]
+
+
+def explain(connection, sql, params=()):
+    return [row[3] for row in connection.execute(f"EXPLAIN QUERY PLAN {sql}", params)]
+
+
+# Run EXPLAIN QUERY PLAN over every registered statement and return one
+# finding per full scan: (query name, table, rows in table, plan detail, allowed).
+# Scans of a CTE or subquery read an intermediate result, not a table.
+def advise(connection, registry=QUERY_REGISTRY):
+    findings = []
+    row_counts = {}
+    tables = {row[0] for row in connection.execute("SELECT name FROM sqlite_master WHERE type = 'table'")}
+    for name, sql, params, allowed_scans in registry:
+        aliases = table_aliases(sql)
+        for detail in explain(connection, sql, params):
+            match = _SCAN.match(detail)
+            if not match:
+                continue
+            table = aliases.get(match.group(1), match.group(1))
+            if table not in tables:
+                continue
+            if table not in row_counts:
+                row_counts[table] = table_rows(connection, table)
+            findings.append((name, table, row_counts[table], detail, table in allowed_scans))
+    return findings
+
+
+# Findings that should fail a check: unexpected scans of tables over max_rows
+def violations(findings, max_rows):
+    return [f for f in findings if not f[4] and f[2] > max_rows]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--db", default=None, help="database file (default: database.db)")
+    parser.add_argument("--max-scan-rows", type=int, default=None,
+                        help="exit with status 1 if a query scans a table with more rows than this")
+    args = parser.parse_args(argv)
+
+    migrations.ensure_migrated(args.db)
+    with db.pooled(args.db) as connection:
+        findings = advise(connection)
+
+    if not findings:
+        print("No full table scans in registered queries.")
+    for name, table, rows, detail, allowed in findings:
+        status = "expected" if allowed else "SCAN"
+        print(f"[{status:>8}] {name}: {detail} ({rows} rows)")
+
+    if args.max_scan_rows is not None:
+        failed = violations(findings, args.max_scan_rows)
+        if failed:
+            print(f"{len(failed)} registered query(ies) scan a table with more than {args.max_scan_rows} rows")
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
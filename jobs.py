@@ -0,0 +1,444 @@
+"""Background jobs for heavy reports.
+
+Jobs are rows of the job table. A page submits one with submit() (or show(),
+which also polls it) and returns at once; a worker builds the report in
+another process and writes its files to job_directory(job_id). Workers are a
+ProcessPoolExecutor fed by a dispatcher thread that claims queued jobs in
+SQLite, so several worker processes can share one queue. A failing
+job is retried up to MAX_ATTEMPTS times with a growing delay, and a job whose
+worker died is taken over once its heartbeat is STALE_SECONDS old.
+
+On every pass the dispatcher also runs the MAINTENANCE calls, such as
+recomputing the dashboard cube's changed cells or indexing bulk-imported
+students for search, so writes never wait for them and reads never do them.
+
+The job table lives in the file at SCHOOL_DB_PATH (the catalog in the
+sharded layout, see sharding.py) whatever file the page is routed to; a
+job records the routed file as the data it reads (job.data_path) and runs
+on that.
+
+Every app process starts a worker (login.main) unless SCHOOL_JOB_WORKER=0,
+in which case run a dedicated one:
+
+    python jobs.py worker        # drain the queue with every core
+    python jobs.py list          # recent jobs
+    python jobs.py prune         # delete finished jobs older than KEEP_DAYS
+    python benchmark.py jobs
+"""
+import hashlib
+import importlib
+import json
+import os
+import platform
+import shutil
+import sqlite3
+import sys
+import threading
+import time
+import traceback
+
+import db
+
+# Job kind -> "module:function". The function runs in a worker process as
+# function(params, job) and returns a JSON-serialisable result; `job` is a
+# JobContext (progress reporting and the directory for its files).
+JOB_KINDS = {
+    "branch_stats_figures": "dashboard:branch_stats_report",
+    "chapter_charts": "teachers:chapter_charts_report",
+}
+
+# "module:function" calls made with the database path on every dispatcher
+# pass, outside the queue: cheap upkeep that must not wait behind reports
+MAINTENANCE = ("cube:refresh_all", "search_index:index_all_pending")
+
+MAX_ATTEMPTS = 3
+RETRY_SECONDS = 5.0  # delay before the first retry, doubled on each one
+STALE_SECONDS = 60.0
+HEARTBEAT_SECONDS = 10.0
+POLL_SECONDS = 1.0
+KEEP_DAYS = 7
+
+WORKER_PROCESSES = int(os.environ.get("SCHOOL_JOB_PROCESSES", "0")) or os.cpu_count() or 1
+START_WORKER = os.environ.get("SCHOOL_JOB_WORKER", "1") != "0"
+
+JOB_COLUMNS = (
+    "job_id", "kind", "params", "status", "progress", "message", "result", "error",
+    "attempts", "max_attempts", "created_at", "started_at", "finished_at",
+)
+
+
+def add_data_path(cursor):
+    """Add job.data_path, the file a job reads when it is not the queue's (migration step)."""
+    if "data_path" not in [row[1] for row in cursor.execute("PRAGMA table_info(job)")]:
+        cursor.execute("ALTER TABLE job ADD COLUMN data_path TEXT")
+
+
+# The file holding the job table: `path`, else DB_PATH, never the branch
+# shard a rerun is routed to
+def _queue(path):
+    return path or db.DB_PATH
+
+
+def create_job_table(cursor):
+    """Create the job table (migration step)."""
+    cursor.execute("""
+    CREATE TABLE IF NOT EXISTS job (
+        job_id INTEGER PRIMARY KEY,
+        kind TEXT NOT NULL,
+        params TEXT NOT NULL,
+        job_key TEXT NOT NULL,
+        status TEXT NOT NULL DEFAULT 'queued',
+        progress REAL NOT NULL DEFAULT 0,
+        message TEXT,
+        result TEXT,
+        error TEXT,
+        attempts INTEGER NOT NULL DEFAULT 0,
+        max_attempts INTEGER NOT NULL DEFAULT 3,
+        run_after REAL NOT NULL DEFAULT 0,
+        heartbeat_at REAL,
+        worker TEXT,
+        created_at REAL NOT NULL,
+        started_at REAL,
+        finished_at REAL
+    )
+    """)
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_job_queue ON job(status, run_after)")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_job_key ON job(job_key)")
+
+
+def job_directory(job_id, path=None):
+    """Directory of a job's files (SCHOOL_JOB_DIR, or job_artifacts/ next to the database)."""
+    root = os.environ.get("SCHOOL_JOB_DIR") or os.path.join(
+        os.path.dirname(os.path.abspath(_queue(path))), "job_artifacts"
+    )
+    return os.path.join(root, str(job_id))
+
+
+def job_key(kind, params):
+    encoded = json.dumps(params, sort_keys=True, default=str)
+    return f"{kind}:{hashlib.sha1(encoded.encode()).hexdigest()}"
+
+
+def submit(kind, params, reuse=True, max_attempts=MAX_ATTEMPTS, path=None):
+    """Queue a job and return its id.
+
+    With `reuse`, a queued, running or finished job of the same kind,
+    parameters and data is returned instead, so a page can submit on every
+    rerun. The job reads the file this thread is routed to.
+    """
+    if kind not in JOB_KINDS:
+        raise ValueError(f"Unknown job kind: {kind}")
+    key = job_key(kind, params)
+    path = _queue(path)
+    data_path = os.path.abspath(db.current_path())
+    data_path = None if data_path == os.path.abspath(path) else data_path
+    connection = db.get_connection(path)
+    if reuse:
+        for job_id, status in connection.execute(
+            "SELECT job_id, status FROM job WHERE job_key = ? AND data_path IS ? AND status != 'failed' "
+            "ORDER BY job_id DESC LIMIT 1", (key, data_path)
+        ):
+            if status != "done":
+                ensure_worker(path)
+                return job_id
+            if os.path.isdir(job_directory(job_id, path)):
+                return job_id
+    with connection:
+        job_id = connection.execute(
+            "INSERT INTO job (kind, params, job_key, data_path, max_attempts, created_at) VALUES (?, ?, ?, ?, ?, ?)",
+            (kind, json.dumps(params, default=str), key, data_path, max_attempts, time.time()),
+        ).lastrowid
+    ensure_worker(path)
+    return job_id
+
+
+def get(job_id, path=None):
+    """The job as a dict (params and result decoded), or None."""
+    row = db.get_connection(_queue(path)).execute(
+        f"SELECT {', '.join(JOB_COLUMNS)} FROM job WHERE job_id = ?", (job_id,)
+    ).fetchone()
+    if row is None:
+        return None
+    job = dict(zip(JOB_COLUMNS, row))
+    job["params"] = json.loads(job["params"])
+    job["result"] = json.loads(job["result"]) if job["result"] is not None else None
+    return job
+
+
+def retry(job_id, path=None):
+    """Queue a failed job again with a fresh set of attempts."""
+    connection = db.get_connection(_queue(path))
+    with connection:
+        connection.execute(
+            "UPDATE job SET status = 'queued', attempts = 0, run_after = 0, error = NULL WHERE job_id = ? AND status = 'failed'",
+            (job_id,),
+        )
+    ensure_worker(path)
+
+
+def recent_jobs(limit=50, path=None):
+    rows = db.get_connection(_queue(path)).execute(
+        f"SELECT {', '.join(JOB_COLUMNS)} FROM job ORDER BY job_id DESC LIMIT ?", (limit,)
+    )
+    return [dict(zip(JOB_COLUMNS, row)) for row in rows]
+
+
+def prune(days=KEEP_DAYS, path=None):
+    """Delete finished jobs (and their files) older than `days`; returns how many."""
+    connection = db.get_connection(_queue(path))
+    cutoff = time.time() - days * 86400
+    job_ids = [row[0] for row in connection.execute(
+        "SELECT job_id FROM job WHERE status IN ('done', 'failed') AND finished_at < ?", (cutoff,)
+    )]
+    for job_id in job_ids:
+        shutil.rmtree(job_directory(job_id, path), ignore_errors=True)
+    with connection:
+        connection.execute("DELETE FROM job WHERE job_id IN (SELECT value FROM json_each(?))", (json.dumps(job_ids),))
+    return len(job_ids)
+
+
+class JobContext:
+    """What a job function gets besides its parameters."""
+
+    def __init__(self, job_id, attempt, directory, path):
+        self.job_id = job_id
+        self.attempt = attempt
+        self.directory = directory
+        self.path = path
+
+    def progress(self, fraction, message=None):
+        """Record how far the job is (0..1), shown by the page polling it."""
+        with db.pooled(self.path) as connection, connection:
+            connection.execute(
+                "UPDATE job SET progress = ?, message = ?, heartbeat_at = ? WHERE job_id = ?",
+                (min(max(fraction, 0.0), 1.0), message, time.time(), self.job_id),
+            )
+
+
+# Entry point of a job in a worker process; `path` holds the job table and
+# `data_path` (if set) the data the job reads
+def _run_job(job_id, kind, target, params, attempt, path, data_path=None):
+    if target is None:
+        raise ValueError(f"Unknown job kind: {kind}")
+    db.DB_PATH = data_path or path
+    module_name, function_name = target.split(":")
+    function = getattr(importlib.import_module(module_name), function_name)
+    directory = job_directory(job_id, path)
+    os.makedirs(directory, exist_ok=True)
+    return json.dumps(function(params, JobContext(job_id, attempt, directory, path)), default=str)
+
+
+# Take the oldest runnable job: queued and due, or running on a worker whose
+# heartbeat stopped. Returns (job_id, kind, params, attempts, data_path) or None.
+_CLAIM_SQL = """
+UPDATE job
+SET status = 'running', attempts = attempts + 1, progress = 0, message = NULL,
+    started_at = ?1, heartbeat_at = ?1, worker = ?2
+WHERE job_id = (
+    SELECT job_id FROM job
+    WHERE (status = 'queued' AND run_after <= ?1)
+       OR (status = 'running' AND heartbeat_at < ?1 - ?3 AND attempts < max_attempts)
+    ORDER BY job_id LIMIT 1
+)
+RETURNING job_id, kind, params, attempts, data_path
+"""
+
+
+class Dispatcher:
+    """Claims queued jobs and runs them on a pool of worker processes."""
+
+    def __init__(self, processes=WORKER_PROCESSES, path=None, parent=None):
+        self.processes = processes
+        self.parent = parent  # stop once this process has exited
+        self.path = _queue(path)
+        self.name = f"{platform.node()}:{os.getpid()}"
+        self.running = {}  # future -> (job_id, attempts)
+        self.pool = None
+
+    def _new_pool(self):
+        import multiprocessing
+        from concurrent.futures import ProcessPoolExecutor
+        # spawn: the dispatcher process is multi-threaded, so forking it is unsafe
+        return ProcessPoolExecutor(self.processes, mp_context=multiprocessing.get_context("spawn"))
+
+    def claim(self, connection):
+        now = time.time()
+        with connection:
+            # Jobs whose worker died on their last attempt fail instead
+            connection.execute(
+                "UPDATE job SET status = 'failed', finished_at = ?1, error = COALESCE(error, 'worker stopped responding') "
+                "WHERE status = 'running' AND heartbeat_at < ?1 - ?2 AND attempts >= max_attempts",
+                (now, STALE_SECONDS),
+            )
+            rows = connection.execute(_CLAIM_SQL, (now, self.name, STALE_SECONDS)).fetchall()
+        return rows[0] if rows else None
+
+    def finish(self, connection, future, job_id, attempts):
+        try:
+            result = future.result()
+        except Exception:
+            error = traceback.format_exc()
+            with connection:
+                connection.execute("""
+                UPDATE job SET
+                    status = CASE WHEN attempts < max_attempts THEN 'queued' ELSE 'failed' END,
+                    run_after = ?, error = ?, finished_at = CASE WHEN attempts < max_attempts THEN NULL ELSE ? END
+                WHERE job_id = ? AND worker = ?
+                """, (time.time() + RETRY_SECONDS * 2 ** (attempts - 1), error, time.time(), job_id, self.name))
+            print(f"Job {job_id} failed (attempt {attempts}): {error.strip().splitlines()[-1]}")
+            return
+        with connection:
+            connection.execute(
+                "UPDATE job SET status = 'done', progress = 1, result = ?, error = NULL, finished_at = ? "
+                "WHERE job_id = ? AND worker = ?",
+                (result, time.time(), job_id, self.name),
+            )
+
+    def heartbeat(self, connection):
+        job_ids = [job_id for job_id, _ in self.running.values()]
+        with connection:
+            connection.execute(
+                "UPDATE job SET heartbeat_at = ? WHERE job_id IN (SELECT value FROM json_each(?)) AND worker = ?",
+                (time.time(), json.dumps(job_ids), self.name),
+            )
+
+    def maintain(self):
+        for target in MAINTENANCE:
+            module, function = target.split(":")
+            try:
+                getattr(importlib.import_module(module), function)(self.path)
+            except Exception as e:
+                print(f"{target} failed: {e}")  # e.g. locked; try again on the next pass
+
+    def orphaned(self):
+        return self.parent is not None and os.getppid() != self.parent
+
+    def run(self, stop=None):
+        """Dispatch jobs until `stop` (a threading.Event) is set or the parent exits."""
+        from concurrent.futures import FIRST_COMPLETED, wait
+        from concurrent.futures.process import BrokenProcessPool
+        stop = stop or threading.Event()
+        self.pool = self._new_pool()
+        last_heartbeat = time.monotonic()
+        with db.pooled(self.path) as connection:
+            try:
+                while not stop.is_set() and not self.orphaned():
+                    self.maintain()
+                    while len(self.running) < self.processes:
+                        try:
+                            claimed = self.claim(connection)
+                        except sqlite3.OperationalError as e:
+                            print(f"Could not claim a job: {e}")  # e.g. locked; try again on the next pass
+                            break
+                        if claimed is None:
+                            break
+                        job_id, kind, params, attempts, data_path = claimed
+                        future = self.pool.submit(
+                            _run_job, job_id, kind, JOB_KINDS.get(kind), json.loads(params), attempts, self.path,
+                            data_path,
+                        )
+                        self.running[future] = (job_id, attempts)
+
+                    if self.running:
+                        done, _ = wait(list(self.running), timeout=POLL_SECONDS, return_when=FIRST_COMPLETED)
+                    else:
+                        done = ()
+                        stop.wait(POLL_SECONDS)
+                    if any(isinstance(future.exception(), BrokenProcessPool) for future in done):
+                        # A worker process died: every job on the pool fails
+                        # (and is retried) and the pool cannot be reused
+                        done, _ = wait(list(self.running))
+                        self.pool.shutdown(wait=False, cancel_futures=True)
+                        self.pool = self._new_pool()
+                    for future in done:
+                        job_id, attempts = self.running.pop(future)
+                        self.finish(connection, future, job_id, attempts)
+                    if self.running and time.monotonic() - last_heartbeat > HEARTBEAT_SECONDS:
+                        self.heartbeat(connection)
+                        last_heartbeat = time.monotonic()
+            finally:
+                self.pool.shutdown(wait=True, cancel_futures=True)
+
+
+_workers = {}
+_workers_lock = threading.Lock()
+
+
+def ensure_worker(path=None):
+    """Start a worker process for the database unless this process has a live one.
+
+    The worker is a separate `python jobs.py worker` rather than a pool in
+    this process: Streamlit runs the page as __main__, which spawned pool
+    processes would re-run. It exits when this process does.
+    """
+    if not START_WORKER:
+        return
+    path = _queue(path)
+    worker = _workers.get(path)
+    if worker is not None and worker.poll() is None:
+        return
+    with _workers_lock:
+        worker = _workers.get(path)
+        if worker is None or worker.poll() is not None:
+            import subprocess
+            _workers[path] = subprocess.Popen(
+                [sys.executable, os.path.abspath(__file__), "worker", "--parent", str(os.getpid())],
+                env=dict(os.environ, SCHOOL_DB_PATH=os.path.abspath(path)),
+            )
+
+
+# Re-run the page once the job has finished, showing its progress until then.
+# show() runs it as a fragment; streamlit is imported there and not at module
+# level, so the worker and the migrations that create the job table do not
+# load it.
+def _poll(job_id, label):
+    import streamlit as st
+    job = get(job_id)
+    if job is None or job["status"] in ("done", "failed"):
+        st.rerun()
+    status = "waiting for a worker" if job["status"] == "queued" else job["message"] or "running"
+    st.progress(job["progress"], text=f"{label}: {status}")
+
+
+def show(kind, params, render, label="Building report", key=None):
+    """Submit (or reuse) a job and show its progress, then render(result, directory)."""
+    import streamlit as st
+    job_id = submit(kind, params)
+    job = get(job_id)
+    if job["status"] == "done":
+        render(job["result"], job_directory(job_id))
+    elif job["status"] == "failed":
+        st.error(f"{label} failed: {(job['error'] or 'unknown error').strip().splitlines()[-1]}")
+        if st.button("Retry", key=key or f"job_retry_{job_id}"):
+            retry(job_id)
+            st.rerun()
+    else:
+        st.fragment(_poll, run_every=POLL_SECONDS)(job_id, label)
+
+
+def main(argv=None):
+    argv = sys.argv[1:] if argv is None else argv
+    command = argv[0] if argv else "list"
+    import migrations
+    migrations.ensure_migrated()
+
+    if command == "worker":
+        parent = int(argv[argv.index("--parent") + 1]) if "--parent" in argv else None
+        print(f"Job worker on {db.DB_PATH} with {WORKER_PROCESSES} process(es)"
+              f"{'' if parent else '; Ctrl+C to stop'}.")
+        try:
+            Dispatcher(parent=parent).run()
+        except KeyboardInterrupt:
+            pass
+        return 0
+    if command == "prune":
+        print(f"{prune()} job(s) pruned.")
+        return 0
+    for job in recent_jobs():
+        print(f"{job['job_id']:>6} {job['kind']:<22} {job['status']:<8} {job['progress']:>5.0%} "
+              f"attempts {job['attempts']}/{job['max_attempts']} {job['message'] or ''}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,7 +1,10 @@
 import streamlit as st
-import sqlite3
+import db
+import jobs
+import metrics
+import query_log
+import sharding
 from database import init_db
-from superadmin import superadmin_dashboards
 
 
 # Custom CSS for styling the login page
@@ -68,28 +71,24 @@ custom_css = """
     }
 </style>
 """
-st.markdown(custom_css, unsafe_allow_html=True)
 
-# Initialize page and role in session state if not present
-if "page" not in st.session_state:
-    st.session_state.page = "Login"
-if "role" not in st.session_state:
-    st.session_state.role = None
+# Role of the user with this email and password
+AUTHENTICATE_SQL = "SELECT role FROM user WHERE email = ? AND password = ?"
 
 # Function to authenticate the user based on email and password
 def authenticate_user(email, password):
-    connection = sqlite3.connect("database.db")
+    connection = db.get_connection()
     cursor = connection.cursor()
     
-    cursor.execute("""
-        SELECT role FROM user WHERE email = ? AND password = ?
-    """, (email, password))
+    cursor.execute(AUTHENTICATE_SQL, (email, password))
     result = cursor.fetchone()
     connection.close()
     
     if result:
+        metrics.LOGIN_ATTEMPTS.inc("success")
         return result[0]  
     else:
+        metrics.LOGIN_ATTEMPTS.inc("failure")
         return None
 
 # Function to handle login form
@@ -118,6 +117,7 @@ def login_form():
                 st.markdown("<p class='error-message'>Invalid email or password. Please try again.</p>", unsafe_allow_html=True)
             else:
                 st.session_state.role = role
+                st.session_state.branch_id = sharding.user_branch(st.session_state.email)
                 st.session_state.page = f"{role.capitalize()}Dashboard"
                 st.success(f"Login successful! Welcome back, {role.capitalize()}!")
 
@@ -128,6 +128,8 @@ def superadmin_dashboard_page():
         st.session_state.page = "Login"
         st.stop()
 
+    # Import here so only the logged-in role's dashboard is loaded
+    from superadmin import superadmin_dashboards
     superadmin_dashboards()
 
     if st.button("Logout"):
@@ -163,21 +165,49 @@ def teacher_dashboard_page():
 
 # Main function to drive the app
 def main():
-    init_db()  # Initialize the database if needed
-    
-    if st.session_state.page == "Login":
-        login_form()
-    elif st.session_state.page == "SuperadminDashboard":
-        superadmin_dashboard_page()
-    elif st.session_state.page == "BranchadminDashboard":
-        branchadmin_dashboard_page()
-    elif st.session_state.page == "TeacherDashboard":
-        teacher_dashboard_page()
+    st.set_page_config(page_title="Indian Public High School", layout="wide", initial_sidebar_state="collapsed")
+    st.markdown(custom_css, unsafe_allow_html=True)
+
+    # Initialize page and role in session state if not present
+    if "page" not in st.session_state:
+        st.session_state.page = "Login"
+    if "role" not in st.session_state:
+        st.session_state.role = None
+
+    # Branch users work on their branch's shard in the sharded layout
+    sharding.route_session(st.session_state.role, st.session_state.get("branch_id"))
+
+    metrics.start_server()  # once per process (see metrics.py)
+
+    # Record this rerun's queries under the page it renders (see query_log.py)
+    query_log.start_rerun(st.session_state.page)
+    failed = False
+    try:
+        init_db()  # Initialize the database if needed
+        jobs.ensure_worker()  # also keeps the dashboard cube fresh (see cube.py)
+
+        if st.session_state.page == "Login":
+            login_form()
+        elif st.session_state.page == "SuperadminDashboard":
+            superadmin_dashboard_page()
+        elif st.session_state.page == "BranchadminDashboard":
+            branchadmin_dashboard_page()
+        elif st.session_state.page == "TeacherDashboard":
+            teacher_dashboard_page()
+    except Exception:
+        failed = True
+        raise
+    finally:
+        rerun = query_log.end_rerun()
+        metrics.RERUN_SECONDS.observe(rerun["seconds"], rerun["page"])
+        if failed:
+            metrics.RERUN_ERRORS.inc(rerun["page"])
 
 # Logout function
 def logout():
     st.session_state.page = "Login"
     st.session_state.role = None
+    st.session_state.branch_id = None
 
 if __name__ == "__main__":
     main()
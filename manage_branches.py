@@ -1,12 +1,12 @@
 import streamlit as st
 import sqlite3
-
-# Set page configuration to hide the sidebar
-st.set_page_config(page_title="Branch Management", layout="wide", initial_sidebar_state="collapsed")
+import db
+import query_cache
+import sharding
 
 # Connect to the database
 def connect_db():
-    conn = sqlite3.connect("database.db")
+    conn = db.get_connection()
     return conn
 
 # Create a new branch
@@ -33,6 +33,8 @@ def create_branch(branch_name, location, contact_number, subjects):
     conn.commit()
 
     conn.close()
+    if sharding.enabled():
+        sharding.ensure_shard(branch_id)
     st.success("Branch created successfully!")
 # Create a new branch admin
 def create_branch_admin(admin_name, email, password, branch_id):
@@ -96,10 +98,7 @@ def create_branch_admin_form():
         admin_name = st.text_input("Branch Admin Name", max_chars=100)
         email = st.text_input("Email")
         password = st.text_input("Password", type="password")
-        conn = connect_db()
-        cursor = conn.cursor()
-        cursor.execute("SELECT branch_id, branch_name FROM branch")
-        branches = cursor.fetchall()
+        branches = query_cache.fetchall("SELECT branch_id, branch_name FROM branch", tables=("branch",))
         branch_names = [branch[1] for branch in branches]
         branch_ids = [branch[0] for branch in branches]
         branch = st.selectbox("Select Branch", options=branch_names, index=0)
@@ -112,22 +111,24 @@ def create_branch_admin_form():
         else:
             st.error("Please fill in all the fields.")
 
+# Existing branches with their admins, as (branch_name, admin_name, admin_email, branch_id)
+BRANCH_ADMINS_SQL = """
+    SELECT b.branch_name,
+           COALESCE(u.name, 'No Admin Assigned') AS admin_name,
+           COALESCE(u.email, 'No Email') AS admin_email,
+           b.branch_id
+    FROM branch b
+    LEFT JOIN user u ON b.branch_id = u.branch_id AND u.role = 'branchadmin'
+"""
+
+def get_branch_admins():
+    return query_cache.fetchall(BRANCH_ADMINS_SQL, tables=("branch", "user"))
+
 # Display existing branches and their details
 def display_existing_branches():
     try:
-        conn = connect_db()
-        cursor = conn.cursor()
-
         # Fetch existing branches and their associated admins
-        cursor.execute("""
-            SELECT b.branch_name, 
-                   COALESCE(u.name, 'No Admin Assigned') AS admin_name, 
-                   COALESCE(u.email, 'No Email') AS admin_email, 
-                   b.branch_id
-            FROM branch b
-            LEFT JOIN user u ON b.branch_id = u.branch_id AND u.role = 'branchadmin'
-        """)
-        branch_admins = cursor.fetchall()
+        branch_admins = get_branch_admins()
 
         if branch_admins:
             st.subheader("Existing Branches and Branch Admins")
@@ -149,20 +150,16 @@ def display_existing_branches():
             st.info("No branches or admins found.")
     except sqlite3.Error as e:
         st.error(f"An error occurred while fetching branches: {e}")
-    finally:
-        conn.close()
 # Function to display details of a branch
+BRANCH_DETAILS_SQL = "SELECT branch_name, location, contact_number FROM branch WHERE branch_id = ?"
+
 def display_branch_details(branch_id):
     try:
         conn = connect_db()
         cursor = conn.cursor()
 
         # Fetch the details of the branch
-        cursor.execute("""
-        SELECT branch_name, location, contact_number 
-        FROM branch 
-        WHERE branch_id = ?
-        """, (branch_id,))
+        cursor.execute(BRANCH_DETAILS_SQL, (branch_id,))
         branch_details = cursor.fetchone()
 
         if branch_details:
@@ -177,4 +174,6 @@ def display_branch_details(branch_id):
         conn.close()
 
 if __name__ == "__main__":
+    # Set page configuration to hide the sidebar
+    st.set_page_config(page_title="Branch Management", layout="wide", initial_sidebar_state="collapsed")
     display_existing_branches()
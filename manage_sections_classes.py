@@ -1,36 +1,32 @@
 import streamlit as st
 import sqlite3
+import db
+import export
+import query_cache
+import roster
 import pandas as pd
-import io
+import os
 
 # Database connection
 def get_connection():
-    return sqlite3.connect("database.db")
+    return db.get_connection()
 
 # Utility Functions
+CLASSES_BY_GRADE_SQL = "SELECT class_id, class_name FROM class WHERE grade = ?"
+SECTIONS_SQL = "SELECT section_id, section_name FROM section WHERE class_id = ?"
+STUDENTS_SQL = (
+    "SELECT student_name, roll_number, gender, phone_number, dob, address, father_name, mother_name "
+    "FROM student WHERE section_id = ?"
+)
+
 def get_classes_by_grade(grade):
-    conn = get_connection()
-    cursor = conn.cursor()
-    cursor.execute("SELECT class_id, class_name FROM class WHERE grade = ?", (grade,))
-    classes = cursor.fetchall()
-    conn.close()
-    return classes
+    return query_cache.fetchall(CLASSES_BY_GRADE_SQL, (grade,), tables=("class",))
 
 def get_sections(class_id):
-    conn = get_connection()
-    cursor = conn.cursor()
-    cursor.execute("SELECT section_id, section_name FROM section WHERE class_id = ?", (class_id,))
-    sections = cursor.fetchall()
-    conn.close()
-    return sections
+    return query_cache.fetchall(SECTIONS_SQL, (class_id,), tables=("section",))
 
 def get_students(section_id):
-    conn = get_connection()
-    cursor = conn.cursor()
-    cursor.execute("SELECT student_name, roll_number, gender, phone_number, dob, address, father_name, mother_name FROM student WHERE section_id = ?", (section_id,))
-    students = cursor.fetchall()
-    conn.close()
-    return students
+    return query_cache.fetchall(STUDENTS_SQL, (section_id,), tables=("student",))
 
 def add_section(section_name, class_id):
     conn = get_connection()
@@ -50,18 +46,10 @@ def add_student(name, father_name, mother_name, roll_number, gender, phone, dob,
     conn.commit()
     conn.close()
 
-def bulk_upload_students(student_data, section_id):
-    conn = get_connection()
-    cursor = conn.cursor()
-    for _, row in student_data.iterrows():
-        cursor.execute("""
-            INSERT INTO student (student_name, father_name, mother_name, roll_number, gender, phone_number, dob, address, section_id)
-            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)""",
-            (row['Student Name'], row['Father Name'], row['Mother Name'], row['Roll Number'],
-             row['Gender'], row['Phone Number'], row['Date of Birth'], row['Address'], section_id)
-        )
-    conn.commit()
-    conn.close()
+# Stream a roster CSV into a section; bad rows go to the import's reject report
+def bulk_upload_students(csv_file, section_id, progress=None):
+    import bulk_import
+    return bulk_import.import_students(csv_file, section_id, progress=progress)
 
 def manage_sections_classes():
     st.header("Manage Classes and Sections")
@@ -91,12 +79,8 @@ def manage_sections_classes():
             section_id = next(sec[0] for sec in sections if sec[1] == selected_section)
             with st.expander("students in section"):
                 st.write(f"Students in Section: {selected_section}")
-                students = get_students(section_id)
-                
-                # Display the student list in a table format
-                if students:
-                    student_df = pd.DataFrame(students, columns=["Student Name", "Roll Number", "Gender", "Phone Number", "Date of Birth", "Address", "Father's Name", "Mother's Name"])
-                    st.dataframe(student_df)
+                # Only the visible page of the roster is fetched
+                roster.show_roster("section", section_id)
 
             # Add New Section using a small form
             with st.expander("add new esction"):
@@ -145,10 +129,6 @@ def manage_sections_classes():
                                     gender, phone_number, date_of_birth, address, section_id
                                 )
                                 st.success(f"Student '{student_name}' added to Section '{selected_section}'.")
-                                # Dynamically update the student list after adding a student
-                                students = get_students(section_id)
-                                student_df = pd.DataFrame(students, columns=["Student Name", "Roll Number", "Gender", "Phone Number", "Date of Birth", "Address", "Father's Name", "Mother's Name"])
-                                st.dataframe(student_df)
 
                             except sqlite3.IntegrityError as e:
                                 st.error(f"Database error: {e}")
@@ -160,44 +140,43 @@ def manage_sections_classes():
                 uploaded_file = st.file_uploader("Upload CSV File", type=["csv"])
                 if uploaded_file:
                     try:
-                        student_data = pd.read_csv(uploaded_file)
                         st.write("Preview of uploaded data:")
-                        st.dataframe(student_data.head())
+                        st.dataframe(pd.read_csv(uploaded_file, nrows=5))
+                        uploaded_file.seek(0)
                         if st.button("Upload Students"):
-                            bulk_upload_students(student_data, section_id)
-                            st.success("Students uploaded successfully.")
-                            # Dynamically update the student list after bulk upload
-                            students = get_students(section_id)
-                            student_df = pd.DataFrame(students, columns=["Student Name", "Roll Number", "Gender", "Phone Number", "Date of Birth", "Address", "Father's Name", "Mother's Name"])
-                            st.dataframe(student_df)
+                            progress_bar = st.progress(0.0, text="Importing students...")
+                            report = bulk_upload_students(
+                                uploaded_file, section_id,
+                                progress=lambda done: progress_bar.progress(done, text=f"Importing students... {done:.0%}")
+                            )
+                            st.success(f"{report.inserted} of {report.rows_read} students uploaded in {report.seconds:.1f}s.")
+                            if report.rejected:
+                                st.warning(f"{report.rejected} row(s) were rejected.")
+                                with open(report.rejects_path, "rb") as rejects:
+                                    st.download_button(
+                                        label="Download rejected rows",
+                                        data=rejects.read(),
+                                        file_name="rejected_students.csv",
+                                        mime="text/csv"
+                                    )
+                                os.unlink(report.rejects_path)
 
                     except Exception as e:
                         st.error(f"Error uploading file: {e}")
                     
-            # Create CSV buffer for export (Move the download button outside of the form)
-            if students:
-                student_df = pd.DataFrame(students, columns=["Student Name", "Roll Number", "Gender", "Phone Number", "Date of Birth", "Address", "Father's Name", "Mother's Name"])
-                csv_buffer = io.StringIO()
-                student_df.to_csv(csv_buffer, index=False)
-                csv_buffer.seek(0)
-                
-                # Convert CSV buffer to bytes
-                csv_data = csv_buffer.getvalue().encode('utf-8')
-
-                # Display the download button after the forms are handled
-                with st.expander("Export student list"):
-                    st.subheader("Export Student List")
-                    col1, col2 = st.columns([1, 1])  # Create two columns for side-by-side layout
-                    with col1:
-                        st.download_button(
-                            label="Download Student List as CSV",
-                            data=csv_data,
-                            file_name=f"student_list_grade_{selected_grade}_section_{selected_section}.csv",
-                            mime="text/csv"
-                        )
-                    
+            # Streamed from the database only when the download is clicked
+            with st.expander("Export student list"):
+                st.subheader("Export Student List")
+                export.export_download(
+                    "students", f"student_list_grade_{selected_grade}_section_{selected_section}",
+                    filters={"section_id": section_id},
+                    key="student_list_export",
+                    default_columns=["student_name", "roll_number", "gender", "phone_number", "dob", "address",
+                                     "father_name", "mother_name"]
+                )
+
         else:
             st.warning(f"No classes found for Grade {selected_grade}.")
 
-# Call the main function to display the Streamlit UI
-manage_sections_classes()
+if __name__ == "__main__":
+    manage_sections_classes()
@@ -1,19 +1,18 @@
 import streamlit as st
 import sqlite3
-import pandas as pd  # For handling CSV
+import db
+import query_cache
+import sharding
 
 # Database Connection
 def connect_db():
-    return sqlite3.connect("database.db")
+    return db.get_connection()
 
 # Fetch Branches
+BRANCHES_SQL = "SELECT branch_id, branch_name FROM branch"
+
 def fetch_branches():
-    conn = connect_db()
-    cursor = conn.cursor()
-    cursor.execute("SELECT branch_id, branch_name FROM branch")
-    branches = cursor.fetchall()
-    conn.close()
-    return branches
+    return query_cache.fetchall(BRANCHES_SQL, tables=("branch",))
 
 # Fetch Grades - Hardcoding Grades 1 to 5
 def fetch_grades(branch_id):
@@ -32,46 +31,23 @@ def fetch_subjects(branch_id, grade):
     subjects = subjects_mapping.get(grade, [])
     return [(subject, subject) for subject in subjects]
 
-# Bulk Upload CSV
-def bulk_upload_csv(csv_file, branch_id, grade, subject_id):
-    data = pd.read_csv(csv_file)
-    conn = connect_db()
-    cursor = conn.cursor()
-
-    for _, row in data.iterrows():
-        chapter_name = row.get("chapter_name")
-        description = row.get("description", "")
-        if chapter_name:
-            # Insert into chapters
-            cursor.execute("""
-                INSERT INTO chapter (chapter_name, description) 
-                VALUES (?, ?)
-            """, (chapter_name, description))
-            chapter_id = cursor.lastrowid
-
-            # Insert associated topics (if any)
-            topics = row.get("topics", "").split(";")  # Assuming topics are semicolon-separated
-            for topic_name in topics:
-                if topic_name.strip():
-                    cursor.execute("""
-                        INSERT INTO topic (topic_name, description)
-                        VALUES (?, ?)
-                    """, (topic_name.strip(), ""))
-                    topic_id = cursor.lastrowid
-                    cursor.execute("""
-                        INSERT INTO topic_association (topic_id, chapter_id) 
-                        VALUES (?, ?)
-                    """, (topic_id, chapter_id))
-
-    conn.commit()
-    conn.close()
-    st.success("Bulk data uploaded successfully!")
-
-def add_chapter(chapter_name, description, class_id=1):  # Defaulting to class_id=1
+# Bulk Upload CSV (Chapter Name, Action Plan, Topic Name, Description, Expected Outcome)
+def bulk_upload_csv(csv_file, class_id, subject_id):
+    import curriculum_import
+    try:
+        report = curriculum_import.import_curriculum(csv_file, class_id, subject_id)
+    except (ValueError, sqlite3.Error) as e:
+        st.error(f"Error uploading curriculum: {e}")
+        return
+    st.success(
+        f"Bulk data uploaded successfully! {report.chapters_added} chapter(s), {report.topics_added} topic(s), "
+        f"{report.associations_added} link(s) and {report.outcomes_added} outcome(s) added from {report.rows_read} row(s)."
+    )
+
+def add_chapter(chapter_name, description, class_id):
     conn = connect_db()
     cursor = conn.cursor()
 
-    # Ensure that class_id is valid, or default it to 1 if not provided
     cursor.execute("""
         INSERT INTO chapter (chapter_name, description, class_id) 
         VALUES (?, ?, ?)
@@ -81,36 +57,40 @@ def add_chapter(chapter_name, description, class_id=1):  # Defaulting to class_i
     conn.close()
     st.success(f"Chapter '{chapter_name}' added successfully!")
 
+# Topics and their outcomes are shared by every branch, so they are written
+# with sharding.shared_connection() and published to the branch shards;
+# a topic's link to a chapter belongs to the chapter's branch
 def add_topic(topic_name, description, expected_outcome, chapter_id):
     conn = connect_db()
-    cursor = conn.cursor()
+    shared = sharding.shared_connection()
 
     # Insert topic with description and expected outcome
-    cursor.execute("""
+    topic_id = shared.execute("""
         INSERT INTO topic (topic_name, description) 
         VALUES (?, ?)
-    """, (topic_name, description))
-    topic_id = cursor.lastrowid
-
-    # Insert topic association with chapter
-    cursor.execute("""
-        INSERT INTO topic_association (topic_id, chapter_id) 
-        VALUES (?, ?)
-    """, (topic_id, chapter_id))
+    """, (topic_name, description)).lastrowid
 
     # Optionally, store expected outcome in a separate table
-    cursor.execute("""
+    shared.execute("""
         INSERT INTO topic_outcome (topic_id, expected_outcome) 
         VALUES (?, ?)
     """, (topic_id, expected_outcome))
+    shared.commit()
+    sharding.publish([topic_id])
+
+    # Insert topic association with chapter
+    conn.execute("""
+        INSERT INTO topic_association (topic_id, chapter_id) 
+        VALUES (?, ?)
+    """, (topic_id, chapter_id))
 
     conn.commit()
     conn.close()
     st.success(f"Topic '{topic_name}' added successfully!")
 
 def update_topic(topic_id, new_topic_name, new_description, new_expected_outcome):
-    conn = connect_db()
-    cursor = conn.cursor()
+    shared = sharding.shared_connection()
+    cursor = shared.cursor()
 
     # Update topic details
     cursor.execute("""
@@ -126,13 +106,13 @@ def update_topic(topic_id, new_topic_name, new_description, new_expected_outcome
         WHERE topic_id = ?
     """, (new_expected_outcome, topic_id))
 
-    conn.commit()
-    conn.close()
+    shared.commit()
+    sharding.publish([topic_id])
     st.success(f"Topic '{new_topic_name}' updated successfully!")
 
 def delete_topic(topic_id):
-    conn = connect_db()
-    cursor = conn.cursor()
+    shared = sharding.shared_connection()
+    cursor = shared.cursor()
 
     # Delete topic outcome
     cursor.execute("""
@@ -140,7 +120,7 @@ def delete_topic(topic_id):
         WHERE topic_id = ?
     """, (topic_id,))
 
-    # Delete topic association
+    # Delete topic association (publish removes the links in the shards)
     cursor.execute("""
         DELETE FROM topic_association 
         WHERE topic_id = ?
@@ -152,10 +132,25 @@ def delete_topic(topic_id):
         WHERE topic_id = ?
     """, (topic_id,))
 
-    conn.commit()
-    conn.close()
+    shared.commit()
+    sharding.publish([topic_id])
     st.success("Topic deleted successfully!")
 
+# Topics of a chapter with their expected outcomes
+TOPICS_SQL = """
+    SELECT t.topic_id, t.topic_name, t.description, "to".expected_outcome
+    FROM topic t
+    JOIN topic_association ta ON t.topic_id = ta.topic_id
+    LEFT JOIN topic_outcome "to" ON t.topic_id = "to".topic_id
+    WHERE ta.chapter_id = ?
+"""
+
+# Every chapter, for the chapter picker
+CHAPTERS_SQL = "SELECT chapter_id, chapter_name FROM chapter"
+
+def fetch_topics(chapter_id):
+    return query_cache.fetchall(TOPICS_SQL, (chapter_id,), tables=("topic", "topic_association", "topic_outcome"))
+
 # UI for Managing Subjects
 def manage_subjects():
     st.title("Manage Subjects")
@@ -168,6 +163,17 @@ def manage_subjects():
 
     # Save branch_id to session state
     st.session_state['branch_id'] = branch_id
+    if branch_id is None:
+        st.info("Create a branch first.")
+        return
+
+    # The branch's classes and chapters are in its shard when sharded
+    with sharding.branch_route(branch_id):
+        manage_branch_subjects(branch_id)
+
+# Steps after the branch is picked, routed to the branch's file
+def manage_branch_subjects(branch_id):
+    import curriculum_import
 
     # Step 2: Select Grade
     grades = fetch_grades(branch_id)
@@ -180,33 +186,42 @@ def manage_subjects():
     subjects = fetch_subjects(branch_id, grade)
     subject_options = {name: id_ for id_, name in subjects}
     subject_name = st.selectbox("Select Subject", options=subject_options.keys())
-    subject_id = subject_options.get(subject_name)
-
-    # Step 4: Bulk Upload Chapters/Topics
-    st.subheader("Bulk Upload Chapters and Topics")
-    csv_file = st.file_uploader("Upload CSV File", type=["csv"])
-    if csv_file and st.button("Upload Data"):
-        bulk_upload_csv(csv_file, branch_id, grade, subject_id)
-
-    # Step 5: Add New Chapter (with Expander)
-    with st.expander("Add New Chapter"):
-        with st.form(key="add_chapter_form"):
-            chapter_name = st.text_input("Chapter Name")
-            description = st.text_area("Description")
-            submit = st.form_submit_button("Add Chapter")
-            if submit and chapter_name:
-                add_chapter(chapter_name, description)
+    class_id, subject_id = curriculum_import.resolve_class_and_subject(connect_db(), branch_id, grade, subject_name)
+
+    if class_id is None:
+        st.warning(f"This branch has no Grade {grade} class yet; add it under Manage Classes and Sections to "
+                   "upload or add chapters.")
+    else:
+        # Step 4: Bulk Upload Chapters/Topics
+        st.subheader("Bulk Upload Chapters and Topics")
+        csv_file = st.file_uploader("Upload CSV File", type=["csv"])
+        if csv_file and st.button("Upload Data"):
+            bulk_upload_csv(csv_file, class_id, subject_id)
+
+        # Step 5: Add New Chapter (with Expander)
+        with st.expander("Add New Chapter"):
+            with st.form(key="add_chapter_form"):
+                chapter_name = st.text_input("Chapter Name")
+                description = st.text_area("Description")
+                submit = st.form_submit_button("Add Chapter")
+                if submit and chapter_name:
+                    add_chapter(chapter_name, description, class_id)
 
     # Step 6: Select Chapter to Manage Topics
     st.subheader("Select Chapter to Manage Topics")
-    conn = connect_db()
-    cursor = conn.cursor()
-    cursor.execute("SELECT chapter_id, chapter_name FROM chapter")
-    chapters = cursor.fetchall()
-    conn.close()
-
+    chapters = query_cache.fetchall(CHAPTERS_SQL, tables=("chapter",))
     chapter_options = {name: id_ for id_, name in chapters}
-    selected_chapter_name = st.selectbox("Select Chapter", options=chapter_options.keys())
+
+    # A search pick selects its chapter once; after that the selectbox is free again
+    from search import curriculum_search_picker
+    hit = curriculum_search_picker(key="manage_subjects_search")
+    if hit and hit != st.session_state.get("manage_subjects_last_hit"):
+        st.session_state["manage_subjects_last_hit"] = hit
+        if hit[1] in chapter_options:
+            st.session_state["manage_subjects_chapter"] = hit[1]
+    focus_topic_id = hit[2] if hit else None
+
+    selected_chapter_name = st.selectbox("Select Chapter", options=chapter_options.keys(), key="manage_subjects_chapter")
     selected_chapter_id = chapter_options.get(selected_chapter_name)
 
     if selected_chapter_id:
@@ -221,22 +236,14 @@ def manage_subjects():
                     add_topic(topic_name, description, expected_outcome, selected_chapter_id)
 
         # UI for Managing Topics (inside the Chapter Expander)
-        with st.expander(f"Manage Topics for Chapter: {selected_chapter_name}"):
+        with st.expander(f"Manage Topics for Chapter: {selected_chapter_name}", expanded=focus_topic_id is not None):
             st.subheader(f"Existing Topics in {selected_chapter_name}")
-            conn = connect_db()
-            cursor = conn.cursor()
-            cursor.execute("""
-                SELECT t.topic_id, t.topic_name, t.description, "to".expected_outcome
-                FROM topic t
-                JOIN topic_association ta ON t.topic_id = ta.topic_id
-                LEFT JOIN topic_outcome "to" ON t.topic_id = "to".topic_id
-                WHERE ta.chapter_id = ?
-            """, (selected_chapter_id,))
-            topics = cursor.fetchall()
-            conn.close()
+            topics = fetch_topics(selected_chapter_id)
 
             if topics:
                 for topic_id, topic_name, description, expected_outcome in topics:
+                    if topic_id == focus_topic_id:
+                        st.caption("Search match")
                     st.write(f"**Topic Name:** {topic_name}")
                     st.write(f"**Description:** {description}")
                     st.write(f"**Expected Outcome:** {expected_outcome}")
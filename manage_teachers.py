@@ -1,11 +1,12 @@
 import streamlit as st
-import sqlite3
+import db
+import query_cache
 
 def get_connection():
-    return sqlite3.connect("database.db")
+    return db.get_connection()
 
 def add_teacher(name, email, password, subject, classes, branch_id):
-    connection = sqlite3.connect("database.db")
+    connection = db.get_connection()
     cursor = connection.cursor()
 
     cursor.execute("""
@@ -17,20 +18,17 @@ def add_teacher(name, email, password, subject, classes, branch_id):
     connection.close()
 
 def delete_teacher(email):
-    connection = sqlite3.connect("database.db")
+    connection = db.get_connection()
     cursor = connection.cursor()
 
     cursor.execute("DELETE FROM teachers WHERE email = ?", (email,))
     connection.commit()
     connection.close()
 
+TEACHERS_BY_SUBJECT_SQL = "SELECT teacher_name, email, subject, classes FROM teachers WHERE subject = ?"
+
 def get_teachers_by_subject(subject):
-    conn = get_connection()
-    cursor = conn.cursor()
-    cursor.execute("SELECT teacher_name, email, subject, classes FROM teachers WHERE subject = ?", (subject,))
-    teachers = cursor.fetchall()
-    conn.close()
-    return teachers
+    return query_cache.fetchall(TEACHERS_BY_SUBJECT_SQL, (subject,), tables=("teachers",))
 
 def manage_teachers(branch_id):
     st.title("Manage Teachers")
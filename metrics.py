@@ -0,0 +1,267 @@
+"""Counters and histograms for alerting, served in the Prometheus text format.
+
+The app records into the module-level metrics below; start_server() (called
+by login.main on every rerun, so the first one starts it) serves them from a
+background thread of the Streamlit process:
+
+    school_page_rerun_seconds         histogram   page reruns by page
+    school_page_rerun_errors_total    counter     reruns that raised, by page
+    school_db_query_seconds           histogram   statements by page and kind (select, insert, ...)
+    school_db_errors_total            counter     statements that raised sqlite3.Error
+    school_query_cache_*              counters    query result cache hits, misses, evictions
+    school_figure_cache_*             counters    rendered chart cache hits, misses, evictions
+    school_login_attempts_total       counter     logins by result (success, failure)
+    school_import_rows_total          counter     bulk-imported rows by result (inserted, rejected)
+    school_import_seconds             histogram   bulk import durations
+    school_errors_total               counter     errors the app reports with print(), by where
+
+Statement metrics come from query_log's cursors, so SCHOOL_QUERY_LOG=0
+turns them off too. Cache counters are read from the caches when scraped.
+SCHOOL_METRICS_PORT (default 9464, empty or 0 for no endpoint) and
+SCHOOL_METRICS_HOST (default 127.0.0.1) set where they are served;
+SCHOOL_METRICS=0 stops recording. Background job worker processes
+(jobs.py) are not covered.
+
+    curl http://127.0.0.1:9464/metrics
+    python benchmark.py metrics
+"""
+import os
+import sys
+import threading
+from bisect import bisect_left
+from threading import get_ident
+
+METRICS_HOST = os.environ.get("SCHOOL_METRICS_HOST", "127.0.0.1")
+METRICS_PORT = os.environ.get("SCHOOL_METRICS_PORT", "9464")
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+QUERY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5)
+RERUN_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+IMPORT_BUCKETS = (0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0, 300.0)
+
+_enabled = os.environ.get("SCHOOL_METRICS", "1") != "0"
+_metrics = []
+_collectors = []
+_server = None
+_server_lock = threading.Lock()
+
+
+def set_enabled(enabled):
+    """Turn recording on or off (off: inc() and observe() return at once)."""
+    global _enabled
+    _enabled = enabled
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _labels(names, values, extra=""):
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _number(value):
+    if value == float("inf"):
+        return "+Inf"
+    return str(value) if isinstance(value, int) else repr(float(value))
+
+
+# Each thread records into its own shard (a dict under its thread id), so
+# recording takes no lock; a scrape adds the shards up. Thread ids are reused
+# once a thread ends, which keeps the shards to about the number of threads
+# alive at once.
+class Counter:
+    """Monotonic count per combination of label values."""
+
+    kind = "counter"
+
+    def __init__(self, name, help, labels=()):
+        self.name = name
+        self.help = help
+        self.labels = tuple(labels)
+        self._shards = {}
+        _metrics.append(self)
+
+    def inc(self, *label_values, amount=1):
+        if not _enabled:
+            return
+        shard = self._shards.get(get_ident())
+        if shard is None:
+            shard = self._shards.setdefault(get_ident(), {})
+        shard[label_values] = shard.get(label_values, 0) + amount
+
+    def totals(self):
+        """Label values -> count, over all threads."""
+        totals = {}
+        for shard in list(self._shards.values()):
+            for key, value in shard.copy().items():
+                totals[key] = totals.get(key, 0) + value
+        return totals
+
+    def value(self, *label_values):
+        return self.totals().get(label_values, 0)
+
+    def samples(self):
+        return [(self.name, _labels(self.labels, key), value) for key, value in sorted(self.totals().items())]
+
+    def clear(self):
+        self._shards.clear()
+
+
+class Histogram:
+    """Observations counted into fixed buckets, per combination of label values."""
+
+    kind = "histogram"
+
+    def __init__(self, name, help, labels=(), buckets=QUERY_BUCKETS):
+        self.name = name
+        self.help = help
+        self.labels = tuple(labels)
+        self.buckets = tuple(sorted(buckets))
+        self._shards = {}  # thread id -> {label values: [count per bucket ..., over the last, sum]}
+        _metrics.append(self)
+
+    def observe(self, value, *label_values):
+        if not _enabled:
+            return
+        shard = self._shards.get(get_ident())
+        if shard is None:
+            shard = self._shards.setdefault(get_ident(), {})
+        counts = shard.get(label_values)
+        if counts is None:
+            counts = shard[label_values] = [0] * (len(self.buckets) + 1) + [0.0]
+        counts[bisect_left(self.buckets, value)] += 1
+        counts[-1] += value
+
+    def totals(self):
+        """Label values -> [count per bucket ..., sum], over all threads."""
+        totals = {}
+        for shard in list(self._shards.values()):
+            for key, counts in shard.copy().items():
+                total = totals.get(key)
+                totals[key] = list(counts) if total is None else [a + b for a, b in zip(total, counts)]
+        return totals
+
+    def count(self, *label_values):
+        counts = self.totals().get(label_values)
+        return sum(counts[:-1]) if counts else 0
+
+    def samples(self):
+        samples = []
+        for key, counts in sorted(self.totals().items()):
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += count
+                samples.append((f"{self.name}_bucket", _labels(self.labels, key, f'le="{_number(bound)}"'),
+                                cumulative))
+            samples.append((f"{self.name}_sum", _labels(self.labels, key), counts[-1]))
+            samples.append((f"{self.name}_count", _labels(self.labels, key), cumulative))
+        return samples
+
+    def clear(self):
+        self._shards.clear()
+
+
+RERUN_SECONDS = Histogram("school_page_rerun_seconds", "Streamlit script reruns by page.", ("page",), RERUN_BUCKETS)
+RERUN_ERRORS = Counter("school_page_rerun_errors_total", "Reruns that raised an exception.", ("page",))
+QUERY_SECONDS = Histogram("school_db_query_seconds", "SQL statements, execute plus fetches.", ("page", "statement"))
+QUERY_ERRORS = Counter("school_db_errors_total", "SQL statements that raised sqlite3.Error.", ("page",))
+LOGIN_ATTEMPTS = Counter("school_login_attempts_total", "Login attempts by result.", ("result",))
+IMPORT_ROWS = Counter("school_import_rows_total", "Rows read by bulk student imports, by result.", ("result",))
+IMPORT_SECONDS = Histogram("school_import_seconds", "Bulk student import durations.", (), IMPORT_BUCKETS)
+ERRORS = Counter("school_errors_total", "Errors the app reports and carries on from, by where.", ("where",))
+
+
+def register_collector(collect):
+    """Add `collect()`, called at every scrape for (name, kind, help, [(labels, value)]) tuples."""
+    _collectors.append(collect)
+
+
+# Hits, misses and evictions of the result and figure caches, read from the
+# caches themselves so lookups pay nothing extra. A cache is reported once a
+# page has imported it.
+def _cache_metrics():
+    families = []
+    for module in ("query_cache", "figure_cache"):
+        cache = sys.modules.get(module)
+        if cache is None:
+            continue
+        stats = cache.stats()
+        for field in ("hits", "misses", "evictions"):
+            families.append((f"school_{module}_{field}_total", "counter", f"{module} {field}.",
+                             [("", stats[field])]))
+        families.append((f"school_{module}_bytes", "gauge", f"Estimated size of the {module} entries.",
+                         [("", stats["bytes"])]))
+    return families
+
+
+register_collector(_cache_metrics)
+
+
+def render():
+    """All metrics in the Prometheus text exposition format."""
+    lines = []
+    for metric in _metrics:
+        lines.append(f"# HELP {metric.name} {metric.help}")
+        lines.append(f"# TYPE {metric.name} {metric.kind}")
+        lines.extend(f"{name}{labels} {_number(value)}" for name, labels, value in metric.samples())
+    for collect in _collectors:
+        try:
+            families = collect()
+        except Exception as e:
+            print(f"A metrics collector failed: {e}")
+            continue
+        for name, kind, help, samples in families:
+            lines.append(f"# HELP {name} {help}")
+            lines.append(f"# TYPE {name} {kind}")
+            lines.extend(f"{name}{labels} {_number(value)}" for labels, value in samples)
+    return "\n".join(lines) + "\n"
+
+
+def reset():
+    for metric in _metrics:
+        metric.clear()
+
+
+def serve(host=METRICS_HOST, port=0):
+    """Serve /metrics on (host, port) from a daemon thread; port 0 picks a free one."""
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path.split("?")[0] not in ("/metrics", "/"):
+                self.send_error(404)
+                return
+            body = render().encode()
+            self.send_response(200)
+            self.send_header("Content-Type", CONTENT_TYPE)
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass  # scrapes every few seconds would flood the Streamlit log
+
+    server = ThreadingHTTPServer((host, port), Handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name="metrics-server", daemon=True).start()
+    return server
+
+
+def start_server():
+    """Start the endpoint configured by SCHOOL_METRICS_PORT once per process."""
+    global _server
+    if _server is not None or METRICS_PORT in ("", "0"):
+        return _server
+    with _server_lock:
+        if _server is None:
+            try:
+                _server = serve(METRICS_HOST, int(METRICS_PORT))
+                print(f"Metrics at http://{METRICS_HOST}:{_server.server_port}/metrics")
+            except (OSError, ValueError) as e:
+                print(f"Could not serve metrics on {METRICS_HOST}:{METRICS_PORT}: {e}")
+                _server = False  # don't retry on every rerun
+    return _server
@@ -0,0 +1,450 @@
+import json
+import threading
+import time
+
+import db
+
+# Schema migrations.
+#
+# Each step is (version, description, function). Steps run in order inside
+# their own transaction and the applied version is recorded in schema_version,
+# so a database is only ever upgraded once. ensure_migrated() additionally
+# remembers which database files this process has already brought up to date,
+# which turns every later call (e.g. on each Streamlit rerun) into a set lookup.
+
+
+def _baseline(cursor):
+    """Tables created by the original init_db (and teachers.py)."""
+    cursor.execute("""
+    CREATE TABLE IF NOT EXISTS branch (
+        branch_id INTEGER PRIMARY KEY AUTOINCREMENT,
+        branch_name TEXT NOT NULL,
+        location TEXT NOT NULL,
+        contact_number TEXT NOT NULL,
+        UNIQUE(branch_name)  -- Ensure each branch name is unique
+    );
+    """)
+
+    # Admins and teachers who can log in, with their role and branch
+    cursor.execute("""
+    CREATE TABLE IF NOT EXISTS user (
+        user_id INTEGER PRIMARY KEY AUTOINCREMENT,
+        name TEXT NOT NULL,  -- This will store the user's name
+        email TEXT NOT NULL UNIQUE,
+        password TEXT NOT NULL,
+        role TEXT NOT NULL CHECK(role IN ('superadmin', 'branchadmin', 'teacher')),
+        branch_id INTEGER,  -- Foreign key referring to the branch
+        FOREIGN KEY (branch_id) REFERENCES branch(branch_id) ON DELETE SET NULL
+    );
+    """)
+
+    cursor.execute("""
+    CREATE TABLE IF NOT EXISTS class (
+        class_id INTEGER PRIMARY KEY AUTOINCREMENT,
+        class_name TEXT NOT NULL,
+        branch_id INTEGER,
+        grade INTEGER,
+        FOREIGN KEY (branch_id) REFERENCES branch(branch_id)
+    );
+    """)
+
+    cursor.execute("""
+    CREATE TABLE IF NOT EXISTS section (
+        section_id INTEGER PRIMARY KEY AUTOINCREMENT,
+        class_id INTEGER NOT NULL,
+        section_name TEXT NOT NULL,
+        FOREIGN KEY (class_id) REFERENCES class(class_id) ON DELETE CASCADE,
+        UNIQUE(class_id, section_name)  -- Ensure each section name is unique per class
+    );
+    """)
+
+    # Students are added from the UI and from CSV without email or branch,
+    # so those columns are nullable
+    cursor.execute("""
+    CREATE TABLE IF NOT EXISTS student (
+        student_id INTEGER PRIMARY KEY AUTOINCREMENT,
+        section_id INTEGER NOT NULL,
+        student_name TEXT NOT NULL,
+        roll_number TEXT UNIQUE NOT NULL,
+        father_name TEXT,
+        mother_name TEXT,
+        gender TEXT NOT NULL CHECK(gender IN ('Male', 'Female', 'Other')),
+        phone_number TEXT NOT NULL,
+        dob DATE NOT NULL,
+        address TEXT NOT NULL,
+        email TEXT UNIQUE,
+        branch TEXT,
+        grade TEXT,
+        section TEXT,
+        FOREIGN KEY (section_id) REFERENCES section(section_id) ON DELETE CASCADE
+    );
+    """)
+
+    cursor.execute("""
+    CREATE TABLE IF NOT EXISTS student_manage_sections_classes (
+        student_id INTEGER PRIMARY KEY AUTOINCREMENT,
+        student_name TEXT NOT NULL,
+        roll_number TEXT NOT NULL,
+        gender TEXT NOT NULL,
+        phone_number TEXT NOT NULL,
+        dob DATE NOT NULL,
+        address TEXT NOT NULL
+    );
+    """)
+
+    # Students managed from the teacher dashboard
+    cursor.execute("""
+    CREATE TABLE IF NOT EXISTS student_new (
+        student_id INTEGER PRIMARY KEY AUTOINCREMENT,
+        student_name TEXT NOT NULL,
+        roll_number INTEGER NOT NULL,
+        age INTEGER NOT NULL,
+        gender TEXT NOT NULL,
+        branch TEXT NOT NULL
+    );
+    """)
+
+    cursor.execute("""
+    CREATE TABLE IF NOT EXISTS grades (
+        grade_id INTEGER PRIMARY KEY AUTOINCREMENT,
+        student_id INTEGER,
+        student_name TEXT,
+        subject TEXT,
+        chapter TEXT,
+        section TEXT,
+        grade INTEGER,
+        FOREIGN KEY(student_id) REFERENCES student_new(student_id)
+    );
+    """)
+
+    cursor.execute("""
+    CREATE TABLE IF NOT EXISTS branch_subject (
+        branch_id INTEGER PRIMARY KEY,
+        subject_name TEXT NOT NULL
+    );
+    """)
+
+    cursor.execute("""
+    CREATE TABLE IF NOT EXISTS subject (
+        subject_id INTEGER PRIMARY KEY AUTOINCREMENT,
+        subject_name TEXT NOT NULL,
+        description TEXT,
+        branch_id INTEGER NOT NULL,
+        class_id INTEGER NOT NULL,
+        FOREIGN KEY (class_id) REFERENCES class(class_id) ON DELETE CASCADE,
+        UNIQUE(branch_id, subject_name, class_id)  -- Ensure each subject is unique per branch and class
+    );
+    """)
+
+    cursor.execute("""
+    CREATE TABLE IF NOT EXISTS chapter (
+        chapter_id INTEGER PRIMARY KEY AUTOINCREMENT,
+        class_id INTEGER NOT NULL,
+        chapter_name TEXT NOT NULL,
+        description TEXT,
+        FOREIGN KEY (class_id) REFERENCES class(class_id) ON DELETE CASCADE,
+        UNIQUE(class_id, chapter_name)  -- Ensure each chapter is unique per class
+    );
+    """)
+
+    cursor.execute("""
+    CREATE TABLE IF NOT EXISTS topic (
+        topic_id INTEGER PRIMARY KEY AUTOINCREMENT,
+        topic_name TEXT NOT NULL,
+        description TEXT,
+        UNIQUE(topic_name)  -- Ensure each topic name is unique
+    );
+    """)
+
+    cursor.execute("""
+    CREATE TABLE IF NOT EXISTS topic_outcome (
+        topic_id INTEGER,
+        expected_outcome TEXT,
+        FOREIGN KEY (topic_id) REFERENCES topic(topic_id)
+    );
+    """)
+
+    cursor.execute("""
+    CREATE TABLE IF NOT EXISTS topic_association (
+        topic_id INTEGER NOT NULL,
+        subject_id INTEGER,
+        chapter_id INTEGER,
+        PRIMARY KEY (topic_id, subject_id, chapter_id),
+        FOREIGN KEY (topic_id) REFERENCES topic(topic_id),
+        FOREIGN KEY (subject_id) REFERENCES subject(subject_id),
+        FOREIGN KEY (chapter_id) REFERENCES chapter(chapter_id)
+    );
+    """)
+
+    cursor.execute("""
+    CREATE TABLE IF NOT EXISTS evaluation (
+        evaluation_id INTEGER PRIMARY KEY AUTOINCREMENT,
+        topic_id INTEGER NOT NULL,
+        is_evaluated BOOLEAN NOT NULL CHECK (is_evaluated IN (0, 1)),
+        FOREIGN KEY (topic_id) REFERENCES topic(topic_id) ON DELETE CASCADE
+    );
+    """)
+
+    cursor.execute("""
+    CREATE TABLE IF NOT EXISTS scores (
+        score_id INTEGER PRIMARY KEY AUTOINCREMENT,
+        student_id INTEGER NOT NULL,
+        subject_id INTEGER NOT NULL,
+        math REAL DEFAULT 0,
+        science REAL DEFAULT 0,
+        FOREIGN KEY (student_id) REFERENCES student(student_id) ON DELETE CASCADE,
+        FOREIGN KEY (subject_id) REFERENCES subject(subject_id) ON DELETE CASCADE
+    );
+    """)
+
+    cursor.execute("""
+    CREATE TABLE IF NOT EXISTS teachers (
+        teacher_id INTEGER PRIMARY KEY AUTOINCREMENT,
+        teacher_name TEXT NOT NULL,
+        branch_id INTEGER NOT NULL,
+        email TEXT NOT NULL UNIQUE,
+        subject TEXT,
+        password TEXT NOT NULL,
+        classes TEXT,  -- Comma-separated list or JSON, depending on your usage
+        FOREIGN KEY (branch_id) REFERENCES branch(branch_id) ON DELETE CASCADE
+    );
+    """)
+
+    # Default logins
+    cursor.execute("""
+    INSERT OR IGNORE INTO user (name, email, password, role, branch_id)
+    VALUES
+    ('Super Admin', 'super@example.com', '123', 'superadmin', NULL),
+    ('Branch Admin', 'branch@example.com', '123', 'branchadmin', 1),
+    ('Teacher', 'teacher@example.com', '123', 'teacher', 1);
+    """)
+
+
+def _add_column_if_missing(cursor, table, column, definition):
+    columns = [row[1] for row in cursor.execute(f"PRAGMA table_info({table})")]
+    if column not in columns:
+        cursor.execute(f"ALTER TABLE {table} ADD COLUMN {column} {definition}")
+
+
+def _reconcile_legacy_columns(cursor):
+    """Bring databases created by older versions of the app in line with the baseline."""
+    # teachers.save_grade writes student_name, which the old init_db never created
+    _add_column_if_missing(cursor, "grades", "student_name", "TEXT")
+
+    for column in ("email", "branch", "grade", "section"):
+        _add_column_if_missing(cursor, "student", column, "TEXT")
+    _add_column_if_missing(cursor, "student", "dob", "DATE")
+    cursor.execute("CREATE UNIQUE INDEX IF NOT EXISTS idx_student_email ON student(email)")
+
+
+def _lookup_indexes(cursor):
+    """Indexes for the dashboard and management lookups (see index_advisor.py)."""
+    # Students of a section, in roll number order
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_student_section ON student(section_id, roll_number)")
+    # Classes by grade, covering get_classes_by_grade
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_class_grade ON class(grade, class_id, class_name)")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_class_branch ON class(branch_id)")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_teachers_branch ON teachers(branch_id)")
+    # Teachers by subject, covering get_teachers_by_subject
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_teachers_subject ON teachers(subject, teacher_name, email, classes)")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_scores_student ON scores(student_id, math, science)")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_topic_association_chapter ON topic_association(chapter_id, topic_id)")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_topic_outcome_topic ON topic_outcome(topic_id)")
+    # Login, covering authenticate_user
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_user_login ON user(email, password, role)")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_user_branch ON user(branch_id, role)")
+
+
+def _branch_rollup(cursor):
+    import rollup
+    rollup.create_branch_rollup(cursor)
+
+
+def _table_versions(cursor):
+    import query_cache
+    query_cache.create_version_tracking(cursor)
+
+
+def _unique_grade_cells(cursor):
+    """One grade per student, subject, chapter and section; keeps the latest of any duplicates."""
+    cursor.execute("""
+    DELETE FROM grades
+    WHERE grade_id NOT IN (
+        SELECT MAX(grade_id) FROM grades GROUP BY student_id, subject, chapter, section
+    )
+    """)
+    cursor.execute(
+        "CREATE UNIQUE INDEX IF NOT EXISTS idx_grades_cell ON grades(student_id, subject, chapter, section)"
+    )
+    # A section's grid for one subject, covering load_grade_grid
+    cursor.execute(
+        "CREATE INDEX IF NOT EXISTS idx_grades_section ON grades(subject, section, student_id, chapter, grade)"
+    )
+
+
+def _roster_indexes(cursor):
+    """Indexes for the roster's keyset pages in each sort order (see roster.py)."""
+    cursor.execute(
+        "CREATE INDEX IF NOT EXISTS idx_student_section_name ON student(section_id, student_name, roll_number)"
+    )
+
+
+def _activity_indexes(cursor):
+    """Indexes for the branch dashboard's activity query (see branch_dashboard.py)."""
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_evaluation_topic ON evaluation(topic_id, is_evaluated)")
+
+
+def _aggregate_cube(cursor):
+    import cube
+    cube.create_cube(cursor)
+
+
+def _cube_dirty_cells(cursor):
+    import cube
+    cube.track_dirty_cells(cursor)
+
+
+def _job_queue(cursor):
+    import jobs
+    jobs.create_job_table(cursor)
+
+
+def _job_data_path(cursor):
+    import jobs
+    jobs.add_data_path(cursor)
+
+
+# The fixed list the teacher page offered before it read a section's students
+# from the student table. Its grades rows hold the name's position in this
+# list (1-30) as student_id, which points at an unrelated student.
+LEGACY_GRADE_STUDENTS = (
+    "John Doe", "Jane Smith", "Alex Brown", "Emily Davis", "Michael Johnson", "Sarah Lee", "David Wilson",
+    "Laura Taylor", "Chris White", "Megan Harris", "Tom Clark", "Anna Martin", "James Walker", "Sophia Hall",
+    "Benjamin Allen", "Olivia Young", "Ethan King", "Charlotte Scott", "Daniel Adams", "Grace Nelson",
+    "Noah Carter", "Ava Mitchell", "Lucas Roberts", "Isabella Perez", "Mason Evans", "Amelia Carter",
+    "Henry Thompson", "Lily Lewis", "William Harris", "Harper Turner",
+)
+
+
+def _detach_legacy_grades(cursor):
+    """Clear student_id on grades saved by list position; the rows stay, attributed to no student."""
+    cursor.execute("""
+    UPDATE grades SET student_id = NULL
+    WHERE (student_id, student_name) IN (SELECT key + 1, value FROM json_each(?))
+      AND NOT EXISTS (
+          SELECT 1 FROM student s WHERE s.student_id = grades.student_id AND s.student_name = grades.student_name
+      )
+    """, (json.dumps(LEGACY_GRADE_STUDENTS),))
+
+
+def _student_search(cursor):
+    import search_index
+    search_index.create_student_search(cursor)
+
+
+def _curriculum_search(cursor):
+    import search_index
+    search_index.create_curriculum_search(cursor)
+
+
+def _deferred_student_search(cursor):
+    import search_index
+    search_index.create_student_triggers(cursor)
+
+
+MIGRATIONS = [
+    (1, "baseline schema", _baseline),
+    (2, "reconcile legacy columns", _reconcile_legacy_columns),
+    (3, "lookup indexes", _lookup_indexes),
+    (4, "branch_rollup table and triggers", _branch_rollup),
+    (5, "table versions for the query cache", _table_versions),
+    (6, "unique grade cells", _unique_grade_cells),
+    (7, "roster sort indexes", _roster_indexes),
+    (8, "student full-text search", _student_search),
+    (9, "curriculum full-text search", _curriculum_search),
+    (10, "branch activity indexes", _activity_indexes),
+    (11, "dashboard aggregate cube", _aggregate_cube),
+    (12, "background job queue", _job_queue),
+    (13, "dashboard cube dirty cells", _cube_dirty_cells),
+    (14, "job data path", _job_data_path),
+    (15, "detach grades saved by list position", _detach_legacy_grades),
+    (16, "student search indexing deferred by bulk imports", _deferred_student_search),
+]
+
+LATEST_VERSION = MIGRATIONS[-1][0]
+
+
+def current_version(connection):
+    connection.execute("""
+    CREATE TABLE IF NOT EXISTS schema_version (
+        version INTEGER PRIMARY KEY,
+        description TEXT NOT NULL,
+        applied_at TEXT NOT NULL DEFAULT CURRENT_TIMESTAMP,
+        duration_ms REAL
+    )
+    """)
+    row = connection.execute("SELECT MAX(version) FROM schema_version").fetchone()
+    return row[0] or 0
+
+
+# Apply every pending migration and return a report of what was done
+def migrate(connection):
+    start = time.perf_counter()
+    from_version = current_version(connection)
+    applied = []
+
+    for version, description, step in MIGRATIONS:
+        if version <= from_version:
+            continue
+        step_start = time.perf_counter()
+        cursor = connection.cursor()
+        try:
+            cursor.execute("BEGIN IMMEDIATE")
+            # Another process may have applied the step while this one waited
+            # for the write lock
+            if cursor.execute("SELECT 1 FROM schema_version WHERE version = ?", (version,)).fetchone():
+                connection.rollback()
+                continue
+            step(cursor)
+            duration_ms = (time.perf_counter() - step_start) * 1000
+            cursor.execute(
+                "INSERT INTO schema_version (version, description, duration_ms) VALUES (?, ?, ?)",
+                (version, description, duration_ms),
+            )
+            connection.commit()
+        except Exception:
+            connection.rollback()
+            raise
+        applied.append((version, description, duration_ms))
+
+    return {
+        "from_version": from_version,
+        "to_version": current_version(connection),
+        "applied": applied,
+        "seconds": time.perf_counter() - start,
+    }
+
+
+_migrated = {}
+_migrate_lock = threading.Lock()
+
+
+# Migrate the database once per process; later calls return the first report
+def ensure_migrated(path=None):
+    path = path or db.current_path()
+    report = _migrated.get(path)
+    if report is not None:
+        return report
+
+    with _migrate_lock:
+        report = _migrated.get(path)
+        if report is None:
+            with db.pooled(path) as connection:
+                report = migrate(connection)
+            report["path"] = path
+            _migrated[path] = report
+    return report
+
+
+def last_report(path=None):
+    return _migrated.get(path or db.current_path())
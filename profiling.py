@@ -0,0 +1,195 @@
+"""Opt-in profiling of dashboard reruns, with a per-phase breakdown.
+
+The dashboard entry points are wrapped with @profiled. When profiling is on
+(SCHOOL_PROFILE=1, or ?profile=1 in the page URL) each rerun of an entry
+point runs under cProfile, and its time is split by where it was spent:
+
+    db          sqlite3 calls and the db/query_cache/query_log layer
+    dataframe   pandas, numpy and pyarrow
+    chart       plotly, matplotlib and altair (streamlit's built-in charts)
+    render      streamlit (widgets, elements, serialization)
+    import      module imports (pages import their libraries on first use)
+    other       the app's own code
+
+Phases go by each function's own time (cProfile's tottime), so a pandas
+call made by streamlit counts as dataframe. Standard library and builtin
+functions (copy.deepcopy, json, isinstance) take the phase of their
+callers, split by the time spent under each. cProfile slows Python-heavy
+phases more than C-heavy ones, so compare phases between runs rather than
+reading them as absolute times. The breakdown is shown in the sidebar and
+the raw stats are written to SCHOOL_PROFILE_DIR (default profiles/), one
+.prof file per rerun, for offline analysis (e.g. `snakeviz` or
+`flameprof` for flame graphs).
+
+An entry point called from another one (display_branch_dashboard from
+superadmin_dashboards) is part of the outer profile.
+
+    python profiling.py summary profiles/<file>.prof
+"""
+import os
+import sys
+import threading
+import time
+from functools import wraps
+
+PROFILE_ENV = os.environ.get("SCHOOL_PROFILE", "0") == "1"
+PROFILE_DIR = os.environ.get("SCHOOL_PROFILE_DIR", "profiles")
+# Oldest .prof files beyond this many are deleted
+PROFILE_KEEP = 200
+
+PHASES = ("db", "dataframe", "chart", "render", "import", "other")
+
+# Phase -> substrings of a function's file (or of a builtin's name)
+_PHASE_MARKERS = (
+    ("db", ("sqlite3", os.sep + "db.py", "query_cache.py", "query_log.py")),
+    ("dataframe", (os.sep + "pandas" + os.sep, os.sep + "numpy" + os.sep, os.sep + "pyarrow" + os.sep,
+                   "numpy.", "pandas.", "pyarrow.")),
+    ("chart", (os.sep + "plotly" + os.sep, os.sep + "_plotly_utils" + os.sep, os.sep + "matplotlib" + os.sep,
+               os.sep + "altair" + os.sep, "matplotlib.")),
+    ("render", (os.sep + "streamlit" + os.sep, os.sep + "google" + os.sep + "protobuf", "google._upb")),
+)
+
+APP_DIR = os.path.dirname(os.path.abspath(__file__))
+
+_local = threading.local()
+
+
+def enabled():
+    """Whether this rerun is profiled: the env var, or ?profile=1 on the page."""
+    if PROFILE_ENV:
+        return True
+    try:
+        import streamlit as st
+        return st.query_params.get("profile") == "1"
+    except Exception:
+        return False
+
+
+# Phase of a function from where it lives; None for the standard library
+# and builtins, which take their callers' phases
+def _phase(filename, function):
+    if function == "<module>" or filename.startswith("<frozen importlib"):
+        return "import"
+    where = function if filename == "~" else filename
+    for phase, markers in _PHASE_MARKERS:
+        if any(marker in where for marker in markers):
+            return phase
+    return "other" if where.startswith(APP_DIR) else None
+
+
+def phases(stats):
+    """Seconds per phase of a pstats.Stats."""
+    shares = {}
+
+    # Phase -> share of one function's own time
+    def share(key):
+        phase = _phase(key[0], key[2])
+        if phase is not None:
+            return {phase: 1.0}
+        if key in shares:
+            return shares[key]
+        shares[key] = {}  # recursive calls add nothing until resolved
+        callers = stats.stats[key][4]
+        weights = {caller: values[2] for caller, values in callers.items()}
+        if not any(weights.values()):
+            weights = {caller: values[0] for caller, values in callers.items()}
+        result = {}
+        for caller, weight in weights.items():
+            for phase, fraction in share(caller).items():
+                result[phase] = result.get(phase, 0.0) + fraction * weight
+        resolved = sum(result.values())
+        shares[key] = {phase: part / resolved for phase, part in result.items()} if resolved else {"other": 1.0}
+        return shares[key]
+
+    totals = dict.fromkeys(PHASES, 0.0)
+    for key, (_, _, own_time, _, _) in stats.stats.items():
+        for phase, fraction in share(key).items():
+            totals[phase] += own_time * fraction
+    return totals
+
+
+def _prune(directory):
+    files = sorted(
+        (entry.path for entry in os.scandir(directory) if entry.name.endswith(".prof")),
+        key=os.path.getmtime,
+    )
+    for path in files[:-PROFILE_KEEP]:
+        os.unlink(path)
+
+
+def _dump(profiler, name, seconds):
+    import pstats
+    stats = pstats.Stats(profiler)
+    breakdown = phases(stats)
+    path = None
+    try:
+        os.makedirs(PROFILE_DIR, exist_ok=True)
+        path = os.path.join(PROFILE_DIR, f"{time.strftime('%Y%m%d_%H%M%S')}_{time.time_ns() % 10**6:06d}_{name}.prof")
+        stats.dump_stats(path)
+        _prune(PROFILE_DIR)
+    except OSError as e:
+        print(f"Could not write the profile of {name}: {e}")
+    return {"name": name, "seconds": seconds, "phases": breakdown, "path": path}
+
+
+def _show(report):
+    import streamlit as st
+    try:
+        with st.sidebar.expander(f"Rerun profile: {report['name']}"):
+            st.write(f"{report['seconds'] * 1000:.0f} ms under cProfile")
+            st.table({phase: f"{seconds * 1000:.1f} ms" for phase, seconds in report["phases"].items()})
+            if report["path"]:
+                st.caption(report["path"])
+    except Exception:
+        pass  # the rerun was stopped or replaced; the dump is still written
+
+
+def profiled(name):
+    """Profile each rerun of a dashboard entry point when profiling is on."""
+    def decorator(func):
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            if getattr(_local, "active", False) or not enabled():
+                return func(*args, **kwargs)
+            import cProfile
+            profiler = cProfile.Profile()
+            _local.active = True
+            start = time.perf_counter()
+            profiler.enable()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                profiler.disable()
+                _local.active = False
+                report = _dump(profiler, name, time.perf_counter() - start)
+                _local.last_report = report
+                print(f"profile {name}: {report['seconds'] * 1000:.0f} ms, "
+                      + ", ".join(f"{phase} {seconds * 1000:.0f} ms" for phase, seconds in report["phases"].items())
+                      + (f" -> {report['path']}" if report["path"] else ""))
+                _show(report)
+        return wrapper
+    return decorator
+
+
+def last_report():
+    """The last profile taken on this thread (for tests and benchmarks)."""
+    return getattr(_local, "last_report", None)
+
+
+def main(argv=None):
+    argv = sys.argv[1:] if argv is None else argv
+    if len(argv) < 2 or argv[0] != "summary":
+        print("usage: python profiling.py summary <file.prof> [top functions]")
+        return 1
+    import pstats
+    stats = pstats.Stats(argv[1])
+    breakdown = phases(stats)
+    total = sum(breakdown.values()) or 1.0
+    for phase, seconds in breakdown.items():
+        print(f"{phase:<10} {seconds * 1000:>9.1f} ms {seconds / total:>6.1%}")
+    stats.sort_stats("tottime").print_stats(int(argv[2]) if len(argv) > 2 else 15)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
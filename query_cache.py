@@ -0,0 +1,227 @@
+"""Process-wide cache for query results, invalidated by per-table versions.
+
+Every tracked table has a row in table_version that triggers bump on each
+insert, update and delete. A cached result is keyed on its SQL, parameters
+and the versions of the tables it reads, so it is reused across reruns and
+sessions until a write touches one of those tables. Reading the versions is
+itself cheap: a dedicated read-only connection checks PRAGMA data_version,
+which only changes when another connection commits, and the version table is
+re-read only then.
+"""
+import os
+import sqlite3
+import sys
+import threading
+from collections import OrderedDict
+from functools import wraps
+
+import db
+
+# Tables whose writes invalidate cached results
+TRACKED_TABLES = (
+    "branch", "user", "class", "section", "student", "student_new", "grades",
+    "branch_subject", "subject", "chapter", "topic", "topic_outcome",
+    "topic_association", "evaluation", "scores", "teachers", "branch_rollup",
+)
+
+CACHE_BUDGET_BYTES = int(float(os.environ.get("SCHOOL_QUERY_CACHE_MB", "64")) * 1024 * 1024)
+
+
+def track_table(cursor, table):
+    """Add a version counter and its triggers for one table (migration helper)."""
+    cursor.execute("INSERT OR IGNORE INTO table_version (table_name, version) VALUES (?, 0)", (table,))
+    for event in ("INSERT", "UPDATE", "DELETE"):
+        name = f"trg_version_{table}_{event.lower()}"
+        cursor.execute(f"DROP TRIGGER IF EXISTS {name}")
+        cursor.execute(f"""
+        CREATE TRIGGER {name} AFTER {event} ON "{table}"
+        BEGIN
+            UPDATE table_version SET version = version + 1 WHERE table_name = '{table}';
+        END
+        """)
+
+
+def create_version_tracking(cursor):
+    """Create table_version and its triggers (migration step)."""
+    cursor.execute("""
+    CREATE TABLE IF NOT EXISTS table_version (
+        table_name TEXT PRIMARY KEY,
+        version INTEGER NOT NULL DEFAULT 0
+    ) WITHOUT ROWID
+    """)
+    for table in TRACKED_TABLES:
+        track_table(cursor, table)
+
+
+def bump_version(cursor, table):
+    """Invalidate cached results for `table` without going through its triggers."""
+    cursor.execute("UPDATE table_version SET version = version + 1 WHERE table_name = ?", (table,))
+
+
+class LRUCache:
+    """Thread-safe LRU mapping bounded by the estimated size of its values."""
+
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, default=None):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return default
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def put(self, key, value, size):
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            previous = self._entries.pop(key, None)
+            if previous is not None:
+                self.bytes -= previous[1]
+            self._entries[key] = (value, size)
+            self.bytes += size
+            while self.bytes > self.max_bytes:
+                _, (_, evicted_size) = self._entries.popitem(last=False)
+                self.bytes -= evicted_size
+                self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.bytes = 0
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "bytes": self.bytes,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+            }
+
+
+# Rough in-memory size of a query result
+def estimate_size(value):
+    if hasattr(value, "memory_usage"):  # pandas DataFrame or Series
+        usage = value.memory_usage(index=True, deep=True)
+        return int(usage if isinstance(usage, int) else usage.sum())
+    if isinstance(value, (list, tuple)):
+        return sys.getsizeof(value) + sum(estimate_size(item) for item in value)
+    return sys.getsizeof(value)
+
+
+class TableVersions:
+    """Current table_version values for one database file."""
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+        self._connection = None
+        self._data_version = None
+        self._versions = {}
+
+    def get(self, tables):
+        with self._lock:
+            if self._connection is None:
+                self._connection = sqlite3.connect(self.path, check_same_thread=False)
+            data_version = self._connection.execute("PRAGMA data_version").fetchone()[0]
+            if data_version != self._data_version:
+                self._versions = dict(self._connection.execute("SELECT table_name, version FROM table_version"))
+                self._data_version = data_version
+            return tuple(self._versions.get(table) for table in tables)
+
+
+_cache = LRUCache(CACHE_BUDGET_BYTES)
+_versions = {}
+_versions_lock = threading.Lock()
+
+
+def table_versions(tables, path=None):
+    path = path or db.current_path()
+    lent = db.lent_connection(path)
+    if lent is not None:
+        # Read through the lent connection rather than open a tracker per
+        # file (see sharding.fan_out); the cursor is a plain one, so the
+        # lookup is not logged as the page's query
+        versions = dict(lent.cursor(sqlite3.Cursor).execute("SELECT table_name, version FROM table_version"))
+        return tuple(versions.get(table) for table in tables)
+    tracker = _versions.get(path)
+    if tracker is None:
+        with _versions_lock:
+            tracker = _versions.setdefault(path, TableVersions(path))
+    return tracker.get(tables)
+
+
+def _lookup(key, compute):
+    result = _cache.get(key, _cache)
+    if result is _cache:
+        result = compute()
+        _cache.put(key, result, estimate_size(result))
+    return result
+
+
+# Cached cursor.fetchall(); `tables` lists every table the query reads.
+# Results are shared between callers and must not be modified.
+def fetchall(sql, params=(), tables=(), path=None):
+    key = ("fetchall", path or db.current_path(), sql, tuple(params), tables_key(tables, path))
+
+    def compute():
+        return db.get_connection(path).execute(sql, params).fetchall()
+
+    return _lookup(key, compute)
+
+
+def fetchone(sql, params=(), tables=(), path=None):
+    rows = fetchall(sql, params, tables, path)
+    return rows[0] if rows else None
+
+
+# Cached pd.read_sql_query()
+def read_frame(sql, params=(), tables=(), path=None):
+    key = ("read_frame", path or db.current_path(), sql, tuple(params), tables_key(tables, path))
+
+    def compute():
+        import pandas as pd
+        return pd.read_sql_query(sql, db.get_connection(path), params=tuple(params))
+
+    return _lookup(key, compute)
+
+
+def tables_key(tables, path=None):
+    tables = tuple(tables)
+    return tables, table_versions(tables, path)
+
+
+def memoize(tables):
+    """Cache a function's return value until a write touches one of `tables`."""
+    def decorator(func):
+        name = f"{func.__module__}.{func.__qualname__}"
+
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            key = (name, db.current_path(), args, tuple(sorted(kwargs.items())), tables_key(tables))
+            return _lookup(key, lambda: func(*args, **kwargs))
+
+        return wrapper
+    return decorator
+
+
+def stats():
+    return _cache.stats()
+
+
+def clear():
+    _cache.clear()
@@ -0,0 +1,374 @@
+"""Per-rerun query instrumentation and the superadmin Performance page.
+
+Every connection db.py hands out creates InstrumentedCursor cursors, so each
+statement the app runs is recorded with its fingerprint (the SQL with
+literals replaced and whitespace collapsed), parameter count, rows returned
+(or changed), wall time (execute plus fetches), the app function that ran
+it and the page set with set_page(). Records feed:
+
+    totals per page and fingerprint     the "top queries" table
+    per-rerun counts per page           start_rerun() / end_rerun() in login.main
+    the slow-query log                  statements over SLOW_QUERY_MS, as JSON
+                                        lines in SCHOOL_SLOW_QUERY_LOG
+
+Statistics are per server process. SCHOOL_QUERY_LOG=0 turns the
+instrumentation off.
+
+    python query_log.py slow     # tail of the slow-query log
+"""
+import json
+import os
+import re
+import sqlite3
+import sys
+import threading
+import time
+from collections import deque
+
+import metrics
+
+ENABLED = os.environ.get("SCHOOL_QUERY_LOG", "1") != "0"
+SLOW_QUERY_MS = float(os.environ.get("SCHOOL_SLOW_QUERY_MS", "100"))
+# Default: slow_queries.log next to the database
+SLOW_QUERY_LOG = os.environ.get("SCHOOL_SLOW_QUERY_LOG")
+SLOW_LOG_LINES = 200
+RECENT_RERUNS = 500
+
+OUTSIDE_RERUN = "(outside a rerun)"
+# Statement kinds metrics are labelled with; anything else is "other"
+STATEMENT_KINDS = frozenset(("select", "insert", "update", "delete", "with", "replace", "pragma", "begin", "commit"))
+
+# Modules between the app and sqlite3; the caller is the first frame outside them
+_PLUMBING = ("db", "query_log", "query_cache", "pandas", "sqlalchemy", "contextlib", "functools", "threading")
+
+_lock = threading.Lock()
+_local = threading.local()
+_fingerprints = {}
+_kinds = {}
+_totals = {}
+_reruns = deque(maxlen=RECENT_RERUNS)
+
+_LITERALS = re.compile(r"'(?:[^']|'')*'|\b\d+(?:\.\d+)?\b")
+_LISTS = re.compile(r"\(\s*\?(?:\s*,\s*\?)+\s*\)")
+_COMMENTS = re.compile(r"--[^\n]*|/\*.*?\*/", re.S)
+
+
+def fingerprint(sql):
+    """SQL with comments dropped, literals as ? and whitespace collapsed."""
+    result = _fingerprints.get(sql)
+    if result is None:
+        text = _COMMENTS.sub(" ", sql)
+        text = _LITERALS.sub("?", text)
+        text = _LISTS.sub("(?, ...)", text)
+        result = " ".join(text.split())
+        if len(_fingerprints) < 10000:
+            _fingerprints[sql] = result
+    return result
+
+
+def _caller():
+    frame = sys._getframe(3)
+    while frame is not None:
+        module = frame.f_globals.get("__name__", "")
+        if module.split(".")[0] not in _PLUMBING:
+            return f"{module}.{frame.f_code.co_qualname}"
+        frame = frame.f_back
+    return "?"
+
+
+def _parameter_count(parameters):
+    return len(parameters) if parameters is not None else 0
+
+
+class QueryRecord:
+    """One statement: what ran, from where, and what it cost so far."""
+
+    __slots__ = ("fingerprint", "parameters", "rows", "seconds", "function", "page")
+
+    def __init__(self, sql, parameters, function, page):
+        self.fingerprint = fingerprint(sql)
+        self.parameters = parameters
+        self.rows = 0
+        self.seconds = 0.0
+        self.function = function
+        self.page = page
+
+
+class InstrumentedCursor(sqlite3.Cursor):
+    """sqlite3 cursor that records every statement it runs.
+
+    Fetch time and rows are added to the statement's record; the record is
+    counted in the totals (and the slow-query log) once the statement is
+    done: its rows are exhausted, the cursor runs another statement, or the
+    cursor is closed or dropped.
+    """
+
+    _record = None
+
+    def _start(self, sql, parameters):
+        self._finish()
+        record = QueryRecord(sql, parameters, _caller(), getattr(_local, "page", None) or OUTSIDE_RERUN)
+        rerun = getattr(_local, "rerun", None)
+        if rerun is not None:
+            rerun.append(record)
+        self._record = record
+        return record
+
+    def _run(self, record, method, *args):
+        start = time.perf_counter()
+        try:
+            return method(*args)
+        except sqlite3.Error:
+            metrics.QUERY_ERRORS.inc(record.page)
+            raise
+        finally:
+            record.seconds += time.perf_counter() - start
+            if self.description is None:
+                record.rows = max(self.rowcount, 0)
+                self._finish()
+
+    def execute(self, sql, parameters=()):
+        record = self._start(sql, _parameter_count(parameters))
+        return self._run(record, super().execute, sql, parameters)
+
+    def executemany(self, sql, seq_of_parameters):
+        record = self._start(sql, 0)
+        return self._run(record, super().executemany, sql, seq_of_parameters)
+
+    def executescript(self, sql_script):
+        record = self._start(sql_script, 0)
+        return self._run(record, super().executescript, sql_script)
+
+    def _fetched(self, start, rows, done):
+        record = self._record
+        if record is not None:
+            record.seconds += time.perf_counter() - start
+            record.rows += rows
+            if done:
+                self._finish()
+
+    def fetchone(self):
+        start = time.perf_counter()
+        row = super().fetchone()
+        self._fetched(start, row is not None, row is None)
+        return row
+
+    def fetchmany(self, size=None):
+        start = time.perf_counter()
+        rows = super().fetchmany(self.arraysize if size is None else size)
+        self._fetched(start, len(rows), not rows)
+        return rows
+
+    def fetchall(self):
+        start = time.perf_counter()
+        rows = super().fetchall()
+        self._fetched(start, len(rows), True)
+        return rows
+
+    def __next__(self):
+        start = time.perf_counter()
+        try:
+            row = super().__next__()
+        except StopIteration:
+            self._fetched(start, 0, True)
+            raise
+        self._fetched(start, 1, False)
+        return row
+
+    def close(self):
+        self._finish()
+        super().close()
+
+    def __del__(self):
+        self._finish()
+
+    def _finish(self):
+        record = self._record
+        if record is not None:
+            self._record = None
+            _count(record)
+
+
+def cursor_class():
+    """Cursor factory for db.py's connections."""
+    return InstrumentedCursor if ENABLED else sqlite3.Cursor
+
+
+def statement_kind(fingerprint):
+    """The metrics label of a statement: its first keyword, or "other"."""
+    kind = _kinds.get(fingerprint)
+    if kind is None:
+        kind = fingerprint.split(" ", 1)[0].lower()
+        kind = kind if kind in STATEMENT_KINDS else "other"
+        if len(_kinds) < 10000:
+            _kinds[fingerprint] = kind
+    return kind
+
+
+def _count(record):
+    metrics.QUERY_SECONDS.observe(record.seconds, record.page, statement_kind(record.fingerprint))
+    key = (record.page, record.fingerprint)
+    with _lock:
+        total = _totals.get(key)
+        if total is None:
+            total = _totals[key] = {"calls": 0, "seconds": 0.0, "max_seconds": 0.0, "rows": 0, "functions": set()}
+        total["calls"] += 1
+        total["seconds"] += record.seconds
+        total["max_seconds"] = max(total["max_seconds"], record.seconds)
+        total["rows"] += record.rows
+        if len(total["functions"]) < 5:
+            total["functions"].add(record.function)
+    if record.seconds * 1000 >= SLOW_QUERY_MS:
+        _log_slow(record)
+
+
+def slow_log_path():
+    if SLOW_QUERY_LOG:
+        return SLOW_QUERY_LOG
+    import db
+    return os.path.join(os.path.dirname(os.path.abspath(db.DB_PATH)), "slow_queries.log")
+
+
+def _log_slow(record):
+    line = json.dumps({
+        "at": time.strftime("%Y-%m-%d %H:%M:%S"), "ms": round(record.seconds * 1000, 2), "rows": record.rows,
+        "parameters": record.parameters, "page": record.page, "function": record.function,
+        "fingerprint": record.fingerprint,
+    })
+    try:
+        with _lock, open(slow_log_path(), "a") as log:
+            log.write(line + "\n")
+    except OSError as e:
+        print(f"Could not write the slow-query log: {e}")
+
+
+def slow_queries(limit=SLOW_LOG_LINES):
+    """The last `limit` slow-query log entries, newest first."""
+    try:
+        with open(slow_log_path()) as log:
+            lines = deque(log, maxlen=limit)
+    except FileNotFoundError:
+        return []
+    return [json.loads(line) for line in reversed(lines) if line.strip()]
+
+
+def start_rerun(page):
+    """Start recording a script rerun of `page` on this thread."""
+    _local.rerun = []
+    _local.page = page
+    _local.rerun_start = time.perf_counter()
+
+
+def set_page(page):
+    """Name the page the rest of this rerun renders (e.g. a dashboard option)."""
+    _local.page = page
+
+
+def end_rerun():
+    """Finish this thread's rerun; returns its summary (None outside a rerun)."""
+    rerun = getattr(_local, "rerun", None)
+    if rerun is None:
+        return
+    _local.rerun = None
+    summary = {
+        "page": _local.page, "queries": len(rerun), "db_seconds": sum(record.seconds for record in rerun),
+        "seconds": time.perf_counter() - _local.rerun_start,
+    }
+    _local.page = None
+    with _lock:
+        _reruns.append(summary)
+    return summary
+
+
+def top_queries(limit=50):
+    """Totals per page and fingerprint, by total time."""
+    with _lock:
+        rows = [
+            {"page": page, "fingerprint": fp, **{k: v for k, v in total.items() if k != "functions"},
+             "functions": ", ".join(sorted(total["functions"]))}
+            for (page, fp), total in _totals.items()
+        ]
+    return sorted(rows, key=lambda row: row["seconds"], reverse=True)[:limit]
+
+
+def reruns_by_page():
+    """Per page: reruns recorded, queries and database time per rerun."""
+    with _lock:
+        reruns = list(_reruns)
+    pages = {}
+    for rerun in reruns:
+        page = pages.setdefault(rerun["page"], {"reruns": 0, "queries": 0, "max_queries": 0, "db_seconds": 0.0, "seconds": 0.0})
+        page["reruns"] += 1
+        page["queries"] += rerun["queries"]
+        page["max_queries"] = max(page["max_queries"], rerun["queries"])
+        page["db_seconds"] += rerun["db_seconds"]
+        page["seconds"] += rerun["seconds"]
+    return pages
+
+
+def reset():
+    with _lock:
+        _totals.clear()
+        _reruns.clear()
+
+
+# Top queries, queries per rerun per page and the slow-query log (superadmin)
+def performance_page():
+    import pandas as pd
+    import streamlit as st
+
+    st.subheader("Performance")
+    if not ENABLED:
+        st.info("Query instrumentation is off (SCHOOL_QUERY_LOG=0).")
+        return
+    st.caption(f"Since the server started or the last reset. Queries over {SLOW_QUERY_MS:.0f} ms are logged "
+               f"to {slow_log_path()}.")
+    if st.button("Reset statistics"):
+        reset()
+
+    st.markdown("#### Queries per rerun")
+    pages = reruns_by_page()
+    if pages:
+        st.dataframe(pd.DataFrame([
+            {"Page": page, "Reruns": p["reruns"], "Queries / rerun": p["queries"] / p["reruns"],
+             "Max queries": p["max_queries"], "DB ms / rerun": p["db_seconds"] * 1000 / p["reruns"],
+             "Rerun ms": p["seconds"] * 1000 / p["reruns"]}
+            for page, p in sorted(pages.items(), key=lambda item: -item[1]["db_seconds"])
+        ]).round(2), hide_index=True)
+    else:
+        st.info("No reruns recorded yet.")
+
+    st.markdown("#### Top queries by total time")
+    top = top_queries()
+    if top:
+        st.dataframe(pd.DataFrame([
+            {"Total ms": row["seconds"] * 1000, "Calls": row["calls"], "Mean ms": row["seconds"] * 1000 / row["calls"],
+             "Max ms": row["max_seconds"] * 1000, "Rows": row["rows"], "Page": row["page"],
+             "Called from": row["functions"], "Query": row["fingerprint"]}
+            for row in top
+        ]).round(2), hide_index=True)
+    else:
+        st.info("No queries recorded yet.")
+
+    st.markdown("#### Slow-query log")
+    slow = slow_queries()
+    if slow:
+        st.dataframe(pd.DataFrame(slow), hide_index=True)
+    else:
+        st.info("No slow queries logged.")
+
+
+def main(argv=None):
+    argv = sys.argv[1:] if argv is None else argv
+    command = argv[0] if argv else "slow"
+    if command == "slow":
+        for entry in slow_queries(int(argv[1]) if len(argv) > 1 else 20):
+            print(f"{entry['at']}  {entry['ms']:>9.1f} ms  {entry['rows']:>7} rows  {entry['page']}  "
+                  f"{entry['function']}\n    {entry['fingerprint']}")
+        return 0
+    print(f"Unknown command: {command}")
+    return 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,254 @@
+"""Per-branch statistics kept current by triggers.
+
+branch_rollup holds one row per branch with the counts and score sums the
+superadmin dashboard shows, so the dashboard reads it by primary key instead
+of joining branch -> class -> section -> student -> teachers -> scores.
+
+    python rollup.py check    # recompute from scratch and diff against the table
+    python rollup.py rebuild  # recompute from scratch and replace the table
+"""
+import sys
+
+import db
+
+ROLLUP_COLUMNS = ("students", "teachers", "classes", "sections", "score_count", "math_sum", "science_sum")
+
+# Everything the rollup holds for one branch, recomputed from the base tables.
+# {branch} is an SQL expression for the branch id.
+_BRANCH_TOTALS = """
+SELECT st.n, t.n, c.n, sec.n, sc.n, sc.math, sc.science
+FROM (SELECT COUNT(*) AS n
+      FROM student s
+      JOIN section sec ON s.section_id = sec.section_id
+      JOIN class c ON sec.class_id = c.class_id
+      WHERE c.branch_id = {branch}) st,
+     (SELECT COUNT(*) AS n FROM teachers WHERE branch_id = {branch}) t,
+     (SELECT COUNT(*) AS n FROM class WHERE branch_id = {branch}) c,
+     (SELECT COUNT(*) AS n
+      FROM section sec
+      JOIN class c ON sec.class_id = c.class_id
+      WHERE c.branch_id = {branch}) sec,
+     (SELECT COUNT(*) AS n, TOTAL(sc.math) AS math, TOTAL(sc.science) AS science
+      FROM scores sc
+      JOIN student s ON sc.student_id = s.student_id
+      JOIN section sec ON s.section_id = sec.section_id
+      JOIN class c ON sec.class_id = c.class_id
+      WHERE c.branch_id = {branch}) sc
+"""
+
+# Branch of a section / of a student, as SQL expressions
+_SECTION_BRANCH = "(SELECT c.branch_id FROM section sec JOIN class c ON sec.class_id = c.class_id WHERE sec.section_id = {section})"
+_STUDENT_BRANCH = (
+    "(SELECT c.branch_id FROM student s JOIN section sec ON s.section_id = sec.section_id "
+    "JOIN class c ON sec.class_id = c.class_id WHERE s.student_id = {student})"
+)
+_CLASS_BRANCH = "(SELECT branch_id FROM class WHERE class_id = {class_id})"
+
+
+def _recompute(branch):
+    columns = ", ".join(ROLLUP_COLUMNS)
+    return f"UPDATE branch_rollup SET ({columns}) = ({_BRANCH_TOTALS.format(branch=branch)}) WHERE branch_id = {branch};"
+
+
+def _bump(branch, **deltas):
+    assignments = ", ".join(f"{column} = {column} + ({delta})" for column, delta in deltas.items())
+    return f"UPDATE branch_rollup SET {assignments} WHERE branch_id = {branch};"
+
+
+def _student_scores(student, sign):
+    """Move a student's score rows in or out of a branch."""
+    return (
+        f"UPDATE branch_rollup SET "
+        f"score_count = score_count {sign} (SELECT COUNT(*) FROM scores WHERE student_id = {student}), "
+        f"math_sum = math_sum {sign} (SELECT TOTAL(math) FROM scores WHERE student_id = {student}), "
+        f"science_sum = science_sum {sign} (SELECT TOTAL(science) FROM scores WHERE student_id = {student}) "
+        f"WHERE branch_id = {{branch}};"
+    )
+
+
+# Trigger name -> (event, body). Frequent writes (students, scores, teachers)
+# adjust the counters in place; structural changes to classes and sections
+# recompute the affected branches.
+TRIGGERS = {
+    "trg_rollup_branch_insert": (
+        "AFTER INSERT ON branch",
+        "INSERT OR IGNORE INTO branch_rollup (branch_id) VALUES (NEW.branch_id);",
+    ),
+    "trg_rollup_branch_delete": (
+        "AFTER DELETE ON branch",
+        "DELETE FROM branch_rollup WHERE branch_id = OLD.branch_id;",
+    ),
+    "trg_rollup_teacher_insert": (
+        "AFTER INSERT ON teachers",
+        _bump("NEW.branch_id", teachers=1),
+    ),
+    "trg_rollup_teacher_delete": (
+        "AFTER DELETE ON teachers",
+        _bump("OLD.branch_id", teachers=-1),
+    ),
+    "trg_rollup_teacher_move": (
+        "AFTER UPDATE OF branch_id ON teachers WHEN OLD.branch_id IS NOT NEW.branch_id",
+        _bump("OLD.branch_id", teachers=-1) + _bump("NEW.branch_id", teachers=1),
+    ),
+    "trg_rollup_class_insert": (
+        "AFTER INSERT ON class",
+        _bump("NEW.branch_id", classes=1),
+    ),
+    "trg_rollup_class_delete": (
+        "AFTER DELETE ON class",
+        _recompute("OLD.branch_id"),
+    ),
+    "trg_rollup_class_move": (
+        "AFTER UPDATE OF branch_id ON class WHEN OLD.branch_id IS NOT NEW.branch_id",
+        _recompute("OLD.branch_id") + _recompute("NEW.branch_id"),
+    ),
+    "trg_rollup_section_insert": (
+        "AFTER INSERT ON section",
+        _bump(_CLASS_BRANCH.format(class_id="NEW.class_id"), sections=1),
+    ),
+    "trg_rollup_section_delete": (
+        "AFTER DELETE ON section",
+        _recompute(_CLASS_BRANCH.format(class_id="OLD.class_id")),
+    ),
+    "trg_rollup_section_move": (
+        "AFTER UPDATE OF class_id ON section WHEN OLD.class_id IS NOT NEW.class_id",
+        _recompute(_CLASS_BRANCH.format(class_id="OLD.class_id"))
+        + _recompute(_CLASS_BRANCH.format(class_id="NEW.class_id")),
+    ),
+    "trg_rollup_student_insert": (
+        "AFTER INSERT ON student",
+        _bump(_SECTION_BRANCH.format(section="NEW.section_id"), students=1),
+    ),
+    "trg_rollup_student_delete": (
+        "AFTER DELETE ON student",
+        _bump(_SECTION_BRANCH.format(section="OLD.section_id"), students=-1)
+        + _student_scores("OLD.student_id", "-").format(branch=_SECTION_BRANCH.format(section="OLD.section_id")),
+    ),
+    "trg_rollup_student_move": (
+        "AFTER UPDATE OF section_id ON student WHEN OLD.section_id IS NOT NEW.section_id",
+        _bump(_SECTION_BRANCH.format(section="OLD.section_id"), students=-1)
+        + _student_scores("OLD.student_id", "-").format(branch=_SECTION_BRANCH.format(section="OLD.section_id"))
+        + _bump(_SECTION_BRANCH.format(section="NEW.section_id"), students=1)
+        + _student_scores("NEW.student_id", "+").format(branch=_SECTION_BRANCH.format(section="NEW.section_id")),
+    ),
+    "trg_rollup_score_insert": (
+        "AFTER INSERT ON scores",
+        _bump(_STUDENT_BRANCH.format(student="NEW.student_id"),
+              score_count=1, math_sum="COALESCE(NEW.math, 0)", science_sum="COALESCE(NEW.science, 0)"),
+    ),
+    "trg_rollup_score_delete": (
+        "AFTER DELETE ON scores",
+        _bump(_STUDENT_BRANCH.format(student="OLD.student_id"),
+              score_count=-1, math_sum="-COALESCE(OLD.math, 0)", science_sum="-COALESCE(OLD.science, 0)"),
+    ),
+    "trg_rollup_score_update": (
+        "AFTER UPDATE OF student_id, math, science ON scores",
+        _bump(_STUDENT_BRANCH.format(student="OLD.student_id"),
+              score_count=-1, math_sum="-COALESCE(OLD.math, 0)", science_sum="-COALESCE(OLD.science, 0)")
+        + _bump(_STUDENT_BRANCH.format(student="NEW.student_id"),
+                score_count=1, math_sum="COALESCE(NEW.math, 0)", science_sum="COALESCE(NEW.science, 0)"),
+    ),
+}
+
+# The full rollup, recomputed from scratch. Each measure is aggregated on its
+# own before joining, so no join multiplies another's rows.
+RECOMPUTE_ALL_SQL = """
+SELECT b.branch_id,
+       COALESCE(st.n, 0), COALESCE(t.n, 0), COALESCE(c.n, 0), COALESCE(sec.n, 0),
+       COALESCE(sc.n, 0), COALESCE(sc.math, 0), COALESCE(sc.science, 0)
+FROM branch b
+LEFT JOIN (SELECT c.branch_id, COUNT(*) AS n
+           FROM student s
+           JOIN section sec ON s.section_id = sec.section_id
+           JOIN class c ON sec.class_id = c.class_id
+           GROUP BY c.branch_id) st ON st.branch_id = b.branch_id
+LEFT JOIN (SELECT branch_id, COUNT(*) AS n FROM teachers GROUP BY branch_id) t ON t.branch_id = b.branch_id
+LEFT JOIN (SELECT branch_id, COUNT(*) AS n FROM class GROUP BY branch_id) c ON c.branch_id = b.branch_id
+LEFT JOIN (SELECT c.branch_id, COUNT(*) AS n
+           FROM section sec
+           JOIN class c ON sec.class_id = c.class_id
+           GROUP BY c.branch_id) sec ON sec.branch_id = b.branch_id
+LEFT JOIN (SELECT c.branch_id, COUNT(*) AS n, TOTAL(sc.math) AS math, TOTAL(sc.science) AS science
+           FROM scores sc
+           JOIN student s ON sc.student_id = s.student_id
+           JOIN section sec ON s.section_id = sec.section_id
+           JOIN class c ON sec.class_id = c.class_id
+           GROUP BY c.branch_id) sc ON sc.branch_id = b.branch_id
+"""
+
+
+def create_branch_rollup(cursor):
+    """Create branch_rollup and its triggers, and fill it (migration step)."""
+    cursor.execute("""
+    CREATE TABLE IF NOT EXISTS branch_rollup (
+        branch_id INTEGER PRIMARY KEY,
+        students INTEGER NOT NULL DEFAULT 0,
+        teachers INTEGER NOT NULL DEFAULT 0,
+        classes INTEGER NOT NULL DEFAULT 0,
+        sections INTEGER NOT NULL DEFAULT 0,
+        score_count INTEGER NOT NULL DEFAULT 0,
+        math_sum REAL NOT NULL DEFAULT 0,
+        science_sum REAL NOT NULL DEFAULT 0
+    )
+    """)
+    for name, (event, body) in TRIGGERS.items():
+        cursor.execute(f"DROP TRIGGER IF EXISTS {name}")
+        cursor.execute(f"CREATE TRIGGER {name} {event} BEGIN {body} END")
+    rebuild_branch_rollup(cursor)
+
+
+def add_students(cursor, section_id, count):
+    """Count `count` new students of a section in one statement (bulk loads)."""
+    cursor.execute(_bump(_SECTION_BRANCH.format(section="?"), students="?"), (count, section_id))
+
+
+def rebuild_branch_rollup(cursor):
+    cursor.execute("DELETE FROM branch_rollup")
+    cursor.execute(f"INSERT INTO branch_rollup (branch_id, {', '.join(ROLLUP_COLUMNS)}) {RECOMPUTE_ALL_SQL}")
+
+
+# Recompute the rollup and return every difference from the stored table as
+# (branch_id, column, stored value, expected value)
+def check_branch_rollup(connection):
+    expected = {row[0]: row[1:] for row in connection.execute(RECOMPUTE_ALL_SQL)}
+    stored = {
+        row[0]: row[1:]
+        for row in connection.execute(f"SELECT branch_id, {', '.join(ROLLUP_COLUMNS)} FROM branch_rollup")
+    }
+    differences = []
+    for branch_id in sorted(expected.keys() | stored.keys()):
+        want = expected.get(branch_id)
+        have = stored.get(branch_id)
+        if want is None or have is None:
+            differences.append((branch_id, "row", have, want))
+            continue
+        for column, have_value, want_value in zip(ROLLUP_COLUMNS, have, want):
+            if abs((have_value or 0) - (want_value or 0)) > 1e-6:
+                differences.append((branch_id, column, have_value, want_value))
+    return differences
+
+
+def main(argv=None):
+    argv = sys.argv[1:] if argv is None else argv
+    command = argv[0] if argv else "check"
+    import migrations
+    migrations.ensure_migrated()
+
+    with db.pooled() as connection:
+        if command == "rebuild":
+            rebuild_branch_rollup(connection.cursor())
+            connection.commit()
+            print("branch_rollup rebuilt.")
+            return 0
+
+        differences = check_branch_rollup(connection)
+    if not differences:
+        print("branch_rollup is consistent.")
+        return 0
+    for branch_id, column, stored, expected in differences:
+        print(f"branch {branch_id}: {column} is {stored}, expected {expected}")
+    return 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,145 @@
+"""Paginated student rosters.
+
+Pages are fetched with keyset pagination: each page starts after the sort
+key of the previous page's last row, so the query walks an index from that
+point and reads only `limit` rows, whatever the page number or roster size.
+Columns and sort orders are whitelisted per roster.
+"""
+import streamlit as st
+
+import query_cache
+
+PAGE_SIZE = 50
+PAGE_SIZES = (25, 50, 100, 250)
+
+# Roster name -> table, column it is filtered on (or None), selectable
+# columns, and sort orders. Every sort order ends in a unique column so the
+# key of a row identifies it, and has an index starting with the filter
+# column (see migrations.py).
+ROSTERS = {
+    "section": {
+        "table": "student",
+        "filter": "section_id",
+        "columns": ("student_name", "roll_number", "gender", "phone_number", "dob", "address",
+                    "father_name", "mother_name", "email", "student_id"),
+        "sorts": {
+            "roll_number": ("roll_number",),
+            "student_name": ("student_name", "roll_number"),
+        },
+    },
+    "student_new": {
+        "table": "student_new",
+        "filter": None,
+        "columns": ("student_id", "student_name", "roll_number", "age", "gender", "branch"),
+        "sorts": {
+            "student_id": ("student_id",),
+        },
+    },
+}
+
+DEFAULT_COLUMNS = {
+    "section": ("student_name", "roll_number", "gender", "phone_number", "dob", "address", "father_name", "mother_name"),
+    "student_new": ROSTERS["student_new"]["columns"],
+}
+
+
+def page_sql(roster, columns, sort, keyed, descending=False):
+    spec = ROSTERS[roster]
+    keys = spec["sorts"][sort]
+    conditions = []
+    if spec["filter"]:
+        conditions.append(f"{spec['filter']} = ?")
+    if keyed:
+        conditions.append(f"({', '.join(keys)}) {'<' if descending else '>'} ({', '.join('?' for _ in keys)})")
+    where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+    order = ", ".join(f"{key} DESC" if descending else key for key in keys)
+    return f"SELECT {', '.join(columns + keys)} FROM {spec['table']} {where} ORDER BY {order} LIMIT ?"
+
+
+def fetch_page(roster, filter_value=None, columns=None, sort=None, after=None, limit=PAGE_SIZE, descending=False):
+    """One page of a roster.
+
+    Returns (rows, next_after): rows hold the requested columns, and
+    next_after is the key to pass as `after` for the next page (None on the
+    last page).
+    """
+    spec = ROSTERS[roster]
+    columns = tuple(columns or DEFAULT_COLUMNS[roster])
+    sort = sort or next(iter(spec["sorts"]))
+    unknown = [c for c in columns if c not in spec["columns"]]
+    if unknown or sort not in spec["sorts"]:
+        raise ValueError(f"Unknown roster column or sort: {', '.join(unknown) or sort}")
+
+    keys = spec["sorts"][sort]
+    params = [filter_value] if spec["filter"] else []
+    if after is not None:
+        params.extend(after)
+    params.append(limit)
+    rows = query_cache.fetchall(page_sql(roster, columns, sort, after is not None, descending),
+                                params, tables=(spec["table"],))
+    next_after = tuple(rows[-1][len(columns):]) if len(rows) == limit else None
+    return [row[:len(columns)] for row in rows], next_after
+
+
+# Students of one section as (student_id, student_name), by name
+SECTION_STUDENTS_SQL = """
+SELECT s.student_id, s.student_name FROM student s
+JOIN section sec ON s.section_id = sec.section_id JOIN class c ON sec.class_id = c.class_id
+WHERE c.branch_id = ? AND c.grade = ? AND sec.section_name = ? ORDER BY s.student_name, s.student_id
+"""
+
+
+def section_students(branch_id, grade, section_name):
+    return query_cache.fetchall(SECTION_STUDENTS_SQL, (branch_id, grade, section_name),
+                                tables=("student", "section", "class"))
+
+
+def _label(column):
+    return column.replace("_", " ").title()
+
+
+# Roster table with sort, column and page size pickers and Previous/Next
+# buttons. Only the visible page is fetched; the keys of the pages before it
+# are kept in session state.
+def show_roster(roster, filter_value=None, key=""):
+    import pandas as pd
+    spec = ROSTERS[roster]
+    state_key = f"roster_{roster}_{filter_value}_{key}"
+
+    col1, col2, col3 = st.columns([2, 1, 1])
+    with col1:
+        columns = st.multiselect("Columns", spec["columns"], default=list(DEFAULT_COLUMNS[roster]),
+                                 format_func=_label, key=f"{state_key}_columns")
+    with col2:
+        sort = st.selectbox("Sort By", list(spec["sorts"]), format_func=_label, key=f"{state_key}_sort")
+    with col3:
+        limit = st.selectbox("Rows Per Page", PAGE_SIZES, index=PAGE_SIZES.index(PAGE_SIZE), key=f"{state_key}_limit")
+    descending = st.checkbox("Descending", key=f"{state_key}_descending")
+
+    # Start keys of the pages up to the current one; reset when the view changes
+    view = (tuple(columns), sort, limit, descending)
+    state = st.session_state.get(state_key)
+    if state is None or state["view"] != view:
+        state = st.session_state[state_key] = {"view": view, "starts": [None]}
+
+    rows, next_after = fetch_page(roster, filter_value, columns or None, sort, state["starts"][-1], limit, descending)
+    page = len(state["starts"])
+    first = (page - 1) * limit + 1
+    st.dataframe(pd.DataFrame(rows, columns=[_label(c) for c in (columns or DEFAULT_COLUMNS[roster])]),
+                 hide_index=True, use_container_width=True)
+
+    col1, col2, col3 = st.columns([1, 2, 1])
+    with col1:
+        if st.button("Previous", key=f"{state_key}_previous", disabled=page == 1):
+            state["starts"].pop()
+            st.rerun()
+    with col2:
+        if rows:
+            st.caption(f"Page {page}: rows {first}-{first + len(rows) - 1}")
+        else:
+            st.caption("No students found.")
+    with col3:
+        if st.button("Next", key=f"{state_key}_next", disabled=next_after is None):
+            state["starts"].append(next_after)
+            st.rerun()
+    return rows
@@ -0,0 +1,195 @@
+"""Full-text student and curriculum search.
+
+Queries student_fts and curriculum_fts (see search_index.py). Every word of
+a query is matched as a prefix, so "pri sha" finds "Priya Sharma"; students
+matching every word exactly come first. Results are ranked with bm25, a name
+match weighing more than a parent's name. The subject pages use the
+curriculum search to jump straight to a chapter or topic instead of
+scrolling a list.
+
+    python benchmark.py search   # latency on a 1M-student table
+"""
+import json
+import re
+
+import streamlit as st
+
+import query_cache
+
+SEARCH_LIMIT = 20
+
+# Turn what the user typed into an FTS5 query: every word becomes a quoted
+# prefix term, so punctuation and FTS5 operators in the input are inert.
+# Single letters match whole words only; the prefix index starts at two.
+# Prefixes of up to six letters are read straight from the prefix index;
+# longer ones merge every indexed word they start.
+def match_query(text):
+    words = re.findall(r"\w+", text or "")
+    return " ".join(f'"{word}"*' if len(word) > 1 else f'"{word}"' for word in words)
+
+
+# The same query with every word matched whole
+def exact_query(text):
+    return " ".join(f'"{word}"' for word in re.findall(r"\w+", text or ""))
+
+
+# Students whose words match the query exactly come first, all of them
+# before any prefix match: those matching in the student's own name, roll
+# number, phone or email (the heaviest search_index.SEARCH_WEIGHTS), then
+# those matching only through a parent's name, newest first within each. Exact matches are
+# read in windows of SEARCH_WINDOW, under the branch filter if there is one,
+# so every window but the last fills the results and an old student matching
+# exactly is not cut off; SEARCH_MAX_WINDOWS still caps the loop. bm25 would
+# have to score every exact match, which costs more than the 20 ms budget
+# for a common full name on a 1M-student table.
+#
+# The rest is filled from prefix matches. bm25 has to read every match it
+# scores, so those are ranked over windows of at most SEARCH_WINDOW matches,
+# newest students first: a prefix matching half the school costs the same as
+# a full name. Older windows are only read when the first one leaves the
+# results short (e.g. under a branch filter), and at most SEARCH_MAX_WINDOWS
+# of them.
+SEARCH_WINDOW = 300
+SEARCH_MAX_WINDOWS = 10
+EXACT_FIRST_COLUMNS = ("student_name", "roll_number", "phone_number", "email")
+
+EXACT_WINDOW_SQL = """
+SELECT f.rowid FROM student_fts f
+{branch_join}
+WHERE student_fts MATCH ? AND f.rowid < ?{branch_filter}
+ORDER BY f.rowid DESC LIMIT ?
+"""
+
+EXACT_BRANCH_JOIN = """JOIN student s ON s.student_id = f.rowid
+JOIN section sec ON sec.section_id = s.section_id
+JOIN class c ON c.class_id = sec.class_id"""
+
+WINDOW_SQL = """
+SELECT rowid, rank FROM student_fts
+WHERE student_fts MATCH ? AND rowid < ?
+ORDER BY rowid DESC LIMIT ?
+"""
+
+# Details of the student ids in the JSON array, kept in array order
+SEARCH_SQL = """
+SELECT s.student_id, s.student_name, s.roll_number, s.father_name, s.mother_name,
+       s.phone_number, s.email, c.grade, c.class_name, sec.section_name, b.branch_name
+FROM json_each(?) j
+JOIN student s ON s.student_id = j.value
+LEFT JOIN section sec ON sec.section_id = s.section_id
+LEFT JOIN class c ON c.class_id = sec.class_id
+LEFT JOIN branch b ON b.branch_id = c.branch_id
+{branch_filter}
+ORDER BY j.key
+LIMIT ?
+"""
+
+SEARCH_RESULT_COLUMNS = ("Student ID", "Student Name", "Roll Number", "Father's Name", "Mother's Name",
+                         "Phone Number", "Email", "Grade", "Class", "Section", "Branch")
+
+
+@query_cache.memoize(tables=("student", "section", "class", "branch"))
+def search_students(text, branch_id=None, limit=SEARCH_LIMIT):
+    """Best matches for `text` across all branches, or within `branch_id`."""
+    import db
+    query = match_query(text)
+    if not query:
+        return []
+    if branch_id is None:
+        sql, extra = SEARCH_SQL.format(branch_filter=""), ()
+        exact_sql = EXACT_WINDOW_SQL.format(branch_join="", branch_filter="")
+    else:
+        sql, extra = SEARCH_SQL.format(branch_filter="WHERE c.branch_id = ?"), (branch_id,)
+        exact_sql = EXACT_WINDOW_SQL.format(branch_join=EXACT_BRANCH_JOIN, branch_filter=" AND c.branch_id = ?")
+
+    connection = db.get_connection()
+    results = []
+    found = set()
+
+    # Append the students among `ids` (best first) not already found
+    def add(ids):
+        ids = [student_id for student_id in ids if student_id not in found]
+        if branch_id is None:
+            ids = ids[:limit - len(results)]
+        rows = connection.execute(sql, (json.dumps(ids), *extra, limit - len(results))).fetchall()
+        results.extend(rows)
+        found.update(row[0] for row in rows)
+
+    top = connection.execute("SELECT COALESCE(MAX(student_id), 0) + 1 FROM student").fetchone()[0]
+    exact = exact_query(text)
+    for tier in (f"{{{' '.join(EXACT_FIRST_COLUMNS)}}} : ({exact})", exact):
+        upper = top
+        for _ in range(SEARCH_MAX_WINDOWS):
+            if len(results) >= limit:
+                break
+            window = [row[0] for row in connection.execute(exact_sql, (tier, upper, *extra, SEARCH_WINDOW))]
+            add(window)
+            if len(window) < SEARCH_WINDOW:
+                break
+            upper = window[-1]
+    if len(results) >= limit or exact == query:
+        return results
+
+    upper = top
+    for _ in range(SEARCH_MAX_WINDOWS):
+        window = connection.execute(WINDOW_SQL, (query, upper, SEARCH_WINDOW)).fetchall()
+        if not window:
+            break
+        add(match[0] for match in sorted(window, key=lambda match: match[1]))
+        if len(results) >= limit or len(window) < SEARCH_WINDOW:
+            break
+        upper = window[-1][0]
+    return results
+
+
+# Search box with the matching students below it
+def student_search_box(branch_id=None, key="student_search"):
+    import pandas as pd
+    text = st.text_input("Search students by name, parent, roll number, phone or email", key=key)
+    if not text.strip():
+        return
+    results = search_students(text, branch_id)
+    if results:
+        st.dataframe(pd.DataFrame(results, columns=SEARCH_RESULT_COLUMNS), hide_index=True, use_container_width=True)
+    else:
+        st.write("No students found.")
+
+
+# Best matching documents, then the chapter each one opens: the chapter
+# itself, or every chapter a topic is linked to
+CURRICULUM_SQL = """
+SELECT COALESCE(c.chapter_id, tc.chapter_id), COALESCE(c.chapter_name, tc.chapter_name),
+       t.topic_id, t.topic_name
+FROM (SELECT rowid, rank FROM curriculum_fts WHERE curriculum_fts MATCH ? ORDER BY rank LIMIT ?) f
+LEFT JOIN chapter c ON f.rowid % 2 = 0 AND c.chapter_id = f.rowid / 2
+LEFT JOIN topic t ON f.rowid % 2 = 1 AND t.topic_id = f.rowid / 2
+LEFT JOIN topic_association ta ON ta.topic_id = t.topic_id
+LEFT JOIN chapter tc ON tc.chapter_id = ta.chapter_id
+WHERE c.chapter_id IS NOT NULL OR tc.chapter_id IS NOT NULL
+ORDER BY f.rank
+"""
+
+
+def search_curriculum(text, limit=SEARCH_LIMIT):
+    """(chapter_id, chapter_name, topic_id, topic_name) for the best matches; topic fields are None for chapters."""
+    query = match_query(text)
+    if not query:
+        return []
+    return query_cache.fetchall(CURRICULUM_SQL, (query, limit),
+                                tables=("chapter", "topic", "topic_outcome", "topic_association"))
+
+
+# Search-as-you-type picker; returns the (chapter_id, chapter_name, topic_id,
+# topic_name) the user picked, or None
+def curriculum_search_picker(key="curriculum_search"):
+    text = st.text_input("Search chapters, topics and expected outcomes", key=key)
+    if not text.strip():
+        return None
+    results = search_curriculum(text)
+    if not results:
+        st.write("No chapters or topics found.")
+        return None
+    return st.selectbox(
+        "Matches", results, index=None, placeholder="Pick a chapter or topic", key=f"{key}_pick",
+        format_func=lambda hit: f"{hit[3]} (chapter: {hit[1]})" if hit[2] else f"Chapter: {hit[1]}",
+    )
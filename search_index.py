@@ -0,0 +1,235 @@
+"""Full-text indexes behind search.py, and their upkeep.
+
+student_fts is an FTS5 index over the student table (external content, so
+the text is not stored twice), kept in sync by triggers. A bulk import
+records the ids it added in student_fts_pending instead, and the job worker
+indexes them (index_all_pending, in jobs.MAINTENANCE). curriculum_fts
+holds one document per chapter and per topic (with the topic's expected
+outcomes), also kept in sync by triggers.
+
+This module holds only the DDL and the bulk indexing calls, so migrations,
+imports and command-line tools do not load streamlit with search.py.
+"""
+import json
+
+SEARCH_COLUMNS = ("student_name", "father_name", "mother_name", "roll_number", "phone_number", "email")
+# bm25 weight per column, in SEARCH_COLUMNS order
+SEARCH_WEIGHTS = (10.0, 2.0, 2.0, 8.0, 5.0, 3.0)
+
+_COLUMNS = ", ".join(SEARCH_COLUMNS)
+_NEW = ", ".join(f"NEW.{c}" for c in SEARCH_COLUMNS)
+_OLD = ", ".join(f"OLD.{c}" for c in SEARCH_COLUMNS)
+
+# Students a bulk load added but has not indexed yet are skipped by the
+# delete and update triggers: index_pending() indexes their current values
+_NOT_PENDING = "NOT EXISTS (SELECT 1 FROM student_fts_pending WHERE OLD.student_id BETWEEN first_id AND last_id)"
+
+# Trigger name -> (event, body)
+SEARCH_TRIGGERS = {
+    "trg_search_student_insert": (
+        "AFTER INSERT ON student",
+        f"INSERT INTO student_fts (rowid, {_COLUMNS}) VALUES (NEW.student_id, {_NEW});",
+    ),
+    "trg_search_student_delete": (
+        f"AFTER DELETE ON student WHEN {_NOT_PENDING}",
+        f"INSERT INTO student_fts (student_fts, rowid, {_COLUMNS}) VALUES ('delete', OLD.student_id, {_OLD});",
+    ),
+    "trg_search_student_update": (
+        f"AFTER UPDATE OF {_COLUMNS} ON student WHEN {_NOT_PENDING}",
+        f"INSERT INTO student_fts (student_fts, rowid, {_COLUMNS}) VALUES ('delete', OLD.student_id, {_OLD});"
+        f"INSERT INTO student_fts (rowid, {_COLUMNS}) VALUES (NEW.student_id, {_NEW});",
+    ),
+}
+
+
+def create_student_search(cursor):
+    """Create student_fts and its triggers, and index every student (migration step)."""
+    cursor.execute(f"""
+    CREATE VIRTUAL TABLE IF NOT EXISTS student_fts USING fts5(
+        {_COLUMNS},
+        content='student', content_rowid='student_id',
+        tokenize='unicode61 remove_diacritics 2', prefix='2 3 4 5 6'
+    )
+    """)
+    create_student_triggers(cursor)
+    create_rank_config(cursor)
+    rebuild_student_search(cursor)
+
+
+def create_student_triggers(cursor):
+    """Create student_fts_pending and the student_fts triggers (migration step)."""
+    cursor.execute(
+        "CREATE TABLE IF NOT EXISTS student_fts_pending (first_id INTEGER PRIMARY KEY, last_id INTEGER NOT NULL)"
+    )
+    for name, (event, body) in SEARCH_TRIGGERS.items():
+        cursor.execute(f"DROP TRIGGER IF EXISTS {name}")
+        cursor.execute(f"CREATE TRIGGER {name} {event} BEGIN {body} END")
+
+
+def rebuild_student_search(cursor):
+    cursor.execute("INSERT INTO student_fts (student_fts) VALUES ('rebuild')")
+
+
+def index_students(cursor, first_id, last_id):
+    """Index the students with ids first_id..last_id in one statement."""
+    cursor.execute(
+        f"INSERT INTO student_fts (rowid, {_COLUMNS}) "
+        f"SELECT student_id, {_COLUMNS} FROM student WHERE student_id BETWEEN ? AND ?",
+        (first_id, last_id),
+    )
+
+
+def defer_students(cursor, first_id, last_id):
+    """Leave the students with ids first_id..last_id for index_pending() (bulk loads)."""
+    cursor.execute("INSERT INTO student_fts_pending (first_id, last_id) VALUES (?, ?)", (first_id, last_id))
+
+
+def index_pending(path=None):
+    """Index the students in student_fts_pending; returns how many ranges.
+
+    Called by the job worker, so an import does not wait for it; until then
+    the new students are not found by search.
+    """
+    import db
+    import query_cache
+    connection = db.get_connection(path)
+    if connection.execute("SELECT 1 FROM student_fts_pending LIMIT 1").fetchone() is None:
+        return 0
+    # The ranges are read again once this process holds the write lock
+    connection.execute("BEGIN IMMEDIATE")
+    try:
+        ranges = connection.execute("SELECT first_id, last_id FROM student_fts_pending").fetchall()
+        cursor = connection.cursor()
+        for first_id, last_id in ranges:
+            index_students(cursor, first_id, last_id)
+        cursor.execute("DELETE FROM student_fts_pending")
+        # Searches cached before the students were indexed are stale
+        query_cache.bump_version(cursor, "student")
+        connection.commit()
+    except Exception:
+        connection.rollback()
+        raise
+    return len(ranges)
+
+
+def index_all_pending(path=None):
+    """index_pending() the database at `path` and, when sharded, every existing branch shard."""
+    import db
+    import sharding
+    return sum(index_pending(shard) for shard in [path or db.DB_PATH] + sharding.shard_paths())
+
+
+def create_rank_config(cursor):
+    """Make ORDER BY rank use the per-column SEARCH_WEIGHTS."""
+    weights = ", ".join(str(w) for w in SEARCH_WEIGHTS)
+    cursor.execute(f"INSERT INTO student_fts (student_fts, rank) VALUES ('rank', 'bm25({weights})')")
+
+
+# Curriculum documents share one rowid space: chapter n is 2n, topic n is
+# 2n + 1, so a trigger can find a document without a lookup
+CURRICULUM_WEIGHTS = (10.0, 2.0, 1.0)
+# A topic's outcomes, looked up through idx_topic_outcome_topic
+_TOPIC_OUTCOMES = "(SELECT group_concat(expected_outcome, ' ') FROM topic_outcome WHERE topic_id = {0})"
+
+CURRICULUM_TRIGGERS = {
+    "trg_search_chapter_insert": (
+        "AFTER INSERT ON chapter",
+        "INSERT INTO curriculum_fts (rowid, title, description) "
+        "VALUES (NEW.chapter_id * 2, NEW.chapter_name, NEW.description);",
+    ),
+    "trg_search_chapter_update": (
+        "AFTER UPDATE OF chapter_name, description ON chapter",
+        "UPDATE curriculum_fts SET title = NEW.chapter_name, description = NEW.description "
+        "WHERE rowid = NEW.chapter_id * 2;",
+    ),
+    "trg_search_chapter_delete": (
+        "AFTER DELETE ON chapter",
+        "DELETE FROM curriculum_fts WHERE rowid = OLD.chapter_id * 2;",
+    ),
+    "trg_search_topic_insert": (
+        "AFTER INSERT ON topic",
+        "INSERT INTO curriculum_fts (rowid, title, description, outcomes) "
+        f"VALUES (NEW.topic_id * 2 + 1, NEW.topic_name, NEW.description, {_TOPIC_OUTCOMES.format('NEW.topic_id')});",
+    ),
+    "trg_search_topic_update": (
+        "AFTER UPDATE OF topic_name, description ON topic",
+        "UPDATE curriculum_fts SET title = NEW.topic_name, description = NEW.description "
+        "WHERE rowid = NEW.topic_id * 2 + 1;",
+    ),
+    "trg_search_topic_delete": (
+        "AFTER DELETE ON topic",
+        "DELETE FROM curriculum_fts WHERE rowid = OLD.topic_id * 2 + 1;",
+    ),
+    "trg_search_outcome_insert": (
+        "AFTER INSERT ON topic_outcome",
+        f"UPDATE curriculum_fts SET outcomes = {_TOPIC_OUTCOMES.format('NEW.topic_id')} "
+        "WHERE rowid = NEW.topic_id * 2 + 1;",
+    ),
+    "trg_search_outcome_update": (
+        "AFTER UPDATE ON topic_outcome",
+        f"UPDATE curriculum_fts SET outcomes = {_TOPIC_OUTCOMES.format('OLD.topic_id')} "
+        "WHERE rowid = OLD.topic_id * 2 + 1;"
+        f"UPDATE curriculum_fts SET outcomes = {_TOPIC_OUTCOMES.format('NEW.topic_id')} "
+        "WHERE rowid = NEW.topic_id * 2 + 1;",
+    ),
+    "trg_search_outcome_delete": (
+        "AFTER DELETE ON topic_outcome",
+        f"UPDATE curriculum_fts SET outcomes = {_TOPIC_OUTCOMES.format('OLD.topic_id')} "
+        "WHERE rowid = OLD.topic_id * 2 + 1;",
+    ),
+}
+
+
+def create_curriculum_search(cursor):
+    """Create curriculum_fts and its triggers, and index every chapter and topic (migration step)."""
+    cursor.execute("""
+    CREATE VIRTUAL TABLE IF NOT EXISTS curriculum_fts USING fts5(
+        title, description, outcomes,
+        tokenize='unicode61 remove_diacritics 2', prefix='2 3'
+    )
+    """)
+    for name, (event, body) in CURRICULUM_TRIGGERS.items():
+        cursor.execute(f"DROP TRIGGER IF EXISTS {name}")
+        cursor.execute(f"CREATE TRIGGER {name} {event} BEGIN {body} END")
+    weights = ", ".join(str(w) for w in CURRICULUM_WEIGHTS)
+    cursor.execute(f"INSERT INTO curriculum_fts (curriculum_fts, rank) VALUES ('rank', 'bm25({weights})')")
+    rebuild_curriculum_search(cursor)
+
+
+def rebuild_curriculum_search(cursor):
+    cursor.execute("DELETE FROM curriculum_fts")
+    cursor.execute("""
+    INSERT INTO curriculum_fts (rowid, title, description)
+    SELECT chapter_id * 2, chapter_name, description FROM chapter
+    """)
+    cursor.execute(f"""
+    INSERT INTO curriculum_fts (rowid, title, description, outcomes)
+    SELECT topic_id * 2 + 1, topic_name, description, {_TOPIC_OUTCOMES.format('topic.topic_id')} FROM topic
+    """)
+
+
+# Insert triggers a bulk curriculum load suspends (see curriculum_import.py)
+CURRICULUM_INSERT_TRIGGERS = ("trg_search_chapter_insert", "trg_search_topic_insert", "trg_search_outcome_insert")
+# The triggers on topic and topic_outcome, for writes that re-index the
+# topics themselves (sharding.publish)
+TOPIC_TRIGGERS = tuple(name for name in CURRICULUM_TRIGGERS if name.startswith(("trg_search_topic", "trg_search_outcome")))
+
+
+def index_curriculum(cursor, chapter_ids, topic_ids):
+    """Re-index the given chapters and topics in a few statements (bulk loads)."""
+    chapter_ids, topic_ids = json.dumps(list(chapter_ids)), json.dumps(list(topic_ids))
+    cursor.execute("""
+    DELETE FROM curriculum_fts WHERE rowid IN (
+        SELECT value * 2 FROM json_each(?1) UNION ALL SELECT value * 2 + 1 FROM json_each(?2)
+    )
+    """, (chapter_ids, topic_ids))
+    cursor.execute("""
+    INSERT INTO curriculum_fts (rowid, title, description)
+    SELECT chapter_id * 2, chapter_name, description FROM chapter
+    WHERE chapter_id IN (SELECT value FROM json_each(?))
+    """, (chapter_ids,))
+    cursor.execute(f"""
+    INSERT INTO curriculum_fts (rowid, title, description, outcomes)
+    SELECT topic_id * 2 + 1, topic_name, description, {_TOPIC_OUTCOMES.format('topic.topic_id')} FROM topic
+    WHERE topic_id IN (SELECT value FROM json_each(?))
+    """, (topic_ids,))
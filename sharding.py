@@ -0,0 +1,342 @@
+"""Optional per-branch sharding: one SQLite file per branch plus a catalog.
+
+All branches share database.db by default, so one branch's bulk upload or
+grade entry holds the write lock every other branch waits for. In the
+sharded layout each branch's classes, sections, students, teachers, grades,
+scores and curriculum live in SCHOOL_SHARD_DIR/branch_<id>.db, and the file
+at SCHOOL_DB_PATH is the catalog of branches and users:
+
+    python sharding.py split database.db shards     # shards/catalog.db + shards/branch_<id>.db
+    SCHOOL_DB_PATH=shards/catalog.db SCHOOL_SHARD_DIR=shards streamlit run login.py
+    python benchmark.py shards
+
+Every file has the full schema (migrations.py), so page code runs unchanged
+on whichever file it is routed to (db.set_route). login.main routes each
+rerun with route_session(): branch admins and teachers to their branch's
+shard, the superadmin to the catalog. superadmin.get_data fans out over the
+shards with fan_out(). The superadmin's Branch Dashboard, Student Dashboard,
+student search and Data Exports run on the shard of the branch selected on
+the page, so they cover one branch at a time (there is no network-wide
+search or export in this layout). The job table is always the catalog's;
+a job reads the file its page was routed to (jobs.py).
+
+A shard holds a copy of its own branch row (for joins) and of the shared
+curriculum tables (SHARED_TABLES: topic, topic_outcome, evaluation). The
+catalog's copy of those is the one written (shared_connection()), and
+publish() copies the changed topics to every shard. AUTOINCREMENT ids in a shard start at branch_id * ID_BLOCK, so
+rows created in different shards never share an id.
+"""
+import json
+import os
+import sqlite3
+import sys
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import nullcontext
+
+import db
+import migrations
+
+SHARD_DIR = os.environ.get("SCHOOL_SHARD_DIR")
+CATALOG_NAME = "catalog.db"
+# Threads fan_out() spreads shards over (SQLite runs without the GIL, so
+# more cores mean more shards read at once)
+FAN_OUT_WORKERS = int(os.environ.get("SCHOOL_SHARD_WORKERS", min(8, os.cpu_count() or 1)))
+# Shard connections fan_out() keeps open between calls, least recently used
+# closed first. With more shards than this, a fan-out reopens some of them
+# (a few ms each) rather than holding a connection per shard per thread.
+SHARD_CONNECTIONS = int(os.environ.get("SCHOOL_SHARD_CONNECTIONS", "32"))
+ID_BLOCK = 10 ** 9
+
+# Rows of one branch: table -> WHERE clause over the source database (src)
+_CLASSES = "SELECT class_id FROM src.class WHERE branch_id = :branch"
+_STUDENTS = (
+    "SELECT student_id FROM src.student WHERE section_id IN "
+    f"(SELECT section_id FROM src.section WHERE class_id IN ({_CLASSES}))"
+)
+SHARD_TABLES = {
+    "branch": "branch_id = :branch",
+    "branch_subject": "branch_id = :branch",
+    "class": "branch_id = :branch",
+    "section": f"class_id IN ({_CLASSES})",
+    "teachers": "branch_id = :branch",
+    "subject": "branch_id = :branch",
+    "chapter": f"class_id IN ({_CLASSES})",
+    "topic": "1",
+    "topic_outcome": "1",
+    "evaluation": "1",
+    "topic_association": (
+        f"chapter_id IN (SELECT chapter_id FROM src.chapter WHERE class_id IN ({_CLASSES})) "
+        "OR subject_id IN (SELECT subject_id FROM src.subject WHERE branch_id = :branch)"
+    ),
+    "student": f"student_id IN ({_STUDENTS})",
+    "scores": f"student_id IN ({_STUDENTS})",
+    "grades": f"student_id IN ({_STUDENTS})",
+    "student_new": "branch IN (SELECT branch_name FROM src.branch WHERE branch_id = :branch)",
+}
+# Tables every file holds in full, keyed by topic_id; written in the catalog
+SHARED_TABLES = ("topic", "topic_outcome", "evaluation")
+CATALOG_TABLES = ("branch", "user", "branch_subject", "topic", "topic_outcome", "evaluation",
+                  "student_manage_sections_classes")
+# Tables whose new rows get ids from the shard's block
+ID_TABLES = ("class", "section", "teachers", "subject", "chapter", "student", "scores", "grades", "student_new")
+
+_create_lock = threading.Lock()
+_executor = None
+_connections = OrderedDict()  # shard path -> idle fan-out connection, least recently used first
+_connections_lock = threading.Lock()
+
+
+def enabled():
+    return bool(SHARD_DIR)
+
+
+def catalog_path():
+    return db.DB_PATH
+
+
+def shard_path(branch_id):
+    return os.path.join(SHARD_DIR, f"branch_{int(branch_id)}.db")
+
+
+def shard_paths():
+    """Paths of the branch shards that exist."""
+    if not enabled() or not os.path.isdir(SHARD_DIR):
+        return []
+    return sorted(
+        os.path.join(SHARD_DIR, name) for name in os.listdir(SHARD_DIR)
+        if name.startswith("branch_") and name.endswith(".db")
+    )
+
+
+def shared_connection():
+    """Connection to write SHARED_TABLES with: the catalog's when sharded, else the routed file's.
+
+    Call publish() with the topics written once it is committed.
+    """
+    return db.get_connection(catalog_path() if enabled() else None)
+
+
+def publish(topic_ids):
+    """Copy the catalog's SHARED_TABLES rows of `topic_ids` to every existing shard (no-op unsharded).
+
+    A topic gone from the catalog is deleted from the shards with its links
+    to chapters, as manage_subjects.delete_topic does in a single file.
+    """
+    import bulk_import
+    import search_index
+    if not enabled() or not topic_ids:
+        return
+    ids = json.dumps(sorted(set(topic_ids)))
+    catalog = db.get_connection(catalog_path())
+    rows = {}
+    for table in SHARED_TABLES:
+        columns = _columns(catalog, "main", table)
+        rows[table] = (columns, catalog.execute(
+            f"SELECT {', '.join(columns)} FROM {table} WHERE topic_id IN (SELECT value FROM json_each(?))", (ids,)
+        ).fetchall())
+    kept = json.dumps([row[0] for row in rows["topic"][1]])
+
+    for path in shard_paths():
+        connection = db.get_connection(path)
+        with bulk_import.suspended_triggers(connection, search_index.TOPIC_TRIGGERS) as (cursor, triggers):
+            for table in ("evaluation", "topic_outcome", "topic"):
+                cursor.execute(f"DELETE FROM {table} WHERE topic_id IN (SELECT value FROM json_each(?))", (ids,))
+            cursor.execute(
+                "DELETE FROM topic_association WHERE topic_id IN (SELECT value FROM json_each(?)) "
+                "AND topic_id NOT IN (SELECT value FROM json_each(?))", (ids, kept)
+            )
+            for table in ("topic", "topic_outcome", "evaluation"):
+                columns, values = rows[table]
+                cursor.executemany(
+                    f"INSERT INTO {table} ({', '.join(columns)}) VALUES ({', '.join('?' for _ in columns)})", values
+                )
+            search_index.index_curriculum(cursor, [], json.loads(ids))
+            for _, sql in triggers:
+                cursor.execute(sql)
+
+
+def branch_ids():
+    """Branch ids in the catalog."""
+    import query_cache
+    rows = query_cache.fetchall("SELECT branch_id FROM branch ORDER BY branch_id", tables=("branch",),
+                                path=catalog_path())
+    return [row[0] for row in rows]
+
+
+def user_branch(email):
+    """The branch of a user account (None for the superadmin)."""
+    connection = db.get_connection(catalog_path())
+    row = connection.execute("SELECT branch_id FROM user WHERE email = ?", (email,)).fetchone()
+    return row[0] if row else None
+
+
+def route_session(role, branch_id):
+    """Route this rerun to the shard of the logged-in user's branch (catalog otherwise)."""
+    if not enabled():
+        return
+    if role in ("branchadmin", "teacher") and branch_id is not None:
+        db.set_route(ensure_shard(branch_id))
+    else:
+        db.set_route(None)
+
+
+def branch_route(branch_id):
+    """Context manager routing a with-block to `branch_id`'s shard (no-op unsharded)."""
+    if not enabled():
+        return nullcontext()
+    return db.routed(ensure_shard(branch_id))
+
+
+def _columns(connection, schema, table):
+    return [row[1] for row in connection.execute(f"PRAGMA {schema}.table_info({table})")]
+
+
+# Copy `tables` (table -> WHERE over src) from `source` into `target`, a new
+# file that gets the full schema first. Triggers stay on, so the rollup,
+# search index and table versions are maintained as rows arrive; the cube is
+# rebuilt at the end.
+def _copy(source, target, tables, branch_id=None):
+    import cube
+    connection = sqlite3.connect(target, isolation_level=None)
+    try:
+        migrations.migrate(connection)
+        connection.execute("ATTACH DATABASE ? AS src", (source,))
+        cursor = connection.cursor()
+        cursor.execute("BEGIN")
+        # The migrations' default logins are replaced by the source's users
+        cursor.execute("DELETE FROM main.user")
+        for table, where in tables.items():
+            source_columns = set(_columns(connection, "src", table))
+            columns = ", ".join(c for c in _columns(connection, "main", table) if c in source_columns)
+            if columns:
+                cursor.execute(f"INSERT INTO main.{table} ({columns}) SELECT {columns} FROM src.{table} WHERE {where}",
+                               {"branch": branch_id})
+        if branch_id is not None:
+            start = int(branch_id) * ID_BLOCK
+            for table in ID_TABLES:
+                cursor.execute("UPDATE sqlite_sequence SET seq = MAX(seq, ?) WHERE name = ?", (start, table))
+                if cursor.rowcount == 0:
+                    cursor.execute("INSERT INTO sqlite_sequence (name, seq) VALUES (?, ?)", (table, start))
+        cube.rebuild_cube(cursor)
+        cursor.execute("COMMIT")
+        connection.execute("DETACH DATABASE src")
+    finally:
+        connection.close()
+
+
+def _create(source, path, tables, branch_id=None):
+    partial = path + ".partial"
+    if os.path.exists(partial):
+        os.unlink(partial)
+    _copy(source, partial, tables, branch_id)
+    os.replace(partial, path)
+
+
+def ensure_shard(branch_id):
+    """Path of `branch_id`'s shard, created from the catalog if it does not exist."""
+    path = shard_path(branch_id)
+    if not os.path.exists(path):
+        with _create_lock:
+            if not os.path.exists(path):
+                os.makedirs(SHARD_DIR, exist_ok=True)
+                _create(catalog_path(), path, SHARD_TABLES, branch_id)
+    return path
+
+
+def split(source, directory, progress=print):
+    """Write `source` as a sharded layout into `directory`; returns branch_id -> shard path."""
+    if os.path.exists(os.path.join(directory, CATALOG_NAME)):
+        raise FileExistsError(f"{directory} already holds a catalog")
+    os.makedirs(directory, exist_ok=True)
+    start = time.perf_counter()
+    _create(source, os.path.join(directory, CATALOG_NAME), {table: "1" for table in CATALOG_TABLES})
+    connection = sqlite3.connect(f"file:{source}?mode=ro", uri=True)
+    try:
+        ids = [row[0] for row in connection.execute("SELECT branch_id FROM branch ORDER BY branch_id")]
+    finally:
+        connection.close()
+    shards = {}
+    for number, branch_id in enumerate(ids, 1):
+        shards[branch_id] = os.path.join(directory, f"branch_{branch_id}.db")
+        _create(source, shards[branch_id], SHARD_TABLES, branch_id)
+        progress(f"branch {branch_id}: {number}/{len(ids)} shards, {time.perf_counter() - start:.1f}s")
+    return shards
+
+
+def _pool():
+    global _executor
+    if _executor is None:
+        with _create_lock:
+            if _executor is None:
+                _executor = ThreadPoolExecutor(max_workers=FAN_OUT_WORKERS, thread_name_prefix="shard")
+    return _executor
+
+
+# A connection to `path` for one fan-out call: an idle one, else a new one
+def _checkout(path):
+    with _connections_lock:
+        conn = _connections.pop(path, None)
+    return conn if conn is not None else db.open_connection(path)
+
+
+def _checkin(path, conn):
+    if conn.in_transaction:
+        conn.rollback()
+    with _connections_lock:
+        _connections[path] = conn
+        closing = [_connections.popitem(last=False)[1] for _ in range(len(_connections) - SHARD_CONNECTIONS)]
+    for extra in closing:
+        extra._dispose()
+
+
+def close_connections():
+    """Close the connections fan_out() keeps (tests, benchmarks, shutdown)."""
+    with _connections_lock:
+        closing = list(_connections.values())
+        _connections.clear()
+    for conn in closing:
+        conn._dispose()
+
+
+def fan_out(func, ids=None):
+    """func() once per branch shard (all branches by default), in parallel.
+
+    Each call runs routed to its shard, so path-less db and query_cache
+    calls inside it use that shard. Results are in branch order. Calls go
+    through connections of fan_out's own (at most SHARD_CONNECTIONS kept),
+    not ones bound to the pool threads.
+    """
+    ids = branch_ids() if ids is None else ids
+    paths = [ensure_shard(branch_id) for branch_id in ids]
+
+    def run(path):
+        conn = _checkout(path)
+        try:
+            with db.lent(path, conn):
+                return func()
+        finally:
+            _checkin(path, conn)
+
+    return list(_pool().map(run, paths))
+
+
+def main(argv=None):
+    argv = sys.argv[1:] if argv is None else argv
+    if len(argv) != 3 or argv[0] != "split":
+        print("usage: python sharding.py split <source.db> <directory>")
+        return 1
+    try:
+        shards = split(argv[1], argv[2])
+    except (FileExistsError, sqlite3.Error) as e:
+        print(f"Could not split {argv[1]}: {e}")
+        return 1
+    print(f"{len(shards)} shards and {CATALOG_NAME} written to {argv[2]}; run the app with\n"
+          f"    SCHOOL_DB_PATH={os.path.join(argv[2], CATALOG_NAME)} SCHOOL_SHARD_DIR={argv[2]} streamlit run login.py")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
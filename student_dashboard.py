@@ -1,65 +1,39 @@
 import streamlit as st
 import pandas as pd
-import plotly.express as px
 import random
-
-# Sample Data for Branches
-branch_data = {
-    1: {"name": "Branch 1", "students": 200, "chapters": 100, "topics": 500, "subjects": 10},
-    2: {"name": "Branch 2", "students": 150, "chapters": 80, "topics": 400, "subjects": 8},
-    3: {"name": "Branch 3", "students": 180, "chapters": 90, "topics": 450, "subjects": 9},
-}
-
-# Generate Performance Data Dynamically
-def generate_performance_data():
-    subjects = ["Math", "Physics", "Chemistry", "Biology", "English"]
-    names = [
-        "John Doe", "Jane Smith", "Alex Brown", "Emily Davis", "Michael Johnson", 
-        "Sarah Lee", "David Wilson", "Laura Taylor", "Chris White", "Megan Harris", 
-        "Tom Clark", "Anna Martin", "James Walker", "Sophia Hall", "Benjamin Allen", 
-        "Olivia Young", "Ethan King", "Charlotte Scott", "Daniel Adams", "Grace Nelson"
-    ]
-    data = []
-    for name in names:
-        for subject in subjects:
-            data.append({
-                "student_name": name,
-                "subject": subject,
-                "score": random.randint(50, 100)
-            })
-    return data
-
-performance_data = generate_performance_data()
-
-# Fetch Overview Statistics
-def fetch_overview_statistics(branch_id):
-    if branch_id in branch_data:
-        return branch_data[branch_id]
-    else:
-        st.error(f"Branch ID {branch_id} not found!")
-        return {}
-
-# Class and Section-wise Analysis Data
-class_section_data = {
-    "Class 1": {"Section A": {"students": 30}, "Section B": {"students": 25}},
-    "Class 2": {"Section A": {"students": 35}, "Section B": {"students": 20}},
-    "Class 3": {"Section A": {"students": 40}, "Section B": {"students": 30}},
-}
-
-# Sidebar for Branch and Class Selection
+import branch_dashboard
+import charts
+import cube
+import figure_cache
+import grade_analytics
+import profiling
+import query_cache
+import roster
+import sharding
+
+# Branches as (branch_id, branch_name), by name
+def get_branches():
+    return query_cache.fetchall("SELECT branch_id, branch_name FROM branch ORDER BY branch_name", tables=("branch",))
+
+# Sidebar for Branch, Grade and Section Selection (options from the aggregate cube)
 def sidebar_selection():
-    branch_options = list(branch_data.keys())
-    selected_branch = st.sidebar.selectbox("Select Branch", branch_options)
-    class_options = list(class_section_data.keys())
-    selected_class = st.sidebar.selectbox("Select Class", class_options)
-    selected_section = st.sidebar.selectbox("Select Section", list(class_section_data[selected_class].keys()))
-    return selected_branch, selected_class, selected_section
+    branches = dict(get_branches())
+    selected_branch = st.sidebar.selectbox("Select Branch", list(branches), format_func=branches.get)
+    if selected_branch is None:
+        return None, None, None
+    with sharding.branch_route(selected_branch):
+        selected_grade = st.sidebar.selectbox("Select Grade", cube.grades(selected_branch),
+                                              format_func=lambda grade: f"Grade {grade}")
+        selected_section = st.sidebar.selectbox("Select Section", cube.sections(selected_branch, selected_grade))
+    return selected_branch, selected_grade, selected_section
 
 # Overview Section
 def display_overview(branch_id):
-    branch_info = fetch_overview_statistics(branch_id)
+    branch_info = branch_dashboard.fetch_overview_statistics(branch_id)
     if not branch_info:
+        st.error(f"Branch ID {branch_id} not found!")
         return
+    totals = cube.cell(branch_id)
 
     st.title(f"{branch_info['name']} - Dashboard")
     st.subheader("Overview Statistics")
@@ -67,81 +41,125 @@ def display_overview(branch_id):
     with col1:
         st.metric(label="Total Students", value=branch_info["students"])
     with col2:
-        st.metric(label="Total Chapters", value=branch_info["chapters"])
+        st.metric(label="Total Chapters", value=totals["chapters"])
     with col3:
-        st.metric(label="Total Topics", value=branch_info["topics"])
+        st.metric(label="Total Topics", value=totals["topics"])
     with col4:
         st.metric(label="Total Subjects", value=branch_info["subjects"])
 
-# Class-wise and Section-wise Analysis
-def class_section_analysis(selected_class, selected_section):
+# Grade and Section-wise Analysis
+def class_section_analysis(branch_id, selected_grade, selected_section):
     st.subheader("Class & Section-wise Analysis")
-    data = class_section_data[selected_class][selected_section]
-    st.write(f"**Class:** {selected_class}, **Section:** {selected_section}")
-    st.metric(label="Students in Section", value=data["students"])
+    if selected_grade is None or selected_section is None:
+        st.info("No sections in this branch yet.")
+        return
+    data = cube.cell(branch_id, selected_grade, section=selected_section)
+    st.write(f"**Grade:** {selected_grade}, **Section:** {selected_section}")
+    col1, col2, col3 = st.columns(3)
+    with col1:
+        st.metric(label="Students in Section", value=data["students"])
+    with col2:
+        st.metric(label="Average Grade", value=f"{data['average_grade']:.1f} / 10")
+    with col3:
+        st.metric(label="Pass Rate", value=f"{data['pass_rate']:.0%}")
+
+# Per-student and per-subject results for the current grades (see grade_analytics.py)
+@query_cache.memoize(tables=("grades",))
+def subject_scores():
+    return grade_analytics.student_subject_scores(grade_analytics.load_grades())
+
+@query_cache.memoize(tables=("grades",))
+def subject_overview():
+    return grade_analytics.subject_summary(grade_analytics.load_grades(), subject_scores())
+
+# Scores of a subject's students; one bar, marker or histogram bin per
+# student depending on how many there are (see charts.py)
+def subject_scores_figure(df, selected_subject):
+    return charts.population_figure(df, x="student_name", y="score",
+                                    title=f"Performance Analysis - {selected_subject}",
+                                    labels={"student_name": "Student Name", "score": "Score"})
+
+def with_student_names(df):
+    return df.assign(student_name=df["student_id"].map(grade_analytics.student_names()).fillna("Unknown"))
 
 # Performance Analysis by Subject
 def performance_analysis():
     st.subheader("Performance Analysis by Subject")
-    subject_options = list(set([entry["subject"] for entry in performance_data]))
+    scores = subject_scores()
+    if scores.empty:
+        st.info("No grades recorded yet.")
+        return
+    subject_options = sorted(scores["subject"].unique())
     selected_subject = st.selectbox("Select Subject", subject_options)
 
-    # Filter data by selected subject
-    filtered_data = [entry for entry in performance_data if entry["subject"] == selected_subject]
-    df = pd.DataFrame(filtered_data)
+    # Mean scores in the selected subject; names are only looked up for the
+    # students the chart draws
+    df = scores.loc[scores["subject"] == selected_subject, ["student_id", "score"]]
+    if charts.shows_each_student(len(df)):
+        df = with_student_names(df)
 
     # Visualization
-    fig = px.bar(df, x="student_name", y="score", title=f"Performance Analysis - {selected_subject}",
-                 labels={"student_name": "Student Name", "score": "Score"}, color="score")
-    st.plotly_chart(fig)
-
-# Performance Analysis by Student
-def student_progress_tracking():
+    figure_cache.plotly_chart(subject_scores_figure, df, selected_subject=selected_subject)
+    if not charts.shows_each_student(len(df)):
+        top, bottom = charts.top_bottom(df, "score")
+        col1, col2 = st.columns(2)
+        col1.caption(f"Top {len(top)}")
+        col1.dataframe(with_student_names(top[["student_id", "score"]]), hide_index=True)
+        col2.caption(f"Bottom {len(bottom)}")
+        col2.dataframe(with_student_names(bottom[["student_id", "score"]]), hide_index=True)
+    st.dataframe(subject_overview(), hide_index=True)
+
+# Bar chart of one student's mean score per subject
+def student_progress_figure(df, student_name):
+    import plotly.express as px
+    return px.bar(df, x="subject", y="score", title=f"Progress Tracking - {student_name}",
+                  labels={"subject": "Subject", "score": "Score"}, color="score")
+
+# Performance Analysis by Student, for the students of the selected section
+def student_progress_tracking(branch_id, selected_grade, selected_section):
     st.subheader("Student Progress Tracking")
-    student_options = list(set([entry["student_name"] for entry in performance_data]))
-    selected_student = st.selectbox("Select Student", student_options)
-
-    # Filter data by selected student
-    filtered_data = [entry for entry in performance_data if entry["student_name"] == selected_student]
-    df = pd.DataFrame(filtered_data)
+    scores = subject_scores()
+    if scores.empty:
+        return None, None
+    students = dict(roster.section_students(branch_id, selected_grade, selected_section))
+    if not students:
+        st.info("No students in this section yet.")
+        return None, None
+    selected_student = st.selectbox("Select Student", list(students),
+                                    format_func=lambda student_id: f"{students[student_id]} ({student_id})")
+
+    # Mean score per subject for the selected student
+    df = scores[scores["student_id"] == selected_student]
 
     # Visualization
-    fig = px.bar(df, x="subject", y="score", title=f"Progress Tracking - {selected_student}",
-                 labels={"subject": "Subject", "score": "Score"}, color="score")
-    st.plotly_chart(fig)
+    figure_cache.plotly_chart(student_progress_figure, df, student_name=students[selected_student])
+
+    grades = grade_analytics.load_grades()
+    return students[selected_student], grades[grades["student_id"].to_numpy() == selected_student]
 
-    return selected_student, filtered_data
+# Pie chart of a student's grades per band
+def grade_distribution_figure(grade_counts, selected_student):
+    import plotly.express as px
+    return px.pie(grade_counts, names="Grade", values="Count", title=f"Grade Distribution - {selected_student}")
 
 # Grade Distribution
 def grade_distribution(filtered_data, selected_student):
     st.subheader(f"Grade Distribution for {selected_student}")
 
-    if not filtered_data:
+    if filtered_data is None or filtered_data.empty:
         st.warning("No data available for the selected student.")
         return
 
-    # Compute grades
-    grades = []
-    for entry in filtered_data:
-        score = entry["score"]
-        if score >= 90:
-            grades.append("A")
-        elif score >= 75:
-            grades.append("B")
-        elif score >= 60:
-            grades.append("C")
-        else:
-            grades.append("D")
-
-    grade_counts = pd.DataFrame({"Grade": grades}).value_counts().reset_index()
-    grade_counts.columns = ["Grade", "Count"]
+    # Count grades per band
+    grade_counts = grade_analytics.band_distribution(filtered_data)
+    grade_counts = grade_counts[grade_counts["Count"] > 0]
 
     # Visualization
-    fig = px.pie(grade_counts, names="Grade", values="Count", title=f"Grade Distribution - {selected_student}")
-    st.plotly_chart(fig)
+    figure_cache.plotly_chart(grade_distribution_figure, grade_counts, selected_student=selected_student)
 
 # Yes/No Visualization (Chapter-wise Summary)
 def yes_no_visualization():
+    import plotly.express as px
     st.subheader("Yes/No Visualization - Chapter Completion")
     chapters = [f"Chapter {i}" for i in range(1, 11)]
     yes_counts = [random.randint(10, 30) for _ in chapters]
@@ -160,15 +178,23 @@ def yes_no_visualization():
     st.plotly_chart(fig)
 
 # Main Application Logic
+@profiling.profiled("student_dashboard")
 def main():
-    selected_branch, selected_class, selected_section = sidebar_selection()
-    display_overview(selected_branch)
-    class_section_analysis(selected_class, selected_section)
-    performance_analysis()
-
-    # Track student selection and update visualizations
-    selected_student, filtered_data = student_progress_tracking()
-    grade_distribution(filtered_data, selected_student)
+    selected_branch, selected_grade, selected_section = sidebar_selection()
+    if selected_branch is None:
+        st.info("No branches yet.")
+        return
+    # In the sharded layout the branch's data is in its shard (see sharding.py)
+    with sharding.branch_route(selected_branch):
+        display_overview(selected_branch)
+        class_section_analysis(selected_branch, selected_grade, selected_section)
+        if sharding.enabled():
+            st.caption("Branches are stored in separate shards: the analysis below covers the selected branch only.")
+        performance_analysis()
+
+        # Track student selection and update visualizations
+        selected_student, filtered_data = student_progress_tracking(selected_branch, selected_grade, selected_section)
+        grade_distribution(filtered_data, selected_student)
     yes_no_visualization()
 
 if __name__ == "__main__":
@@ -1,15 +1,27 @@
 import streamlit as st
-import sqlite3
+import db
+import profiling
+import query_cache
+import query_log
+import sharding
 import pandas as pd
-from dashboard import display_overall_stats, display_branch_stats
-from manage_branches import create_branch_form, display_existing_branches, create_branch_admin_form
-from manage_subjects import manage_subjects
-from branch_dashboard import display_branch_dashboard
-from student_dashboard import main as display_student_dashboard  # Import the Student Dashboard
 
-# Connect to the database and fetch data
-def get_data():
-    conn = sqlite3.connect("database.db")
+# Per-branch statistics, one row per branch, from branch_rollup
+BRANCH_STATS_SQL = """
+SELECT
+    b.branch_id, b.branch_name,
+    r.students, r.teachers, r.classes, r.sections,
+    CASE WHEN r.score_count > 0 THEN r.math_sum / r.score_count ELSE 0 END AS math_avg,
+    CASE WHEN r.score_count > 0 THEN r.science_sum / r.score_count ELSE 0 END AS science_avg
+FROM branch b
+JOIN branch_rollup r ON r.branch_id = b.branch_id
+ORDER BY b.branch_name
+"""
+
+# Connect to the database and fetch data (cached until one of these tables changes)
+@query_cache.memoize(tables=("branch", "teachers", "student", "subject", "branch_rollup"))
+def database_data():
+    conn = db.get_connection()
     cursor = conn.cursor()
     
     # Overall statistics
@@ -18,44 +30,60 @@ def get_data():
     total_students = cursor.execute("SELECT COUNT(*) FROM student").fetchone()[0]
     total_subjects = cursor.execute("SELECT COUNT(*) FROM subject").fetchone()[0]
     
-    query = """
-    SELECT 
-        b.branch_id, b.branch_name,
-        COUNT(DISTINCT s.student_id) AS students,
-        COUNT(DISTINCT t.teacher_id) AS teachers,
-        COUNT(DISTINCT c.class_id) AS classes,
-        COUNT(DISTINCT sec.section_id) AS sections,
-        AVG(COALESCE(scores.math, 0)) AS math_avg,
-        AVG(COALESCE(scores.science, 0)) AS science_avg
-    FROM branch b
-    LEFT JOIN class c ON b.branch_id = c.branch_id
-    LEFT JOIN section sec ON c.class_id = sec.class_id
-    LEFT JOIN student s ON sec.section_id = s.section_id
-    LEFT JOIN teachers t ON b.branch_id = t.branch_id
-    LEFT JOIN scores ON s.student_id = scores.student_id
-    GROUP BY b.branch_name
-    """
-    branch_stats = pd.read_sql_query(query, conn)
+    # Branch-wise statistics come from branch_rollup, which triggers keep
+    # current (see rollup.py)
+    branch_stats = pd.read_sql_query(BRANCH_STATS_SQL, conn)
     
     conn.close()
     return total_branches, total_teachers, total_students, total_subjects, branch_stats
 
-# Fetch data
-total_branches, total_teachers, total_students, total_subjects, branch_stats = get_data()
+# Network-wide statistics: database_data() of the one database, or of every
+# branch shard in parallel, merged (see sharding.py)
+def get_data():
+    if not sharding.enabled():
+        return database_data()
+    parts = sharding.fan_out(database_data)
+    if not parts:
+        return 0, 0, 0, 0, database_data()[4]
+    totals = [sum(part[i] for part in parts) for i in range(4)]
+    branch_stats = pd.concat([part[4] for part in parts], ignore_index=True)
+    return (*totals, branch_stats.sort_values("branch_name", ignore_index=True))
 
 # Streamlit App Layout
+@profiling.profiled("superadmin_dashboards")
 def superadmin_dashboards():
     st.title("Super Admin Dashboard")
     st.sidebar.title("SuperAdmin Dashboard")  # Sidebar title
-    options = ["Dashboard", "Manage Branches", "Branch Dashboard", "Manage Subjects", "Student Dashboard"]
+    options = ["Dashboard", "Manage Branches", "Branch Dashboard", "Manage Subjects", "Student Dashboard", "Data Exports",
+               "Performance"]
     choice = st.sidebar.radio("Dashboard Options", options)
+    query_log.set_page(f"Superadmin: {choice}")
+
+    # Fetch data (served from the query cache unless something changed)
+    total_branches, total_teachers, total_students, total_subjects, branch_stats = get_data()
 
+    with st.expander("Search students"):
+        from search import student_search_box
+        if sharding.enabled():
+            # Each branch's students are in its own shard, searched one at a time
+            search_names = dict(branch_stats[["branch_id", "branch_name"]].itertuples(index=False, name=None))
+            search_branch = st.selectbox("Branch to search", list(search_names), format_func=search_names.get,
+                                         key="superadmin_search_branch")
+            if search_branch is not None:
+                with sharding.branch_route(search_branch):
+                    student_search_box(search_branch, key="superadmin_student_search")
+        else:
+            student_search_box(key="superadmin_student_search")
+
+    # Each option's page module is imported only when it is shown
     if choice == "Dashboard":
+        from dashboard import display_overall_stats, display_branch_stats
         # Display overall and branch-wise statistics
         display_overall_stats(total_branches, total_teachers, total_students, total_subjects)
         display_branch_stats(branch_stats)
 
     elif choice == "Manage Branches":
+        from manage_branches import create_branch_form, display_existing_branches, create_branch_admin_form
         manage_choice = st.sidebar.radio("Manage Branch Options", ["Create Branch", "Create Branch Admin", "View Existing Branches"])
 
         if manage_choice == "Create Branch":
@@ -68,24 +96,40 @@ def superadmin_dashboards():
             display_existing_branches()
 
     elif choice == "Manage Subjects":
+        from manage_subjects import manage_subjects
         manage_subjects()
 
     elif choice == "Branch Dashboard":
+        from branch_dashboard import display_branch_dashboard
         # Add branch selection for the Super Admin
-        branch_names = [branch["branch_name"] for branch in branch_stats.to_dict("records")]
-        branch_ids = [branch["branch_id"] for branch in branch_stats.to_dict("records")]
+        branch_names = branch_stats["branch_name"].tolist()
+        branch_ids = branch_stats["branch_id"].tolist()
         
         selected_branch_name = st.selectbox("Select Branch", branch_names)
         selected_branch_id = branch_ids[branch_names.index(selected_branch_name)]
 
         # Pass the selected branch ID to display_branch_dashboard
-        display_branch_dashboard(selected_branch_id)
+        with sharding.branch_route(selected_branch_id):
+            display_branch_dashboard(selected_branch_id)
 
     elif choice == "Student Dashboard":
+        from student_dashboard import main as display_student_dashboard  # Import the Student Dashboard
         # Directly call the Student Dashboard's main function
         display_student_dashboard()
 
+    elif choice == "Data Exports":
+        from export import export_page
+        export_page(branch_stats[["branch_id", "branch_name"]].itertuples(index=False, name=None))
+
+    elif choice == "Performance":
+        query_log.performance_page()
+
     st.session_state.current_page = choice
 
+    with st.sidebar.expander("Query cache"):
+        cache_stats = query_cache.stats()
+        st.write(f"Hits: {cache_stats['hits']}, misses: {cache_stats['misses']}, evictions: {cache_stats['evictions']}")
+        st.write(f"{cache_stats['entries']} entries, {cache_stats['bytes'] / 1024:.0f} KB of {cache_stats['max_bytes'] / 1024 / 1024:.0f} MB")
+
 if __name__ == "__main__":
     superadmin_dashboards()
@@ -1,9 +1,48 @@
 import sqlite3
+import cube
+import db
+import export
+import jobs
+import metrics
+import profiling
+import query_log
+import roster
 import streamlit as st
 import pandas as pd
-import matplotlib.pyplot as plt
 
 
+# Student Names (replace with actual student names)
+STUDENT_NAMES = ["John Doe", "Jane Smith", "Alex Brown", "Emily Davis", "Michael Johnson", "Sarah Lee", "David Wilson", "Laura Taylor", "Chris White", "Megan Harris", 
+                 "Tom Clark", "Anna Martin", "James Walker", "Sophia Hall", "Benjamin Allen", "Olivia Young", "Ethan King", "Charlotte Scott", "Daniel Adams", "Grace Nelson", 
+                 "Noah Carter", "Ava Mitchell", "Lucas Roberts", "Isabella Perez", "Mason Evans", "Amelia Carter", "Henry Thompson", "Lily Lewis", "William Harris", "Harper Turner"]
+
+# Define Chapter data based on subject
+CHAPTER_DATA = {
+   "Mathematics": {
+        "Chapter 1. Algebra": [1, 0, 1, 1, 1, 0, 1, 1, 0, 1, 1, 1, 1, 0, 1, 1, 0, 1, 1, 0, 0, 1, 1, 1, 0, 1, 1, 1, 0, 1],
+        "Chapter 2. Geometry": [0, 1, 0, 1, 1, 0, 1, 1, 1, 1, 0, 1, 1, 1, 0, 0, 1, 0, 1, 1, 1, 0, 1, 1, 1, 0, 1, 1, 1, 1],
+        "Chapter 3. Calculus": [1, 0, 1, 1, 0, 1, 1, 1, 0, 1, 1, 0, 1, 0, 1, 1, 1, 0, 0, 1, 1, 0, 1, 1, 0, 0, 1, 1, 1, 0],
+        "Chapter 4. Trigonometry": [1, 1, 1, 1, 0, 1, 0, 1, 1, 1, 0, 1, 0, 1, 1, 1, 1, 0, 1, 1, 0, 1, 1, 0, 1, 1, 0, 1, 0, 1],
+        "Chapter 5. Statistics": [0, 1, 1, 0, 1, 1, 0, 0, 1, 1, 1, 0, 1, 1, 0, 1, 0, 1, 0, 1, 1, 1, 0, 1, 1, 0, 1, 0, 1, 1]
+    },
+    "Physics": {
+        "Chapter 1. Mechanics": [1, 1, 0, 1, 0, 1, 1, 1, 0, 0, 1, 0, 1, 0, 1, 1, 0, 0, 1, 1, 1, 0, 1, 0, 1, 1, 0, 1, 1, 0],
+        "Chapter 2. Thermodynamics": [0, 0, 1, 1, 0, 1, 0, 1, 1, 1, 1, 0, 1, 1, 1, 0, 1, 1, 1, 0, 0, 1, 1, 0, 1, 1, 0, 1, 1, 1],
+        "Chapter 3. Optics": [1, 1, 0, 1, 0, 1, 1, 1, 0, 1, 0, 1, 1, 0, 1, 1, 0, 0, 1, 1, 1, 0, 1, 1, 0, 1, 0, 1, 0, 1],
+        "Chapter 4. Electromagnetism": [0, 1, 1, 0, 0, 1, 1, 1, 1, 1, 0, 1, 1, 0, 0, 1, 1, 1, 0, 1, 0, 1, 0, 1, 0, 1, 1, 0, 1, 1],
+        "Chapter 5. Quantum Physics": [1, 0, 1, 1, 1, 0, 0, 1, 1, 1, 0, 1, 0, 1, 1, 0, 1, 0, 1, 1, 0, 1, 1, 0, 1, 0, 0, 1, 1, 1]
+    },
+    "Computer Science": {
+        "Chapter 1. Data Structures": [1, 1, 0, 1, 1, 0, 1, 1, 0, 1, 0, 1, 1, 1, 1, 0, 1, 0, 1, 1, 0, 0, 1, 0, 1, 1, 1, 0, 1, 1],
+        "Chapter 2. Algorithms": [0, 1, 1, 1, 0, 0, 1, 1, 1, 0, 1, 0, 1, 1, 0, 1, 0, 1, 0, 1, 0, 1, 0, 1, 1, 1, 0, 0, 1, 1],
+        "Chapter 3. Operating Systems": [1, 1, 0, 1, 1, 1, 0, 1, 0, 1, 0, 1, 1, 0, 1, 0, 0, 1, 1, 1, 0, 1, 0, 1, 1, 1, 0, 0, 1, 0],
+        "Chapter 4. Databases": [1, 0, 1, 1, 0, 1, 1, 0, 0, 1, 1, 0, 1, 1, 0, 1, 1, 1, 0, 0, 1, 1, 0, 1, 1, 1, 0, 1, 1, 0],
+        "Chapter 5. Networking": [1, 0, 1, 1, 1, 0, 1, 1, 0, 1, 1, 0, 1, 0, 1, 0, 1, 1, 1, 0, 1, 0, 1, 1, 0, 1, 1, 1, 0, 1]
+    }
+}
+
+
+@profiling.profiled("teacher_dashboard")
 def teacher_dashboard():
     # Sidebar
     if "username" in st.session_state:
@@ -16,6 +55,7 @@ def teacher_dashboard():
 
     st.sidebar.write("Subject: Mathematics, Physics, Computer Science")
     menu = st.sidebar.radio("Menu", ["Dashboard", "Manage Students", "Manage Grades"])
+    query_log.set_page(f"Teacher: {menu}")
     logout_button = st.sidebar.button("Logout", key="logout", help="Logout from the application")
 
     # Logic for Logout
@@ -36,6 +76,61 @@ def teacher_dashboard():
         manage_students()
     elif menu == "Manage Grades":
         manage_grades()
+
+# Pie chart of the YES/NO split
+def grade_distribution_figure(pie_data):
+    import matplotlib.pyplot as plt
+    pie_labels = ["YES", "NO"]
+    fig, ax = plt.subplots()
+    ax.pie(pie_data, labels=pie_labels, autopct='%1.1f%%', startangle=90, colors=["#1f77b4", "#aec7e8"])
+    ax.axis("equal")
+    return fig
+
+# Bars of each student's YES/NO per chapter
+def chapter_grades_figure(df_melted, subject):
+    import matplotlib.pyplot as plt
+    fig, ax = plt.subplots(figsize=(12, 8))
+    for chapter, data in df_melted.groupby("Chapter"):
+        ax.bar(data["Student"], data["Grade"], label=chapter, alpha=0.7)
+    ax.set_ylabel("Grade (1 = YES, 0 = NO)")
+    ax.set_title(f"Chapter-wise Grade Distribution for {subject}")
+    ax.legend()
+    ax.tick_params(axis="x", labelrotation=90, labelsize=8)
+    return fig
+
+# Job "chapter_charts": render the dashboard's matplotlib charts for
+# params["subject"] to PNG files (through the figure cache, which a worker
+# process keeps between jobs)
+def chapter_charts_report(params, job):
+    import os
+    import matplotlib
+    matplotlib.use("Agg")
+    import figure_cache
+    subject = params["subject"]
+    images = {"grade_distribution": "grade_distribution.png", "chapter_grades": "chapter_grades.png"}
+
+    # Grade Distribution Pie Chart
+    job.progress(0.1, "grade distribution")
+    pie_data = [61.1, 38.9]  # Example data for "YES" and "NO"
+    with open(os.path.join(job.directory, images["grade_distribution"]), "wb") as image:
+        image.write(figure_cache.png(grade_distribution_figure, pie_data))
+
+    # Convert the chapter data into a DataFrame
+    job.progress(0.4, "chapter-wise grades")
+    df = pd.DataFrame(CHAPTER_DATA.get(subject, {}))
+    df["Student"] = STUDENT_NAMES
+    df_melted = df.melt(id_vars="Student", var_name="Chapter", value_name="Grade")
+
+    # Plot chapter-wise grade distribution
+    with open(os.path.join(job.directory, images["chapter_grades"]), "wb") as image:
+        image.write(figure_cache.png(chapter_grades_figure, df_melted, subject=subject))
+    return images
+
+# Render one image of a finished "chapter_charts" job
+def show_chart(name):
+    import os
+    return lambda result, directory: st.image(os.path.join(directory, result[name]))
+
 def render_dashboard():
     # Title and Metrics Section
     st.title("Teacher Dashboard")
@@ -74,12 +169,8 @@ def render_dashboard():
 
     # Grade Distribution Pie Chart
     st.markdown(f"### Overall Grade Distribution - {subject}")
-    pie_data = [61.1, 38.9]  # Example data for "YES" and "NO"
-    pie_labels = ["YES", "NO"]
-    fig, ax = plt.subplots()
-    ax.pie(pie_data, labels=pie_labels, autopct='%1.1f%%', startangle=90, colors=["#1f77b4", "#aec7e8"])
-    ax.axis("equal")
-    st.pyplot(fig)
+    jobs.show("chapter_charts", {"subject": subject}, show_chart("grade_distribution"),
+              label="Grade distribution chart", key="grade_distribution_retry")
 
     # Grade and Section Selection
     st.markdown("### Analysis for Grades and Sections")
@@ -88,38 +179,8 @@ def render_dashboard():
     selected_section = st.selectbox("Select Section", ["Section A", "Section B", "Section C"])
     st.markdown(f"Performance Analysis - {selected_section}")
 
-    # Student Names (replace with actual student names)
-    student_names = ["John Doe", "Jane Smith", "Alex Brown", "Emily Davis", "Michael Johnson", "Sarah Lee", "David Wilson", "Laura Taylor", "Chris White", "Megan Harris", 
-                     "Tom Clark", "Anna Martin", "James Walker", "Sophia Hall", "Benjamin Allen", "Olivia Young", "Ethan King", "Charlotte Scott", "Daniel Adams", "Grace Nelson", 
-                     "Noah Carter", "Ava Mitchell", "Lucas Roberts", "Isabella Perez", "Mason Evans", "Amelia Carter", "Henry Thompson", "Lily Lewis", "William Harris", "Harper Turner"]
-
-    # Define Chapter data based on subject
-    chapter_data = {
-       "Mathematics": {
-            "Chapter 1. Algebra": [1, 0, 1, 1, 1, 0, 1, 1, 0, 1, 1, 1, 1, 0, 1, 1, 0, 1, 1, 0, 0, 1, 1, 1, 0, 1, 1, 1, 0, 1],
-            "Chapter 2. Geometry": [0, 1, 0, 1, 1, 0, 1, 1, 1, 1, 0, 1, 1, 1, 0, 0, 1, 0, 1, 1, 1, 0, 1, 1, 1, 0, 1, 1, 1, 1],
-            "Chapter 3. Calculus": [1, 0, 1, 1, 0, 1, 1, 1, 0, 1, 1, 0, 1, 0, 1, 1, 1, 0, 0, 1, 1, 0, 1, 1, 0, 0, 1, 1, 1, 0],
-            "Chapter 4. Trigonometry": [1, 1, 1, 1, 0, 1, 0, 1, 1, 1, 0, 1, 0, 1, 1, 1, 1, 0, 1, 1, 0, 1, 1, 0, 1, 1, 0, 1, 0, 1],
-            "Chapter 5. Statistics": [0, 1, 1, 0, 1, 1, 0, 0, 1, 1, 1, 0, 1, 1, 0, 1, 0, 1, 0, 1, 1, 1, 0, 1, 1, 0, 1, 0, 1, 1]
-        },
-        "Physics": {
-            "Chapter 1. Mechanics": [1, 1, 0, 1, 0, 1, 1, 1, 0, 0, 1, 0, 1, 0, 1, 1, 0, 0, 1, 1, 1, 0, 1, 0, 1, 1, 0, 1, 1, 0],
-            "Chapter 2. Thermodynamics": [0, 0, 1, 1, 0, 1, 0, 1, 1, 1, 1, 0, 1, 1, 1, 0, 1, 1, 1, 0, 0, 1, 1, 0, 1, 1, 0, 1, 1, 1],
-            "Chapter 3. Optics": [1, 1, 0, 1, 0, 1, 1, 1, 0, 1, 0, 1, 1, 0, 1, 1, 0, 0, 1, 1, 1, 0, 1, 1, 0, 1, 0, 1, 0, 1],
-            "Chapter 4. Electromagnetism": [0, 1, 1, 0, 0, 1, 1, 1, 1, 1, 0, 1, 1, 0, 0, 1, 1, 1, 0, 1, 0, 1, 0, 1, 0, 1, 1, 0, 1, 1],
-            "Chapter 5. Quantum Physics": [1, 0, 1, 1, 1, 0, 0, 1, 1, 1, 0, 1, 0, 1, 1, 0, 1, 0, 1, 1, 0, 1, 1, 0, 1, 0, 0, 1, 1, 1]
-        },
-        "Computer Science": {
-            "Chapter 1. Data Structures": [1, 1, 0, 1, 1, 0, 1, 1, 0, 1, 0, 1, 1, 1, 1, 0, 1, 0, 1, 1, 0, 0, 1, 0, 1, 1, 1, 0, 1, 1],
-            "Chapter 2. Algorithms": [0, 1, 1, 1, 0, 0, 1, 1, 1, 0, 1, 0, 1, 1, 0, 1, 0, 1, 0, 1, 0, 1, 0, 1, 1, 1, 0, 0, 1, 1],
-            "Chapter 3. Operating Systems": [1, 1, 0, 1, 1, 1, 0, 1, 0, 1, 0, 1, 1, 0, 1, 0, 0, 1, 1, 1, 0, 1, 0, 1, 1, 1, 0, 0, 1, 0],
-            "Chapter 4. Databases": [1, 0, 1, 1, 0, 1, 1, 0, 0, 1, 1, 0, 1, 1, 0, 1, 1, 1, 0, 0, 1, 1, 0, 1, 1, 1, 0, 1, 1, 0],
-            "Chapter 5. Networking": [1, 0, 1, 1, 1, 0, 1, 1, 0, 1, 1, 0, 1, 0, 1, 0, 1, 1, 1, 0, 1, 0, 1, 1, 0, 1, 1, 1, 0, 1]
-        }
-    }
-
     # Use the selected subject's chapters
-    chapters = chapter_data.get(subject, {})
+    chapters = CHAPTER_DATA.get(subject, {})
 
     # Calculate YES and NO counts for each chapter
     chapter_summary = {}
@@ -133,20 +194,9 @@ def render_dashboard():
     summary_df = pd.DataFrame.from_dict(chapter_summary, orient='index', columns=["YES", "NO"])
     st.dataframe(summary_df)
 
-    # Convert the chapter data into a DataFrame
-    df = pd.DataFrame(chapters)
-    df["Student"] = student_names
-    df_melted = df.melt(id_vars="Student", var_name="Chapter", value_name="Grade")
-
-    # Plot chapter-wise grade distribution
-    fig, ax = plt.subplots(figsize=(12, 8))
-    for chapter, data in df_melted.groupby("Chapter"):
-        ax.bar(data["Student"], data["Grade"], label=chapter, alpha=0.7)
-    ax.set_ylabel("Grade (1 = YES, 0 = NO)")
-    ax.set_title(f"Chapter-wise Grade Distribution for {subject}")
-    ax.legend()
-    plt.xticks(rotation=90, fontsize=8)
-    st.pyplot(fig)
+    # Chapter-wise grade distribution, rendered by the same background job
+    jobs.show("chapter_charts", {"subject": subject}, show_chart("chapter_grades"),
+              label="Chapter-wise grade chart", key="chapter_grades_retry")
 
     # Chapter-wise Performance Data
     st.markdown(f"### Chapter-wise Performance - {subject}")
@@ -177,7 +227,7 @@ def render_dashboard():
 }
     # Use the selected subject's performance data
     performance_df = pd.DataFrame(performance_data.get(subject, {}))
-    performance_df["Student"] = student_names
+    performance_df["Student"] = STUDENT_NAMES
 
     # Display the performance data in a table
     st.dataframe(performance_df)
@@ -188,54 +238,30 @@ import sqlite3
 import pandas as pd
 import streamlit as st
 
-# Function to create the student_new table
+# Function to create the student_new table (part of the schema migrations)
 def create_student_table():
-    try:
-        connection = sqlite3.connect("database.db")
-        cursor = connection.cursor()
+    from database import init_db
+    init_db()
 
-        # Create the 'student_new' table
-        cursor.execute("""
-        CREATE TABLE IF NOT EXISTS student_new (
-            student_id INTEGER PRIMARY KEY AUTOINCREMENT,
-            student_name TEXT NOT NULL,
-            roll_number INTEGER NOT NULL,
-            age INTEGER NOT NULL,
-            gender TEXT NOT NULL,
-            branch TEXT NOT NULL
-        )
-        """)
-
-        connection.commit()
-        print("Table 'student_new' created successfully")
-    except sqlite3.Error as e:
-        print(f"An error occurred while creating the table: {e}")
-    finally:
-        if connection:
-            connection.close()
-
-# Call the function to create the table when the app starts
-create_student_table()
-
-# Helper function to get all students from the database
-def get_all_students():
+# Helper function to get one page of students from the database, in student_id
+# order; pass the last student_id of a page as `after_id` to get the next one
+def get_all_students(after_id=None, limit=None):
     try:
-        connection = sqlite3.connect("database.db")
-        cursor = connection.cursor()
-        cursor.execute("SELECT * FROM student_new")  # Fetching data from student_new table
-        students = cursor.fetchall()
+        students, _ = roster.fetch_page(
+            "student_new", sort="student_id",
+            after=(after_id,) if after_id is not None else None,
+            limit=limit or roster.PAGE_SIZE
+        )
         return students
     except sqlite3.Error as e:
         print(f"An error occurred: {e}")
+        metrics.ERRORS.inc("teachers.get_all_students")
         return []
-    finally:
-        if connection:
-            connection.close()
 
 # Add student function
 def add_student(name, roll_number, age, gender, branch):
     try:
-        connection = sqlite3.connect("database.db")
+        connection = db.get_connection()
         cursor = connection.cursor()
 
         # Update the SQL query to match the 'student_new' table structure without the 'email' column
@@ -248,6 +274,7 @@ def add_student(name, roll_number, age, gender, branch):
         print("Student added successfully")
     except sqlite3.Error as e:
         print(f"An error occurred while adding the student: {e}")
+        metrics.ERRORS.inc("teachers.add_student")
     finally:
         if connection:
             connection.close()
@@ -255,7 +282,7 @@ def add_student(name, roll_number, age, gender, branch):
 # Update student function
 def update_student(student_id, name, roll_number, age, gender, branch):
     try:
-        connection = sqlite3.connect("database.db")
+        connection = db.get_connection()
         cursor = connection.cursor()
         cursor.execute("""
         UPDATE student_new 
@@ -265,6 +292,7 @@ def update_student(student_id, name, roll_number, age, gender, branch):
         connection.commit()
     except sqlite3.Error as e:
         print(f"An error occurred while updating the student: {e}")
+        metrics.ERRORS.inc("teachers.update_student")
     finally:
         if connection:
             connection.close()
@@ -282,10 +310,6 @@ def update_student(student_id, name, roll_number, age, gender, branch):
     # Update student logic here (e.g., update database)
     pass
 
-def get_all_students():
-    # Get all students from the database (replace with actual database query)
-    return []
-
 # Manage Students function
 def manage_students():
     st.title("Manage Students")
@@ -316,15 +340,9 @@ def manage_students():
                 update_student(student_id, name, roll_number, age, gender, branch)
                 st.success(f"Student {name} with Roll Number {roll_number} updated successfully!")
 
-    # Displaying existing students
+    # Displaying existing students, one page at a time
     st.subheader("Existing Students")
-    students = get_all_students()  # Fetch all students from the database
-
-    if students:
-        student_df = pd.DataFrame(students, columns=["student_id", "student_name", "roll_number", "age", "gender", "branch", "address", "phone_number"])
-        st.write(student_df)
-    else:
-        st.write("No existing students found.")
+    roster.show_roster("student_new", key="teacher")
     
     # Bulk Upload Section
     st.subheader("Bulk Upload Students")
@@ -344,44 +362,17 @@ def manage_students():
                 student_df = pd.DataFrame(students, columns=["student_id", "student_name", "roll_number", "age", "gender", "branch"])
                 st.write(student_df)
 
-# Call manage_students to run the Streamlit app functionality
-manage_students()
 
 
 import sqlite3
 import pandas as pd
 import streamlit as st
+import query_cache
 
-# Function to create grades table (if not exists)
+# Function to create grades table (part of the schema migrations)
 def create_grades_table():
-    try:
-        connection = sqlite3.connect("database.db")
-        cursor = connection.cursor()
-
-        cursor.execute("""
-        CREATE TABLE IF NOT EXISTS grades (
-            grade_id INTEGER PRIMARY KEY AUTOINCREMENT,
-            student_id INTEGER,
-            student_name TEXT,
-            subject TEXT,
-            chapter TEXT,
-            section TEXT,
-            grade INTEGER,
-            FOREIGN KEY(student_id) REFERENCES student_new(student_id)
-        )
-        """)
-        connection.commit()
-    except sqlite3.Error as e:
-        st.error(f"An error occurred while creating the grades table: {e}")
-    finally:
-        if connection:
-            connection.close()
-
-# Function to get all students (hardcoded for now)
-def get_students():
-    return ["John Doe", "Jane Smith", "Alex Brown", "Emily Davis", "Michael Johnson", "Sarah Lee", "David Wilson", "Laura Taylor", "Chris White", "Megan Harris", 
-                     "Tom Clark", "Anna Martin", "James Walker", "Sophia Hall", "Benjamin Allen", "Olivia Young", "Ethan King", "Charlotte Scott", "Daniel Adams", "Grace Nelson", 
-                     "Noah Carter", "Ava Mitchell", "Lucas Roberts", "Isabella Perez", "Mason Evans", "Amelia Carter", "Henry Thompson", "Lily Lewis", "William Harris", "Harper Turner"]
+    from database import init_db
+    init_db()
 
 # Function to get all subjects (hardcoded for now)
 def get_subjects():
@@ -396,60 +387,182 @@ def get_chapters_for_subject(subject):
     }
     return subject_chapters.get(subject, [])
 
-# Function to get all sections (hardcoded for now)
-def get_sections():
-    return ["Section A", "Section B", "Section C", "Section D"]
-
-# Function to save grades to the database
+# Label of a section in grades.section, as the generated data writes it
+def section_label(section_name):
+    return f"Section {section_name}"
+
+# Grade and section of the teacher's branch, picked from the aggregate cube.
+# Returns (branch_id, grade, section_name), or None when there is nothing to pick.
+def select_section():
+    branch_id = st.session_state.get("branch_id")
+    if branch_id is None:
+        st.info("No branch is assigned to your account.")
+        return None
+    col1, col2 = st.columns(2)
+    with col1:
+        grade = st.selectbox("Select Grade", cube.grades(branch_id), format_func=lambda grade: f"Grade {grade}",
+                             key="grade_level_selectbox")
+    with col2:
+        section_name = st.selectbox("Select Section", cube.sections(branch_id, grade) if grade is not None else [],
+                                    key="grade_section_selectbox")
+    if section_name is None:
+        st.info("No classes in your branch yet.")
+        return None
+    return branch_id, grade, section_name
+
+# Function to save grades to the database (one grade per student, subject, chapter and section)
 def save_grade(student_id, student_name, subject, chapter, section, grade):
-    connection = sqlite3.connect('database.db')
-    cursor = connection.cursor()
-    cursor.execute("""
-    INSERT INTO grades (student_id, student_name, subject, chapter, section, grade)
-    VALUES (?, ?, ?, ?, ?, ?)
-    """, (student_id, student_name, subject, chapter, section, grade))
-    connection.commit()
-    
-    # Fetch the last inserted grade_id
-    cursor.execute("SELECT last_insert_rowid()")
-    grade_id = cursor.fetchone()[0]
-    
-    connection.close()
-    
-    return grade_id  # Return the generated grade_id
+    connection = db.get_connection()
+    with connection:
+        grade_id = connection.execute("""
+        INSERT INTO grades (student_id, student_name, subject, chapter, section, grade)
+        VALUES (?, ?, ?, ?, ?, ?)
+        ON CONFLICT (student_id, subject, chapter, section)
+        DO UPDATE SET grade = excluded.grade, student_name = excluded.student_name
+        RETURNING grade_id
+        """, (student_id, student_name, subject, chapter, section, grade)).fetchone()[0]
+    return grade_id  # Return the grade_id of the new or updated row
+
+# Grades already entered for a subject by the students of one section (branch ?1,
+# grade ?2, section name ?3), looked up from the students through idx_grades_cell
+GRADE_GRID_SQL = """
+SELECT g.student_id, g.chapter, g.grade
+FROM class c
+JOIN section sec ON sec.class_id = c.class_id
+JOIN student s ON s.section_id = sec.section_id
+JOIN grades g ON g.student_id = s.student_id AND g.subject = ?4 AND g.section = ?5
+WHERE c.branch_id = ?1 AND c.grade = ?2 AND sec.section_name = ?3
+"""
+
+# Function to load a section's grades as a student x chapter grid (NaN where no grade yet).
+# The grid is indexed by student.student_id, the id grades.student_id holds.
+def load_grade_grid(subject, branch_id, grade, section_name):
+    students = roster.section_students(branch_id, grade, section_name)
+    chapters = get_chapters_for_subject(subject)
+    grid = pd.DataFrame(float("nan"), index=pd.Index([student_id for student_id, _ in students], name="student_id"),
+                        columns=chapters)
+    rows = query_cache.fetchall(GRADE_GRID_SQL, (branch_id, grade, section_name, subject, section_label(section_name)),
+                                tables=("grades", "student", "section", "class"))
+    for student_id, chapter, mark in rows:
+        if chapter in grid.columns:
+            grid.loc[student_id, chapter] = mark
+    grid.insert(0, "Student", [name for _, name in students])
+    return grid
+
+# Function to write only the cells that differ between two grids, in one transaction.
+# The grids are compared as arrays and the names looked up once per row, not per cell.
+# Returns (cells saved, cells cleared).
+def save_grade_grid(subject, section, original, edited):
+    import numpy as np
+    chapters = [column for column in original.columns if column != "Student"]
+    student_ids = edited.index.to_numpy()
+    names = original["Student"].reindex(edited.index).to_numpy()
+    before = original[chapters].reindex(edited.index).to_numpy(dtype="float64", na_value=np.nan)
+    after = edited[chapters].to_numpy(dtype="float64", na_value=np.nan)
+    changed = (before != after) & ~(np.isnan(before) & np.isnan(after))
+
+    rows, columns = np.nonzero(changed & ~np.isnan(after))
+    upserts = [
+        (student_id, name, subject, chapters[column], section, grade)
+        for student_id, name, column, grade in zip(student_ids[rows].tolist(), names[rows].tolist(),
+                                                   columns.tolist(), after[rows, columns].astype(int).tolist())
+    ]
+    rows, columns = np.nonzero(changed & np.isnan(after))
+    deletes = [
+        (student_id, subject, chapters[column], section)
+        for student_id, column in zip(student_ids[rows].tolist(), columns.tolist())
+    ]
+
+    connection = db.get_connection()
+    with connection:
+        connection.executemany("""
+        INSERT INTO grades (student_id, student_name, subject, chapter, section, grade)
+        VALUES (?, ?, ?, ?, ?, ?)
+        ON CONFLICT (student_id, subject, chapter, section)
+        DO UPDATE SET grade = excluded.grade, student_name = excluded.student_name
+        """, upserts)
+        connection.executemany(
+            "DELETE FROM grades WHERE student_id = ? AND subject = ? AND chapter = ? AND section = ?",
+            deletes
+        )
+    return len(upserts), len(deletes)
 
 # Function to delete all grades from the database
 def delete_all_grades_from_db():
-    connection = sqlite3.connect('database.db')
+    connection = db.get_connection()
     cursor = connection.cursor()
     cursor.execute("DELETE FROM grades")  # Deletes all rows in the grades table
     connection.commit()
     connection.close()
 
+# Spreadsheet-style entry: every student of the section against every chapter
+def grade_grid_editor(subject, branch_id, grade, section_name):
+    section = section_label(section_name)
+    original = load_grade_grid(subject, branch_id, grade, section_name)
+    chapters = get_chapters_for_subject(subject)
+    edited = st.data_editor(
+        original,
+        hide_index=True,
+        disabled=["Student"],
+        column_config={
+            chapter: st.column_config.NumberColumn(chapter, min_value=1, max_value=10, step=1)
+            for chapter in chapters
+        },
+        key=f"grade_grid_{subject}_{grade}_{section}",
+        use_container_width=True,
+    )
+    if st.button("Save", key="save_grade_grid"):
+        saved, cleared = save_grade_grid(subject, section, original, edited)
+        if saved or cleared:
+            st.success(f"Grades Saved Successfully! {saved} grade(s) saved, {cleared} cleared.")
+        else:
+            st.info("No changes to save.")
+    return edited
+
 # Main function to manage grades
 def manage_grades():
     st.title("Manage Student Grades")
-
-    # Select student from list
-    student_name = st.selectbox("Select Student", get_students(), key="student_selectbox")
-    
-    # Get student ID based on the selected student (In a real scenario, you would fetch this from the database)
-    student_id = get_students().index(student_name) + 1  # Simple ID based on list index
+    mode = st.radio("Entry Mode", ["Grid", "Single Grade"], horizontal=True, key="grade_entry_mode")
+    selection = select_section()
+    if selection is None:
+        return
+    branch_id, grade_level, section_name = selection
+    section = section_label(section_name)
+
+    if mode == "Grid":
+        subject = st.selectbox("Select Subject", get_subjects(), key="grid_subject_selectbox")
+        grid = grade_grid_editor(subject, branch_id, grade_level, section_name)
+        with st.expander("Download Grades Summary", expanded=False):
+            csv_data = grid.to_csv(index=False).encode('utf-8')
+            st.download_button(
+                label="Download Summary (CSV)",
+                data=csv_data,
+                file_name=f"grades_{subject}_{section}.csv",
+                mime="text/csv"
+            )
+        return
+
+    # Select a student of the section; grades are saved against student.student_id
+    students = dict(roster.section_students(branch_id, grade_level, section_name))
+    if not students:
+        st.info("No students in this section yet.")
+        return
+    student_id = st.selectbox("Select Student", list(students),
+                              format_func=lambda student_id: f"{students[student_id]} ({student_id})",
+                              key="student_selectbox")
+    student_name = students[student_id]
 
     # Container for grade selection
     with st.container():
         st.subheader("Select Grade Details")
         
-        col1, col2, col3 = st.columns([2, 3, 2])
+        col1, col2 = st.columns([2, 3])
         with col1:
             subject = st.selectbox("Select Subject", get_subjects(), key="subject_selectbox")
         
         with col2:
             chapters = get_chapters_for_subject(subject)
             chapter = st.selectbox(f"Select Chapter for {subject}", chapters, key="chapter_selectbox")
-        
-        with col3:
-            section = st.selectbox("Select Section", get_sections(), key="section_selectbox")
 
     # Initialize grades in session state if not already initialized
     if "grades" not in st.session_state:
@@ -460,7 +573,8 @@ def manage_grades():
         st.subheader("Select Grade")
         grade = st.selectbox("Grade", list(range(1, 11)), key="grade_selectbox")
         
-    # Add grade entry to session state when button is clicked
+    # Add grade entry to session state when button is clicked. The grade is
+    # saved right away; adding the same cell again replaces it.
     with st.container():
         if st.button("Add", key="add_grade"):
             grade_id = save_grade(student_id, student_name, subject, chapter, section, grade)
@@ -472,56 +586,39 @@ def manage_grades():
                 "section": section,
                 "grade": grade
             }
-            st.session_state["grades"].append(grade_entry)
+            st.session_state["grades"] = [
+                entry for entry in st.session_state["grades"] if entry["grade_id"] != grade_id
+            ] + [grade_entry]
             st.success("Grade Added Successfully!")
 
-    # Layout for buttons: Save and Download
+    # Summary and download of the grades added in this session
     with st.container():
-        col1, col2 = st.columns([2, 1])
-        
-        with col1:
-            if st.button("Save"):
-                if "grades" in st.session_state and st.session_state["grades"]:
-                    for grade_entry in st.session_state["grades"]:
-                        if "grade" in grade_entry:
-                            save_grade(student_id=student_id,  # Using the student_id derived from the name
-                                       student_name=student_name,
-                                       subject=grade_entry["subject"],
-                                       chapter=grade_entry["chapter"],
-                                       section=grade_entry["section"],
-                                       grade=grade_entry["grade"])
-                    st.success("Grades Saved Successfully!")
+        if st.session_state.get("grades"):
+            with st.expander("Download Grades Summary", expanded=False):
+                grades_df = pd.DataFrame(st.session_state["grades"])
+                if not grades_df.empty:
+                    st.write("Grades Summary:")
+                    st.dataframe(grades_df, use_container_width=True)
+
+                    # Add "Delete All Grades" button to delete the entire table
+                    if st.button("Delete"):
+                        # Clear grades from session state
+                        st.session_state["grades"] = []
+                        # Delete all grades from the database
+                        delete_all_grades_from_db()
+                        st.success("All grades deleted successfully!")
+
+                    # Download the saved rows, streamed from the database
+                    export.export_download(
+                        "grades", "grades_summary",
+                        filters={"grade_ids": grades_df["grade_id"].tolist()},
+                        key="grades_summary_export",
+                        default_columns=["student_name", "subject", "chapter", "section", "grade"]
+                    )
                 else:
-                    st.warning("No grades to save.")
-        
-        with col2:
-            if st.session_state.get("grades"):
-                with st.expander("Download Grades Summary", expanded=False):
-                    grades_df = pd.DataFrame(st.session_state["grades"])
-                    if not grades_df.empty:
-                        st.write("Grades Summary:")
-                        st.dataframe(grades_df, use_container_width=True)
-
-                        # Add "Delete All Grades" button to delete the entire table
-                        if st.button("Delete"):
-                            # Clear grades from session state
-                            st.session_state["grades"] = []
-                            # Delete all grades from the database
-                            delete_all_grades_from_db()
-                            st.success("All grades deleted successfully!")
-
-                        # Download button for CSV
-                        csv_data = grades_df.to_csv(index=False).encode('utf-8')
-                        st.download_button(
-                            label="Download Summary (CSV)",
-                            data=csv_data,
-                            file_name="grades_summary.csv",
-                            mime="text/csv"
-                        )
-                    else:
-                        st.warning("No grades available to download.")
-            else:
-                st.warning("No grades added yet.")
+                    st.warning("No grades available to download.")
+        else:
+            st.warning("No grades added yet.")
 
 if __name__ == "__main__":
     if "authenticated" in st.session_state and st.session_state["authenticated"]:
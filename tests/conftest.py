@@ -0,0 +1,51 @@
+"""Shared fixtures: a small generated school database per test session.
+
+    python -m pytest -q tests
+"""
+import os
+import shutil
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import db  # noqa: E402
+
+# 1,000 students over one branch: big enough that a full scan of grades or
+# student stands out, small enough to generate in a couple of seconds
+TEST_SCALE = 0.05
+
+
+@pytest.fixture(scope="session")
+def generated_db(tmp_path_factory):
+    """Path of a database generated once for the session; tests must not write to it."""
+    import generate_data
+    path = str(tmp_path_factory.mktemp("school") / "school.db")
+    generate_data.generate(path, sf=TEST_SCALE, progress=lambda message: None)
+    yield path
+    db.close_all()
+
+
+@pytest.fixture
+def school_db(generated_db, monkeypatch):
+    """Point db.DB_PATH (and SCHOOL_DB_PATH for subprocesses) at the generated database."""
+    import query_cache
+    monkeypatch.setattr(db, "DB_PATH", generated_db)
+    monkeypatch.setenv("SCHOOL_DB_PATH", generated_db)
+    query_cache.clear()
+    yield generated_db
+    query_cache.clear()
+
+
+@pytest.fixture
+def scratch_db(generated_db, tmp_path, monkeypatch):
+    """A writable copy of the generated database, set as db.DB_PATH."""
+    import query_cache
+    path = str(tmp_path / "school.db")
+    shutil.copy(generated_db, path)
+    monkeypatch.setattr(db, "DB_PATH", path)
+    monkeypatch.setenv("SCHOOL_DB_PATH", path)
+    query_cache.clear()
+    yield path
+    query_cache.clear()
@@ -0,0 +1,80 @@
+import io
+
+import numpy as np
+import pytest
+
+import bulk_import
+import db
+import rollup
+
+COLUMNS = ["student_name", "father_name", "mother_name", "roll_number", "gender", "phone_number", "dob", "address",
+           "section_id"]
+
+
+def triggers(connection):
+    return sorted(row[0] for row in connection.execute("SELECT name FROM sqlite_master WHERE type = 'trigger'"))
+
+
+def test_chunk_with_a_duplicate_keeps_the_triggers(scratch_db):
+    connection = db.get_connection()
+    section_id, taken = connection.execute("SELECT section_id, roll_number FROM student LIMIT 1").fetchone()
+    before = triggers(connection)
+    values = np.array([
+        ("New Student", "F", "M", "TEST-1", "Male", "0", "2012-01-01", "Street 1", section_id),
+        ("Same Roll", "F", "M", taken, "Female", "0", "2012-01-01", "Street 2", section_id),
+    ], dtype=object)
+    with bulk_import.suspended_triggers(connection) as (cursor, dropped):
+        inserted, failures = bulk_import._insert_chunk(cursor, COLUMNS, values)
+        bulk_import._restore_triggers(cursor, dropped, section_id, inserted)
+
+    assert inserted == 1
+    assert [position for position, _ in failures] == [1]
+    assert triggers(connection) == before
+    assert rollup.check_branch_rollup(connection) == []
+
+
+def test_imported_students_are_indexed_by_the_job_worker(scratch_db):
+    import jobs
+    import search
+    connection = db.get_connection()
+    section_id = connection.execute("SELECT section_id FROM student LIMIT 1").fetchone()[0]
+    rows = "".join(
+        f"Quillon Student {i},F,M,QS-{i},Male,0,2012-01-01,Street\n"
+        for i in range(bulk_import.INSERT_BATCH_ROWS + 3)
+    )
+    csv_file = io.StringIO("Student Name,Father Name,Mother Name,Roll Number,Gender,Phone Number,Date of Birth,"
+                           "Address\n" + rows)
+    report = bulk_import.import_students(csv_file, section_id)
+    assert report.inserted == bulk_import.INSERT_BATCH_ROWS + 3
+
+    new_ids = [row[0] for row in connection.execute("SELECT student_id FROM student WHERE roll_number LIKE 'QS-%'")]
+    assert connection.execute("SELECT first_id, last_id FROM student_fts_pending").fetchall() == [
+        (min(new_ids), max(new_ids))
+    ]
+    # Deleting or renaming a student that is not indexed yet leaves the index intact
+    with connection:
+        connection.execute("DELETE FROM student WHERE student_id = ?", (new_ids[0],))
+        connection.execute("UPDATE student SET student_name = 'Quillon Renamed' WHERE student_id = ?", (new_ids[1],))
+    assert search.search_students("quillon") == []
+
+    jobs.Dispatcher(path=scratch_db).maintain()
+    assert connection.execute("SELECT COUNT(*) FROM student_fts_pending").fetchone()[0] == 0
+    found = [row[0] for row in search.search_students("quillon")]
+    assert len(found) == search.SEARCH_LIMIT and set(found) <= set(new_ids[1:])
+    assert [row[0] for row in search.search_students("renamed")] == [new_ids[1]]
+    connection.execute("INSERT INTO student_fts (student_fts) VALUES ('integrity-check')")
+
+
+def test_error_inside_suspended_triggers_rolls_back(scratch_db):
+    connection = db.get_connection()
+    before = triggers(connection)
+    students = connection.execute("SELECT COUNT(*) FROM student").fetchone()[0]
+    with pytest.raises(RuntimeError):
+        with bulk_import.suspended_triggers(connection) as (cursor, dropped):
+            assert dropped
+            cursor.execute("DELETE FROM student")
+            raise RuntimeError("chunk failed")
+
+    assert not connection.in_transaction
+    assert triggers(connection) == before
+    assert connection.execute("SELECT COUNT(*) FROM student").fetchone()[0] == students
@@ -0,0 +1,57 @@
+import timeit
+
+import numpy as np
+import pandas as pd
+import pytest
+
+import charts
+
+
+def population(count, label_length=12):
+    rng = np.random.default_rng(count)
+    df = pd.DataFrame({"score": rng.normal(6, 1.8, count).clip(1, 10)})
+    df["student_name"] = [f"Student {i}".ljust(label_length, "x") for i in range(count)]
+    return df
+
+
+def points(fig):
+    return sum(len(trace.y) for trace in fig.data if trace.y is not None)
+
+
+@pytest.mark.parametrize("count", [10, charts.MAX_BARS + 1, charts.MAX_POINTS, charts.MAX_POINTS + 1, 100_000])
+def test_payload_stays_bounded(count):
+    fig = charts.population_figure(population(count), x="student_name", y="score", title="Scores")
+    assert charts.payload_bytes(fig) <= charts.MAX_PAYLOAD_BYTES
+    assert points(fig) <= charts.MAX_POINTS
+    if charts.shows_each_student(count):
+        assert points(fig) == count
+    else:
+        assert fig.data[0].type == "bar" and points(fig) == charts.BINS
+        assert sum(fig.data[0].y) == count
+
+
+def test_long_labels_fall_back_to_bins():
+    fig = charts.population_figure(population(charts.MAX_POINTS, label_length=200), x="student_name", y="score",
+                                   title="Scores")
+    assert fig.data[0].type == "bar" and points(fig) == charts.BINS
+    assert charts.payload_bytes(fig) <= charts.MAX_PAYLOAD_BYTES
+
+
+def test_missing_scores_are_not_binned():
+    df = population(charts.MAX_POINTS + 100)
+    df.loc[:99, "score"] = np.nan
+    fig = charts.population_figure(df, x="student_name", y="score", title="Scores")
+    assert sum(fig.data[0].y) == charts.MAX_POINTS
+
+
+def test_build_time_does_not_follow_row_count():
+    def build_seconds(count):
+        df = population(count)
+        return min(timeit.repeat(lambda: charts.population_figure(df, x="student_name", y="score", title="Scores"),
+                                 number=1, repeat=3))
+
+    # Binning is one pass over the scores, so 200x the rows of the largest
+    # chart that shows each student may cost a few times as much, not 200x
+    baseline = build_seconds(charts.MAX_POINTS)
+    for count in (100_000, 1_000_000):
+        assert build_seconds(count) < baseline * 5
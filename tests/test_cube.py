@@ -0,0 +1,98 @@
+import cube
+import db
+
+
+def dirty(connection):
+    return sorted(connection.execute("SELECT branch_id, grade FROM agg_cube_dirty").fetchall())
+
+
+def some_student(connection, grade):
+    return connection.execute(
+        "SELECT s.student_id, c.branch_id FROM student s JOIN section sec ON s.section_id = sec.section_id "
+        "JOIN class c ON sec.class_id = c.class_id WHERE c.grade = ? LIMIT 1", (grade,)
+    ).fetchone()
+
+
+def test_writes_mark_only_the_grades_they_touch(scratch_db):
+    connection = db.get_connection()
+    student_id, branch_id = some_student(connection, 3)
+    with connection:
+        connection.execute("UPDATE grades SET grade = 10 - grade WHERE student_id = ?", (student_id,))
+    assert dirty(connection) == [(branch_id, 3)]
+
+    with connection:
+        connection.execute("INSERT INTO teachers (teacher_name, branch_id, email, password, subject) "
+                           "VALUES ('New Teacher', ?, 'new.teacher@example.com', 'x', 'Math')", (branch_id,))
+    assert dirty(connection) == [(branch_id, cube.ALL_GRADES), (branch_id, 3)]
+
+
+def test_reads_do_not_refresh(scratch_db):
+    connection = db.get_connection()
+    student_id, branch_id = some_student(connection, 3)
+    before = cube.cell(branch_id, 3)
+    with connection:
+        connection.execute("DELETE FROM grades WHERE student_id = ?", (student_id,))
+    assert cube.cell(branch_id, 3) == before
+    assert dirty(connection) == [(branch_id, 3)]
+
+    assert cube.refresh() == 1
+    assert cube.cell(branch_id, 3)["assessed"] == before["assessed"] - 1
+    assert dirty(connection) == []
+
+
+def test_refreshed_cells_match_a_full_recompute(scratch_db):
+    connection = db.get_connection()
+    student_id, branch_id = some_student(connection, 2)
+    other_section = connection.execute(
+        "SELECT sec.section_id FROM section sec JOIN class c ON sec.class_id = c.class_id WHERE c.grade = 7 LIMIT 1"
+    ).fetchone()[0]
+    with connection:
+        connection.execute("UPDATE grades SET grade = 1 WHERE student_id = ?", (student_id,))
+        connection.execute("UPDATE student SET section_id = ? WHERE student_id = ?", (other_section, student_id))
+        connection.execute("UPDATE class SET grade = 11 WHERE branch_id = ? AND grade = 4", (branch_id,))
+        # A second branch, so the all-branches rollup sums more than one
+        connection.execute("INSERT INTO branch (branch_name, location, contact_number) VALUES ('North', 'X', '1')")
+        new_branch = connection.execute("SELECT MAX(branch_id) FROM branch").fetchone()[0]
+        connection.execute("INSERT INTO class (class_name, branch_id, grade) VALUES ('Grade 2', ?, 2)", (new_branch,))
+        class_id = connection.execute("SELECT MAX(class_id) FROM class").fetchone()[0]
+        connection.execute("INSERT INTO section (class_id, section_name) VALUES (?, 'A')", (class_id,))
+        connection.execute("INSERT INTO teachers (teacher_name, branch_id, email, password, subject) "
+                           "VALUES ('North Teacher', ?, 'north.teacher@example.com', 'x', 'Math')", (new_branch,))
+    assert cube.refresh() > 0
+    assert cube.check_cube(connection) == []
+
+    # A class without a grade is only in its branch's totals
+    with connection:
+        connection.execute("INSERT INTO class (class_name, branch_id) VALUES ('Bridge', ?)", (branch_id,))
+        class_id = connection.execute("SELECT MAX(class_id) FROM class").fetchone()[0]
+        section_id = connection.execute(
+            "INSERT INTO section (class_id, section_name) VALUES (?, 'A') RETURNING section_id", (class_id,)
+        ).fetchone()[0]
+        connection.execute("UPDATE student SET section_id = ? WHERE student_id = ?", (section_id, student_id))
+    assert dirty(connection) == [(branch_id, cube.ALL_GRADES), (branch_id, 7)]
+    cube.refresh()
+    assert cube.check_cube(connection) == []
+    assert cube.cell()["students"] == connection.execute("SELECT COUNT(*) FROM student").fetchone()[0]
+
+
+def test_migration_keeps_marked_branches(scratch_db):
+    connection = db.get_connection()
+    with connection:
+        connection.execute("DROP TABLE agg_cube_dirty")
+        connection.execute("CREATE TABLE agg_cube_dirty (branch_id INTEGER PRIMARY KEY) WITHOUT ROWID")
+        connection.execute("INSERT INTO agg_cube_dirty VALUES (1)")
+        cube.track_dirty_cells(connection.cursor())
+    assert dirty(connection) == [(1, cube.ALL_GRADES)]
+    cube.refresh()
+    assert cube.check_cube(connection) == []
+
+
+def test_job_worker_refreshes_the_cube(scratch_db):
+    import jobs
+    connection = db.get_connection()
+    student_id, branch_id = some_student(connection, 5)
+    with connection:
+        connection.execute("DELETE FROM grades WHERE student_id = ?", (student_id,))
+    jobs.Dispatcher(path=scratch_db).maintain()
+    assert dirty(connection) == []
+    assert cube.check_cube(connection) == []
@@ -0,0 +1,89 @@
+import json
+import os
+import shutil
+import subprocess
+import sys
+
+import pyarrow.csv as pacsv
+import pyarrow.parquet as pq
+import pytest
+
+import benchmark
+import db
+import export
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+# Past the 16 MB page cache at both sizes, so what is left to grow with the
+# rows is the export itself
+LARGE_ROWS = 800_000
+SMALL_ROWS = LARGE_ROWS // 4
+MAX_GROWTH_MB = 100
+
+
+def read_export(path, fmt):
+    if fmt == "parquet":
+        return pq.read_table(path)
+    return pacsv.read_csv(path)
+
+
+@pytest.mark.parametrize("fmt", list(export.EXPORT_FORMATS))
+@pytest.mark.parametrize("dataset", list(export.EXPORTS))
+def test_export_writes_every_row(school_db, tmp_path, dataset, fmt):
+    path = str(tmp_path / f"{dataset}{export.EXPORT_FORMATS[fmt][0]}")
+    count = db.get_connection().execute(f"SELECT COUNT(*) FROM {export.EXPORTS[dataset]['from']}").fetchone()[0]
+    assert count > 0
+
+    report = export.write_export(path, dataset, fmt, chunk_rows=97)
+    table = read_export(path, fmt)
+    assert report.rows == table.num_rows == count == export.export_count(dataset)
+    assert table.column_names == export.export_columns(dataset)
+
+
+def test_branch_filter_matches_the_count(school_db, tmp_path):
+    branch_id = db.get_connection().execute("SELECT MIN(branch_id) FROM class").fetchone()[0]
+    path = str(tmp_path / "grades.csv")
+    report = export.write_export(path, "grades", filters={"branch_id": branch_id})
+    assert report.rows == export.export_count("grades", {"branch_id": branch_id}) > 0
+    assert export.export_count("grades", {"branch_id": branch_id + 1}) == 0
+
+
+def test_unknown_filters_are_refused(school_db):
+    with pytest.raises(ValueError):
+        export.export_count("grades", {"password": "x"})
+    with pytest.raises(ValueError):
+        export.export_sql("teachers", ["password"])
+
+
+def test_download_reads_the_path_it_was_given(school_db, tmp_path):
+    # The download callback runs off the script thread: it must use the
+    # path captured when the button was drawn, not db.DB_PATH
+    other = str(tmp_path / "other.db")
+    shutil.copy(school_db, other)
+    with db.get_connection(other) as connection:
+        connection.execute("DELETE FROM teachers WHERE teacher_id > (SELECT MIN(teacher_id) FROM teachers)")
+    with export.export_to_file("teachers", db_path=other) as handle:
+        assert len(handle.read().decode().splitlines()) == 2  # header and one teacher
+
+
+# Figures of benchmark.measure_export run in a fresh process on `path`
+def measure_export(path, fmt):
+    code = f"import benchmark; benchmark.measure_export('grades', {fmt!r}, 10000)"
+    result = subprocess.run([sys.executable, "-c", code], capture_output=True, text=True, cwd=ROOT,
+                            env=dict(os.environ, SCHOOL_DB_PATH=path), check=True)
+    return json.loads(result.stdout.splitlines()[-1])
+
+
+def test_export_memory_does_not_follow_row_count(scratch_db):
+    connection = db.get_connection()
+    benchmark.fill_grades(connection, LARGE_ROWS)
+    large = {fmt: measure_export(scratch_db, fmt) for fmt in export.EXPORT_FORMATS}
+    for figures in large.values():
+        assert figures["rows"] == LARGE_ROWS
+        assert figures["growth_mb"] < MAX_GROWTH_MB
+
+    with connection:
+        connection.execute("DELETE FROM grades WHERE grade_id > (SELECT MIN(grade_id) FROM grades) + ?", (SMALL_ROWS - 1,))
+    small = measure_export(scratch_db, "csv")
+    assert small["rows"] == SMALL_ROWS
+    # Four times the rows may not cost more than noise
+    assert large["csv"]["growth_mb"] - small["growth_mb"] < 16
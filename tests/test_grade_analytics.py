@@ -0,0 +1,46 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+import grade_analytics
+import sharding
+
+
+def grades_frame(student_ids, rng):
+    frame = pd.DataFrame({
+        "student_id": grade_analytics._ids(student_ids),
+        "subject": pd.Categorical(rng.choice(["Math", "Science", "English"], len(student_ids))),
+        "grade": rng.integers(1, 11, len(student_ids)).astype(np.int8),
+    })
+    frame["score"] = frame["grade"].astype(np.float32) * grade_analytics.SCORE_SCALE
+    return frame
+
+
+@pytest.mark.parametrize("offsets", [(0,), (5 * sharding.ID_BLOCK,), (sharding.ID_BLOCK, 7 * sharding.ID_BLOCK)],
+                         ids=["unsharded", "one shard", "two shards"])
+def test_student_subject_scores_match_a_groupby(offsets):
+    rng = np.random.default_rng(1)
+    ids = np.concatenate([offset + rng.integers(1, 2000, 5000) for offset in offsets])
+    frame = grades_frame(ids, rng)
+
+    scores = grade_analytics.student_subject_scores(frame)
+    expected = frame.groupby(["student_id", "subject"], observed=True)["score"].mean()
+    assert len(scores) == len(expected)
+    actual = scores.set_index(["student_id", "subject"])["score"]
+    assert np.allclose(actual.loc[expected.index].to_numpy(), expected.to_numpy())
+
+
+def test_ids_stay_int32_only_when_they_fit():
+    assert grade_analytics._ids([1, 2, 3]).dtype == np.int32
+    ids = grade_analytics._ids([3 * sharding.ID_BLOCK + 1])
+    assert ids.dtype == np.int64
+    assert ids[0] == 3 * sharding.ID_BLOCK + 1
+
+
+def test_read_grades_matches_the_grades_table(school_db):
+    import db
+    frame = grade_analytics.read_grades(school_db)
+    connection = db.get_connection(school_db)
+    count, total = connection.execute("SELECT COUNT(*), SUM(grade) FROM grades WHERE grade IS NOT NULL").fetchone()
+    assert len(frame) == count
+    assert int(frame["grade"].astype(np.int64).sum()) == total
@@ -0,0 +1,50 @@
+import os
+import subprocess
+import sys
+
+import pytest
+
+import benchmark
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+PAGE_MODULES = (
+    "login", "superadmin", "branchadmin", "teachers", "manage_branches", "manage_sections_classes",
+    "manage_subjects", "manage_teachers", "student_dashboard", "dashboard", "branch_dashboard",
+    "branchadmin_dashboard", "roster", "export", "search", "charts", "jobs",
+)
+LOGIN_BUDGET_MS = 750
+
+
+def run_python(code, db_path, *flags):
+    env = dict(os.environ, SCHOOL_DB_PATH=str(db_path), SCHOOL_METRICS_PORT="0")
+    return subprocess.run([sys.executable, *flags, "-c", code], capture_output=True, text=True, env=env, cwd=ROOT,
+                          check=True)
+
+
+@pytest.mark.parametrize("module", PAGE_MODULES)
+def test_import_has_no_side_effects(module, tmp_path):
+    result = run_python(f"import {module}", tmp_path / "school.db")
+    assert os.listdir(tmp_path) == []  # no database created or migrated
+    assert result.stdout == ""
+    assert result.stderr == ""  # st.* calls outside a session would warn here
+
+
+def test_login_loads_no_dashboard_modules(tmp_path):
+    code = f"import sys, login; print(','.join(m for m in {benchmark.LOGIN_LAZY_MODULES!r} if m in sys.modules))"
+    assert run_python(code, tmp_path / "school.db").stdout.strip() == ""
+
+
+def test_login_import_time_within_budget(tmp_path):
+    timings = []
+    for _ in range(3):
+        stderr = run_python("import login", tmp_path / "school.db", "-X", "importtime").stderr
+        for line in stderr.splitlines():
+            fields = line.split("|")
+            if len(fields) == 3 and fields[2].strip() == "login":
+                timings.append(int(fields[1]) / 1000)
+    assert min(timings) < LOGIN_BUDGET_MS
+
+
+def test_migrations_and_the_job_worker_do_not_load_streamlit(tmp_path):
+    code = "import sys, jobs, migrations; migrations.ensure_migrated(); print('streamlit' in sys.modules)"
+    assert run_python(code, tmp_path / "school.db").stdout.strip() == "False"
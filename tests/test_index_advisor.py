@@ -0,0 +1,19 @@
+import db
+import index_advisor
+
+# Tables of the generated database smaller than this may be scanned
+MAX_SCAN_ROWS = 500
+
+
+def test_registered_queries_avoid_full_scans(school_db):
+    with db.pooled(school_db) as connection:
+        findings = index_advisor.advise(connection)
+    assert index_advisor.violations(findings, MAX_SCAN_ROWS) == []
+
+
+def test_unindexed_lookup_is_reported(school_db):
+    registry = [("student by address", "SELECT student_id FROM student WHERE address = ?", ("x",), ())]
+    with db.pooled(school_db) as connection:
+        findings = index_advisor.advise(connection, registry)
+    assert [(name, table) for name, table, *_ in index_advisor.violations(findings, MAX_SCAN_ROWS)] == [
+        ("student by address", "student")]
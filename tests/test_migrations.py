@@ -0,0 +1,35 @@
+import os
+import subprocess
+import sys
+
+import migrations
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def test_concurrent_processes_apply_each_step_once(tmp_path):
+    path = str(tmp_path / "school.db")
+    code = "import migrations; print(migrations.ensure_migrated()['to_version'])"
+    processes = [
+        subprocess.Popen([sys.executable, "-c", code], cwd=ROOT, env=dict(os.environ, SCHOOL_DB_PATH=path),
+                         stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True)
+        for _ in range(3)
+    ]
+    for process in processes:
+        stdout, stderr = process.communicate()
+        assert process.returncode == 0, stderr
+        assert stdout.strip() == str(migrations.LATEST_VERSION)
+
+
+def test_grades_saved_by_list_position_are_detached(scratch_db):
+    import db
+    connection = db.get_connection()
+    name = connection.execute("SELECT student_name FROM student WHERE student_id = 1").fetchone()[0]
+    rows = [(1, "John Doe", "Algebra"), (27, "Henry Thompson", "Algebra"), (1, name, "Geometry")]
+    with connection:
+        connection.executemany("INSERT INTO grades (student_id, student_name, subject, chapter, section, grade) "
+                               "VALUES (?, ?, 'Mathematics', ?, 'Section Z', 5)", rows)
+        migrations._detach_legacy_grades(connection.cursor())
+    assert connection.execute(
+        "SELECT student_id, student_name FROM grades WHERE section = 'Section Z' ORDER BY grade_id"
+    ).fetchall() == [(None, "John Doe"), (None, "Henry Thompson"), (1, name)]
@@ -0,0 +1,56 @@
+import db
+import search
+
+INSERT_SQL = (
+    "INSERT INTO student (section_id, student_name, roll_number, father_name, mother_name, gender, phone_number, dob, "
+    "address) VALUES (?, ?, ?, ?, 'Mother', 'Male', '0', '2012-01-01', 'Address')"
+)
+
+
+def test_exact_matches_rank_before_newer_prefix_matches(scratch_db):
+    connection = db.get_connection()
+    with connection:
+        section_id, oldest = connection.execute("SELECT section_id, MIN(student_id) FROM student").fetchone()
+        connection.execute("UPDATE student SET student_name = 'Ravi Zorawar' WHERE student_id = ?", (oldest,))
+        connection.executemany(INSERT_SQL, [
+            (section_id, f"Zorawarsingh {i}", f"ZR-{i}", "Father") for i in range(search.SEARCH_WINDOW * 2)
+        ])
+        parent_match = connection.execute(INSERT_SQL, (section_id, "Anil Kumar", "ZR-parent", "Zorawar")).lastrowid
+
+    results = search.search_students("zorawar")
+    assert [row[0] for row in results[:2]] == [oldest, parent_match]
+    assert len(results) == search.SEARCH_LIMIT
+    assert all(row[1].startswith("Zorawarsingh") for row in results[2:])
+
+
+def test_branch_filter_keeps_exact_matches_of_that_branch(scratch_db):
+    connection = db.get_connection()
+    student_id, roll_number, branch_id = connection.execute(
+        "SELECT s.student_id, s.roll_number, c.branch_id FROM student s JOIN section sec ON s.section_id = sec.section_id "
+        "JOIN class c ON sec.class_id = c.class_id ORDER BY s.student_id LIMIT 1"
+    ).fetchone()
+    assert [row[0] for row in search.search_students(roll_number, branch_id)] == [student_id]
+    assert search.search_students(roll_number, branch_id + 1000) == []
+
+
+def test_branch_filter_reaches_past_other_branches_exact_matches(scratch_db):
+    connection = db.get_connection()
+    with connection:
+        oldest, branch_id = connection.execute(
+            "SELECT s.student_id, c.branch_id FROM student s JOIN section sec ON s.section_id = sec.section_id "
+            "JOIN class c ON sec.class_id = c.class_id ORDER BY s.student_id LIMIT 1"
+        ).fetchone()
+        connection.execute("UPDATE student SET student_name = 'Ravi Zorawar' WHERE student_id = ?", (oldest,))
+        other_branch = connection.execute(
+            "INSERT INTO branch (branch_name, location, contact_number) VALUES ('North', 'X', '1')").lastrowid
+        class_id = connection.execute(
+            "INSERT INTO class (class_name, branch_id, grade) VALUES ('Grade 5', ?, 5)", (other_branch,)).lastrowid
+        section_id = connection.execute("INSERT INTO section (class_id, section_name) VALUES (?, 'A')",
+                                        (class_id,)).lastrowid
+        # More exact matches in the other branch than the windows could hold
+        connection.executemany(INSERT_SQL, [
+            (section_id, f"Zorawar {i}", f"ZN-{i}", "Father")
+            for i in range(search.SEARCH_WINDOW * search.SEARCH_MAX_WINDOWS + 1)
+        ])
+
+    assert [row[0] for row in search.search_students("zorawar", branch_id)] == [oldest]
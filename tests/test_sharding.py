@@ -0,0 +1,112 @@
+import os
+
+import pytest
+
+import db
+import jobs
+import query_cache
+import sharding
+import superadmin
+
+EXTRA_BRANCHES = 20
+
+
+@pytest.fixture
+def sharded(scratch_db, tmp_path, monkeypatch):
+    """The scratch database plus EXTRA_BRANCHES empty branches, split into shards."""
+    with db.get_connection(scratch_db) as connection:
+        connection.executemany("INSERT INTO branch (branch_name, location, contact_number) VALUES (?, 'X', '1')",
+                               [(f"Extra {i}",) for i in range(EXTRA_BRANCHES)])
+    directory = str(tmp_path / "shards")
+    sharding.split(scratch_db, directory, progress=lambda message: None)
+    single = superadmin.get_data()
+    catalog = os.path.join(directory, sharding.CATALOG_NAME)
+    monkeypatch.setattr(sharding, "SHARD_DIR", directory)
+    monkeypatch.setattr(db, "DB_PATH", catalog)
+    query_cache.clear()
+    yield single
+    sharding.close_connections()
+    db.close_all()
+
+
+def open_files():
+    return len(os.listdir("/proc/self/fd"))
+
+
+@pytest.mark.skipif(not os.path.isdir("/proc/self/fd"), reason="counts open files through /proc")
+def test_fan_out_matches_the_single_file_with_bounded_connections(sharded, monkeypatch):
+    monkeypatch.setattr(sharding, "SHARD_CONNECTIONS", 4)
+    sharding.branch_ids()  # the catalog's connection and version tracker
+    before = open_files()
+    for _ in range(3):
+        query_cache.clear()
+        totals = superadmin.get_data()
+    assert totals[:4] == sharded[:4]
+    assert len(totals[4]) == len(sharded[4]) == EXTRA_BRANCHES + 1
+    # A WAL connection holds the database, -wal and -shm files; the catalog's
+    # -wal may open too
+    assert open_files() - before <= 3 * sharding.SHARD_CONNECTIONS + 1
+
+
+def test_jobs_stay_in_the_catalog(sharded, monkeypatch):
+    monkeypatch.setattr(jobs, "START_WORKER", False)
+    branch_id = sharding.branch_ids()[0]
+    shard = sharding.ensure_shard(branch_id)
+    with sharding.branch_route(branch_id):
+        job_id = jobs.submit("chapter_charts", {"subject": "Math"})
+        assert jobs.get(job_id)["kind"] == "chapter_charts"
+        assert jobs.submit("chapter_charts", {"subject": "Math"}) == job_id
+    assert db.get_connection(shard).execute("SELECT COUNT(*) FROM job").fetchone()[0] == 0
+    row = db.get_connection(db.DB_PATH).execute("SELECT data_path FROM job WHERE job_id = ?", (job_id,)).fetchone()
+    assert row[0] == os.path.abspath(shard)
+    # The same report of the catalog's data is a different job
+    assert jobs.submit("chapter_charts", {"subject": "Math"}) != job_id
+
+
+def test_superadmin_curriculum_import_reaches_the_branch_shard(sharded):
+    import io
+    import curriculum_import
+    import manage_subjects
+    branch_id, other_branch = sharding.branch_ids()[:2]
+    shard, other = sharding.ensure_shard(branch_id), sharding.ensure_shard(other_branch)
+    grade = db.get_connection(shard).execute("SELECT grade FROM class WHERE branch_id = ? LIMIT 1",
+                                             (branch_id,)).fetchone()[0]
+    csv_file = io.StringIO("Chapter Name,Action Plan,Topic Name,Description,Expected Outcome\n"
+                           "Sharded Chapter,Plan,Sharded Topic,About it,Knows it\n")
+    with sharding.branch_route(branch_id):
+        class_id, subject_id = curriculum_import.resolve_class_and_subject(db.get_connection(), branch_id, grade, "Math")
+        assert class_id is not None
+        manage_subjects.bulk_upload_csv(csv_file, class_id, subject_id)
+
+    topic_sql = "SELECT topic_id, topic_name, description FROM topic WHERE topic_name = 'Sharded Topic'"
+    matches_sql = "SELECT COUNT(*) FROM curriculum_fts WHERE curriculum_fts MATCH 'sharded'"
+    topics = db.get_connection(db.DB_PATH).execute(topic_sql).fetchall()
+    topic_id = topics[0][0]
+    assert db.get_connection(shard).execute(
+        "SELECT ch.class_id, o.expected_outcome FROM chapter ch "
+        "JOIN topic_association ta ON ta.chapter_id = ch.chapter_id "
+        "JOIN topic_outcome o ON o.topic_id = ta.topic_id WHERE ta.topic_id = ?", (topic_id,)
+    ).fetchall() == [(class_id, "Knows it")]
+    assert db.get_connection(shard).execute(matches_sql).fetchone()[0] == 2
+    # The shared tables match everywhere; the chapter is only the branch's
+    for path in (shard, other):
+        assert db.get_connection(path).execute(topic_sql).fetchall() == topics
+    assert db.get_connection(other).execute(matches_sql).fetchone()[0] == 1
+    assert db.get_connection(db.DB_PATH).execute(
+        "SELECT COUNT(*) FROM chapter WHERE chapter_name = 'Sharded Chapter'").fetchone()[0] == 0
+
+    with sharding.branch_route(branch_id):
+        manage_subjects.update_topic(topic_id, "Sharded Topic", "Rewritten", "Knows more")
+    for path in (shard, other):
+        assert db.get_connection(path).execute(
+            "SELECT t.description, o.expected_outcome FROM topic t JOIN topic_outcome o ON o.topic_id = t.topic_id "
+            "WHERE t.topic_id = ?", (topic_id,)
+        ).fetchall() == [("Rewritten", "Knows more")]
+
+    with sharding.branch_route(branch_id):
+        manage_subjects.delete_topic(topic_id)
+    for path in (db.DB_PATH, shard, other):
+        connection = db.get_connection(path)
+        assert connection.execute(topic_sql).fetchall() == []
+        assert connection.execute("SELECT COUNT(*) FROM topic_association WHERE topic_id = ?",
+                                  (topic_id,)).fetchone()[0] == 0
@@ -0,0 +1,29 @@
+import db
+import roster
+import teachers
+
+
+def test_grid_saves_against_student_ids(scratch_db):
+    connection = db.get_connection()
+    branch_id, grade, section_name = connection.execute(
+        "SELECT c.branch_id, c.grade, sec.section_name FROM section sec JOIN class c ON c.class_id = sec.class_id "
+        "ORDER BY sec.section_id DESC LIMIT 1"
+    ).fetchone()
+    students = roster.section_students(branch_id, grade, section_name)
+    original = teachers.load_grade_grid("Mathematics", branch_id, grade, section_name)
+    assert list(original.index) == [student_id for student_id, _ in students]
+
+    section = teachers.section_label(section_name)
+    cleared = original.copy()
+    cleared["Algebra"] = None
+    teachers.save_grade_grid("Mathematics", section, original, cleared)
+    edited = cleared.copy()
+    edited["Algebra"] = 7
+    assert teachers.save_grade_grid("Mathematics", section, cleared, edited) == (len(students), 0)
+    saved = connection.execute(
+        "SELECT student_id, student_name FROM grades WHERE subject = 'Mathematics' AND chapter = 'Algebra' "
+        "AND section = ? AND grade = 7", (section,)
+    ).fetchall()
+    ids = {student_id for student_id, _ in students}
+    assert sorted(row for row in saved if row[0] in ids) == sorted(students)
+    assert (teachers.load_grade_grid("Mathematics", branch_id, grade, section_name)["Algebra"] == 7).all()